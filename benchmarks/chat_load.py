@@ -0,0 +1,344 @@
+"""
+Concurrent end-to-end chat load test for either backend.
+
+Each simulated user logs in, opens a chat and runs a number of streaming
+turns (optionally with an image attachment) followed by a history reload,
+the same sequence the frontend performs. Run it against a backend that has
+``AWS_BEDROCK_ENDPOINT_URL`` pointing at ``fake_bedrock.py`` so the numbers
+measure the backend rather than the model:
+
+    python benchmarks/chat_load.py --backend django --base-url http://127.0.0.1:8000 \\
+        --users 50 --turns 5 --attach-every 3 --output results/django-50u.json
+
+Reported as JSON: time to first byte, time to first token, inter-chunk
+latency, full turn and history-reload latency (p50/p90/p99/max), completed
+turns per second, and, when the backend runs with ``PERF_METRICS=true``,
+DB queries per turn and peak RSS of the worker.
+
+Requires ``httpx`` (already a dependency of ``fastapi-backend``).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+PROMPTS = [
+    "Explain how Python generators work with a short example.",
+    "What are the trade-offs between REST and GraphQL?",
+    "Summarise the previous answer in three bullet points.",
+    "How would I add caching to a Django view?",
+    "Write a SQL query that finds duplicate emails in a users table.",
+]
+
+PERF_PATHS = {
+    "django": "/api/v1/perf/metrics/",
+    "fastapi": "/api/v1/perf/metrics",
+}
+
+
+def tiny_png(width: int = 64, height: int = 64) -> bytes:
+    """A valid solid-colour RGB PNG, small enough not to dominate the request."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + b"\x3c\x78\xb4" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "p50": round(pick(0.50) * 1000, 2),
+        "p90": round(pick(0.90) * 1000, 2),
+        "p99": round(pick(0.99) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+@dataclass
+class Samples:
+    ttfb: List[float] = field(default_factory=list)
+    first_token: List[float] = field(default_factory=list)
+    inter_chunk: List[float] = field(default_factory=list)
+    turn: List[float] = field(default_factory=list)
+    history: List[float] = field(default_factory=list)
+    login: List[float] = field(default_factory=list)
+    completed_turns: int = 0
+    failed_turns: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+class ChatClient:
+    """Backend-specific request shapes; everything else in the harness is shared."""
+
+    def __init__(self, http: httpx.AsyncClient, backend: str):
+        self.http = http
+        self.backend = backend
+        self.headers: Dict[str, str] = {}
+
+    async def login(self, email: str, password: str):
+        path = "/api/v1/auth/login/" if self.backend == "django" else "/api/v1/auth/login"
+        response = await self.http.post(path, json={"email": email, "password": password})
+        response.raise_for_status()
+        data = response.json()
+        if self.backend == "django":
+            self.headers = {"Authorization": f"Token {data['token']}"}
+        else:
+            self.headers = {"Authorization": f"Bearer {data['access_token']}"}
+
+    async def create_chat(self) -> Optional[str]:
+        # Django creates the chat on the first streamed turn (chat_id='new')
+        if self.backend == "django":
+            return None
+        response = await self.http.post("/api/v1/chat/chats", json={"title": "Load test"}, headers=self.headers)
+        response.raise_for_status()
+        return str(response.json()["id"])
+
+    def stream_turn(self, chat_id: Optional[str], message: str, attachment: Optional[bytes]):
+        if self.backend == "django":
+            data = {"message": message, "chat_id": chat_id or "new"}
+            files = [("files", ("load-test.png", attachment, "image/png"))] if attachment else None
+            return self.http.stream("POST", "/api/v1/chat/chat/", data=data, files=files, headers=self.headers)
+        return self.http.stream(
+            "POST", f"/api/v1/chat/chats/{chat_id}/messages", json={"message": message}, headers=self.headers
+        )
+
+    def parse_line(self, line: str) -> Optional[Dict[str, Any]]:
+        """Decode one streamed line: NDJSON for Django, ``data: {...}`` SSE for FastAPI."""
+        line = line.strip()
+        if not line:
+            return None
+        if self.backend == "fastapi":
+            if not line.startswith("data:"):
+                return None
+            line = line[5:].strip()
+        return json.loads(line)
+
+    @staticmethod
+    def is_token(event: Dict[str, Any]) -> bool:
+        return event.get("type") in ("content", "text")
+
+    def chat_id_from(self, event: Dict[str, Any]) -> Optional[str]:
+        if self.backend == "django" and event.get("type") == "chat_id":
+            return event["content"]
+        return None
+
+    async def reload_history(self, chat_id: str):
+        # The message window both backends serve; FastAPI routes have no trailing slash
+        path = f"/api/v1/chat/chats/{chat_id}/messages/" if self.backend == "django" else f"/api/v1/chat/chats/{chat_id}/messages"
+        response = await self.http.get(path, headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+
+async def run_turn(client: ChatClient, chat_id: Optional[str], message: str,
+                   attachment: Optional[bytes], samples: Samples) -> Optional[str]:
+    started = time.perf_counter()
+    first_byte = first_token = last_chunk = None
+    async with client.stream_turn(chat_id, message, attachment) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+        async for line in response.aiter_lines():
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now
+            event = client.parse_line(line)
+            if event is None:
+                continue
+            if event.get("type") == "error":
+                raise RuntimeError(event.get("error") or event.get("content") or "stream error")
+            if client.is_token(event):
+                if first_token is None:
+                    first_token = now
+                else:
+                    samples.inter_chunk.append(now - last_chunk)
+                last_chunk = now
+            chat_id = client.chat_id_from(event) or chat_id
+
+    finished = time.perf_counter()
+    if first_byte is not None:
+        samples.ttfb.append(first_byte - started)
+    if first_token is not None:
+        samples.first_token.append(first_token - started)
+    samples.turn.append(finished - started)
+    return chat_id
+
+
+async def simulate_user(index: int, args, samples: Samples, start_delay: float):
+    await asyncio.sleep(start_delay)
+    attachment = tiny_png() if args.attach_every else None
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as http:
+        client = ChatClient(http, args.backend)
+        try:
+            started = time.perf_counter()
+            await client.login(args.email_template.format(i=index), args.password)
+            samples.login.append(time.perf_counter() - started)
+            chat_id = await client.create_chat()
+        except Exception as e:
+            samples.error(f"login: {type(e).__name__}")
+            samples.failed_turns += args.turns
+            return
+
+        for turn in range(args.turns):
+            message = PROMPTS[(index + turn) % len(PROMPTS)]
+            send_file = client.backend == "django" and args.attach_every and (turn + 1) % args.attach_every == 0
+            try:
+                chat_id = await run_turn(client, chat_id, message, attachment if send_file else None, samples)
+                samples.completed_turns += 1
+            except Exception as e:
+                samples.failed_turns += 1
+                samples.error(f"turn: {type(e).__name__}")
+                continue
+
+            if chat_id and args.reload_history:
+                try:
+                    started = time.perf_counter()
+                    await client.reload_history(chat_id)
+                    samples.history.append(time.perf_counter() - started)
+                except Exception as e:
+                    samples.error(f"history: {type(e).__name__}")
+
+            if args.think_time:
+                await asyncio.sleep(args.think_time)
+
+
+async def fetch_perf(args) -> Optional[Dict[str, Any]]:
+    try:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=10.0) as http:
+            response = await http.get(PERF_PATHS[args.backend])
+            if response.status_code == 200:
+                return response.json()
+    except httpx.HTTPError:
+        pass
+    return None
+
+
+async def run(args) -> Dict[str, Any]:
+    samples = Samples()
+    before = await fetch_perf(args)
+
+    started = time.perf_counter()
+    step = args.ramp_up / args.users if args.users else 0
+    await asyncio.gather(*(
+        simulate_user(i, args, samples, i * step) for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+
+    after = await fetch_perf(args)
+
+    report: Dict[str, Any] = {
+        "backend": args.backend,
+        "base_url": args.base_url,
+        "users": args.users,
+        "turns_per_user": args.turns,
+        "attach_every": args.attach_every,
+        "elapsed_s": round(elapsed, 3),
+        "completed_turns": samples.completed_turns,
+        "failed_turns": samples.failed_turns,
+        "turns_per_second": round(samples.completed_turns / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "login": percentiles(samples.login),
+            "ttfb": percentiles(samples.ttfb),
+            "first_token": percentiles(samples.first_token),
+            "inter_chunk": percentiles(samples.inter_chunk),
+            "turn": percentiles(samples.turn),
+            "history_reload": percentiles(samples.history),
+        },
+        "errors": samples.errors,
+        "server": None,
+    }
+    if before and after:
+        if before.get("pid") != after.get("pid"):
+            report["server_warning"] = "perf metrics came from different workers; run the backend with a single worker"
+        queries = after["db_queries"] - before["db_queries"]
+        report["server"] = {
+            "db_queries": queries,
+            # Includes login and history reloads, i.e. everything a turn costs end to end
+            "db_queries_per_turn": round(queries / samples.completed_turns, 2) if samples.completed_turns else None,
+            "peak_rss_kb": after["peak_rss_kb"],
+            "peak_rss_growth_kb": after["peak_rss_kb"] - before["peak_rss_kb"],
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--backend", choices=["django", "fastapi"], required=True)
+    parser.add_argument("--base-url", default=None, help="Defaults to :8000 for both backends")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per user")
+    parser.add_argument("--email-template", default="loadtest{i}@example.com",
+                        help="Login email per user; {i} is the user index")
+    parser.add_argument("--password", default="LoadTest123!")
+    parser.add_argument("--attach-every", type=int, default=0,
+                        help="Attach a small PNG every N turns (django only, 0 disables)")
+    parser.add_argument("--no-history", dest="reload_history", action="store_false",
+                        help="Skip the history reload after each turn")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between turns")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which users start")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request read timeout")
+    parser.add_argument("--fake-bedrock", type=int, metavar="PORT", default=None,
+                        help="Also start fake_bedrock.py in-process on PORT (the backend must point at it)")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Used with --fake-bedrock")
+    parser.add_argument("--first-token-latency", type=float, default=0.5, help="Used with --fake-bedrock")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args(argv)
+    args.base_url = (args.base_url or "http://127.0.0.1:8000").rstrip("/")
+
+    server = None
+    if args.fake_bedrock is not None:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from fake_bedrock import FakeBedrockConfig, start_server
+
+        server = start_server(FakeBedrockConfig(
+            tokens_per_second=args.tokens_per_second,
+            first_token_latency=args.first_token_latency,
+        ), port=args.fake_bedrock)
+        print(f"Fake bedrock-runtime listening on {server.endpoint_url}", file=sys.stderr)
+
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    if server is not None:
+        report["bedrock_requests"] = dict(server.request_counts)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Read-path cost: DRF serializers and the stdlib JSON encoder versus values()
+rows and orjson.
+
+Builds one chat with ``--pairs`` message pairs (two messages of one text
+content each), ``--chats`` chats and ``--memories`` tagged memories for one
+user in a temporary SQLite database, then times turning them into response
+bytes both ways:
+
+    python benchmarks/chat_read_bench.py --pairs 500
+
+``history`` is the whole chat: the old ``MessageSerializer`` over prefetched
+instances, copied into the response shape, against ``compact_messages``.
+``chat_list`` and ``memory_list`` are one page of ``GET chats/`` and ``GET
+memories/``. Each row is the same data rendered with DRF's
+``JSONRenderer`` and with ``ORJSONRenderer``.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "django-backend"))
+
+
+def setup_django(database: dict):
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes", "django.contrib.auth",
+            "appauth", "chat", "prototypes",
+        ],
+        AUTH_USER_MODEL="appauth.AppUser",
+        DATABASES={"default": database},
+        DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
+        USE_TZ=True,
+    )
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def populate(args, rng: random.Random):
+    from appauth.models import AppUser
+    from chat.models import Chat, MemoryTag, Message, MessageContent, MessagePair, UserMemory
+
+    words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+    user = AppUser.objects.create_user(email="read@example.com")
+    chats = Chat.objects.bulk_create([
+        Chat(user=user, title=f"Chat {i}", system_prompt="You are helpful.") for i in range(max(args.chats, 1))
+    ])
+    chat = chats[0]
+    pairs = MessagePair.objects.bulk_create([MessagePair(chat=chat) for _ in range(args.pairs)])
+    messages = Message.objects.bulk_create([
+        Message(message_pair=pair, role=role) for pair in pairs for role in ("user", "assistant")
+    ])
+    MessageContent.objects.bulk_create([
+        MessageContent(message=message, content_type="text", text_content=" ".join(rng.choices(words, k=args.words)))
+        for message in messages
+    ], batch_size=2000)
+
+    tags = MemoryTag.objects.bulk_create([MemoryTag(name=f"tag-{i}") for i in range(10)])
+    memories = UserMemory.objects.bulk_create([
+        UserMemory(user=user, chat=chat, summary=f"Memory {i}", raw_content=" ".join(rng.choices(words, k=20)),
+                   category="fact", confidence_score=0.9)
+        for i in range(args.memories)
+    ])
+    Through = UserMemory.tags.through
+    Through.objects.bulk_create([
+        Through(usermemory=memory, memorytag=tag) for memory in memories for tag in rng.sample(tags, 3)
+    ])
+    return user, chat, pairs
+
+
+def old_history(chat):
+    """ChatMessagesListView.list before windowing: serializer output copied into the response shape"""
+    from chat.models import Message
+    from chat.serializers import MessageSerializer
+
+    queryset = Message.objects.filter(message_pair__chat=chat).order_by(
+        "message_pair__created_at", "created_at"
+    ).prefetch_related("contents")
+    return {
+        "system_prompt": chat.system_prompt,
+        "messages": [
+            {
+                "id": message["id"],
+                "role": message["role"],
+                "contents": [
+                    {key: content[key] for key in (
+                        "id", "content_type", "text_content", "file_content", "mime_type", "edited_at", "created_at"
+                    )}
+                    for content in message["contents"]
+                ],
+                "created_at": message["created_at"],
+                "message_pair": message["message_pair"],
+                "hidden": message["hidden"],
+            }
+            for message in MessageSerializer(queryset, many=True).data
+        ],
+    }
+
+
+def new_history(chat, pairs):
+    from chat.serializers import compact_messages
+
+    return {"system_prompt": chat.system_prompt, "messages": compact_messages([pair.id for pair in pairs])}
+
+
+def old_chat_list(user, size):
+    from chat.models import Chat
+    from chat.serializers import ChatSerializer
+
+    return ChatSerializer(Chat.objects.filter(user=user).order_by("-created_at", "-id")[:size], many=True).data
+
+
+def new_chat_list(user, size):
+    from chat.models import Chat
+    from chat.serializers import ChatSerializer
+
+    rows = list(Chat.objects.filter(user=user).order_by("-created_at", "-id").values(
+        *ChatSerializer.list_columns
+    )[:size])
+    return ChatSerializer.list_rows(rows)
+
+
+def old_memory_list(user, size):
+    from chat.models import UserMemory
+    from chat.serializers import UserMemoryListSerializer
+
+    queryset = UserMemoryListSerializer.setup_eager_loading(UserMemory.objects.filter(user=user))
+    return UserMemoryListSerializer(queryset.order_by("-created_at", "-id")[:size], many=True).data
+
+
+def new_memory_list(user, size):
+    from chat.models import UserMemory
+    from chat.serializers import UserMemoryListSerializer
+
+    rows = list(UserMemory.objects.filter(user=user).order_by("-created_at", "-id").values(
+        *UserMemoryListSerializer.list_columns
+    )[:size])
+    return UserMemoryListSerializer.list_rows(rows)
+
+
+def timed(build, renderer, repeat: int):
+    samples, body = [], b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = renderer.render(build())
+        samples.append(time.perf_counter() - started)
+    return {"p50_ms": round(statistics.median(samples) * 1000, 2), "bytes": len(body)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--pairs", type=int, default=500, help="Message pairs in the chat (two messages each)")
+    parser.add_argument("--words", type=int, default=150, help="Words per message")
+    parser.add_argument("--chats", type=int, default=100, help="Chats in the list page")
+    parser.add_argument("--memories", type=int, default=100, help="Memories in the list page, three tags each")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="chat-read-"), "bench.sqlite3")
+    setup_django({"ENGINE": "django.db.backends.sqlite3", "NAME": path})
+    from rest_framework.renderers import JSONRenderer
+    from aiassistant.renderers import ORJSONRenderer
+
+    user, chat, pairs = populate(args, random.Random(args.seed))
+    cases = {
+        "history": (lambda: old_history(chat), lambda: new_history(chat, pairs)),
+        "chat_list": (lambda: old_chat_list(user, args.chats), lambda: new_chat_list(user, args.chats)),
+        "memory_list": (lambda: old_memory_list(user, args.memories), lambda: new_memory_list(user, args.memories)),
+    }
+    results = {}
+    for label, (old, new) in cases.items():
+        results[label] = {
+            "serializer_json": timed(old, JSONRenderer(), args.repeat),
+            "serializer_orjson": timed(old, ORJSONRenderer(), args.repeat),
+            "values_orjson": timed(new, ORJSONRenderer(), args.repeat),
+        }
+
+    report = {
+        "messages": args.pairs * 2,
+        "words_per_message": args.words,
+        "chats": args.chats,
+        "memories": args.memories,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
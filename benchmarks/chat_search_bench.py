@@ -0,0 +1,184 @@
+"""
+Chat search latency: unindexed LIKE versus the full-text index.
+
+Fills a database with synthetic chats (default 1M text message contents
+spread over many users), then times the first page of ``GET
+/api/v1/chat/chats/?search=`` for one user with both backends, and the
+first page of message hits from ``GET /api/v1/chat/search/``:
+
+    python benchmarks/chat_search_bench.py --contents 1000000
+
+SQLite (FTS5) by default, in a temporary file; ``--postgres NAME`` runs
+against an existing, empty Postgres database instead (host and
+credentials come from the usual PG* environment variables). Loading 1M
+rows takes a few minutes.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "django-backend"))
+
+
+def setup_django(database: dict):
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes", "django.contrib.auth",
+            "appauth", "chat", "prototypes",
+        ],
+        AUTH_USER_MODEL="appauth.AppUser",
+        DATABASES={"default": database},
+        DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
+        USE_TZ=True,
+    )
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def populate(args, rng: random.Random):
+    """Users with chats of message pairs; each message has ``--contents-per-message`` text blocks"""
+    from django.db import transaction
+    from appauth.models import AppUser
+    from chat.models import Chat, Message, MessageContent, MessagePair
+
+    words = vocabulary(args.vocabulary, rng)
+    # Zipf-like: a few very common words, a long tail of rare ones
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    users = [AppUser.objects.create_user(email=f"search{i}@example.com") for i in range(args.users)]
+
+    contents_per_chat = args.pairs_per_chat * 2 * args.contents_per_message
+    chats_needed = max(1, args.contents // contents_per_chat)
+    planted = 0
+    for start in range(0, chats_needed, 100):
+        with transaction.atomic():
+            chats = Chat.objects.bulk_create([
+                Chat(user=users[n % len(users)], title=" ".join(rng.choices(words, cum_weights=cum_weights, k=4)))
+                for n in range(start, min(start + 100, chats_needed))
+            ])
+            pairs = MessagePair.objects.bulk_create([
+                MessagePair(chat=chat) for chat in chats for _ in range(args.pairs_per_chat)
+            ])
+            messages = Message.objects.bulk_create([
+                Message(message_pair=pair, role=role) for pair in pairs for role in ("user", "assistant")
+            ])
+            contents = []
+            for message in messages:
+                for _ in range(args.contents_per_message):
+                    text = " ".join(rng.choices(words, cum_weights=cum_weights, k=args.words))
+                    if rng.random() < args.rare_probability:
+                        text += " kubernetes ingress controller"
+                        planted += 1
+                    contents.append(MessageContent(message=message, content_type="text", text_content=text))
+            MessageContent.objects.bulk_create(contents, batch_size=2000)
+    return users, words, planted
+
+
+def time_search(backend, user, query: str, repeat: int):
+    from chat.models import Chat
+
+    samples, hits = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        queryset = backend.filter_chats(Chat.objects.filter(user=user), user, query)
+        page = list(queryset[:20])
+        hits = queryset.count()
+        samples.append(time.perf_counter() - started)
+    return {"p50_ms": round(statistics.median(samples) * 1000, 2), "max_ms": round(max(samples) * 1000, 2),
+            "chats": hits, "first_page": len(page)}
+
+
+def time_message_search(backend, user, query: str, repeat: int):
+    """First page of ``GET /api/v1/chat/search/``: ranked message hits with snippets"""
+    samples, hits = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hits = backend.search_messages(user, query, 21)
+        samples.append(time.perf_counter() - started)
+    return {"p50_ms": round(statistics.median(samples) * 1000, 2), "max_ms": round(max(samples) * 1000, 2),
+            "first_page": len(hits[:20])}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--contents", type=int, default=1_000_000, help="Text message contents to create")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pairs-per-chat", type=int, default=10)
+    parser.add_argument("--contents-per-message", type=int, default=1)
+    parser.add_argument("--words", type=int, default=40, help="Words per message content")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--rare-probability", type=float, default=0.0005,
+                        help="Fraction of contents that get the rare phrase searched for")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--postgres", metavar="NAME", help="Use this Postgres database instead of SQLite")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if args.postgres:
+        database = {"ENGINE": "django.db.backends.postgresql", "NAME": args.postgres}
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix="chat-search-"), "bench.sqlite3")
+        database = {"ENGINE": "django.db.backends.sqlite3", "NAME": path}
+    setup_django(database)
+    from django.db import connection
+    from chat.services.search_service import LikeSearchBackend, install_search_index
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    users, words, planted = populate(args, rng)
+    load_seconds = time.perf_counter() - started
+    # bulk_create skips the save signal the SQLite index is maintained from
+    started = time.perf_counter()
+    index = install_search_index(connection)
+    index_seconds = time.perf_counter() - started
+    queries = {
+        "common_word": words[0],
+        "mid_frequency_word": words[len(words) // 50],
+        "rare_phrase": "kubernetes ingress",
+        "prefix": "kuber",
+        "no_match": "zzzzzzzzzz",
+    }
+    user = users[0]
+    results = {}
+    for label, query in queries.items():
+        results[label] = {
+            "query": query,
+            "like": time_search(LikeSearchBackend(), user, query, args.repeat),
+            index.name: time_search(index, user, query, args.repeat),
+            f"{index.name}_message_hits": time_message_search(index, user, query, args.repeat),
+        }
+
+    from chat.models import MessageContent
+    report = {
+        "database": database["ENGINE"].rsplit(".", 1)[-1],
+        "message_contents": MessageContent.objects.count(),
+        "users": len(users),
+        "planted_rare_phrase": planted,
+        "load_seconds": round(load_seconds, 1),
+        "index_rebuild_seconds": round(index_seconds, 1),
+        "index_backend": index.name,
+        "queries": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""
+Local stand-in for the AWS ``bedrock-runtime`` service.
+
+Point boto3 at it with ``endpoint_url`` (or set ``AWS_BEDROCK_ENDPOINT_URL``
+for either backend) to exercise the chat and prototype flows without paying
+for real model calls:
+
+    python benchmarks/fake_bedrock.py --port 8765 --tokens-per-second 80 \\
+        --first-token-latency 0.6 --throttle-probability 0.02
+
+Supports ``InvokeModel`` and ``InvokeModelWithResponseStream`` using the
+same wire format as Bedrock (JSON for the former, binary
+``application/vnd.amazon.eventstream`` frames for the latter), including
+``usage`` payloads and ``amazon-bedrock-invocationMetrics`` on the final
+event. Streams recorded with ``record`` can be replayed with their original
+timing via ``--replay``.
+
+Only the standard library is used so the server can run next to either
+backend without extra dependencies.
+"""
+import argparse
+import base64
+import binascii
+import glob
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+
+LOREM = (
+    "Sure! Here is a detailed answer that walks through the problem step by step, "
+    "covering the main trade-offs, a short code example and a few pitfalls to avoid "
+    "when you apply it to a real project. "
+)
+
+PROTOTYPE_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <script src="https://cdn.tailwindcss.com"></script>
+  <title>Prototype</title>
+</head>
+<body class="bg-gray-50 min-h-screen flex items-center justify-center">
+  <main class="max-w-xl w-full bg-white rounded-2xl shadow p-8 space-y-4">
+{rows}
+  </main>
+</body>
+</html>"""
+
+
+@dataclass
+class FakeBedrockConfig:
+    """Timing and behaviour knobs for the stand-in."""
+    tokens_per_second: float = 60.0
+    first_token_latency: float = 0.5  # seconds before the first content delta
+    tokens_per_chunk: int = 3  # tokens per content_block_delta event
+    output_tokens: int = 400  # capped by the request's max_tokens
+    throttle_probability: float = 0.0
+    replay: List[str] = field(default_factory=list)  # recorded .jsonl streams
+    replay_speed: float = 1.0  # >1 replays faster than recorded
+    seed: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+# ---------------------------------------------------------------------------
+# Event stream encoding
+# ---------------------------------------------------------------------------
+
+def _encode_headers(headers: Dict[str, str]) -> bytes:
+    encoded = b""
+    for name, value in headers.items():
+        name_bytes = name.encode("utf-8")
+        value_bytes = value.encode("utf-8")
+        # header value type 7 = string
+        encoded += struct.pack("!B", len(name_bytes)) + name_bytes
+        encoded += struct.pack("!BH", 7, len(value_bytes)) + value_bytes
+    return encoded
+
+
+def encode_event(headers: Dict[str, str], payload: bytes) -> bytes:
+    """Encode a single ``application/vnd.amazon.eventstream`` message."""
+    header_bytes = _encode_headers(headers)
+    total_length = 12 + len(header_bytes) + len(payload) + 4
+    prelude = struct.pack("!II", total_length, len(header_bytes))
+    prelude += struct.pack("!I", binascii.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + header_bytes + payload
+    return message + struct.pack("!I", binascii.crc32(message) & 0xFFFFFFFF)
+
+
+def encode_chunk(chunk: Dict[str, Any]) -> bytes:
+    """Wrap a Claude streaming event the way Bedrock does (base64 in a PayloadPart)."""
+    payload = json.dumps({
+        "bytes": base64.b64encode(json.dumps(chunk).encode("utf-8")).decode("ascii")
+    }).encode("utf-8")
+    return encode_event({
+        ":event-type": "chunk",
+        ":content-type": "application/json",
+        ":message-type": "event",
+    }, payload)
+
+
+# ---------------------------------------------------------------------------
+# Response synthesis
+# ---------------------------------------------------------------------------
+
+def _system_text(request: Dict[str, Any]) -> str:
+    system = request.get("system") or ""
+    if isinstance(system, list):
+        system = " ".join(block.get("text", "") for block in system if isinstance(block, dict))
+    return system
+
+
+def _request_text(request: Dict[str, Any]) -> str:
+    parts = [_system_text(request)]
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            for block in content:
+                if block.get("type") == "text":
+                    parts.append(block.get("text", ""))
+                elif block.get("type") == "image":
+                    parts.append("x" * 6000)  # ~1.5k tokens per image
+    return "\n".join(parts)
+
+
+def synthesize_text(request: Dict[str, Any], output_tokens: int) -> str:
+    """
+    Build a plausible response for the request. Prototype, memory-extraction
+    and title prompts get output in the shape their callers parse.
+    """
+    system = _system_text(request)
+    if "prototype_file" in system:
+        rows = []
+        while estimate_tokens("\n".join(rows)) < output_tokens - 60:
+            rows.append(f'    <p class="text-gray-700">{LOREM.strip()}</p>')
+        html = PROTOTYPE_HTML.format(rows="\n".join(rows))
+        return f'<prototype_file name="Fake Prototype">{html}</prototype_file>'
+    if "memory extraction" in system.lower():
+        return "[]"
+    if request.get("max_tokens", 4096) <= 50:
+        return "Fake Bedrock Chat Title"
+
+    text = ""
+    while estimate_tokens(text) < output_tokens:
+        text += LOREM
+    return text[:output_tokens * 4]
+
+
+def split_tokens(text: str, tokens_per_chunk: int) -> List[str]:
+    """Split text into deltas of roughly ``tokens_per_chunk`` tokens."""
+    size = max(1, tokens_per_chunk * 4)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def synthetic_events(request: Dict[str, Any], config: FakeBedrockConfig) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """Yield ``(delay_before, chunk)`` pairs for a synthetic stream."""
+    max_tokens = int(request.get("max_tokens", 4096))
+    input_tokens = estimate_tokens(_request_text(request))
+    text = synthesize_text(request, min(config.output_tokens, max_tokens))
+    deltas = split_tokens(text, config.tokens_per_chunk)
+    output_tokens = estimate_tokens(text)
+    delta_interval = config.tokens_per_chunk / config.tokens_per_second if config.tokens_per_second > 0 else 0
+
+    yield 0.0, {
+        "type": "message_start",
+        "message": {
+            "id": f"msg_bdrk_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": "claude-fake",
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+        },
+    }
+    yield 0.0, {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    for i, delta in enumerate(deltas):
+        delay = config.first_token_latency if i == 0 else delta_interval
+        yield delay, {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": delta}}
+    yield 0.0, {"type": "content_block_stop", "index": 0}
+    yield 0.0, {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": output_tokens},
+    }
+    yield 0.0, {
+        "type": "message_stop",
+        "amazon-bedrock-invocationMetrics": {
+            "inputTokenCount": input_tokens,
+            "outputTokenCount": output_tokens,
+            "invocationLatency": int((config.first_token_latency + delta_interval * len(deltas)) * 1000),
+            "firstByteLatency": int(config.first_token_latency * 1000),
+        },
+    }
+
+
+def load_recording(path: str) -> List[Tuple[float, Dict[str, Any]]]:
+    """Load a stream recorded by ``record_stream`` (one JSON object per line)."""
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                events.append((entry.get("delay_ms", 0) / 1000.0, entry["chunk"]))
+    return events
+
+
+def message_from_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fold streaming events into the body InvokeModel would return."""
+    message: Dict[str, Any] = {}
+    text = []
+    for chunk in events:
+        if chunk["type"] == "message_start":
+            message = dict(chunk["message"])
+        elif chunk["type"] == "content_block_delta" and chunk["delta"].get("type") == "text_delta":
+            text.append(chunk["delta"]["text"])
+        elif chunk["type"] == "message_delta":
+            message.update(chunk.get("delta", {}))
+            message.setdefault("usage", {}).update(chunk.get("usage", {}))
+    message["content"] = [{"type": "text", "text": "".join(text)}]
+    return message
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeBedrock/1.0"
+
+    @property
+    def config(self) -> FakeBedrockConfig:
+        return self.server.config
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length) if length else b"{}"
+        parts = self.path.split("/")
+        # /model/{modelId}/invoke or /model/{modelId}/invoke-with-response-stream
+        if len(parts) != 4 or parts[1] != "model":
+            self._send_error(404, "UnknownOperationException", f"Unknown path {self.path}")
+            return
+        model_id = unquote(parts[2])
+        operation = parts[3]
+
+        try:
+            request = json.loads(raw_body or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "ValidationException", "Malformed input request")
+            return
+
+        self.server.record_request(model_id, operation)
+
+        if self.server.rng.random() < self.config.throttle_probability:
+            self._send_error(429, "ThrottlingException", "Too many requests, please wait before trying again.")
+            return
+
+        events = self._events_for(request)
+        if operation == "invoke":
+            self._send_invoke(events)
+        elif operation == "invoke-with-response-stream":
+            self._send_stream(events)
+        else:
+            self._send_error(404, "UnknownOperationException", f"Unknown operation {operation}")
+
+    def _events_for(self, request: Dict[str, Any]) -> List[Tuple[float, Dict[str, Any]]]:
+        if self.server.recordings:
+            recording = self.server.rng.choice(self.server.recordings)
+            speed = self.config.replay_speed or 1.0
+            return [(delay / speed, chunk) for delay, chunk in recording]
+        return list(synthetic_events(request, self.config))
+
+    def _send_error(self, status: int, error_type: str, message: str):
+        body = json.dumps({"message": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("x-amzn-ErrorType", f"{error_type}:http://internal.amazon.com/coral/com.amazon.bedrock/")
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_invoke(self, events: List[Tuple[float, Dict[str, Any]]]):
+        # A non-streaming call still waits for the whole generation
+        time.sleep(sum(delay for delay, _ in events))
+        message = message_from_events([chunk for _, chunk in events])
+        body = json.dumps(message).encode("utf-8")
+        usage = message.get("usage", {})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+        self.send_header("X-Amzn-Bedrock-Input-Token-Count", str(usage.get("input_tokens", 0)))
+        self.send_header("X-Amzn-Bedrock-Output-Token-Count", str(usage.get("output_tokens", 0)))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, events: List[Tuple[float, Dict[str, Any]]]):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+        self.send_header("X-Amzn-Bedrock-Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for delay, chunk in events:
+                if delay > 0:
+                    time.sleep(delay)
+                frame = encode_chunk(chunk)
+                self.wfile.write(f"{len(frame):X}\r\n".encode("ascii") + frame + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+
+
+class FakeBedrockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: FakeBedrockConfig, verbose: bool = False):
+        super().__init__(address, FakeBedrockHandler)
+        self.config = config
+        self.verbose = verbose
+        self.rng = random.Random(config.seed)
+        self.recordings = [load_recording(path) for path in config.replay]
+        self._lock = threading.Lock()
+        self.request_counts: Dict[str, int] = {}
+
+    def record_request(self, model_id: str, operation: str):
+        with self._lock:
+            key = f"{operation}:{model_id}"
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_server(config: Optional[FakeBedrockConfig] = None, host: str = "127.0.0.1",
+                 port: int = 0, verbose: bool = False) -> FakeBedrockServer:
+    """Start the stand-in on a background thread and return the server (``server.endpoint_url``)."""
+    server = FakeBedrockServer((host, port), config or FakeBedrockConfig(), verbose=verbose)
+    thread = threading.Thread(target=server.serve_forever, name="fake-bedrock", daemon=True)
+    thread.start()
+    return server
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def record_stream(response: Dict[str, Any], path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Tee a real ``invoke_model_with_response_stream`` response to ``path`` while
+    yielding its events unchanged, keeping the inter-event timing for replay.
+    """
+    last = time.monotonic()
+    with open(path, "w") as f:
+        for event in response["body"]:
+            now = time.monotonic()
+            chunk = json.loads(event["chunk"]["bytes"])
+            f.write(json.dumps({"delay_ms": round((now - last) * 1000, 2), "chunk": chunk}) + "\n")
+            last = now
+            yield event
+
+
+def _record_command(args):
+    import boto3
+
+    client = boto3.client("bedrock-runtime", region_name=args.region)
+    body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": args.max_tokens,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": args.prompt}]}],
+    })
+    response = client.invoke_model_with_response_stream(body=body, modelId=args.model)
+    count = sum(1 for _ in record_stream(response, args.out))
+    print(f"Recorded {count} events to {args.out}")
+
+
+def _serve_command(args):
+    replay = []
+    for pattern in args.replay or []:
+        replay.extend(sorted(glob.glob(pattern)))
+    config = FakeBedrockConfig(
+        tokens_per_second=args.tokens_per_second,
+        first_token_latency=args.first_token_latency,
+        tokens_per_chunk=args.tokens_per_chunk,
+        output_tokens=args.output_tokens,
+        throttle_probability=args.throttle_probability,
+        replay=replay,
+        replay_speed=args.replay_speed,
+        seed=args.seed,
+    )
+    server = FakeBedrockServer((args.host, args.port), config, verbose=args.verbose)
+    print(f"Fake bedrock-runtime listening on {server.endpoint_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve = subparsers.add_parser("serve", help="Run the stand-in server (default)")
+    record = subparsers.add_parser("record", help="Record a real Bedrock stream for replay")
+
+    for p in (parser, serve):
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8765)
+        p.add_argument("--tokens-per-second", type=float, default=60.0)
+        p.add_argument("--first-token-latency", type=float, default=0.5)
+        p.add_argument("--tokens-per-chunk", type=int, default=3)
+        p.add_argument("--output-tokens", type=int, default=400)
+        p.add_argument("--throttle-probability", type=float, default=0.0)
+        p.add_argument("--replay", action="append", help="Recorded .jsonl stream(s); glob patterns allowed")
+        p.add_argument("--replay-speed", type=float, default=1.0)
+        p.add_argument("--seed", type=int, default=None)
+        p.add_argument("--verbose", action="store_true")
+
+    record.add_argument("--model", default="anthropic.claude-3-5-sonnet-20241022-v2:0")
+    record.add_argument("--region", default="us-west-2")
+    record.add_argument("--prompt", required=True)
+    record.add_argument("--max-tokens", type=int, default=1024)
+    record.add_argument("--out", required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        _record_command(args)
+    else:
+        _serve_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
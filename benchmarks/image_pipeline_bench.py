@@ -0,0 +1,113 @@
+"""
+Image attachments as sent to the model: the original upload versus the
+derivative from ``chat.utils.image_pipeline``.
+
+Generates a phone photo, a retina screenshot and a transparent diagram,
+runs each through ``optimize_for_model`` and reports, per image, the file
+and base64 payload bytes and the estimated input tokens both ways:
+
+    python benchmarks/image_pipeline_bench.py
+
+Tokens for the original are what the model bills after scaling it down on
+its side; images past the bound also pay for the upload and the base64
+payload of every turn that resends them.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "django-backend"))
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from chat.utils.image_pipeline import estimate_image_tokens, model_size, optimize_for_model  # noqa: E402
+
+
+def encode(image: Image.Image, format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+def phone_photo(rng: random.Random) -> bytes:
+    """4032x3024 JPEG at quality 92 with camera EXIF, shot sideways"""
+    width, height = 4032, 3024
+    image = Image.effect_noise((width // 8, height // 8), 48).resize((width, height), Image.Resampling.BICUBIC)
+    image = Image.merge("RGB", [image.point(lambda v, k=k: min(255, v + k)) for k in (30, 10, rng.randint(0, 40))])
+    exif = Image.Exif()
+    exif[0x010F], exif[0x0110], exif[0x0112] = "Phone", "Phone 15", 6
+    return encode(image, "JPEG", quality=92, exif=exif)
+
+
+def screenshot(rng: random.Random) -> bytes:
+    """2880x1800 PNG of a page: anti-aliased text beside an embedded photo"""
+    words = ["request", "latency", "payload", "token", "history", "image", "upload", "model", "chat", "cursor"]
+    image = Image.new("RGB", (2880, 1800), (248, 248, 250))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 2880, 96), fill=(36, 41, 47))
+    font = ImageFont.load_default(size=26)
+    for y in range(160, 1760, 44):
+        draw.text((80, y), " ".join(rng.choices(words, k=12)), fill=(40, 40, 48), font=font)
+    photo = Image.effect_noise((130, 100), 48).resize((1040, 800), Image.Resampling.BICUBIC).convert("RGB")
+    image.paste(photo, (1760, 200))
+    return encode(image, "PNG")
+
+
+def diagram(rng: random.Random) -> bytes:
+    """2000x2000 RGBA PNG of boxes and arrows on a transparent background"""
+    image = Image.new("RGBA", (2000, 2000), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for _ in range(24):
+        x, y = rng.randint(0, 1700), rng.randint(0, 1800)
+        draw.rounded_rectangle((x, y, x + 260, y + 140), radius=18, fill=(66, 133, 244, 220), outline=(0, 0, 0, 255), width=4)
+        draw.line((x + 130, y + 140, rng.randint(0, 2000), rng.randint(0, 2000)), fill=(0, 0, 0, 255), width=5)
+    return encode(image, "PNG")
+
+
+def measure(data: bytes, repeat: int):
+    samples, model_image = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        model_image = optimize_for_model(data)
+        samples.append(time.perf_counter() - started)
+    with Image.open(io.BytesIO(data)) as image:
+        original_tokens = estimate_image_tokens(*model_size(*image.size))
+        original = {"size": list(image.size), "bytes": len(data), "base64_bytes": len(base64.b64encode(data)),
+                    "tokens": original_tokens}
+    if model_image is None:
+        return {"original": original, "optimized": None}
+    return {
+        "original": original,
+        "optimized": {
+            "size": [model_image.width, model_image.height],
+            "mime_type": model_image.mime_type,
+            "bytes": len(model_image.data),
+            "base64_bytes": len(base64.b64encode(model_image.data)),
+            "tokens": model_image.tokens,
+        },
+        "payload_reduction": round(1 - len(model_image.data) / len(data), 3),
+        "pipeline_p50_ms": round(statistics.median(samples) * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    results = {name: measure(build(rng), args.repeat)
+               for name, build in (("phone_photo", phone_photo), ("screenshot", screenshot), ("diagram", diagram))}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+CPU cost of relaying a Bedrock stream to the client, per 1k output tokens.
+
+Compares the per-token relay both backends used to do (``json`` parse, string
+concatenation and one encoded frame per delta) with the coalescing relay
+(``orjson`` parse, buffered text and one frame per flush interval):
+
+    python benchmarks/stream_relay_bench.py --tokens 5000 --tokens-per-second 80
+
+Events arrive on a simulated clock so the coalescing matches what a real
+stream at ``--tokens-per-second`` would produce; only CPU time is measured.
+Database writes are not executed; the report counts how many each relay
+would issue (Django updates the message per frame, FastAPI once at the end)
+and the characters those writes carry.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import orjson
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "django-backend"))
+sys.path.insert(0, os.path.join(ROOT, "fastapi-backend"))
+
+from chat.utils.stream_relay import DeltaCoalescer  # noqa: E402
+from app.schemas.chat import ChatStreamChunk  # noqa: E402
+from app.utils.stream_relay import coalesce_text  # noqa: E402
+
+WORDS = "the quick brown fox jumps over a lazy dog while streaming tokens to the browser".split()
+
+
+class SimulatedClock:
+    def __init__(self, step: float):
+        self.step = step
+        self.now = 0.0
+
+    def tick(self):
+        self.now += self.step
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_events(tokens: int) -> List[Dict[str, Any]]:
+    """Bedrock ``chunk`` events, one text delta per token"""
+    events = []
+    for i in range(tokens):
+        delta = {"type": "content_block_delta", "index": 0,
+                 "delta": {"type": "text_delta", "text": WORDS[i % len(WORDS)] + " "}}
+        events.append({"chunk": {"bytes": json.dumps(delta).encode()}})
+    return events
+
+
+def django_before(events, clock):
+    current_text = ""
+    frames = writes = sent = written = 0
+    for chunk in events:
+        clock.tick()
+        chunk_data = json.loads(chunk['chunk']['bytes'].decode())
+        if chunk_data['type'] == 'content_block_delta':
+            content = chunk_data['delta']['text']
+            current_text += content
+            writes += 1
+            written += len(current_text)
+            sent += len(json.dumps({'type': 'content', 'message_id': 'm', 'content': content}) + '\n')
+            frames += 1
+    return frames, writes, sent, written
+
+
+def django_after(events, clock, interval, max_bytes):
+    relay = DeltaCoalescer(flush_interval=interval, flush_bytes=max_bytes, clock=clock)
+    frames = writes = sent = written = 0
+
+    def content_frame():
+        nonlocal frames, writes, sent, written
+        content = relay.flush()
+        written += len(relay.text)
+        writes += 1
+        frames += 1
+        sent += len(orjson.dumps({'type': 'content', 'message_id': 'm', 'content': content}) + b'\n')
+
+    for chunk in events:
+        clock.tick()
+        chunk_data = orjson.loads(chunk['chunk']['bytes'])
+        if chunk_data['type'] == 'content_block_delta':
+            if relay.add(chunk_data['delta'].get('text', '')):
+                content_frame()
+    if relay.has_pending:
+        content_frame()
+    return frames, writes, sent, written
+
+
+async def _bedrock_text(events, clock, parse):
+    for event in events:
+        # Each event is a network read, so the relay runs between them
+        await asyncio.sleep(0)
+        clock.tick()
+        chunk = parse(event['chunk']['bytes'])
+        if chunk['type'] == 'content_block_delta':
+            yield chunk['delta']['text']
+
+
+async def fastapi_before(events, clock):
+    response_text = ""
+    frames = sent = 0
+    async for chunk in _bedrock_text(events, clock, json.loads):
+        response_text += chunk
+        sent += len(f"data: {ChatStreamChunk(type='text', content=chunk).model_dump_json()}\n\n")
+        frames += 1
+    # The whole response is written once when the stream ends
+    return frames, 1, sent, len(response_text)
+
+
+async def fastapi_after(events, clock, interval, max_bytes):
+    parts = []
+    frames = sent = 0
+    async for chunk in coalesce_text(_bedrock_text(events, clock, orjson.loads), interval, max_bytes, clock):
+        parts.append(chunk)
+        sent += len(b"data: " + orjson.dumps(ChatStreamChunk(type='text', content=chunk).model_dump()) + b"\n\n")
+        frames += 1
+    return frames, 1, sent, len("".join(parts))
+
+
+def measure(fn, events, args, repeat: int) -> Dict[str, Any]:
+    best = None
+    for _ in range(repeat):
+        clock = SimulatedClock(1.0 / args.tokens_per_second)
+        started = time.process_time()
+        result = fn(clock)
+        if asyncio.iscoroutine(result):
+            result = asyncio.run(result)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    frames, writes, sent, written = result
+    return {
+        "cpu_ms_per_1k_tokens": round(best / len(events) * 1000 * 1000, 3),
+        "frames": frames,
+        "bytes_sent": sent,
+        "db_writes": writes,
+        "db_chars_written": written,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--flush-interval", type=float, default=0.04)
+    parser.add_argument("--flush-bytes", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs")
+    args = parser.parse_args(argv)
+
+    events = make_events(args.tokens)
+    interval, max_bytes = args.flush_interval, args.flush_bytes
+    cases = {
+        "django": {
+            "before": lambda clock: django_before(events, clock),
+            "after": lambda clock: django_after(events, clock, interval, max_bytes),
+        },
+        "fastapi": {
+            "before": lambda clock: fastapi_before(events, clock),
+            "after": lambda clock: fastapi_after(events, clock, interval, max_bytes),
+        },
+    }
+
+    report = {"tokens": args.tokens, "tokens_per_second": args.tokens_per_second,
+              "flush_interval": interval, "flush_bytes": max_bytes}
+    for backend, variants in cases.items():
+        results = {name: measure(fn, events, args, args.repeat) for name, fn in variants.items()}
+        before, after = results["before"]["cpu_ms_per_1k_tokens"], results["after"]["cpu_ms_per_1k_tokens"]
+        results["speedup"] = round(before / after, 2) if after else None
+        report[backend] = results
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Storage size and read latency of prototype version HTML on a long edit chain.
+
+Builds a chain of small edits to one prototype variant in an in-memory
+SQLite database and compares what the inline ``html_content`` column used
+to hold with the delta-compressed blobs that replace it:
+
+    python benchmarks/version_store_bench.py --versions 100 --snapshot-interval 10
+
+Reads are timed cold (fresh row from the database, empty text cache) and
+warm (text cache populated), the way the API sees a version it served
+recently. Stored bytes include the precompressed encodings (``HtmlEncoding``)
+of the versions that were served, by default only the latest one, since
+encodings are written on a blob's first ``html`` request.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "django-backend"))
+
+
+def setup_django(snapshot_interval: int):
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes", "django.contrib.auth",
+            "appauth", "chat", "prototypes",
+        ],
+        AUTH_USER_MODEL="appauth.AppUser",
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}},
+        DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
+        USE_TZ=True,
+        PROTOTYPE_SNAPSHOT_INTERVAL=snapshot_interval,
+    )
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def base_page(sections: int) -> list:
+    lines = [
+        "<!DOCTYPE html>", '<html lang="en">', "<head>",
+        '  <script src="https://cdn.tailwindcss.com"></script>', "</head>",
+        '<body class="bg-gray-50 text-gray-900">',
+    ]
+    for i in range(sections):
+        lines += [
+            f'  <section id="section-{i}" class="max-w-5xl mx-auto px-6 py-12">',
+            f'    <h2 class="text-2xl font-semibold mb-4">Section {i} heading</h2>',
+            f'    <p class="text-gray-600 leading-relaxed">Body copy for section {i} describing the feature.</p>',
+            '    <div class="grid grid-cols-1 md:grid-cols-3 gap-6 mt-8">',
+            *[f'      <div class="rounded-xl shadow p-6 bg-white">Card {i}.{j}</div>' for j in range(3)],
+            "    </div>",
+            "  </section>",
+        ]
+    return lines + ["</body>", "</html>"]
+
+
+def edit(lines: list, rng: random.Random, n: int) -> list:
+    """A small edit: tweak a few lines and sometimes add a block"""
+    lines = list(lines)
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(6, len(lines) - 2)
+        lines[i] = lines[i].replace("text-gray-600", "text-slate-500").replace("p-6", "p-8") + f"<!-- edit {n} -->"
+    if rng.random() < 0.3:
+        i = rng.randrange(6, len(lines) - 2)
+        lines[i:i] = [f'    <p class="mt-4 text-sm">Added in edit {n}</p>']
+    return lines
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--versions", type=int, default=100)
+    parser.add_argument("--sections", type=int, default=40, help="Size of the page (~400 bytes each)")
+    parser.add_argument("--snapshot-interval", type=int, default=10)
+    parser.add_argument("--revert-probability", type=float, default=0.05,
+                        help="Chance an edit restores an earlier version (exercises dedup)")
+    parser.add_argument("--served", type=int, default=1,
+                        help="Latest versions requested through the html endpoint, which stores their encodings")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    setup_django(args.snapshot_interval)
+    from appauth.models import AppUser
+    from prototypes.models import DesignProject, HtmlBlob, HtmlEncoding, Prototype, PrototypeVariant, PrototypeVersion
+    from prototypes.version_store import text_cache
+
+    rng = random.Random(args.seed)
+    user = AppUser.objects.create_user(email="bench@example.com", password="bench")
+    project = DesignProject.objects.create(user=user, title="Bench")
+    prototype = Prototype.objects.create(design_project=project, title="Bench", prompt="bench")
+    variant = PrototypeVariant.objects.create(prototype=prototype, name="Original", is_original=True)
+
+    history = [base_page(args.sections)]
+    for n in range(1, args.versions):
+        if rng.random() < args.revert_probability:
+            history.append(list(rng.choice(history)))
+        else:
+            history.append(edit(history[-1], rng, n))
+    pages = ["\n".join(lines) for lines in history]
+
+    write_times = []
+    for number, html in enumerate(pages):
+        started = time.perf_counter()
+        PrototypeVersion.objects.create(variant=variant, version_number=number, name=f"v{number}", html_content=html)
+        write_times.append(time.perf_counter() - started)
+
+    cold, warm = [], []
+    for number, html in enumerate(pages):
+        text_cache.clear()
+        started = time.perf_counter()
+        version = PrototypeVersion.objects.select_related("blob").get(variant=variant, version_number=number)
+        assert version.html_content == html, f"v{number} reconstructed incorrectly"
+        cold.append(time.perf_counter() - started)
+    for number in range(len(pages)):
+        started = time.perf_counter()
+        PrototypeVersion.objects.select_related("blob").get(variant=variant, version_number=number).html_content
+        warm.append(time.perf_counter() - started)
+
+    # What the html endpoint stores on the first request for each served version
+    served = PrototypeVersion.objects.filter(variant=variant).order_by("-version_number")[:args.served]
+    for blob in {version.blob for version in served.select_related("blob")}:
+        if not blob.encodings.exists():
+            HtmlEncoding.create_for(blob)
+
+    blobs = list(HtmlBlob.objects.all())
+    inline_bytes = sum(len(html.encode("utf-8")) for html in pages)
+    blob_bytes = sum(len(blob.data) for blob in blobs)
+    encoding_bytes = sum(len(encoding.data) for encoding in HtmlEncoding.objects.all())
+    report = {
+        "versions": len(pages),
+        "page_bytes": len(pages[-1].encode("utf-8")),
+        "snapshot_interval": args.snapshot_interval,
+        "inline_bytes": inline_bytes,
+        "blob_bytes": blob_bytes,
+        "served_versions": args.served,
+        "encoding_bytes": encoding_bytes,
+        "stored_bytes": blob_bytes + encoding_bytes,
+        "compression_ratio": round(inline_bytes / (blob_bytes + encoding_bytes), 1),
+        "blobs": {
+            "snapshots": sum(1 for blob in blobs if not blob.is_delta),
+            "deltas": sum(1 for blob in blobs if blob.is_delta),
+            "deduplicated_versions": len(pages) - len(blobs),
+            "max_depth": max(blob.depth for blob in blobs),
+        },
+        "write": percentiles(write_times),
+        "read_cold": percentiles(cold),
+        "read_warm": percentiles(warm),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
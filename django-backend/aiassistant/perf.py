@@ -0,0 +1,45 @@
+"""
+Process-level performance counters used by the load-test harness
+(benchmarks/chat_load.py). Only wired up when PERF_METRICS is enabled.
+"""
+import os
+import resource
+import threading
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+_lock = threading.Lock()
+_queries = 0
+
+
+def _count_query(execute, sql, params, many, context):
+    global _queries
+    with _lock:
+        _queries += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """Count every query on every new connection, including ones made while streaming"""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def peak_rss_kb() -> int:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def perf_metrics(request):
+    """Cumulative DB query count and peak RSS for this worker process"""
+    return Response({
+        'pid': os.getpid(),
+        'db_queries': _queries,
+        'peak_rss_kb': peak_rss_kb(),
+    })
@@ -0,0 +1,173 @@
+"""
+Per-endpoint database query budgets for the API test suites.
+
+Every endpoint is requested twice: once against a small fixture and once
+against a large one, each built inside a savepoint that is rolled back
+afterwards so the two never see each other's rows. The test fails when the
+two query counts differ (an N+1 somewhere) or when the count goes over the
+endpoint's budget, and the failure lists the SQL with repeated statements
+grouped so the loop is easy to spot.
+
+    class ChatQueryBudgetTests(QueryBudgetMixin, APITestCase):
+        url_prefix = '/api/v1/chat/'
+        endpoints = [
+            Endpoint('GET', 'chats/{chat.id}/', 4),
+        ]
+
+        def build_fixture(self, size):
+            ...
+            return {'user': user, 'chat': chat}
+
+Paths are formatted with the fixture dict and are relative to ``url_prefix``
+unless they start with ``/``; ``data`` may be a callable that takes it.
+Every route under ``url_prefix`` needs an endpoint, or an entry in
+``uncovered_routes`` saying why not.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve
+
+SMALL = 2
+LARGE = 6
+
+
+@dataclass
+class Endpoint:
+    method: str
+    path: str
+    max_queries: int
+    data: Union[Dict[str, Any], Callable[[dict], Any], None] = None
+    status: int = 200
+    format: str = 'json'
+    user: Optional[str] = 'user'  # fixture key to authenticate as, None for anonymous
+    session: bool = False  # log in with a session (admin pages) instead of forcing DRF auth
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    def __str__(self):
+        return f"{self.method} {self.path}"
+
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '%s'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '%s'),
+    (re.compile(r'\bIN \((?:%s(?:, )?)+\)'), 'IN (...)'),
+]
+
+
+def normalize_sql(sql: str) -> str:
+    """The statement with literal values replaced, so the same query in a loop compares equal"""
+    for pattern, replacement in _LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def format_queries(queries: List[dict]) -> str:
+    statements = [query['sql'] for query in queries]
+    lines = []
+    repeated = [(sql, count) for sql, count in Counter(map(normalize_sql, statements)).most_common() if count > 1]
+    if repeated:
+        lines.append('Repeated statements:')
+        lines += [f'  x{count} {sql}' for sql, count in repeated]
+    lines.append('Queries:')
+    lines += [f'  {number}. {sql}' for number, sql in enumerate(statements, 1)]
+    return '\n'.join(lines)
+
+
+def iter_routes(patterns=None, prefix: str = '') -> Iterator[str]:
+    """Full route of every URL pattern, joined the way ``ResolverMatch.route`` is"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        route = URLResolver._join_route(prefix, str(pattern.pattern))
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            # Skip the router's API root and .json-style suffix variants
+            if pattern.name == 'api-root' or '(?P<format>' in route:
+                continue
+            yield route
+
+
+class QueryBudgetMixin:
+    """Mix into an APITestCase; see the module docstring"""
+    url_prefix = ''
+    endpoints: List[Endpoint] = []
+    uncovered_routes: Dict[str, str] = {}
+
+    def build_fixture(self, size: int) -> dict:
+        """Create ``size`` of everything the endpoints touch; return the objects paths refer to"""
+        raise NotImplementedError
+
+    def reset_state(self):
+        """Called after the fixture is built; clears rate limits, quotas and response caches"""
+        cache.clear()
+
+    def url_for(self, endpoint: Endpoint, fixture: dict) -> str:
+        path = endpoint.path.format(**fixture)
+        # Absolute paths (e.g. admin pages) are used as they are
+        return path if path.startswith('/') else self.url_prefix + path
+
+    def measure(self, endpoint: Endpoint, size: int) -> List[dict]:
+        """Queries made while answering ``endpoint`` against a fixture of ``size``"""
+        with transaction.atomic():
+            fixture = self.build_fixture(size)
+            self.reset_state()
+            client = self.client_class()
+            if endpoint.user and endpoint.session:
+                client.force_login(fixture[endpoint.user])
+            elif endpoint.user:
+                client.force_authenticate(fixture[endpoint.user])
+            url = self.url_for(endpoint, fixture)
+            data = endpoint.data(fixture) if callable(endpoint.data) else endpoint.data
+            options = {'headers': endpoint.headers}
+            if endpoint.method != 'GET':
+                options['format'] = endpoint.format
+
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, endpoint.method.lower())(url, data, **options)
+                # Streaming responses do their work while being read
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+
+        self.assertEqual(
+            response.status_code, endpoint.status,
+            f"{endpoint.method} {url} returned {response.status_code}, expected {endpoint.status}: "
+            f"{getattr(response, 'content', b'')[:500]!r}"
+        )
+        return queries.captured_queries
+
+    def assertWithinBudget(self, endpoint: Endpoint):
+        small = self.measure(endpoint, SMALL)
+        large = self.measure(endpoint, LARGE)
+        if len(small) != len(large):
+            self.fail(
+                f"{endpoint}: {len(small)} queries with fixture size {SMALL} but {len(large)} with size "
+                f"{LARGE}; the query count depends on the amount of data.\n{format_queries(large)}"
+            )
+        if len(large) > endpoint.max_queries:
+            self.fail(
+                f"{endpoint}: {len(large)} queries, over its budget of {endpoint.max_queries}.\n"
+                f"{format_queries(large)}"
+            )
+
+    def test_query_budgets(self):
+        for endpoint in self.endpoints:
+            with self.subTest(endpoint=str(endpoint)):
+                self.assertWithinBudget(endpoint)
+
+    def test_every_route_has_a_budget(self):
+        fixture = self.build_fixture(SMALL)
+        covered = {resolve(self.url_for(endpoint, fixture).split('?')[0]).route for endpoint in self.endpoints}
+        prefix = self.url_prefix.lstrip('/')
+        missing = [
+            route for route in iter_routes()
+            if route.startswith(prefix) and route not in covered and route not in self.uncovered_routes
+        ]
+        self.assertEqual(missing, [], 'Routes without a query budget; add an Endpoint or an uncovered_routes entry')
@@ -0,0 +1,24 @@
+"""
+JSON rendering with orjson instead of the stdlib encoder DRF's JSONRenderer
+uses. Dicts, lists, strings, numbers, datetimes and UUIDs are encoded in C;
+anything else (Decimal, lazy translations, querysets) goes through DRF's own
+encoder, so responses come out the same, only compact.
+"""
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback = JSONEncoder()
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    # 'Z' for UTC like DRF's DateTimeField, and non-string keys like json.dumps
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_fallback.default, option=self.options)
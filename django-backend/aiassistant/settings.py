@@ -117,6 +117,10 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': ('knox.auth.TokenAuthentication',),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'aiassistant.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 
@@ -196,6 +200,70 @@ PAYSTACK_SECRET_KEY = env('PAYSTACK_SECRET_KEY')
 
 TOKEN_PRICE= 0.01
 
+# Expose DB query / RSS counters for benchmarks/chat_load.py (load testing only)
+PERF_METRICS = env.bool('PERF_METRICS', default=False)
+
+# Response cache for deterministic Bedrock calls (titles, memory extraction, prototypes)
+LLM_CACHE_TTL = env.int('LLM_CACHE_TTL', default=3600)  # seconds
+LLM_CACHE_MAX_ENTRIES = env.int('LLM_CACHE_MAX_ENTRIES', default=1024)
+
+# Chat streaming: text deltas are batched into one frame per interval or once this many
+# characters are pending (the first delta is always sent immediately)
+STREAM_FLUSH_INTERVAL = env.float('STREAM_FLUSH_INTERVAL', default=0.04)  # seconds
+STREAM_FLUSH_BYTES = env.int('STREAM_FLUSH_BYTES', default=512)
+
+# Shared cache for quota counters; use Redis when running more than one worker
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Rolling-window token budgets per user, by plan (None = unlimited).
+# plan_tokens caps the combined usage of every user on the plan.
+TOKEN_QUOTA_ENABLED = env.bool('TOKEN_QUOTA_ENABLED', default=True)
+TOKEN_QUOTA_WINDOW = env.int('TOKEN_QUOTA_WINDOW', default=3600)  # seconds
+TOKEN_QUOTA_BUCKET = 60  # seconds per counter bucket
+TOKEN_QUOTA_QUEUE_TIMEOUT = env.int('TOKEN_QUOTA_QUEUE_TIMEOUT', default=0)  # seconds to wait before rejecting
+TOKEN_QUOTA_PLANS = {
+    'free': {'user_tokens': env.int('TOKEN_QUOTA_FREE', default=200000), 'plan_tokens': None},
+    'pro': {'user_tokens': env.int('TOKEN_QUOTA_PRO', default=2000000), 'plan_tokens': None},
+    'unlimited': {'user_tokens': None, 'plan_tokens': None},
+}
+
+# Hedged chat requests: if the first token is slower than the rolling p90, send the
+# same request to the us-east-1 fallback and keep whichever stream answers first
+BEDROCK_HEDGING_ENABLED = env.bool('BEDROCK_HEDGING_ENABLED', default=False)
+BEDROCK_HEDGE_PERCENTILE = 0.9
+BEDROCK_HEDGE_DEFAULT_DELAY = env.float('BEDROCK_HEDGE_DEFAULT_DELAY', default=2.0)  # seconds, until p90 is known
+BEDROCK_HEDGE_MIN_DELAY = 0.5  # seconds
+BEDROCK_HEDGE_MAX_PER_MINUTE = env.int('BEDROCK_HEDGE_MAX_PER_MINUTE', default=30)  # extra requests, all workers
+
+# Celery (prototype jobs): celery -A aiassistant worker
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)  # run inline, for development
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Prototype jobs
+PROTOTYPE_JOBS_PER_USER = env.int('PROTOTYPE_JOBS_PER_USER', default=2)  # running at once
+PROTOTYPE_JOBS_MAX_QUEUED = env.int('PROTOTYPE_JOBS_MAX_QUEUED', default=10)  # pending + running
+PROTOTYPE_JOB_RETRY_DELAY = 5  # seconds before a job waiting for a slot is retried
+PROTOTYPE_JOB_TIME_LIMIT = 600  # seconds; older running jobs no longer hold a slot
+PROTOTYPE_JOB_POLL_INTERVAL = 1.0  # seconds between SSE status checks
+PROTOTYPE_JOB_EVENTS_TIMEOUT = env.int('PROTOTYPE_JOB_EVENTS_TIMEOUT', default=30)  # seconds an SSE stream polls before the client reconnects
+
+# Batch variant generation (prototypes/<id>/create_variants/)
+PROTOTYPE_VARIANT_BATCH_MAX = env.int('PROTOTYPE_VARIANT_BATCH_MAX', default=8)  # variants per request
+PROTOTYPE_VARIANT_CONCURRENCY = env.int('PROTOTYPE_VARIANT_CONCURRENCY', default=6)  # model calls in flight
+
+# Prototype edits: 'patch' asks for SEARCH/REPLACE hunks (full rewrite if they don't apply), 'full' for the whole file
+PROTOTYPE_EDIT_MODE = env('PROTOTYPE_EDIT_MODE', default='patch')
+PROTOTYPE_OUTPUT_TOKENS_PER_SECOND = 60  # used to estimate latency saved by patch edits
+
+# Version HTML is stored as deltas with a full snapshot at least every N versions along a chain
+PROTOTYPE_SNAPSHOT_INTERVAL = env.int('PROTOTYPE_SNAPSHOT_INTERVAL', default=10)
+# Also upload each new version's HTML to S3 (PrototypeHtmlStorage) for CDN previews
+PROTOTYPE_HTML_PUBLISH = env.bool('PROTOTYPE_HTML_PUBLISH', default=False)
+
 AWS_BEDROCK_ACCESS_KEY_ID=env("AWS_BEDROCK_ACCESS_KEY_ID")
 AWS_BEDROCK_SECRET_ACCESS_KEY=env("AWS_BEDROCK_SECRET_ACCESS_KEY")
 
@@ -7,4 +7,14 @@ class StaticStorage(S3Boto3Storage):
 class MediaStorage(S3Boto3Storage):
     location = 'media'
     default_acl = 'public-read'
-    file_overwrite = False
\ No newline at end of file
+    file_overwrite = False
+
+class PrototypeHtmlStorage(MediaStorage):
+    """Published prototype HTML, stored gzipped under its content hash so it can be cached forever"""
+    location = 'media/prototypes'
+    file_overwrite = True
+    object_parameters = {
+        'ContentType': 'text/html; charset=utf-8',
+        'ContentEncoding': 'gzip',
+        'CacheControl': 'public, max-age=31536000, immutable',
+    }
\ No newline at end of file
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
@@ -22,4 +23,9 @@ urlpatterns = [
     path("api/v1/auth/", include("appauth.urls")),
     path("api/v1/chat/", include("chat.urls")),
     path("api/v1/prototypes/", include("prototypes.urls")),
-]
\ No newline at end of file
+]
+
+if settings.PERF_METRICS:
+    # Load-test instrumentation, never enable in production
+    from .perf import perf_metrics
+    urlpatterns.append(path("api/v1/perf/metrics/", perf_metrics, name='perf-metrics'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appauth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appuser',
+            name='plan',
+            field=models.CharField(default='free', help_text='Plan that determines the token quota', max_length=20),
+        ),
+    ]
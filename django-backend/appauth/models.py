@@ -65,11 +65,13 @@ class UserManager(BaseUserManager):
         if len(base) < 3:
             base = base + 'user'
             
+        # Fetch every taken name with this prefix at once rather than one query per attempt
+        taken = set(self.filter(username__startswith=base).values_list('username', flat=True))
         username = base
         counter = 1
         
         # Keep trying until we find a unique username
-        while self.filter(username=username).exists():
+        while username in taken:
             username = f"{base}{counter}"
             counter += 1
             
@@ -94,6 +96,7 @@ class AppUser(AbstractUser):
         locked_until (DateTimeField): Account locked until this time
         avatar (ImageField): User's profile picture
         is_active (BooleanField): Whether this user account is active
+        plan (CharField): Billing plan, selects the user's token quota
     """
     
     id = models.UUIDField(
@@ -179,6 +182,13 @@ class AppUser(AbstractUser):
         help_text=_('User profile picture')
     )
 
+    # Billing plan, keys into settings.TOKEN_QUOTA_PLANS
+    plan = models.CharField(
+        max_length=20,
+        default='free',
+        help_text=_('Plan that determines the token quota')
+    )
+
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
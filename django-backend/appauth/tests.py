@@ -1,3 +1,62 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from knox.models import AuthToken
+from rest_framework.test import APITestCase
+
+from aiassistant.query_budget import Endpoint, QueryBudgetMixin
+from .models import AppUser
+
+PASSWORD = 'Budget-pass-1!'
+NEW_PASSWORD = 'Budget-pass-2!'
+
+
+def google_userinfo(email):
+    response = mock.Mock()
+    response.json.return_value = {'email': email, 'given_name': 'Ada', 'family_name': 'Lovelace'}
+    return response
+
+
+class AuthQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    url_prefix = '/api/v1/auth/'
+    endpoints = [
+        Endpoint('POST', 'register/', 12, user=None, status=201, data={
+            'email': 'newuser@example.com', 'password': NEW_PASSWORD, 'password_confirm': NEW_PASSWORD,
+        }),
+        Endpoint('POST', 'login/', 4, user=None, data=lambda f: {'email': f['user'].email, 'password': PASSWORD}),
+        Endpoint('POST', 'login/google/', 8, user=None, data={'access_token': 'google-token'}),
+        Endpoint('POST', 'logout/', 1, data={'all_sessions': True}),
+        Endpoint('POST', 'verify-email/', 3, user=None,
+                 data=lambda f: {'email': f['user'].email, 'token': f['verification_token']}),
+        Endpoint('POST', 'verify-email/resend/', 3, user=None, data=lambda f: {'email': f['user'].email}),
+        Endpoint('POST', 'password/reset/', 2, user=None, data=lambda f: {'email': f['user'].email}),
+        Endpoint('POST', 'password/reset/confirm/', 3, user=None, data=lambda f: {
+            'email': f['user'].email, 'token': f['reset_token'],
+            'new_password': NEW_PASSWORD, 'new_password_confirm': NEW_PASSWORD,
+        }),
+        Endpoint('POST', 'password/change/', 1, data={
+            'current_password': PASSWORD, 'new_password': NEW_PASSWORD, 'new_password_confirm': NEW_PASSWORD,
+        }),
+        Endpoint('GET', 'profile/', 0),
+        Endpoint('PATCH', 'profile/', 1, data={'first_name': 'Ada'}),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch(
+            'appauth.views.requests.get',
+            side_effect=lambda *args, **kwargs: google_userinfo('newuser@example.com')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build_fixture(self, size):
+        user = AppUser.objects.create_user(email=f'budget-{size}@example.com', password=PASSWORD)
+        for i in range(size):
+            # Same local part as the address used to register, so usernames collide
+            AppUser.objects.create_user(email=f'newuser@team{i}.example.com')
+            AuthToken.objects.create(user)
+        return {
+            'user': user,
+            'verification_token': user.generate_token('email_verification'),
+            'reset_token': user.generate_token('password_reset'),
+        }
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Count, Sum
+from django.db.models import Count, Q, Sum
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
@@ -19,7 +19,7 @@ class ProjectKnowledgeInline(admin.StackedInline):
 
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'created_at', 'is_archived', 'knowledge_count', 'total_knowledge_tokens')
+    list_display = ('name', 'user', 'created_at', 'is_archived', 'knowledge_count', 'knowledge_tokens')
     list_filter = ('is_archived', 'created_at', 'user')
     search_fields = ('name', 'description', 'user__email')
     readonly_fields = ('created_at', 'updated_at', 'total_knowledge_tokens')
@@ -27,11 +27,20 @@ class ProjectAdmin(admin.ModelAdmin):
     actions = ['archive_projects', 'unarchive_projects']
 
     def knowledge_count(self, obj):
-        return obj.knowledge_items.count()
+        return obj.knowledge_items_count
     knowledge_count.short_description = 'Knowledge Items'
+    knowledge_count.admin_order_field = 'knowledge_items_count'
+
+    def knowledge_tokens(self, obj):
+        return obj.knowledge_tokens or 0
+    knowledge_tokens.short_description = 'Total knowledge tokens'
+    knowledge_tokens.admin_order_field = 'knowledge_tokens'
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user')
+        return super().get_queryset(request).select_related('user').annotate(
+            knowledge_items_count=Count('knowledge_items', distinct=True),
+            knowledge_tokens=Sum('knowledge_items__token_count', filter=Q(knowledge_items__include_in_chat=True)),
+        )
 
     def archive_projects(self, request, queryset):
         queryset.update(is_archived=True)
@@ -59,15 +68,22 @@ class ChatAdmin(admin.ModelAdmin):
     actions = ['archive_chats', 'unarchive_chats']
 
     def message_count(self, obj):
-        return Message.objects.filter(message_pair__chat=obj).count()
+        return obj.messages_count
     message_count.short_description = 'Messages'
+    message_count.admin_order_field = 'messages_count'
     
     def memory_count(self, obj):
-        return obj.extracted_memories.filter(is_active=True).count()
+        return obj.active_memories_count
     memory_count.short_description = 'Active Memories'
+    memory_count.admin_order_field = 'active_memories_count'
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'project')
+        return super().get_queryset(request).select_related('user', 'project').annotate(
+            messages_count=Count('message_pairs__messages', distinct=True),
+            active_memories_count=Count(
+                'extracted_memories', filter=Q(extracted_memories__is_active=True), distinct=True
+            ),
+        )
 
     def archive_chats(self, request, queryset):
         queryset.update(is_archived=True)
@@ -90,6 +106,9 @@ class MessageAdmin(admin.ModelAdmin):
     get_chat_title.short_description = 'Chat'
     get_chat_title.admin_order_field = 'message_pair__chat__title'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('message_pair__chat')
+
 
 @admin.register(SavedSystemPrompt)
 class SavedSystemPromptAdmin(admin.ModelAdmin):
@@ -126,8 +145,14 @@ class MemoryTagAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
     
     def memory_count(self, obj):
-        return obj.memories.filter(is_active=True).count()
+        return obj.active_memories_count
     memory_count.short_description = 'Active Memories'
+    memory_count.admin_order_field = 'active_memories_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            active_memories_count=Count('memories', filter=Q(memories__is_active=True))
+        )
 
 
 class MemoryTagInline(admin.TabularInline):
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from chat.models import AttachmentBlob
+from chat.services.attachment_service import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete attachment blobs, and their files, that no message references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many blobs would be deleted')
+
+    def handle(self, *args, **options):
+        # Deleting a message pair or chat collects its own blobs; this catches the rest, e.g. deleted users
+        if options['dry_run']:
+            unused = AttachmentBlob.objects.filter(contents__isnull=True)
+            self.stdout.write(f"{unused.count()} unused blobs would be deleted")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Deleted {collect_garbage()} unused blobs"))
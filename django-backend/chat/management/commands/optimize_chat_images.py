@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from chat.models import MessageContent
+
+
+class Command(BaseCommand):
+    help = 'Build the model derivative of chat images uploaded before the image pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many images would be processed')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many images')
+
+    def handle(self, *args, **options):
+        pending = MessageContent.objects.filter(
+            Q(optimized_file__isnull=True) | Q(optimized_file=''), content_type='image', blob__isnull=True
+        ).exclude(file_content='').order_by('created_at')
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        if options['dry_run']:
+            self.stdout.write(f"{pending.count()} images would be processed")
+            return
+
+        optimized = unchanged = failed = bytes_before = bytes_after = tokens_before = tokens_after = 0
+        for content in pending.iterator():
+            try:
+                with content.file_content.open('rb') as stored:
+                    model_image = content.attach_model_image(stored.read())
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Image {content.id}: {e}"))
+                failed += 1
+                continue
+            if model_image is None:
+                unchanged += 1
+                continue
+            content.save(update_fields=['optimized_file', 'optimized_mime_type'])
+            optimized += 1
+            bytes_before += model_image.original_bytes
+            bytes_after += len(model_image.data)
+            tokens_before += model_image.original_tokens
+            tokens_after += model_image.tokens
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Optimized {optimized} images ({bytes_before} -> {bytes_after} bytes, "
+            f"~{tokens_before} -> ~{tokens_after} input tokens); {unchanged} already optimal, {failed} failed"
+        ))
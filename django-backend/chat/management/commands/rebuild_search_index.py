@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from chat.services.search_service import install_search_index
+
+
+class Command(BaseCommand):
+    help = 'Create the chat full-text search index if it is missing and re-index every chat and message'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to index')
+
+    def handle(self, *args, **options):
+        backend = install_search_index(connections[options['database']])
+        if backend is None:
+            self.stdout.write(self.style.WARNING('This database has no full-text support; chat search uses LIKE'))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {backend.name} chat search index"))
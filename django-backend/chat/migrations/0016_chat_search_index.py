@@ -0,0 +1,95 @@
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+# The SQL as it stood when this migration was written; chat.services.search_service
+# may change later without changing what this migration does
+INSTALL = {
+    'postgresql': [
+        "ALTER TABLE chat_messagecontent ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(text_content, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS chat_messagecontent_search_idx ON chat_messagecontent USING GIN (search_vector)",
+        "ALTER TABLE chat_chat ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(title, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS chat_chat_search_idx ON chat_chat USING GIN (search_vector)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_messagecontent_fts "
+        "USING fts5(text_content, owner, tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS chat_messagecontent_fts_delete AFTER DELETE ON chat_messagecontent "
+        "BEGIN DELETE FROM chat_messagecontent_fts WHERE rowid = old.id; END",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_chat_fts "
+        "USING fts5(title, owner, tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS chat_chat_fts_insert AFTER INSERT ON chat_chat BEGIN "
+        "INSERT INTO chat_chat_fts(rowid, title, owner) VALUES (new.rowid, new.title, 'u' || new.user_id); END",
+        "CREATE TRIGGER IF NOT EXISTS chat_chat_fts_update AFTER UPDATE OF title ON chat_chat "
+        "WHEN old.title IS NOT new.title BEGIN "
+        "INSERT OR REPLACE INTO chat_chat_fts(rowid, title, owner) VALUES (new.rowid, new.title, 'u' || new.user_id); "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS chat_chat_fts_delete AFTER DELETE ON chat_chat "
+        "BEGIN DELETE FROM chat_chat_fts WHERE rowid = old.rowid; END",
+        # Index the rows that already exist
+        "DELETE FROM chat_messagecontent_fts",
+        "INSERT INTO chat_messagecontent_fts(rowid, text_content, owner) "
+        "SELECT mc.id, mc.text_content, 'u' || c.user_id FROM chat_messagecontent mc "
+        "JOIN chat_message m ON m.id = mc.message_id "
+        "JOIN chat_messagepair p ON p.id = m.message_pair_id "
+        "JOIN chat_chat c ON c.id = p.chat_id",
+        "DELETE FROM chat_chat_fts",
+        "INSERT INTO chat_chat_fts(rowid, title, owner) SELECT rowid, title, 'u' || user_id FROM chat_chat",
+    ],
+}
+
+UNINSTALL = {
+    'postgresql': [
+        "DROP INDEX IF EXISTS chat_messagecontent_search_idx",
+        "ALTER TABLE chat_messagecontent DROP COLUMN IF EXISTS search_vector",
+        "DROP INDEX IF EXISTS chat_chat_search_idx",
+        "ALTER TABLE chat_chat DROP COLUMN IF EXISTS search_vector",
+    ],
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS chat_messagecontent_fts_delete",
+        "DROP TRIGGER IF EXISTS chat_chat_fts_insert",
+        "DROP TRIGGER IF EXISTS chat_chat_fts_update",
+        "DROP TRIGGER IF EXISTS chat_chat_fts_delete",
+        "DROP TABLE IF EXISTS chat_messagecontent_fts",
+        "DROP TABLE IF EXISTS chat_chat_fts",
+    ],
+}
+
+
+def run(statements, schema_editor):
+    conn = schema_editor.connection
+    try:
+        with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+            for sql in statements.get(conn.vendor, ()):
+                cursor.execute(sql)
+    except DatabaseError as e:
+        # e.g. SQLite compiled without FTS5; search falls back to LIKE
+        logger.warning(f"Could not change the {conn.vendor} chat search index: {e}")
+
+
+def install(apps, schema_editor):
+    run(INSTALL, schema_editor)
+
+
+def uninstall(apps, schema_editor):
+    run(UNINSTALL, schema_editor)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over chat titles and message text: a generated tsvector
+    column with a GIN index on Postgres, FTS5 tables kept current by
+    triggers on SQLite. Other databases keep the unindexed LIKE search.
+    """
+
+    dependencies = [
+        ('chat', '0015_memorytag_usermemory'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.3 on 2026-10-19 05:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0016_chat_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chat",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="chat_chat_user_id_25523c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(
+                fields=["user", "created_at", "id"],
+                name="chat_projec_user_id_14301d_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usermemory",
+            index=models.Index(
+                fields=["user", "created_at", "id"],
+                name="chat_userme_user_id_d66d9f_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.3 on 2026-10-19 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0017_listing_cursor_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="messagepair",
+            index=models.Index(
+                fields=["chat", "created_at", "id"],
+                name="chat_messag_chat_id_c7bdef_idx",
+            ),
+        ),
+    ]
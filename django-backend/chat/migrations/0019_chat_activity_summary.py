@@ -0,0 +1,99 @@
+# Generated by Django 5.0.3 on 2026-10-19 05:45
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from chat.services.search_service import install_search_index
+
+
+PREVIEW_LENGTH = 120
+BATCH_SIZE = 500
+
+
+def preview(text):
+    """Chat.preview as of this migration: whitespace collapsed, cut with an ellipsis"""
+    text = ' '.join((text or '').split())
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1].rstrip() + '\u2026'
+
+
+def backfill(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    MessageContent = apps.get_model('chat', 'MessageContent')
+    messages = Message.objects.filter(message_pair__chat=OuterRef('pk'))
+    Chat.objects.update(
+        message_count=Coalesce(
+            Subquery(messages.order_by().values('message_pair__chat').annotate(n=Count('id')).values('n')), 0
+        ),
+        last_activity_at=Coalesce(
+            Subquery(messages.order_by('-created_at').values('created_at')[:1]), F('created_at')
+        ),
+    )
+
+    # Previews are normalized in Python, like the ones written from now on, a batch of chats at a time
+    texts = MessageContent.objects.filter(
+        message__message_pair__chat=OuterRef('pk'), content_type='text'
+    ).exclude(text_content='').exclude(text_content__isnull=True).order_by(
+        '-message__message_pair__created_at', '-message__created_at', '-id'
+    )
+    chats = Chat.objects.order_by('pk').annotate(latest_text=Subquery(texts.values('text_content')[:1]))
+    last_pk = None
+    while True:
+        batch = chats.filter(pk__gt=last_pk) if last_pk is not None else chats
+        batch = list(batch.only('pk')[:BATCH_SIZE])
+        if not batch:
+            return
+        for chat in batch:
+            chat.last_message_preview = preview(chat.latest_text)
+        Chat.objects.bulk_update(batch, ['last_message_preview'])
+        last_pk = batch[-1].pk
+
+
+def restore_search_index(apps, schema_editor):
+    # Adding or dropping columns with defaults makes SQLite rebuild chat_chat,
+    # which drops the title triggers and renumbers the rowids the index is keyed on
+    if schema_editor.connection.vendor == 'sqlite':
+        install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0018_messagepair_window_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_index),
+        migrations.RemoveIndex(
+            model_name="chat",
+            name="chat_chat_user_id_25523c_idx",
+        ),
+        migrations.AddField(
+            model_name="chat",
+            name="last_activity_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="chat",
+            name="last_message_preview",
+            field=models.CharField(blank=True, default="", max_length=200),
+        ),
+        migrations.AddField(
+            model_name="chat",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="chat",
+            index=models.Index(
+                fields=["user", "last_activity_at", "id"],
+                name="chat_chat_user_id_71cc62_idx",
+            ),
+        ),
+    ]
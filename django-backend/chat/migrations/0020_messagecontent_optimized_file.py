@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-19 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0019_chat_activity_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagecontent",
+            name="optimized_file",
+            field=models.FileField(
+                blank=True, null=True, upload_to="chat_contents/optimized/%Y/%m/%d/"
+            ),
+        ),
+        migrations.AddField(
+            model_name="messagecontent",
+            name="optimized_mime_type",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
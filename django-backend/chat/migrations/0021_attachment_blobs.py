@@ -0,0 +1,48 @@
+# Generated by Django 5.0.3 on 2026-10-19 06:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0020_messagecontent_optimized_file"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttachmentBlob",
+            fields=[
+                (
+                    "hash",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("file", models.FileField(upload_to="chat_contents/blobs/")),
+                ("mime_type", models.CharField(max_length=100)),
+                ("size", models.PositiveIntegerField()),
+                (
+                    "optimized_file",
+                    models.FileField(
+                        blank=True, null=True, upload_to="chat_contents/optimized/"
+                    ),
+                ),
+                (
+                    "optimized_mime_type",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="messagecontent",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="contents",
+                to="chat.attachmentblob",
+            ),
+        ),
+    ]
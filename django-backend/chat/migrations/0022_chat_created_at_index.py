@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-19 07:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0021_attachment_blobs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chat",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="chat_chat_user_id_25523c_idx"
+            ),
+        ),
+    ]
@@ -1,10 +1,101 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.core.exceptions import ValidationError
-from .utils.file_validators import validate_image_size, validate_document_size, validate_mime_type
+from django.core.files.base import ContentFile
+from .utils.file_validators import (
+    MAX_DOCUMENTS_PER_MESSAGE, MAX_IMAGES_PER_MESSAGE, content_kind, validate_document_size, validate_image_size,
+    validate_mime_type
+)
+from .utils.image_pipeline import optimize_for_model
 import uuid
-import base64
+import mimetypes
+import posixpath
 from django.utils import timezone
 
+
+def _attach_model_image(instance, stem: str, data: bytes):
+    """Sets optimized_file and optimized_mime_type on ``instance`` from the image's bytes"""
+    model_image = optimize_for_model(data)
+    if model_image is None:
+        return None
+    instance.optimized_file.save(f'{stem}.{model_image.extension}', ContentFile(model_image.data), save=False)
+    instance.optimized_mime_type = model_image.mime_type
+    return model_image
+
+
+class AttachmentBlob(models.Model):
+    """
+    An attachment's bytes, stored once under their SHA-256 however many
+    messages, chats or users attach them, together with the image's model
+    derivative. The MessageContent rows pointing at a blob are its
+    reference count; attachment_service.collect_garbage deletes blobs, and
+    their files, once that reaches zero.
+    """
+    hash = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to='chat_contents/blobs/')
+    mime_type = models.CharField(max_length=100)
+    size = models.PositiveIntegerField()
+    optimized_file = models.FileField(upload_to='chat_contents/optimized/', null=True, blank=True)
+    optimized_mime_type = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Set by store on a new image blob: the derivative it built, for reporting
+    model_image = None
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.mime_type}, {self.size} bytes)"
+
+    @property
+    def kind(self):
+        return content_kind(self.mime_type)
+
+    @classmethod
+    def store(cls, digest: str, mime_type: str, size: int, file=None, key: str = None, data: bytes = None):
+        """
+        Returns ``(blob, created)`` for content hashing to ``digest``,
+        reusing an existing blob, in which case nothing is uploaded or
+        re-encoded. A new blob uploads ``file`` under its hash, or adopts
+        ``key``, an object already in storage. ``data`` is the content when
+        the caller already holds it; images are read from ``file`` otherwise,
+        and an adopted image without ``data`` gets no model derivative.
+
+        The blob's row stays locked until the surrounding transaction ends:
+        attach it in the same transaction, or collect_garbage can delete it
+        before anything references it.
+        """
+        with transaction.atomic():
+            existing = cls.objects.select_for_update().filter(hash=digest).first()
+        if existing:
+            return existing, False
+
+        blob = cls(hash=digest, mime_type=mime_type, size=size)
+        if key is not None:
+            blob.file.name = key
+        else:
+            extension = mimetypes.guess_extension(mime_type) or ''
+            blob.file.save(f'{digest[:2]}/{digest}{extension}', file, save=False)
+        if blob.kind == 'image':
+            if data is None and file is not None:
+                file.seek(0)
+                data = file.read()
+                file.seek(0)
+            if data is not None:
+                blob.model_image = _attach_model_image(blob, f'{digest[:2]}/{digest}', data)
+        try:
+            with transaction.atomic():
+                blob.save(force_insert=True)
+        except IntegrityError:
+            # Stored concurrently by another request; this copy is the duplicate
+            blob.delete_files()
+            with transaction.atomic():
+                return cls.objects.select_for_update().get(hash=digest), False
+        return blob, True
+
+    def delete_files(self):
+        for stored in (self.file, self.optimized_file):
+            if stored:
+                stored.storage.delete(stored.name)
+
+
 class MessageContent(models.Model):
     CONTENT_TYPES = (
         ('text', 'Text'),
@@ -22,8 +113,33 @@ class MessageContent(models.Model):
     )
     edited_at = models.DateTimeField(auto_now=True, null=True)
     mime_type = models.CharField(max_length=100, null=True, blank=True)
+    # Upright, resized, metadata-free re-encode of an image; sent to the model instead of the original
+    optimized_file = models.FileField(upload_to='chat_contents/optimized/%Y/%m/%d/', null=True, blank=True)
+    optimized_mime_type = models.CharField(max_length=100, null=True, blank=True)
+    # The shared stored file; file_content and optimized_file name the blob's files
+    blob = models.ForeignKey(
+        AttachmentBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='contents'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Set by from_blob: the file was validated in one pass, with the rest of its message
+    file_descriptor = None
+
+    @classmethod
+    def from_blob(cls, message, blob, descriptor=None):
+        """An unsaved attachment referencing ``blob``'s files instead of storing its own"""
+        content = cls(
+            message=message,
+            content_type=blob.kind,
+            blob=blob,
+            file_content=blob.file.name,
+            mime_type=blob.mime_type,
+            optimized_file=blob.optimized_file.name or None,
+            optimized_mime_type=blob.optimized_mime_type
+        )
+        content.file_descriptor = descriptor
+        return content
+
     def clean(self):
         if self.content_type == 'text' and not self.text_content:
             raise ValidationError('Text content is required for text type')
@@ -31,6 +147,10 @@ class MessageContent(models.Model):
         if self.content_type in ['image', 'document'] and not self.file_content:
             raise ValidationError('File content is required for image/document type')
         
+        if self.file_descriptor is not None:
+            # Size, dimensions and per-message counts were checked when it was described
+            return
+
         if self.content_type == 'image':
             validate_image_size(self.file_content)
         
@@ -43,17 +163,34 @@ class MessageContent(models.Model):
             content_type=self.content_type
         ).count()
         
-        if self.content_type == 'image' and content_count >= 20:
-            raise ValidationError('Maximum 20 images per message')
+        if self.content_type == 'image' and content_count >= MAX_IMAGES_PER_MESSAGE:
+            raise ValidationError(f'Maximum {MAX_IMAGES_PER_MESSAGE} images per message')
         
-        if self.content_type == 'document' and content_count >= 5:
-            raise ValidationError('Maximum 5 documents per message')
+        if self.content_type == 'document' and content_count >= MAX_DOCUMENTS_PER_MESSAGE:
+            raise ValidationError(f'Maximum {MAX_DOCUMENTS_PER_MESSAGE} documents per message')
 
     def save(self, *args, **kwargs):
-        if self.file_content:
+        # Callers that already sniffed the file (or its S3 header) pass mime_type
+        if self.file_content and not self.mime_type:
             self.mime_type = validate_mime_type(self.file_content)
         super().save(*args, **kwargs)
 
+    def attach_model_image(self, data: bytes):
+        """
+        Builds the model derivative of this image from its bytes and sets
+        optimized_file, to be stored with the next save. Returns the
+        ModelImage, or None when the original is sent as it is.
+        """
+        stem = posixpath.splitext(posixpath.basename(self.file_content.name or 'image'))[0]
+        return _attach_model_image(self, stem, data)
+
+    @property
+    def model_file(self):
+        """The file and mime type to send to the model: the derivative when there is one"""
+        if self.optimized_file:
+            return self.optimized_file, self.optimized_mime_type
+        return self.file_content, self.mime_type
+
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     message_pair = models.ForeignKey('MessagePair', on_delete=models.CASCADE, related_name='messages')
@@ -68,6 +205,8 @@ class Message(models.Model):
         Get message content in Claude API format
         Returns a list of content blocks
         """
+        from .services import attachment_service
+
         content_blocks = []
         
         for content_item in self.contents.all():
@@ -76,41 +215,28 @@ class Message(models.Model):
                     'type': 'text',
                     'text': content_item.text_content
                 })
-            elif content_item.content_type in ['image', 'document']:
+            elif content_item.content_type == 'image':
                 try:
-                    # Read file content as base64
-                    file_content = content_item.file_content
-                    if not file_content:
-                        continue
-                        
-                    # Get the file content as bytes
-                    file_bytes = file_content.read()
-                    
-                    # Encode as base64
-                    base64_content = base64.b64encode(file_bytes).decode('utf-8')
-                    
-                    if content_item.content_type == 'image':
-                        content_blocks.append({
-                            'type': 'image',
-                            'source': {
-                                'type': 'base64',
-                                'media_type': content_item.mime_type,
-                                'data': base64_content
-                            }
-                        })
-                    else:  # document
-                        content_blocks.append({
-                            'type': 'text',
-                            'text': f"[Document: {content_item.file_content.name}]\n"
-                        })
-                        
+                    # Shared by every content of the same blob, and cached
+                    base64_content = attachment_service.model_base64(content_item)
                 except Exception as e:
                     print(f"Error processing file content: {e}")
                     continue
-                finally:
-                    # Reset file pointer if it's a file
-                    if file_content:
-                        file_content.seek(0)
+                if base64_content is None:
+                    continue
+                content_blocks.append({
+                    'type': 'image',
+                    'source': {
+                        'type': 'base64',
+                        'media_type': content_item.model_file[1],
+                        'data': base64_content
+                    }
+                })
+            elif content_item.content_type == 'document' and content_item.file_content:
+                content_blocks.append({
+                    'type': 'text',
+                    'text': f"[Document: {content_item.file_content.name}]\n"
+                })
         
         return content_blocks
 
@@ -132,6 +258,10 @@ class Project(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Cursor pagination of a user's projects, newest first
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
 
     @property
     def total_knowledge_tokens(self):
@@ -179,25 +309,81 @@ class Chat(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     system_prompt = models.TextField(blank=True, null=True)
     is_archived = models.BooleanField(default=False)
+    # Denormalized for the chat list, so it needs no per-chat queries; see record_message
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    last_message_preview = models.CharField(max_length=200, blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
+
+    PREVIEW_LENGTH = 120
+
+    class Meta:
+        indexes = [
+            # Cursor pagination of a user's chats, most recently active first
+            models.Index(fields=['user', 'last_activity_at', 'id']),
+            # A user's chats by age, which search results fall back to (see search_service.filter_chats)
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def preview(cls, text):
+        """First PREVIEW_LENGTH characters of ``text`` with whitespace collapsed"""
+        text = ' '.join((text or '').split())
+        return text if len(text) <= cls.PREVIEW_LENGTH else text[:cls.PREVIEW_LENGTH - 1].rstrip() + '\u2026'
+
+    def record_message(self, text=None):
+        """
+        Count one new message and bump the chat's activity, in a single
+        UPDATE so concurrent turns don't lose counts. ``text`` replaces the
+        preview when given; attachment-only messages keep the previous one.
+        """
+        fields = {'last_activity_at': timezone.now(), 'message_count': models.F('message_count') + 1}
+        if text and text.strip():
+            fields['last_message_preview'] = self.preview(text)
+        Chat.objects.filter(pk=self.pk).update(**fields)
+
+    def refresh_activity(self):
+        """Recompute the denormalized fields from the messages, e.g. after some were deleted"""
+        messages = Message.objects.filter(message_pair__chat=self).aggregate(
+            count=models.Count('id'), latest=models.Max('created_at')
+        )
+        text = MessageContent.objects.filter(
+            message__message_pair__chat=self, content_type='text'
+        ).exclude(text_content='').order_by(
+            '-message__message_pair__created_at', '-message__created_at', '-id'
+        ).values_list('text_content', flat=True).first()
+        Chat.objects.filter(pk=self.pk).update(
+            last_activity_at=messages['latest'] or self.created_at,
+            last_message_preview=self.preview(text),
+            message_count=messages['count'],
+        )
+
+    @property
+    def message_tokens(self):
+        """Get total tokens of every message in this chat"""
+        return Message.objects.filter(message_pair__chat=self).aggregate(
+            total=models.Sum('token_count')
+        )['total'] or 0
+
     @property
     def total_tokens(self):
         """Get total tokens used in this chat including project knowledge"""
-        message_tokens = sum(
-            message.token_count 
-            for pair in self.message_pairs.all()
-            for message in pair.messages.all()
-        )
         project_tokens = self.project.total_knowledge_tokens if self.project else 0
-        return message_tokens + project_tokens
+        return self.message_tokens + project_tokens
 
 class MessagePair(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='message_pairs')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Windows of a chat's newest pairs
+            models.Index(fields=['chat', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return f"Message Pair for {self.chat.title} at {self.created_at}"
 
@@ -283,6 +469,8 @@ class UserMemory(models.Model):
             models.Index(fields=['user', 'category']),
             models.Index(fields=['user', 'is_active']),
             models.Index(fields=['created_at']),
+            # Cursor pagination of a user's memories, newest first
+            models.Index(fields=['user', 'created_at', 'id']),
         ]
     
     def __str__(self):
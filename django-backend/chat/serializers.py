@@ -1,4 +1,8 @@
 # serializers.py
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from .models import Chat, Message, MessagePair, SavedSystemPrompt, Project, ProjectKnowledge, MessageContent, UserMemory, MemoryTag
 
@@ -17,7 +21,24 @@ class MessageSerializer(serializers.ModelSerializer):
 class ChatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chat
-        fields = ['id', 'title', 'created_at', 'system_prompt', 'project', 'user']
+        fields = [
+            'id', 'title', 'created_at', 'system_prompt', 'project', 'user',
+            'last_activity_at', 'last_message_preview', 'message_count',
+        ]
+        read_only_fields = ['last_activity_at', 'last_message_preview', 'message_count']
+
+    # Read path for lists: values(*list_columns), then list_rows, instead of instances and fields
+    list_columns = (
+        'id', 'title', 'created_at', 'system_prompt', 'project_id', 'user_id',
+        'last_activity_at', 'last_message_preview', 'message_count',
+    )
+
+    @staticmethod
+    def list_rows(rows):
+        for row in rows:
+            row['project'] = row.pop('project_id')
+            row['user'] = row.pop('user_id')
+        return rows
 
 class SystemPromptSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,11 +54,24 @@ class MessagePairSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class ProjectSerializer(serializers.ModelSerializer):
+    total_knowledge_tokens = serializers.SerializerMethodField()
+
     class Meta:
         model = Project
         fields = ['id', 'name', 'description', 'instructions', 'created_at', 'updated_at', 'total_knowledge_tokens']
         read_only_fields = ['created_at', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.annotate(knowledge_tokens=Sum(
+            'knowledge_items__token_count', filter=Q(knowledge_items__include_in_chat=True)
+        ))
+
+    def get_total_knowledge_tokens(self, obj):
+        if hasattr(obj, 'knowledge_tokens'):
+            return obj.knowledge_tokens or 0
+        return obj.total_knowledge_tokens
+
 class ProjectKnowledgeSerializer(serializers.ModelSerializer):
     token_count = serializers.IntegerField(read_only=True)
     
@@ -70,11 +104,25 @@ class MemoryTagSerializer(serializers.ModelSerializer):
         model = MemoryTag
         fields = ['id', 'name', 'color', 'created_at', 'memory_count']
         read_only_fields = ['created_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        active = UserMemory.tags.through.objects.filter(
+            memorytag=OuterRef('pk'), usermemory__is_active=True
+        ).values('memorytag').annotate(count=Count('pk')).values('count')
+        return queryset.annotate(active_memories=Coalesce(Subquery(active), 0))
     
     def get_memory_count(self, obj):
         """Return the number of active memories with this tag"""
+        if hasattr(obj, 'active_memories'):
+            return obj.active_memories
         return obj.memories.filter(is_active=True).count()
 
+
+def memory_tags_prefetch():
+    """Tags of a memory with their memory counts, for either memory serializer"""
+    return Prefetch('tags', queryset=MemoryTagSerializer.setup_eager_loading(MemoryTag.objects.all()))
+
 class UserMemorySerializer(serializers.ModelSerializer):
     tags = MemoryTagSerializer(many=True, read_only=True)
     tag_ids = serializers.ListField(
@@ -92,6 +140,10 @@ class UserMemorySerializer(serializers.ModelSerializer):
             'created_at', 'updated_at', 'last_referenced'
         ]
         read_only_fields = ['created_at', 'updated_at', 'last_referenced']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(memory_tags_prefetch())
     
     def create(self, validated_data):
         tag_ids = validated_data.pop('tag_ids', [])
@@ -129,6 +181,67 @@ class UserMemoryListSerializer(serializers.ModelSerializer):
             'id', 'summary', 'category', 'confidence_score', 'is_verified', 
             'is_active', 'tags', 'tag_count', 'created_at', 'last_referenced'
         ]
+
+    # Read path for lists: values(*list_columns), then list_rows, instead of instances and fields
+    list_columns = (
+        'id', 'summary', 'category', 'confidence_score', 'is_verified', 'is_active', 'created_at', 'last_referenced'
+    )
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(memory_tags_prefetch())
+
+    @staticmethod
+    def list_rows(rows):
+        """Adds tags and tag_count to values(*list_columns) rows, with one query for all their tags"""
+        tags = defaultdict(list)
+        tag_rows = MemoryTagSerializer.setup_eager_loading(
+            MemoryTag.objects.filter(memories__in=[row['id'] for row in rows])
+        ).annotate(memory_id=F('memories')).order_by('name').values(
+            'memory_id', 'id', 'name', 'color', 'created_at', memory_count=F('active_memories')
+        )
+        for tag in tag_rows:
+            tags[tag.pop('memory_id')].append(tag)
+        for row in rows:
+            row['tags'] = tags[row['id']]
+            row['tag_count'] = len(row['tags'])
+        return rows
     
     def get_tag_count(self, obj):
-        return obj.tags.count()
\ No newline at end of file
+        return len(obj.tags.all())
+
+
+def compact_messages(pair_ids):
+    """
+    The messages of ``pair_ids`` as plain dicts, in pair order and then by
+    creation, read with values() in two queries. Content keys are only
+    present when set, which keeps long histories small on the wire.
+    """
+    position = {pair_id: index for index, pair_id in enumerate(pair_ids)}
+    storage = MessageContent._meta.get_field('file_content').storage
+    contents = defaultdict(list)
+    for row in MessageContent.objects.filter(message__message_pair_id__in=position).order_by('id').values(
+        'id', 'message_id', 'content_type', 'text_content', 'file_content', 'mime_type'
+    ):
+        content = {'id': row['id'], 'content_type': row['content_type']}
+        if row['text_content'] is not None:
+            content['text_content'] = row['text_content']
+        if row['file_content']:
+            content['file_content'] = storage.url(row['file_content'])
+            content['mime_type'] = row['mime_type']
+        contents[row['message_id']].append(content)
+
+    messages = Message.objects.filter(message_pair_id__in=position).values(
+        'id', 'role', 'created_at', 'message_pair_id', 'hidden'
+    )
+    return [
+        {
+            'id': message['id'],
+            'role': message['role'],
+            'contents': contents[message['id']],
+            'created_at': message['created_at'],
+            'message_pair': message['message_pair_id'],
+            'hidden': message['hidden'],
+        }
+        for message in sorted(messages, key=lambda m: (position[m['message_pair_id']], m['created_at']))
+    ]
@@ -0,0 +1,173 @@
+"""
+Content-addressed chat attachments.
+
+Every attached file is stored once as an AttachmentBlob under its SHA-256,
+so the screenshot or PDF a user attaches again, in the same chat or
+another, is neither uploaded nor re-encoded a second time, and its model
+derivative and base64 encoding are shared. Blobs are reference counted by
+the MessageContent rows pointing at them and deleted with their files once
+nothing does.
+"""
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ProtectedError
+
+from ..models import AttachmentBlob, MessageContent
+from ..utils.file_validators import FileDescriptor, content_kind
+from . import upload_service
+from .upload_service import Upload
+
+logger = logging.getLogger(__name__)
+
+
+class EncodedCache:
+    """
+    LRU of the base64 sent to the model for a blob, bounded by total
+    characters. Blobs never change once written, so entries can't go stale;
+    it saves reading the file from S3 and encoding it again each time a
+    history with the same image is built.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._items = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            encoded = self._items.get(digest)
+            if encoded is not None:
+                self._items.move_to_end(digest)
+            return encoded
+
+    def put(self, digest: str, encoded: str):
+        if len(encoded) > self.max_chars:
+            return
+        with self._lock:
+            previous = self._items.pop(digest, None)
+            if previous is not None:
+                self._chars -= len(previous)
+            self._items[digest] = encoded
+            self._chars += len(encoded)
+            while self._chars > self.max_chars:
+                _, evicted = self._items.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def discard(self, digests: Iterable[str]):
+        with self._lock:
+            for digest in digests:
+                evicted = self._items.pop(digest, None)
+                if evicted is not None:
+                    self._chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._chars = 0
+
+
+encoded_cache = EncodedCache(getattr(settings, 'ATTACHMENT_CACHE_CHARS', 64 * 1024 * 1024))
+
+
+def model_base64(content) -> Optional[str]:
+    """The base64 of the file a MessageContent sends to the model, from the cache when it has a blob"""
+    if content.blob_id:
+        encoded = encoded_cache.get(content.blob_id)
+        if encoded is not None:
+            return encoded
+    file, _ = content.model_file
+    if not file:
+        return None
+    try:
+        encoded = base64.b64encode(file.read()).decode('utf-8')
+    finally:
+        file.seek(0)
+    if content.blob_id:
+        encoded_cache.put(content.blob_id, encoded)
+    return encoded
+
+
+def store_file(descriptor: FileDescriptor) -> AttachmentBlob:
+    """The blob for a posted file; a duplicate of a stored one is not uploaded"""
+    blob, created = AttachmentBlob.store(
+        descriptor.sha256, descriptor.mime_type, descriptor.size, file=descriptor.file
+    )
+    if not created:
+        logger.info(f"Attachment {descriptor.sha256[:12]} already stored, {descriptor.size} bytes not uploaded")
+    return blob
+
+
+def upload_image_data(upload: Upload) -> Optional[bytes]:
+    """
+    The bytes of an uploaded image that is not stored yet, which its blob
+    needs to build the model derivative. Read before the transaction that
+    attaches it; None for documents and images already stored, which are
+    never downloaded, and when the object can't be read.
+    """
+    if content_kind(upload.mime_type) != 'image' or AttachmentBlob.objects.filter(hash=upload.sha256).exists():
+        return None
+    try:
+        return upload_service.read_object(upload.key)
+    except (ClientError, BotoCoreError) as e:
+        logger.warning(f"Could not read upload {upload.key}, attached without a model derivative: {e}")
+        return None
+
+
+def store_upload(upload: Upload, data: bytes = None) -> AttachmentBlob:
+    """
+    The blob for an object uploaded straight to S3, matched on the SHA-256
+    S3 verified. A new blob adopts the object, a duplicate deletes it once
+    the transaction commits. ``data`` is the image, from upload_image_data.
+    """
+    blob, created = AttachmentBlob.store(upload.sha256, upload.mime_type, upload.size, key=upload.key, data=data)
+    if not created and blob.file.name != upload.key:
+        storage = blob.file.storage
+        transaction.on_commit(lambda: storage.delete(upload.key))
+        logger.info(f"Attachment {blob.hash[:12]} already stored, dropped duplicate upload {upload.key}")
+    return blob
+
+
+def referenced_blobs(**filters) -> set:
+    """Hashes of the blobs the MessageContent rows matching ``filters`` reference, read before deleting them"""
+    return set(
+        MessageContent.objects.filter(blob__isnull=False, **filters).values_list('blob_id', flat=True).distinct()
+    )
+
+
+def collect_garbage(hashes: Iterable[str] = None) -> int:
+    """
+    Deletes blobs that no MessageContent references any more, limited to
+    ``hashes`` when given (the blobs a deletion just dereferenced). Their
+    files are deleted once the transaction commits. Returns the number of
+    blobs deleted.
+    """
+    unused = AttachmentBlob.objects.filter(contents__isnull=True)
+    if hashes is not None:
+        unused = unused.filter(hash__in=list(hashes))
+    try:
+        with transaction.atomic():
+            blobs = list(unused.select_for_update(of=('self',)))
+            if not blobs:
+                return 0
+            # Waits for AttachmentBlob.store's lock on a blob being attached; PROTECT then
+            # re-checks for contents, so a blob attached meanwhile is kept
+            AttachmentBlob.objects.filter(hash__in=[blob.hash for blob in blobs]).delete()
+    except ProtectedError:
+        # Left for the next collection
+        return 0
+    encoded_cache.discard(blob.hash for blob in blobs)
+
+    def delete_files():
+        for blob in blobs:
+            blob.delete_files()
+
+    transaction.on_commit(delete_files)
+    return len(blobs)
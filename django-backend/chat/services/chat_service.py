@@ -6,12 +6,19 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from ..models import Chat, MessagePair, Message, Project, MessageContent
 from ..prompts.coding import get_coding_system_prompt
-from ..utils.file_validators import validate_image_size, validate_document_size, validate_mime_type
+from ..utils.file_validators import FileDescriptor, describe_file
 from ..utils.token_counter import count_tokens
 from .memory_service import MemoryExtractionService
+from .llm_cache import llm_response_cache
+from .hedging import hedged_invoke
+from . import attachment_service
+from django.conf import settings
+from django.db import transaction
 from botocore.exceptions import ClientError
 from transformers import GPT2TokenizerFast
+import logging
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 
@@ -19,20 +26,24 @@ class ChatService:
     CLAUDE_35_SONNET_V2 = "anthropic.claude-3-5-sonnet-20241022-v2:0"
     CLAUDE_35_HAIKU_V1_0 = "anthropic.claude-3-5-haiku-20241022-v1:0"
     CLAUDE_35_SONNET_V1 = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+    MAX_OUTPUT_TOKENS = 4096
     
-    def __init__(self): 
+    def __init__(self, bypass_cache: bool = False): 
+        self.bypass_cache = bypass_cache
         self.bedrock_runtime = boto3.client(
             service_name="bedrock-runtime",
             region_name="us-west-2",
             aws_access_key_id=os.getenv("AWS_BEDROCK_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY")
+            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY"),
+            endpoint_url=os.getenv("AWS_BEDROCK_ENDPOINT_URL")  # local stand-in for load tests
         )
 
         self.bedrock_runtime_us_east = boto3.client(
             service_name="bedrock-runtime",
             region_name="us-east-1",
             aws_access_key_id=os.getenv("AWS_BEDROCK_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY")
+            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY"),
+            endpoint_url=os.getenv("AWS_BEDROCK_ENDPOINT_URL")  # local stand-in for load tests
         )
 
     def create_or_get_chat(self, user: AbstractUser, chat_id: str, message_text: str, project_id: Optional[str] = None) -> Chat:
@@ -78,12 +89,19 @@ class ChatService:
                 "messages": messages
             })
 
-            response = self.bedrock_runtime.invoke_model(
-                body=body,
-                modelId=self.CLAUDE_35_HAIKU_V1_0
+            def invoke():
+                response = self.bedrock_runtime.invoke_model(
+                    body=body,
+                    modelId=self.CLAUDE_35_HAIKU_V1_0
+                )
+                return json.loads(response.get('body').read())
+
+            # Identical first messages produce identical titles, so share the result
+            response_body = llm_response_cache.get_or_call(
+                llm_response_cache.make_key(self.CLAUDE_35_HAIKU_V1_0, body),
+                invoke,
+                bypass=self.bypass_cache
             )
-            
-            response_body = json.loads(response.get('body').read())
             title = response_body.get('content')[0].get('text').strip()
             
             # Validate the title
@@ -178,7 +196,7 @@ class ChatService:
             })
         
         # Build message history
-        for pair in MessagePair.objects.filter(chat=chat).order_by('created_at'):
+        for pair in MessagePair.objects.filter(chat=chat).order_by('created_at').prefetch_related('messages__contents'):
             for message in pair.messages.all():
                 messages.append({
                     'role': message.role,
@@ -192,7 +210,7 @@ class ChatService:
 
     def _build_message_history(self, chat: Chat) -> List[Dict[str, Any]]:
         messages = []
-        for pair in MessagePair.objects.filter(chat=chat).order_by('created_at'):
+        for pair in MessagePair.objects.filter(chat=chat).order_by('created_at').prefetch_related('messages__contents'):
             for message in pair.messages.all():
                 messages.append({
                     'role': message.role,
@@ -214,7 +232,7 @@ class ChatService:
         
         return json.dumps({
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
+            "max_tokens": self.MAX_OUTPUT_TOKENS,
             "system": system_prompt,
             "messages": messages,
         })
@@ -223,6 +241,16 @@ class ChatService:
         """
         Invoke Claude model with fallback to different versions/regions on throttling
         """
+        if getattr(settings, 'BEDROCK_HEDGING_ENABLED', False):
+            return hedged_invoke(
+                lambda: self.bedrock_runtime.invoke_model_with_response_stream(
+                    body=body, modelId=self.CLAUDE_35_SONNET_V2
+                ),
+                lambda: self.bedrock_runtime_us_east.invoke_model_with_response_stream(
+                    body=body, modelId=self.CLAUDE_35_SONNET_V1
+                ),
+            )
+
         try:
             return self.bedrock_runtime.invoke_model_with_response_stream(
                 body=body,
@@ -237,9 +265,12 @@ class ChatService:
                 )
             raise e
 
-    def create_new_message(self, message_pair: MessagePair, role: str, text: str = None, files: list = None) -> Message:
+    def create_new_message(self, message_pair: MessagePair, role: str, text: str = None, files: list = None,
+                           uploads: list = None) -> Message:
         """
         Create a new message with optional file attachments using MessageContent model.
+        ``files`` are uploaded files or their FileDescriptors (see file_validators.describe_file);
+        ``uploads`` are objects already in S3 (see upload_service.inspect_upload), attached by key.
         """
         # Create the base message
         message = Message.objects.create(
@@ -255,19 +286,33 @@ class ChatService:
                 text_content=text
             )
 
-        # Handle file attachments if any
-        if files:
-            for file in files:
-                # Determine content type based on mime type
-                mime_type = validate_mime_type(file)
-                content_type = 'image' if mime_type.startswith('image/') else 'document'
-                
-                MessageContent.objects.create(
-                    message=message,
-                    content_type=content_type,
-                    file_content=file,
-                    mime_type=mime_type
-                )
+        # Handle file attachments if any, stored once per distinct content (see attachment_service)
+        for file in files or ():
+            # Views pass descriptors they already validated; anything else is described here, in one pass
+            descriptor = file if isinstance(file, FileDescriptor) else describe_file(file)
+            # Stored and referenced in one transaction, so collect_garbage can't delete a reused blob in between
+            with transaction.atomic():
+                blob = attachment_service.store_file(descriptor)
+                MessageContent.from_blob(message, blob, descriptor).save()
+            self._report_model_image(blob)
+
+        for upload in uploads or ():
+            # The upload went straight to S3; only a new image is fetched, once, for its derivative
+            data = attachment_service.upload_image_data(upload)
+            with transaction.atomic():
+                blob = attachment_service.store_upload(upload, data)
+                MessageContent.from_blob(message, blob).save()
+            self._report_model_image(blob)
 
         return message 
+
+    @staticmethod
+    def _report_model_image(blob):
+        model_image = blob.model_image
+        if model_image is not None:
+            logger.info(
+                f"Image {blob.hash[:12]}: {model_image.original_width}x{model_image.original_height} "
+                f"{model_image.original_bytes} bytes -> {model_image.width}x{model_image.height} "
+                f"{len(model_image.data)} bytes, ~{model_image.original_tokens} -> ~{model_image.tokens} input tokens"
+            )
     
@@ -0,0 +1,287 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'primary'
+SECONDARY = 'secondary'
+
+_END = object()
+
+
+class FirstTokenLatencyTracker:
+    """Rolling window of first-token latencies for the primary region"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def threshold(self, q: float, default: float, minimum: float) -> float:
+        """Hedge delay: the rolling ``q`` percentile, or ``default`` until enough samples exist"""
+        value = self.percentile(q)
+        return default if value is None else max(minimum, value)
+
+
+class HedgeBudget:
+    """
+    Rate cap on hedging: at most ``max_per_minute`` hedged (duplicate)
+    requests per minute across all workers, counted in the shared cache.
+    It limits how often a hedge is sent, not what hedges cost; the token
+    counters in ``stats()`` only report the extra spend after the fact.
+    """
+
+    def __init__(self, max_per_minute: int):
+        self.max_per_minute = max_per_minute
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'hedged': 0, 'secondary_wins': 0, 'primary_wins_after_hedge': 0,
+            'budget_exhausted': 0, 'extra_input_tokens': 0, 'extra_output_tokens': 0,
+        }
+
+    def try_acquire(self) -> bool:
+        key = f"bedrock:hedges:{int(time.time() // 60)}"
+        cache.add(key, 0, timeout=120)
+        try:
+            allowed = cache.incr(key) <= self.max_per_minute
+        except ValueError:
+            allowed = True
+        if not allowed:
+            self.count('budget_exhausted')
+        return allowed
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_per_minute'] = self.max_per_minute
+        stats['hedge_rate'] = round(stats['hedged'] / stats['requests'], 4) if stats['requests'] else 0.0
+        return stats
+
+
+def _decode(event: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return json.loads(event['chunk']['bytes'])
+    except (KeyError, TypeError, ValueError):
+        return {}
+
+
+def _shutdown(stream):
+    """
+    Close a stream's connection from another thread. The close runs on a
+    helper thread because it can wait for the reading thread's blocked read
+    to return; the caller carries on straight away.
+    """
+    if hasattr(stream, 'close'):
+        threading.Thread(target=stream.close, name='bedrock-hedge-close', daemon=True).start()
+
+
+class _StreamReader(threading.Thread):
+    """
+    Opens one Bedrock stream and forwards its events to the shared queue,
+    tallying the tokens it was billed for. A reader that lost the race
+    adds them to the budget's hedging cost when it stops.
+    """
+
+    def __init__(self, source: str, open_stream: Callable[[], Dict[str, Any]], events: queue.Queue,
+                 budget: 'HedgeBudget'):
+        super().__init__(name=f"bedrock-hedge-{source}", daemon=True)
+        self.source = source
+        self.open_stream = open_stream
+        self.events = events
+        self.budget = budget
+        self.stopped = threading.Event()
+        self.lost = False
+        self.stream = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._output_chars = 0
+
+    def run(self):
+        try:
+            self.stream = self.open_stream()['body']
+            if self.stopped.is_set():
+                return
+            for event in self.stream:
+                self._tally(event)
+                if self.stopped.is_set():
+                    break
+                self.events.put((self.source, event))
+            else:
+                self.events.put((self.source, _END))
+        except Exception as e:
+            if not self.stopped.is_set():
+                self.events.put((self.source, e))
+        finally:
+            if self.stream is not None:
+                self.stream.close()
+            if self.lost:
+                self.budget.count('extra_input_tokens', self.input_tokens)
+                self.budget.count('extra_output_tokens', self.output_tokens or self._output_chars // 4)
+
+    def _tally(self, event: Dict[str, Any]):
+        data = _decode(event)
+        if data.get('type') == 'message_start':
+            self.input_tokens = data['message'].get('usage', {}).get('input_tokens', 0)
+        elif data.get('type') == 'content_block_delta':
+            self._output_chars += len(data['delta'].get('text', ''))
+        elif data.get('type') == 'message_delta':
+            self.output_tokens = data.get('usage', {}).get('output_tokens', self.output_tokens)
+
+    def cancel(self, lost: bool = False):
+        """Stop forwarding and drop the connection, without waiting for its next event"""
+        self.lost = self.lost or lost
+        self.stopped.set()
+        if self.stream is not None:
+            _shutdown(self.stream)
+
+
+def _is_throttle(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response['Error']['Code'] == 'ThrottlingException'
+
+
+class HedgedStream:
+    """
+    Races a primary Bedrock stream against a delayed duplicate in a secondary
+    region.
+
+    The primary request is sent immediately. If its first token hasn't
+    arrived after the hedge delay (rolling p90 by default) and the per-minute
+    hedge rate cap allows, the same request is sent to the secondary
+    region/model. Whichever stream yields a content delta first wins; the
+    other's connection is closed straight away. A throttled primary falls back to the secondary straight
+    away, as the unhedged path does.
+
+    ``start()`` blocks until there is a winner so errors still surface
+    before the HTTP response begins; ``body`` then replays the winner's
+    buffered events and continues its stream.
+    """
+
+    def __init__(self, open_primary: Callable[[], Dict[str, Any]], open_secondary: Callable[[], Dict[str, Any]],
+                 delay: float, tracker: FirstTokenLatencyTracker, budget: HedgeBudget):
+        self.delay = delay
+        self.tracker = tracker
+        self.budget = budget
+        self.events: queue.Queue = queue.Queue()
+        self.readers = {
+            PRIMARY: _StreamReader(PRIMARY, open_primary, self.events, budget),
+            SECONDARY: _StreamReader(SECONDARY, open_secondary, self.events, budget),
+        }
+        self.buffers: Dict[str, List[Dict[str, Any]]] = {PRIMARY: [], SECONDARY: []}
+        self.winner: Optional[str] = None
+        self.hedged = False
+        self._finished = set()
+
+    def _launch_secondary(self):
+        self.hedged = True
+        if self.readers[SECONDARY].ident is None:
+            self.readers[SECONDARY].start()
+
+    def start(self) -> 'HedgedStream':
+        self.budget.count('requests')
+        started = time.monotonic()
+        self.readers[PRIMARY].start()
+        can_hedge = True
+        errors: Dict[str, Exception] = {}
+
+        while self.winner is None:
+            timeout = max(0.0, started + self.delay - time.monotonic()) if can_hedge and not self.hedged else None
+            try:
+                source, item = self.events.get(timeout=timeout)
+            except queue.Empty:
+                can_hedge = False
+                if self.budget.try_acquire():
+                    self.budget.count('hedged')
+                    self._launch_secondary()
+                continue
+
+            if isinstance(item, Exception):
+                errors[source] = item
+                if source == PRIMARY and not self.hedged:
+                    if not _is_throttle(item):
+                        raise item
+                    # Same behaviour as the unhedged path: throttling goes straight to the fallback
+                    self._launch_secondary()
+                elif len(errors) == 2:
+                    raise item
+                continue
+
+            if item is _END:
+                self._finished.add(source)
+                self.winner = source
+                break
+
+            self.buffers[source].append(item)
+            if _decode(item).get('type') == 'content_block_delta':
+                self.winner = source
+
+        elapsed = time.monotonic() - started
+        if PRIMARY not in errors:
+            # When the secondary wins this is a lower bound on the primary's latency
+            self.tracker.record(elapsed)
+
+        loser = SECONDARY if self.winner == PRIMARY else PRIMARY
+        # The loser reports the tokens it was billed for, the hedge's cost, once it has stopped
+        self.readers[loser].cancel(lost=True)
+        if self.hedged and PRIMARY not in errors:
+            self.budget.count('secondary_wins' if self.winner == SECONDARY else 'primary_wins_after_hedge')
+        if self.hedged:
+            logger.info(f"Hedged Bedrock request won by {self.winner} after {elapsed:.2f}s")
+        return self
+
+    @property
+    def body(self) -> Iterator[Dict[str, Any]]:
+        try:
+            yield from self.buffers[self.winner]
+            if self.winner in self._finished:
+                return
+            while True:
+                source, item = self.events.get()
+                if source != self.winner:
+                    continue
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for reader in self.readers.values():
+                reader.cancel()
+
+
+latency_tracker = FirstTokenLatencyTracker()
+hedge_budget = HedgeBudget(max_per_minute=getattr(settings, 'BEDROCK_HEDGE_MAX_PER_MINUTE', 30))
+
+
+def hedged_invoke(open_primary: Callable[[], Dict[str, Any]],
+                  open_secondary: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Invoke with hedging and return a response shaped like ``invoke_model_with_response_stream``"""
+    delay = latency_tracker.threshold(
+        getattr(settings, 'BEDROCK_HEDGE_PERCENTILE', 0.9),
+        default=getattr(settings, 'BEDROCK_HEDGE_DEFAULT_DELAY', 2.0),
+        minimum=getattr(settings, 'BEDROCK_HEDGE_MIN_DELAY', 0.5),
+    )
+    stream = HedgedStream(open_primary, open_secondary, delay, latency_tracker, hedge_budget).start()
+    return {'body': stream.body, 'hedged': stream.hedged, 'winner': stream.winner}
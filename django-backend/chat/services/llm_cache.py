@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from django.conf import settings
+
+# Request header that skips the response cache for a single request (debugging)
+BYPASS_HEADER = 'X-LLM-Cache-Bypass'
+
+
+class _InFlight:
+    """A single upstream call that concurrent identical requests wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMResponseCache:
+    """
+    In-process response cache for deterministic Bedrock calls.
+
+    Entries are keyed on a hash of the model id and the full request body
+    (system prompt, messages and sampling params), expire after ``ttl``
+    seconds and are evicted least-recently-used once ``max_entries`` is
+    reached. Concurrent misses for the same key are coalesced so only one
+    upstream call is made; the other callers wait for and share its result.
+    Errors are never cached.
+    """
+
+    def __init__(self, ttl: int = 3600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'bypassed': 0}
+
+    @staticmethod
+    def make_key(model_id: str, body: Union[str, Dict[str, Any]]) -> str:
+        """Build a cache key from the model id and request body"""
+        if isinstance(body, str):
+            body = json.loads(body)
+        canonical = json.dumps({'model': model_id, 'body': body}, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get_or_call(self, key: str, fn: Callable[[], Any], bypass: bool = False) -> Any:
+        """
+        Return the cached value for ``key`` or compute it with ``fn``.
+        With ``bypass`` the cache is neither read nor written.
+        """
+        return self.lookup_or_call(key, fn, bypass)[0]
+
+    def lookup_or_call(self, key: str, fn: Callable[[], Any], bypass: bool = False) -> Tuple[Any, bool]:
+        """
+        ``get_or_call``, also telling whether the value was served without
+        this caller making the call: a cache hit, or another caller's call.
+        The value is shared with every other caller; copy it to change it.
+        """
+        if bypass:
+            with self._lock:
+                self._stats['bypassed'] += 1
+            return fn(), False
+
+        with self._lock:
+            cached = self._get_locked(key)
+            if cached is not None:
+                self._stats['hits'] += 1
+                return cached, True
+
+            flight = self._in_flight.get(key)
+            if flight is None:
+                flight = _InFlight()
+                self._in_flight[key] = flight
+                is_leader = True
+                self._stats['misses'] += 1
+            else:
+                is_leader = False
+                self._stats['coalesced'] += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            with self._lock:
+                self._set_locked(key, flight.result)
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+
+    def _get_locked(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_locked(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for this process"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['ttl'] = self.ttl
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = round((stats['hits'] + stats['coalesced']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+llm_response_cache = LLMResponseCache(
+    ttl=getattr(settings, 'LLM_CACHE_TTL', 3600),
+    max_entries=getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 1024),
+)
+
+
+def cache_bypass_requested(request) -> bool:
+    """True when the client asked to skip the LLM response cache"""
+    value = request.headers.get(BYPASS_HEADER, '')
+    return value.lower() in ('1', 'true', 'yes')
@@ -2,20 +2,24 @@ import json
 import boto3
 import os
 from typing import List, Dict, Optional
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 from ..models import UserMemory, MemoryTag, Chat, MessagePair
 from ..utils.token_counter import count_tokens
+from .llm_cache import llm_response_cache
 
 
 class MemoryExtractionService:
     """Service for extracting and managing user memories from conversations"""
     
-    def __init__(self):
+    def __init__(self, bypass_cache: bool = False):
+        self.bypass_cache = bypass_cache
         self.bedrock_runtime = boto3.client(
             service_name="bedrock-runtime",
             region_name="us-west-2",
             aws_access_key_id=os.getenv("AWS_BEDROCK_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY")
+            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY"),
+            endpoint_url=os.getenv("AWS_BEDROCK_ENDPOINT_URL")  # local stand-in for load tests
         )
         self.haiku_model = "anthropic.claude-3-5-haiku-20241022-v1:0"
     
@@ -58,16 +62,17 @@ class MemoryExtractionService:
             pairs = [message_pair]
         else:
             # Extract from entire chat (last 10 message pairs to avoid token limits)
-            pairs = chat.message_pairs.order_by('-created_at')[:10]
+            pairs = list(chat.message_pairs.order_by('-created_at')[:10])
+        prefetch_related_objects(pairs, 'messages__contents')
         
-        for pair in reversed(list(pairs)):
+        for pair in reversed(pairs):
             for message in pair.messages.all():
                 role_prefix = "User: " if message.role == "user" else "Assistant: "
                 
                 # Get text content from all message contents
                 text_contents = []
-                for content in message.contents.filter(content_type='text'):
-                    if content.text_content:
+                for content in message.contents.all():
+                    if content.content_type == 'text' and content.text_content:
                         text_contents.append(content.text_content)
                 
                 if text_contents:
@@ -124,13 +129,20 @@ If no meaningful user information is found, return an empty array."""
                 ]
             })
             
-            response = self.bedrock_runtime.invoke_model(
-                body=body,
-                modelId=self.haiku_model,
-                contentType="application/json"
+            def invoke():
+                response = self.bedrock_runtime.invoke_model(
+                    body=body,
+                    modelId=self.haiku_model,
+                    contentType="application/json"
+                )
+                return json.loads(response['body'].read())
+
+            # Extraction runs at temperature 0.1, so the same conversation yields the same result
+            response_body = llm_response_cache.get_or_call(
+                llm_response_cache.make_key(self.haiku_model, body),
+                invoke,
+                bypass=self.bypass_cache
             )
-            
-            response_body = json.loads(response['body'].read())
             content = response_body['content'][0]['text']
             
             # Parse the JSON response
@@ -0,0 +1,225 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Rough cost of an image block when estimating a request before it is sent
+IMAGE_TOKEN_ESTIMATE = 1600
+
+
+class QuotaExceeded(Exception):
+    """Raised when a request would take a user or plan over its token budget"""
+    def __init__(self, message: str, retry_after: int, quota: Dict[str, Any]):
+        self.message = message
+        self.retry_after = retry_after
+        self.quota = quota
+        super().__init__(message)
+
+
+@dataclass
+class PlanQuota:
+    """Token budgets for a plan over the rolling window. ``None`` means unlimited."""
+    user_tokens: Optional[int]
+    plan_tokens: Optional[int] = None
+
+
+@dataclass
+class Reservation:
+    """Tokens held for one in-flight request, reconciled once actual usage is known"""
+    keys: List[str]
+    tokens: int
+    plan: str
+    settled: bool = False
+
+    @property
+    def active(self) -> bool:
+        return bool(self.keys)
+
+
+class TokenQuotaService:
+    """
+    Rolling-window token budgets per user and per plan.
+
+    Usage is counted in fixed-size buckets in the shared Django cache
+    (Redis in production) with atomic ``add``/``incr``, so every worker
+    sees the same totals. A request reserves an estimate of its tokens
+    before Bedrock is called and the reservation is corrected with the
+    real ``usage`` once the stream finishes.
+    """
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'TOKEN_QUOTA_ENABLED', True)
+        self.window = getattr(settings, 'TOKEN_QUOTA_WINDOW', 3600)
+        self.bucket_size = getattr(settings, 'TOKEN_QUOTA_BUCKET', 60)
+        self.queue_timeout = getattr(settings, 'TOKEN_QUOTA_QUEUE_TIMEOUT', 0)
+        self.plans = {
+            name: PlanQuota(**limits)
+            for name, limits in getattr(settings, 'TOKEN_QUOTA_PLANS', {}).items()
+        }
+
+    def get_plan(self, user) -> str:
+        plan = getattr(user, 'plan', None) or 'free'
+        return plan if plan in self.plans else 'free'
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.bucket_size)
+
+    def _key(self, scope: str, identifier: str, bucket: int) -> str:
+        return f"tokenquota:{scope}:{identifier}:{bucket}"
+
+    def _window_keys(self, scope: str, identifier: str, now: float) -> List[str]:
+        current = self._bucket(now)
+        count = math.ceil(self.window / self.bucket_size)
+        return [self._key(scope, identifier, b) for b in range(current - count + 1, current + 1)]
+
+    def _used(self, scope: str, identifier: str, now: float) -> Dict[str, Any]:
+        """Tokens used in the window and seconds until the oldest non-empty bucket drops out"""
+        keys = self._window_keys(scope, identifier, now)
+        values = cache.get_many(keys)
+        used = sum(max(0, values.get(key, 0)) for key in keys)
+        reset_in = 0
+        for key in keys:
+            if values.get(key, 0) > 0:
+                bucket = int(key.rsplit(':', 1)[1])
+                reset_in = max(0, math.ceil((bucket + len(keys)) * self.bucket_size - now))
+                break
+        return {'used': used, 'reset_in': reset_in}
+
+    def _incr(self, key: str, tokens: int) -> int:
+        """Add ``tokens`` to a bucket and return its new value"""
+        # add() only creates the key if missing, incr() is atomic on Redis/Memcached/LocMem
+        cache.add(key, 0, timeout=self.window + self.bucket_size)
+        try:
+            return cache.incr(key, tokens)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(key, tokens, timeout=self.window + self.bucket_size)
+            return tokens
+
+    def _scopes(self, user, plan: str) -> List[tuple]:
+        quota = self.plans[plan]
+        scopes = [('user', str(user.pk), quota.user_tokens)]
+        if quota.plan_tokens is not None:
+            scopes.append(('plan', plan, quota.plan_tokens))
+        return scopes
+
+    def get_status(self, user, now: Optional[float] = None) -> Dict[str, Any]:
+        """Remaining budget for ``user``, as reported to the client"""
+        now = now or time.time()
+        plan = self.get_plan(user)
+        limit = self.plans[plan].user_tokens
+        if not self.enabled or limit is None:
+            return {'plan': plan, 'limit': None, 'used': None, 'remaining': None,
+                    'window': self.window, 'reset_in': 0}
+        usage = self._used('user', str(user.pk), now)
+        return {
+            'plan': plan,
+            'limit': limit,
+            'used': usage['used'],
+            'remaining': max(0, limit - usage['used']),
+            'window': self.window,
+            'reset_in': usage['reset_in'],
+        }
+
+    def reserve(self, user, estimated_tokens: int) -> Reservation:
+        """
+        Hold ``estimated_tokens`` against the user's and plan's budgets.
+
+        The estimate is added to the current bucket first and the total
+        compared afterwards, so concurrent requests can't all pass a check
+        made before any of them counted; a request that went over takes its
+        estimate back out. If the budget is exhausted the call waits up to
+        ``TOKEN_QUOTA_QUEUE_TIMEOUT`` seconds for the window to roll over
+        before raising ``QuotaExceeded``.
+        """
+        plan = self.get_plan(user)
+        if not self.enabled:
+            return Reservation(keys=[], tokens=0, plan=plan)
+
+        deadline = time.time() + self.queue_timeout
+        while True:
+            now = time.time()
+            bucket = self._bucket(now)
+            keys, exceeded = [], None
+            for scope, identifier, limit in self._scopes(user, plan):
+                if limit is None:
+                    continue
+                key = self._key(scope, identifier, bucket)
+                current = self._incr(key, estimated_tokens)
+                keys.append(key)
+                earlier = [k for k in self._window_keys(scope, identifier, now) if k != key]
+                used = current + sum(max(0, value) for value in cache.get_many(earlier).values())
+                if used > limit:
+                    exceeded = (scope, identifier)
+                    break
+
+            if exceeded is None:
+                return Reservation(keys=keys, tokens=estimated_tokens, plan=plan)
+            for key in keys:
+                self._incr(key, -estimated_tokens)
+            retry_after = self._used(*exceeded, now)['reset_in'] or self.bucket_size
+            if now + retry_after > deadline:
+                raise QuotaExceeded(
+                    f"Token quota exceeded for the {plan} plan. Please try again later.",
+                    retry_after=retry_after,
+                    quota=self.get_status(user, now)
+                )
+            time.sleep(min(retry_after, self.bucket_size))
+
+    def reconcile(self, reservation: Reservation, actual_tokens: int):
+        """Replace the reserved estimate with the tokens Bedrock actually reported"""
+        if not reservation.active or reservation.settled:
+            return
+        reservation.settled = True
+        delta = actual_tokens - reservation.tokens
+        if not delta:
+            return
+        for key in reservation.keys:
+            try:
+                self._incr(key, delta)
+            except Exception as e:
+                logger.warning(f"Failed to reconcile token quota for {key}: {e}")
+        reservation.tokens = actual_tokens
+
+    def release(self, reservation: Reservation):
+        """Give back a reservation nothing was generated for; no-op once it has been reconciled"""
+        self.reconcile(reservation, 0)
+
+    @staticmethod
+    def estimate_tokens(text: str, attachments: int = 0, max_tokens: int = 0) -> int:
+        """
+        Cheap pre-flight estimate (~4 characters per token) used for the
+        reservation; history and project context are picked up when the
+        request is reconciled with Bedrock's reported usage.
+        """
+        return len(text or '') // 4 + attachments * IMAGE_TOKEN_ESTIMATE + max_tokens
+
+
+class ReservedStream:
+    """
+    A streaming response body holding a reservation. The body settles it
+    when it runs; closing the response releases it if the body never
+    started, e.g. when the client disconnected before the first chunk.
+    """
+
+    def __init__(self, stream, reservation: Reservation, service: TokenQuotaService):
+        self.stream = stream
+        self.reservation = reservation
+        self.service = service
+
+    def __iter__(self):
+        return iter(self.stream)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.service.release(self.reservation)
+
+
+token_quota_service = TokenQuotaService()
@@ -0,0 +1,430 @@
+import html
+import logging
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from ..models import Chat, Message, MessageContent
+from ..utils.keyset import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration for Postgres. SQLite indexes unstemmed words: its porter stemmer
+# turns "deploy" into "deploi" but "deployment" into "deploy", which breaks prefix queries
+SEARCH_CONFIG = 'english'
+# Words of the query that are used; the rest are ignored
+MAX_TERMS = 8
+# Most chats a search returns, best ranked first
+MAX_CHAT_RESULTS = 200
+# A title hit counts for more than the same hit in one message
+TITLE_WEIGHT = 2.0
+# Snippet length around the first match, in words
+SNIPPET_WORDS = 24
+# Private-use characters put around matches by the database, turned into <mark> after escaping
+HIGHLIGHT_START, HIGHLIGHT_END = '\ue000', '\ue001'
+
+
+def search_terms(query: str) -> List[str]:
+    """Words of a free-text query; punctuation and operators are dropped so input can't break the syntax"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def highlight(snippet: str) -> str:
+    """HTML-escape a snippet and wrap its matches in <mark>"""
+    return html.escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def make_snippet(text: str, pattern: re.Pattern) -> str:
+    """The words of ``text`` around the first match of ``pattern``, with every match between the highlight markers"""
+    words = text.split()
+    first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+    start = max(0, first - SNIPPET_WORDS // 4)
+    marked = pattern.sub(
+        lambda match: HIGHLIGHT_START + match.group(0) + HIGHLIGHT_END, ' '.join(words[start:start + SNIPPET_WORDS])
+    )
+    return ('…' if start else '') + marked + ('…' if start + SNIPPET_WORDS < len(words) else '')
+
+
+@dataclass
+class SearchHit:
+    """One matching message content; ``snippet`` is escaped HTML with matches in <mark>"""
+    content_id: int
+    message_id: object
+    chat_id: object
+    score: float
+    snippet: str
+
+    @property
+    def cursor(self) -> str:
+        """Keyset position after this hit: results are ordered by score, then content id, both descending"""
+        return encode_cursor(self.score, self.content_id)
+
+
+class SearchBackend:
+    """
+    Chat search over a full-text index of chat titles and text message
+    contents. Every term of the query has to match, as a prefix so results
+    show up while the last word is still being typed, and chats come back
+    best ranked first.
+    """
+    name = None
+
+    def install(self, conn):
+        """Create the index and whatever keeps it up to date as rows are written; safe to run again"""
+
+    def uninstall(self, conn):
+        pass
+
+    def rebuild(self, conn):
+        """Re-index every existing row"""
+
+    def index_content(self, content):
+        """Called when a MessageContent is saved, for indexes the database doesn't maintain itself"""
+
+    def chat_ranks(self, user_id, terms: List[str], limit: int) -> List[Tuple[str, float]]:
+        raise NotImplementedError
+
+    def message_hits(self, user_id, terms: List[str], limit: int, after: Optional[Tuple[float, int]]) -> list:
+        """Rows of (content id, message id, chat id, score, snippet), best first and after the ``after`` key"""
+        raise NotImplementedError
+
+    def user_id(self, user):
+        return Chat._meta.get_field('user').get_db_prep_value(user.pk, connection)
+
+    def search_messages(self, user, query: str, limit: int, after: Optional[Tuple[float, int]] = None) -> List[SearchHit]:
+        """Up to ``limit`` of ``user``'s message contents matching ``query``, best ranked first"""
+        terms = search_terms(query)
+        if not terms:
+            return []
+        message_pk, chat_pk = Message._meta.pk, Chat._meta.pk
+        return [
+            SearchHit(content_id, message_pk.to_python(message_id), chat_pk.to_python(chat_id), score, highlight(snippet))
+            for content_id, message_id, chat_id, score, snippet in self.message_hits(self.user_id(user), terms, limit, after)
+        ]
+
+    def filter_chats(self, queryset, user, query: str):
+        """``queryset`` narrowed to chats matching ``query``, annotated with ``search_rank`` and ordered by it"""
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        pk = Chat._meta.pk
+        ranks = [
+            (pk.to_python(chat_id), score)
+            for chat_id, score in self.chat_ranks(self.user_id(user), terms, MAX_CHAT_RESULTS)
+        ]
+        if not ranks:
+            return queryset.none()
+        return queryset.filter(id__in=[chat_id for chat_id, _ in ranks]).annotate(
+            search_rank=Case(
+                *[When(id=chat_id, then=Value(score)) for chat_id, score in ranks],
+                output_field=FloatField()
+            )
+        ).order_by('-search_rank', '-created_at')
+
+    def _fetch(self, sql: str, params: list) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    A stored ``tsvector`` column generated from ``text_content`` (and from
+    ``title`` on chats) with a GIN index. Postgres recomputes the column on
+    every insert and update, so the index never needs a separate refresh.
+    """
+    name = 'postgresql'
+
+    def install(self, conn):
+        with conn.cursor() as cursor:
+            for table, column in (('chat_messagecontent', 'text_content'), ('chat_chat', 'title')):
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                    f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', coalesce({column}, ''))) STORED"
+                )
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN (search_vector)")
+
+    def uninstall(self, conn):
+        with conn.cursor() as cursor:
+            for table in ('chat_messagecontent', 'chat_chat'):
+                cursor.execute(f"DROP INDEX IF EXISTS {table}_search_idx")
+                cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+
+    def tsquery(self, terms: List[str]) -> str:
+        return ' & '.join(f"{term}:*" for term in terms)
+
+    def chat_ranks(self, user_id, terms, limit):
+        return self._fetch(
+            f"""
+            SELECT chat_id, MAX(score) FROM (
+                SELECT p.chat_id AS chat_id, ts_rank(mc.search_vector, query) AS score
+                FROM to_tsquery('{SEARCH_CONFIG}', %s) query, chat_messagecontent mc
+                JOIN chat_message m ON m.id = mc.message_id
+                JOIN chat_messagepair p ON p.id = m.message_pair_id
+                JOIN chat_chat c ON c.id = p.chat_id
+                WHERE mc.search_vector @@ query AND c.user_id = %s
+                UNION ALL
+                SELECT c.id, ts_rank(c.search_vector, query) * %s
+                FROM to_tsquery('{SEARCH_CONFIG}', %s) query, chat_chat c
+                WHERE c.search_vector @@ query AND c.user_id = %s
+            ) hits
+            GROUP BY chat_id ORDER BY 2 DESC LIMIT %s
+            """,
+            [self.tsquery(terms), user_id, TITLE_WEIGHT, self.tsquery(terms), user_id, limit]
+        )
+
+    def message_hits(self, user_id, terms, limit, after):
+        # float8 so the score survives the round trip through the cursor exactly
+        keyset = "WHERE (score, id) < (%s, %s)" if after else ""
+        return self._fetch(
+            f"""
+            SELECT id, message_id, chat_id, score, ts_headline('{SEARCH_CONFIG}', text_content, query, %s)
+            FROM (
+                SELECT * FROM (
+                    SELECT mc.id, mc.message_id, p.chat_id, mc.text_content, query,
+                           ts_rank(mc.search_vector, query)::float8 AS score
+                    FROM to_tsquery('{SEARCH_CONFIG}', %s) query, chat_messagecontent mc
+                    JOIN chat_message m ON m.id = mc.message_id
+                    JOIN chat_messagepair p ON p.id = m.message_pair_id
+                    JOIN chat_chat c ON c.id = p.chat_id
+                    WHERE mc.search_vector @@ query AND c.user_id = %s
+                ) hits
+                {keyset}
+                ORDER BY score DESC, id DESC LIMIT %s
+            ) page
+            ORDER BY score DESC, id DESC
+            """,
+            [
+                f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, '
+                f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 3}, MaxFragments=1',
+                self.tsquery(terms), user_id, *(after or ()), limit
+            ]
+        )
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 tables for local development. Every row carries an ``owner``
+    token for the chat's user and queries match on it, so a common word
+    costs one user's share of the index rather than everyone's.
+
+    Chat titles are indexed by triggers on ``chat_chat``. Message contents
+    are indexed by ``index_content`` on save (streamed replies once they
+    end, not on every frame), since their owner is three tables away and
+    a trigger that reads other tables breaks the table rebuilds Django
+    does for SQLite migrations; a trigger only removes deleted rows. Those rebuilds drop the triggers and renumber
+    ``chat_chat`` rowids, so run ``manage.py rebuild_search_index`` after
+    a migration that alters these tables, and after importing rows with
+    ``bulk_create``.
+    """
+    name = 'sqlite'
+    TOKENIZER = 'unicode61 remove_diacritics 2'
+    OWNER_JOIN = (
+        "FROM chat_messagecontent mc "
+        "JOIN chat_message m ON m.id = mc.message_id "
+        "JOIN chat_messagepair p ON p.id = m.message_pair_id "
+        "JOIN chat_chat c ON c.id = p.chat_id"
+    )
+
+    def install(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS chat_messagecontent_fts "
+                f"USING fts5(text_content, owner, tokenize='{self.TOKENIZER}')"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS chat_messagecontent_fts_delete AFTER DELETE ON chat_messagecontent "
+                "BEGIN DELETE FROM chat_messagecontent_fts WHERE rowid = old.id; END"
+            )
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS chat_chat_fts USING fts5(title, owner, tokenize='{self.TOKENIZER}')"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS chat_chat_fts_insert AFTER INSERT ON chat_chat BEGIN "
+                "INSERT INTO chat_chat_fts(rowid, title, owner) VALUES (new.rowid, new.title, 'u' || new.user_id); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS chat_chat_fts_update AFTER UPDATE OF title ON chat_chat "
+                "WHEN old.title IS NOT new.title BEGIN "
+                "INSERT OR REPLACE INTO chat_chat_fts(rowid, title, owner) VALUES (new.rowid, new.title, 'u' || new.user_id); "
+                "END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS chat_chat_fts_delete AFTER DELETE ON chat_chat "
+                "BEGIN DELETE FROM chat_chat_fts WHERE rowid = old.rowid; END"
+            )
+
+    def uninstall(self, conn):
+        with conn.cursor() as cursor:
+            for trigger in ('chat_messagecontent_fts_delete', 'chat_chat_fts_insert', 'chat_chat_fts_update',
+                            'chat_chat_fts_delete'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute("DROP TABLE IF EXISTS chat_messagecontent_fts")
+            cursor.execute("DROP TABLE IF EXISTS chat_chat_fts")
+
+    def rebuild(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_messagecontent_fts")
+            cursor.execute(
+                f"INSERT INTO chat_messagecontent_fts(rowid, text_content, owner) "
+                f"SELECT mc.id, mc.text_content, 'u' || c.user_id {self.OWNER_JOIN}"
+            )
+            cursor.execute("DELETE FROM chat_chat_fts")
+            cursor.execute(
+                "INSERT INTO chat_chat_fts(rowid, title, owner) SELECT rowid, title, 'u' || user_id FROM chat_chat"
+            )
+
+    def index_content(self, content):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO chat_messagecontent_fts(rowid, text_content, owner) "
+                f"SELECT mc.id, mc.text_content, 'u' || c.user_id {self.OWNER_JOIN} WHERE mc.id = %s",
+                [content.pk]
+            )
+
+    def match(self, user_id, column: str, terms: List[str]) -> str:
+        phrases = ' '.join(f'"{term}"*' for term in terms)
+        return f'owner:"u{user_id}" AND {column}:({phrases})'
+
+    def chat_ranks(self, user_id, terms, limit):
+        # bm25() is lower for better matches and only works in a query on the FTS table itself,
+        # hence the materialized CTEs; the weights leave the owner column out of the score
+        return self._fetch(
+            """
+            WITH content_hits AS MATERIALIZED (
+                SELECT rowid AS id, -bm25(chat_messagecontent_fts, 1.0, 0.0) AS score
+                FROM chat_messagecontent_fts WHERE chat_messagecontent_fts MATCH %s
+            ), title_hits AS MATERIALIZED (
+                SELECT rowid AS id, -bm25(chat_chat_fts, 1.0, 0.0) AS score
+                FROM chat_chat_fts WHERE chat_chat_fts MATCH %s
+            )
+            SELECT chat_id, MAX(score) FROM (
+                SELECT p.chat_id AS chat_id, hits.score AS score
+                FROM content_hits hits
+                JOIN chat_messagecontent mc ON mc.id = hits.id
+                JOIN chat_message m ON m.id = mc.message_id
+                JOIN chat_messagepair p ON p.id = m.message_pair_id
+                UNION ALL
+                SELECT c.id, hits.score * %s
+                FROM title_hits hits JOIN chat_chat c ON c.rowid = hits.id
+                WHERE c.user_id = %s
+            )
+            GROUP BY chat_id ORDER BY 2 DESC LIMIT %s
+            """,
+            [self.match(user_id, 'text_content', terms), self.match(user_id, 'title', terms),
+             TITLE_WEIGHT, user_id, limit]
+        )
+
+    def message_hits(self, user_id, terms, limit, after):
+        keyset = "WHERE score < %s OR (score = %s AND id < %s)" if after else ""
+        rows = self._fetch(
+            f"""
+            WITH hits AS MATERIALIZED (
+                SELECT rowid AS id, -bm25(chat_messagecontent_fts, 1.0, 0.0) AS score
+                FROM chat_messagecontent_fts WHERE chat_messagecontent_fts MATCH %s
+            )
+            SELECT page.id, mc.message_id, p.chat_id, page.score, mc.text_content
+            FROM (SELECT * FROM hits {keyset} ORDER BY score DESC, id DESC LIMIT %s) page
+            JOIN chat_messagecontent mc ON mc.id = page.id
+            JOIN chat_message m ON m.id = mc.message_id
+            JOIN chat_messagepair p ON p.id = m.message_pair_id
+            ORDER BY page.score DESC, page.id DESC
+            """,
+            [self.match(user_id, 'text_content', terms), *((after[0], after[0], after[1]) if after else ()), limit]
+        )
+        # FTS5's snippet() re-runs the match for every row it is asked about, which costs seconds for
+        # common words; the page's own text is already here, so mark the same word prefixes in Python
+        pattern = re.compile(r'(?<!\w)(?:%s)\w*' % '|'.join(map(re.escape, terms)), re.IGNORECASE)
+        return [(*row[:4], make_snippet(row[4], pattern)) for row in rows]
+
+    @staticmethod
+    def is_installed(conn) -> bool:
+        return 'chat_messagecontent_fts' in conn.introspection.table_names(include_views=True)
+
+
+class LikeSearchBackend(SearchBackend):
+    """Unindexed substring match, for databases without a full-text index"""
+    name = 'like'
+
+    def filter_chats(self, queryset, user, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(message_pairs__messages__contents__text_content__icontains=query)
+        ).distinct().order_by('-created_at')
+
+    def search_messages(self, user, query, limit, after=None):
+        """Newest first with a score of 0, since nothing is ranked"""
+        terms = search_terms(query)
+        if not terms:
+            return []
+        contents = MessageContent.objects.filter(message__message_pair__chat__user=user)
+        for term in terms:
+            contents = contents.filter(text_content__icontains=term)
+        if after:
+            contents = contents.filter(id__lt=after[1])
+        rows = contents.order_by('-id').values_list('id', 'message_id', 'message__message_pair__chat_id', 'text_content')
+        pattern = re.compile('|'.join(map(re.escape, terms)), re.IGNORECASE)
+        return [
+            SearchHit(content_id, message_id, chat_id, 0.0, highlight(make_snippet(text, pattern)))
+            for content_id, message_id, chat_id, text in rows[:limit]
+        ]
+
+
+_backends = {}
+
+
+def backend_for(conn) -> SearchBackend:
+    """The backend matching ``conn``'s database, whether or not its index is installed"""
+    if conn.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if conn.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    return LikeSearchBackend()
+
+
+def get_search_backend() -> SearchBackend:
+    """The backend for the default database, falling back to LIKE when SQLite was built without FTS5"""
+    backend = _backends.get(connection.alias)
+    if backend is None:
+        backend = backend_for(connection)
+        if isinstance(backend, SQLiteSearchBackend) and not SQLiteSearchBackend.is_installed(connection):
+            logger.warning("Chat search index is not installed; run manage.py rebuild_search_index")
+            backend = LikeSearchBackend()
+        _backends[connection.alias] = backend
+    return backend
+
+
+def install_search_index(conn, rebuild: bool = True) -> Optional[SearchBackend]:
+    """
+    Create (and optionally fill) the index for ``conn``'s database. Returns
+    the backend, or None when the database has no full-text support.
+    """
+    backend = backend_for(conn)
+    if isinstance(backend, LikeSearchBackend):
+        return None
+    try:
+        with transaction.atomic(using=conn.alias):
+            backend.install(conn)
+            if rebuild:
+                backend.rebuild(conn)
+    except DatabaseError as e:
+        # e.g. SQLite compiled without FTS5
+        logger.warning(f"Could not install the {backend.name} chat search index: {e}")
+        return None
+    _backends.pop(conn.alias, None)
+    return backend
+
+
+@receiver(post_save, sender=MessageContent)
+def index_message_content(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'text_content' not in update_fields:
+        return
+    # Streaming saves each frame of text on its own; the stream indexes the message once it ends
+    if update_fields == {'text_content'}:
+        return
+    get_search_backend().index_content(instance)
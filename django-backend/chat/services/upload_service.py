@@ -0,0 +1,143 @@
+"""
+Direct-to-S3 uploads for chat attachments.
+
+The client asks for a presigned POST, sends the file straight to the
+bucket and then passes the object key with its chat message, so no
+worker holds the upload. The presigned policy already caps the size; the
+key is checked when the message arrives, from a ranged GET of the
+object's first bytes rather than the whole file. The client declares the
+file's SHA-256, which S3 verifies on upload, so the object can be matched
+with a stored attachment without downloading it.
+"""
+import base64
+import binascii
+import logging
+import posixpath
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.utils.text import get_valid_filename
+
+from ..models import MessageContent
+from ..utils.file_validators import (
+    MAX_IMAGES_PER_MESSAGE, SNIFF_BYTES, validate_declared_upload, validate_upload_header
+)
+
+logger = logging.getLogger(__name__)
+
+# Storage names of direct uploads, below the media storage's location
+UPLOAD_PREFIX = 'chat_contents/uploads'
+# Caps the ranged GETs before the per-message counts are checked
+MAX_UPLOADS_PER_MESSAGE = MAX_IMAGES_PER_MESSAGE
+
+
+@dataclass
+class Upload:
+    """An uploaded object that passed validation, ready to attach to a message"""
+    key: str
+    mime_type: str
+    size: int
+    # Hex SHA-256 of the content, as S3 checked it
+    sha256: str
+
+
+def _storage():
+    return MessageContent._meta.get_field('file_content').storage
+
+
+def _object_key(name: str) -> str:
+    """The bucket key of a storage name"""
+    return posixpath.join(_storage().location, name)
+
+
+def presign_upload(user, filename: str, mime_type: str, size: int, sha256: str) -> Dict[str, Any]:
+    """
+    A presigned POST for one attachment of ``user``'s, whose content must
+    have the base64 SHA-256 ``sha256``. Raises ValidationError for types
+    and sizes a message can't take.
+    """
+    validate_declared_upload(mime_type, size)
+    try:
+        if len(base64.b64decode(sha256, validate=True)) != 32:
+            raise ValueError
+    except (binascii.Error, ValueError):
+        raise ValidationError('sha256 must be the base64 SHA-256 of the file')
+    try:
+        filename = get_valid_filename(posixpath.basename(filename))
+    except SuspiciousFileOperation:
+        filename = 'file'
+    storage = _storage()
+    name = f'{UPLOAD_PREFIX}/{user.pk}/{uuid.uuid4().hex}/{filename}'
+    expires_in = getattr(settings, 'UPLOAD_URL_EXPIRES', 900)
+    # S3 rejects an upload whose content doesn't match the declared checksum
+    fields = {'Content-Type': mime_type, 'x-amz-checksum-sha256': sha256}
+    if storage.default_acl:
+        # Readable the same way as files the storage uploads itself
+        fields['acl'] = storage.default_acl
+    post = storage.connection.meta.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=_object_key(name),
+        Fields=fields,
+        Conditions=[*({key: value} for key, value in fields.items()), ['content-length-range', 1, size]],
+        ExpiresIn=expires_in,
+    )
+    return {'key': name, 'url': post['url'], 'fields': post['fields'], 'expires_in': expires_in}
+
+
+def read_header(key: str) -> Tuple[bytes, int]:
+    """The first SNIFF_BYTES of an uploaded object and its total size, from one ranged GET"""
+    storage = _storage()
+    try:
+        response = storage.connection.meta.client.get_object(
+            Bucket=storage.bucket_name, Key=_object_key(key), Range=f'bytes=0-{SNIFF_BYTES - 1}'
+        )
+    except ClientError as e:
+        # NoSuchKey, or InvalidRange for an empty object
+        logger.info(f"Upload {key} not readable: {e}")
+        raise ValidationError('Uploaded file not found')
+    header = response['Body'].read()
+    # "bytes 0-65535/1234567"; absent when S3 answers the whole object
+    total = response.get('ContentRange', '').rpartition('/')[2]
+    return header, int(total) if total.isdigit() else len(header)
+
+
+def read_checksum(key: str) -> Optional[str]:
+    """The hex SHA-256 S3 verified when the object was uploaded, from a HEAD request"""
+    storage = _storage()
+    try:
+        response = storage.connection.meta.client.head_object(
+            Bucket=storage.bucket_name, Key=_object_key(key), ChecksumMode='ENABLED'
+        )
+    except ClientError as e:
+        logger.info(f"Upload {key} not readable: {e}")
+        raise ValidationError('Uploaded file not found')
+    checksum = response.get('ChecksumSHA256')
+    return base64.b64decode(checksum).hex() if checksum else None
+
+
+def read_object(key: str) -> bytes:
+    """The whole of an uploaded object, for the server-side work an attachment needs"""
+    storage = _storage()
+    response = storage.connection.meta.client.get_object(Bucket=storage.bucket_name, Key=_object_key(key))
+    return response['Body'].read()
+
+
+def inspect_upload(user, key: str) -> Upload:
+    """
+    Validates an uploaded object before it is attached to a message: it
+    must be under ``user``'s prefix, and its sniffed type and size must be
+    allowed, and it must carry the SHA-256 its presigned POST required.
+    Raises ValidationError otherwise.
+    """
+    if not key.startswith(f'{UPLOAD_PREFIX}/{user.pk}/') or '..' in key.split('/'):
+        raise ValidationError('Uploaded file not found')
+    header, size = read_header(key)
+    mime_type = validate_upload_header(header, size)
+    sha256 = read_checksum(key)
+    if sha256 is None:
+        raise ValidationError('Uploaded file has no SHA-256 checksum')
+    return Upload(key=key, mime_type=mime_type, size=size, sha256=sha256)
@@ -1,3 +1,1105 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import magic
+from botocore.exceptions import ClientError
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from PIL import Image, ImageFile, JpegImagePlugin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from aiassistant.query_budget import Endpoint, QueryBudgetMixin
+from appauth.models import AppUser
+from .models import (
+    AttachmentBlob, Chat, MemoryTag, Message, MessageContent, MessagePair, Project, ProjectKnowledge,
+    SavedSystemPrompt, TokenUsage, UserMemory
+)
+from .serializers import ChatSerializer, UserMemoryListSerializer
+from .services.chat_service import ChatService
+from .services.hedging import PRIMARY, SECONDARY, FirstTokenLatencyTracker, HedgeBudget, HedgedStream
+from .services.llm_cache import BYPASS_HEADER, LLMResponseCache, cache_bypass_requested
+from .services.memory_service import MemoryExtractionService
+from .services.quota_service import PlanQuota, QuotaExceeded, TokenQuotaService, token_quota_service
+from .services import attachment_service, upload_service
+from .services.search_service import SQLiteSearchBackend, get_search_backend
+from .utils import image_pipeline
+from .utils.file_validators import describe_file
+from .utils.image_pipeline import optimize_for_model
+from .utils.stream_relay import DeltaCoalescer, with_flush_deadline
+
+
+def bedrock_stream(text='Sure, here it is.'):
+    events = [
+        {'type': 'message_start', 'message': {'usage': {'input_tokens': 12}}},
+        {'type': 'content_block_delta', 'delta': {'text': text}},
+        {'type': 'content_block_delta', 'delta': {'text': ' Done.'}},
+        {'type': 'message_delta', 'usage': {'output_tokens': 8}},
+    ]
+    return {'body': [{'chunk': {'bytes': json.dumps(event).encode()}} for event in events]}
+
+
+EXTRACTED_MEMORIES = [
+    {'summary': 'Writes Django backends', 'raw_content': 'I write Django backends',
+     'confidence_score': 0.9, 'category': 'work', 'tags': ['django', 'python']},
+]
+
+
+@override_settings(STREAM_FLUSH_INTERVAL=60)
+class ChatQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    url_prefix = '/api/v1/chat/'
+    endpoints = [
+        Endpoint('GET', 'chats/', 1),
+        Endpoint('GET', 'chats/?search=assistant text', 3),
+        Endpoint('GET', 'search/?q=assistant text&limit=3', 2),
+        Endpoint('POST', 'chats/', 2, data=lambda f: {'title': 'New chat', 'user': str(f['user'].id)}, status=201),
+        Endpoint('GET', 'chats/{chat.id}/', 1),
+        Endpoint('PATCH', 'chats/{chat.id}/', 2, data={'title': 'Renamed'}),
+        Endpoint('DELETE', 'chats/{chat.id}/', 13, status=204),
+        Endpoint('POST', 'chats/{chat.id}/archive/', 2),
+        Endpoint('POST', 'chats/{chat.id}/unarchive/', 2),
+        Endpoint('GET', 'chats/{chat.id}/messages/', 4),
+        Endpoint('POST', 'chats/{chat.id}/messages/', 6,
+                 data=lambda f: {'role': 'user', 'message_pair': str(f['pair'].id)}, status=201),
+        Endpoint('GET', 'chats/{chat.id}/tokens/', 4),
+        Endpoint('POST', 'chats/{chat.id}/extract-memories/', 18),
+        Endpoint('POST', 'chat/', 39, data=lambda f: {'chat_id': str(f['chat'].id), 'message': 'Add a login page'}),
+        Endpoint('PATCH', 'message-pairs/{pair.id}/toggle/', 2, data={'hidden': True}),
+        Endpoint('DELETE', 'message-pairs/{pair.id}/delete/', 10),
+        Endpoint('GET', 'saved-system-prompts/', 1),
+        Endpoint('POST', 'saved-system-prompts/', 1, data={'title': 'Reviewer', 'prompt': 'Review code'}, status=201),
+        Endpoint('GET', 'saved-system-prompts/{prompt.id}/', 1),
+        Endpoint('PATCH', 'saved-system-prompts/{prompt.id}/', 2, data={'title': 'Renamed'}),
+        Endpoint('DELETE', 'saved-system-prompts/{prompt.id}/', 2, status=204),
+        Endpoint('GET', 'projects/', 1),
+        Endpoint('POST', 'projects/', 2, data={'name': 'New project'}, status=201),
+        Endpoint('GET', 'projects/{project.id}/', 1),
+        Endpoint('PATCH', 'projects/{project.id}/', 2, data={'name': 'Renamed'}),
+        Endpoint('DELETE', 'projects/{project.id}/', 4, status=204),
+        Endpoint('GET', 'projects/{project.id}/knowledge/', 2),
+        Endpoint('GET', 'projects/{project.id}/chats/', 2),
+        Endpoint('GET', 'knowledge/', 1),
+        Endpoint('POST', 'knowledge/', 3, status=201,
+                 data=lambda f: {'project': str(f['project'].id), 'title': 'Notes', 'content': 'Use tabs'}),
+        Endpoint('GET', 'knowledge/{knowledge.id}/', 1),
+        Endpoint('PATCH', 'knowledge/{knowledge.id}/', 4,
+                 data=lambda f: {'project': str(f['project'].id), 'content': 'Use spaces'}),
+        Endpoint('DELETE', 'knowledge/{knowledge.id}/', 2, status=204),
+        Endpoint('PATCH', 'knowledge/{knowledge.id}/toggle/', 2),
+        Endpoint('GET', 'memories/', 2),
+        Endpoint('GET', 'memories/?tags=tag-0', 2),
+        Endpoint('GET', 'memories/{memory.id}/', 2),
+        Endpoint('PATCH', 'memories/{memory.id}/', 7, data=lambda f: {'summary': 'Edited', 'tag_ids': [f['tag'].id]}),
+        Endpoint('DELETE', 'memories/{memory.id}/', 3, status=204),
+        Endpoint('POST', 'memories/{memory.id}/verify/', 2),
+        Endpoint('POST', 'memories/{memory.id}/toggle_active/', 2),
+        Endpoint('GET', 'memory-tags/', 1),
+        Endpoint('POST', 'memory-tags/', 3, data={'name': 'new-tag'}, status=201),
+        Endpoint('GET', 'memory-tags/{tag.id}/', 1),
+        Endpoint('PATCH', 'memory-tags/{tag.id}/', 2, data={'color': '#000000'}),
+        Endpoint('DELETE', 'memory-tags/{tag.id}/', 3, status=204),
+        Endpoint('GET', 'memory/stats/', 5),
+        Endpoint('GET', 'memory/context/', 3),
+        Endpoint('GET', 'llm-cache/stats/', 0, user='admin'),
+        Endpoint('GET', 'hedging/stats/', 0, user='admin'),
+        Endpoint('GET', 'quota/', 0),
+        Endpoint('POST', 'validate-file/', 0, format='multipart',
+                 data=lambda f: {'file': SimpleUploadedFile('notes.txt', b'plain text notes\n', 'text/plain')}),
+        Endpoint('POST', 'uploads/presign/', 0, data={'filename': 'notes.txt', 'content_type': 'text/plain', 'size': 17,
+                                                      'sha256': base64.b64encode(bytes(32)).decode()},
+                 status=201),
+        # Admin changelists, which have the same N+1 risk in their list_display columns
+        Endpoint('GET', '/admin/chat/chat/', 7, user='admin', session=True),
+        Endpoint('GET', '/admin/chat/project/', 6, user='admin', session=True),
+        Endpoint('GET', '/admin/chat/message/', 5, user='admin', session=True),
+        Endpoint('GET', '/admin/chat/memorytag/', 5, user='admin', session=True),
+        Endpoint('GET', '/admin/chat/usermemory/', 7, user='admin', session=True),
+    ]
+    uncovered_routes = {
+        'api/v1/chat/chats/<str:pk>/': 'shadowed by the router\'s chats/<pk>/ route',
+        'api/v1/chat/projects/<str:pk>/chats/': 'shadowed by ProjectViewSet.chats',
+        'api/v1/chat/messages/<str:message_id>/edit/': 'edit_message uses Message.text, which no longer exists',
+    }
+
+    def setUp(self):
+        super().setUp()
+        # Picked once per process, on the first search
+        get_search_backend()
+        for target, attribute, value in [
+            (ChatService, 'invoke_model', lambda *args, **kwargs: bedrock_stream()),
+            (ChatService, '_generate_chat_title', lambda *args, **kwargs: 'Generated title'),
+            (MemoryExtractionService, '_extract_with_claude', lambda *args, **kwargs: EXTRACTED_MEMORIES),
+        ]:
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def build_fixture(self, size):
+        user = AppUser.objects.create_user(email=f'budget-{size}@example.com')
+        admin = AppUser.objects.create_superuser(email=f'budget-admin-{size}@example.com')
+        tags = [MemoryTag.objects.create(name=f'tag-{i}') for i in range(size)]
+        projects, chats, pairs, memories = [], [], [], []
+        for i in range(size):
+            project = Project.objects.create(user=user, name=f'Project {i}')
+            projects.append(project)
+            for j in range(size):
+                ProjectKnowledge.objects.create(
+                    project=project, title=f'Doc {j}', content='Some notes', token_count=3
+                )
+            SavedSystemPrompt.objects.create(user=user, title=f'Prompt {i}', prompt='Be brief')
+
+        for i in range(size):
+            chat = Chat.objects.create(user=user, project=projects[0], title=f'Chat {i}')
+            chats.append(chat)
+            for j in range(size):
+                pair = MessagePair.objects.create(chat=chat)
+                pairs.append(pair)
+                for role in ('user', 'assistant'):
+                    message = Message.objects.create(message_pair=pair, role=role, token_count=10)
+                    for k in range(size):
+                        MessageContent.objects.create(
+                            message=message, content_type='text', text_content=f'{role} text {k}'
+                        )
+            TokenUsage.objects.create(user=user, chat=chat, tokens_used=100)
+            memory = UserMemory.objects.create(
+                user=user, chat=chat, source_message_pair=pairs[-1],
+                summary=f'Likes topic {i}', raw_content=f'I like topic {i}', category='preferences'
+            )
+            memory.tags.set(tags)
+            memories.append(memory)
+
+        return {
+            'user': user,
+            'admin': admin,
+            'project': projects[0],
+            'knowledge': projects[0].knowledge_items.first(),
+            'chat': chats[0],
+            'pair': chats[0].message_pairs.first(),
+            'prompt': SavedSystemPrompt.objects.filter(user=user).first(),
+            'memory': memories[0],
+            'tag': tags[0],
+        }
+
+
+class ChatSearchTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='search@example.com')
+        self.client.force_authenticate(self.user)
+
+    def add_chat(self, title, *texts, user=None):
+        chat = Chat.objects.create(user=user or self.user, title=title)
+        pair = MessagePair.objects.create(chat=chat)
+        message = Message.objects.create(message_pair=pair, role='user')
+        for text in texts:
+            MessageContent.objects.create(message=message, content_type='text', text_content=text)
+        return chat
+
+    def search(self, query):
+        response = self.client.get('/api/v1/chat/chats/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [chat['title'] for chat in response.data['results']]
+
+    def test_uses_the_full_text_index(self):
+        self.assertIsInstance(get_search_backend(), SQLiteSearchBackend)
+
+    def test_matches_every_term_by_prefix_and_ranks_titles_first(self):
+        self.add_chat('Groceries', 'Remember the milk')
+        self.add_chat('Notes', 'Deploying the Django backend to production')
+        self.add_chat('Deployment checklist', 'Backups first')
+        self.add_chat('Other user', 'Deploying Django', user=AppUser.objects.create_user(email='other@example.com'))
+
+        self.assertEqual(self.search('deploy'), ['Deployment checklist', 'Notes'])
+        self.assertEqual(self.search('djan deploy'), ['Notes'])
+        self.assertEqual(self.search('deploy milk'), [])
+        self.assertEqual(self.search('"?*'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        chat = self.add_chat('Untitled', 'first draft')
+        content = MessageContent.objects.get(message__message_pair__chat=chat)
+        content.text_content = 'second revision'
+        content.save()
+        self.assertEqual(self.search('draft'), [])
+        self.assertEqual(self.search('revision'), ['Untitled'])
+
+        chat.title = 'Release plan'
+        chat.save()
+        self.assertEqual(self.search('release'), ['Release plan'])
+
+        content.delete()
+        self.assertEqual(self.search('revision'), [])
+
+    @override_settings(STREAM_FLUSH_BYTES=1)
+    def test_streamed_replies_are_indexed_once_they_end(self):
+        chat = self.add_chat('Untitled', 'Hello')
+        with mock.patch.object(ChatService, 'invoke_model', lambda *args, **kwargs: bedrock_stream('Kubernetes')), \
+                mock.patch.object(MemoryExtractionService, 'extract_memories_from_chat', return_value=[]), \
+                mock.patch.object(SQLiteSearchBackend, 'index_content', autospec=True,
+                                  side_effect=SQLiteSearchBackend.index_content) as index_content:
+            response = self.client.post('/api/v1/chat/chat/', {'chat_id': str(chat.id), 'message': 'Hi'})
+            b''.join(response.streaming_content)
+            response.close()
+        reply = MessageContent.objects.get(message__role='assistant')
+        # Created empty, then indexed once at the end rather than per frame
+        self.assertEqual([call.args[1].pk for call in index_content.call_args_list].count(reply.pk), 2)
+        self.assertEqual(self.search('kubernetes'), ['Untitled'])
+
+    def test_message_hits_have_escaped_highlighted_snippets(self):
+        chat = self.add_chat('Notes', 'Render <b>deployment</b> logs', 'Nothing here')
+        self.add_chat('Other user', 'deployment', user=AppUser.objects.create_user(email='other@example.com'))
+
+        response = self.client.get('/api/v1/chat/search/', {'q': 'deploy'})
+        self.assertEqual(response.status_code, 200)
+        [hit] = response.data['results']
+        self.assertEqual(hit['chat_id'], str(chat.id))
+        self.assertEqual(hit['chat_title'], 'Notes')
+        self.assertEqual(hit['role'], 'user')
+        self.assertEqual(hit['snippet'], 'Render &lt;b&gt;<mark>deployment</mark>&lt;/b&gt; logs')
+        self.assertIsNone(response.data['next'])
+
+    def test_message_hits_are_ranked_and_keyset_paginated(self):
+        self.add_chat('Ranked', 'kafka', 'kafka kafka consumer lag', *[f'kafka note {i}' for i in range(4)])
+
+        response = self.client.get('/api/v1/chat/search/', {'q': 'kafka', 'limit': 2})
+        snippets = [hit['snippet'] for hit in response.data['results']]
+        self.assertEqual(snippets[0], '<mark>kafka</mark> <mark>kafka</mark> consumer lag')
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data['results'])
+        scores = [hit['score'] for page in pages for hit in page]
+        self.assertEqual([len(page) for page in pages], [2, 2, 2])
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len({hit['snippet'] for page in pages for hit in page}), 6)
+
+        self.assertEqual(self.client.get('/api/v1/chat/search/', {'q': 'kafka', 'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/chat/search/').status_code, 400)
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def photo(width, height, orientation=None):
+    """A textured JPEG with camera EXIF, and an orientation tag when given"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    Image.effect_noise((width // 8, height // 8), 64).resize((width, height)).convert('RGB').save(buffer, 'JPEG', quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+class InMemoryMediaMixin:
+    """Keeps chat attachments written by a test out of S3"""
+    in_memory_fields = (
+        (MessageContent, 'file_content'), (MessageContent, 'optimized_file'),
+        (AttachmentBlob, 'file'), (AttachmentBlob, 'optimized_file'),
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.storage = InMemoryStorage()
+        for model, name in self.in_memory_fields:
+            patcher = mock.patch.object(model._meta.get_field(name), 'storage', self.storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        attachment_service.encoded_cache.clear()
+
+
+@override_settings(STREAM_FLUSH_INTERVAL=60)
+class DirectUploadTests(InMemoryMediaMixin, APITestCase):
+    # Presigned POSTs are made for the S3 storage of MessageContent.file_content
+    in_memory_fields = InMemoryMediaMixin.in_memory_fields[1:]
+
+    def setUp(self):
+        super().setUp()
+        self.user = AppUser.objects.create_user(email='uploads@example.com')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create(user=self.user, title='Chat')
+        for target, attribute, value in [
+            (ChatService, 'invoke_model', lambda *args, **kwargs: bedrock_stream()),
+            (ChatService, 'prepare_message_history', lambda *args, **kwargs: []),
+            (MemoryExtractionService, 'extract_memories_from_chat', lambda *args, **kwargs: []),
+        ]:
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def presign(self, **data):
+        return self.client.post('/api/v1/chat/uploads/presign/', {
+            'filename': '../My photo.png', 'content_type': 'image/png', 'size': 1000,
+            'sha256': base64.b64encode(hashlib.sha256(b'file').digest()).decode(), **data
+        })
+
+    def uploaded(self, data, header=None, size=None):
+        """Stands in for S3 holding ``data``: its header, the checksum S3 verified and the object"""
+        patchers = [
+            mock.patch.object(upload_service, 'read_header', return_value=(header or data[:65536], size or len(data))),
+            mock.patch.object(upload_service, 'read_checksum', return_value=hashlib.sha256(data).hexdigest()),
+            mock.patch.object(upload_service, 'read_object', return_value=data),
+        ]
+        mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        return mocks
+
+    def send(self, *keys):
+        response = self.client.post(
+            '/api/v1/chat/chat/', {'chat_id': str(self.chat.id), 'message': 'Look', 'file_keys': list(keys)},
+            format='json'
+        )
+        if response.status_code == 200:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_presigned_post_is_scoped_to_the_user_declared_size_and_checksum(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, 201)
+        key = response.data['key']
+        self.assertTrue(key.startswith(f'chat_contents/uploads/{self.user.pk}/'))
+        self.assertTrue(key.endswith('/My_photo.png'))
+        self.assertEqual(response.data['fields']['key'], f'media/{key}')
+        policy = json.loads(base64.b64decode(response.data['fields']['policy']))
+        self.assertIn(['content-length-range', 1, 1000], policy['conditions'])
+        checksum = base64.b64encode(hashlib.sha256(b'file').digest()).decode()
+        self.assertIn({'x-amz-checksum-sha256': checksum}, policy['conditions'])
+        self.assertEqual(response.data['fields']['x-amz-checksum-sha256'], checksum)
+
+        self.assertEqual(self.presign(content_type='application/zip').status_code, 400)
+        self.assertEqual(self.presign(size=5 * 1024 * 1024).status_code, 400)
+        self.assertEqual(self.presign(size='lots').status_code, 400)
+        self.assertEqual(self.presign(sha256='').status_code, 400)
+        self.assertEqual(self.presign(sha256='bm90IGEgZGlnZXN0').status_code, 400)
+        self.assertTrue(self.presign(filename='..').data['key'].endswith('/file'))
+
+    def test_message_attaches_uploads_checked_from_their_header(self):
+        key = self.presign().data['key']
+        read_header, _, _ = self.uploaded(png(40, 30), size=1000)
+        self.assertEqual(self.send(key).status_code, 200)
+        read_header.assert_called_once_with(key)
+        content = MessageContent.objects.get(message__message_pair__chat=self.chat, content_type='image')
+        self.assertEqual((content.file_content.name, content.mime_type), (key, 'image/png'))
+        # Already small and clean: sent as it is
+        self.assertFalse(content.optimized_file)
+
+    def test_documents_are_never_downloaded(self):
+        key = self.presign(filename='notes.pdf', content_type='application/pdf').data['key']
+        _, _, read_object = self.uploaded(b'%PDF-1.4\n' + b'0' * 2000)
+        self.assertEqual(self.send(key).status_code, 200)
+        read_object.assert_not_called()
+        content = MessageContent.objects.get(message__message_pair__chat=self.chat, content_type='document')
+        self.assertEqual((content.file_content.name, content.blob.file.name), (key, key))
+
+    def test_large_upload_gets_a_model_derivative(self):
+        key = self.presign(filename='IMG_0001.jpg', content_type='image/jpeg').data['key']
+        _, _, read_object = self.uploaded(photo(3000, 2000, orientation=6))
+        self.assertEqual(self.send(key).status_code, 200)
+        read_object.assert_called_once_with(key)
+        content = MessageContent.objects.get(message__message_pair__chat=self.chat, content_type='image')
+        self.assertEqual(content.file_content.name, key)
+        self.assertTrue(content.optimized_file.name.startswith('chat_contents/optimized/'))
+        with Image.open(content.optimized_file) as image:
+            self.assertEqual(image.size, (875, 1313))
+
+    def test_duplicate_upload_is_matched_on_its_checksum_and_dropped(self):
+        keys = [self.presign(filename='IMG_0001.jpg', content_type='image/jpeg').data['key'] for _ in range(2)]
+        _, _, read_object = self.uploaded(photo(600, 400))
+        with mock.patch.object(self.storage, 'delete') as delete, self.captureOnCommitCallbacks(execute=True):
+            for key in keys:
+                self.assertEqual(self.send(key).status_code, 200)
+        delete.assert_called_once_with(keys[1])
+        # Only the first copy was downloaded, for its derivative
+        read_object.assert_called_once_with(keys[0])
+        contents = MessageContent.objects.filter(message__message_pair__chat=self.chat, content_type='image')
+        self.assertEqual(set(contents.values_list('file_content', flat=True)), {keys[0]})
+        self.assertEqual(AttachmentBlob.objects.get().file.name, keys[0])
+
+    def test_rejects_bad_uploads_before_calling_the_model(self):
+        key = self.presign().data['key']
+        for header, size in [(png(9000, 10), 1000), (b'PK\x03\x04 zip', 1000), (png(40, 30), 4 * 1024 * 1024)]:
+            with mock.patch.object(upload_service, 'read_header', return_value=(header, size)), \
+                    mock.patch.object(upload_service, 'read_checksum', return_value='0' * 64):
+                self.assertEqual(self.send(key).status_code, 400)
+        with mock.patch.object(upload_service, 'read_header', return_value=(png(40, 30), 1000)), \
+                mock.patch.object(upload_service, 'read_checksum', return_value=None):
+            self.assertEqual(self.send(key).status_code, 400)
+        with mock.patch.object(upload_service, 'read_header') as read_header:
+            self.assertEqual(self.send('chat_contents/uploads/someone-else/x/a.png').status_code, 400)
+            self.assertEqual(self.send(f'chat_contents/uploads/{self.user.pk}/../other/a.png').status_code, 400)
+        read_header.assert_not_called()
+        self.assertFalse(MessagePair.objects.filter(chat=self.chat).exists())
+
+
+@override_settings(STREAM_FLUSH_INTERVAL=60)
+class FileDescriptorTests(InMemoryMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = AppUser.objects.create_user(email='describe@example.com')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create(user=self.user, title='Chat')
+        for target, attribute, value in [
+            (ChatService, 'invoke_model', lambda *args, **kwargs: bedrock_stream()),
+            (ChatService, 'prepare_message_history', lambda *args, **kwargs: []),
+            (MemoryExtractionService, 'extract_memories_from_chat', lambda *args, **kwargs: []),
+        ]:
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_one_pass_finds_type_size_hash_and_dimensions(self):
+        data = photo(1200, 900)
+        upload = SimpleUploadedFile('IMG_0001.jpg', data)
+        with mock.patch.object(Image.Image, 'load') as load:
+            descriptor = describe_file(upload)
+        load.assert_not_called()
+        self.assertEqual(
+            (descriptor.mime_type, descriptor.kind, descriptor.size, descriptor.width, descriptor.height),
+            ('image/jpeg', 'image', len(data), 1200, 900)
+        )
+        self.assertEqual(descriptor.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(upload.tell(), 0)
+
+    def test_stops_at_the_first_invalid_chunk(self):
+        oversized = SimpleUploadedFile('big.png', png(40, 30) + bytes(5 * 1024 * 1024))
+        with self.assertRaisesMessage(ValidationError, '3.75MB'):
+            describe_file(oversized)
+        self.assertLess(oversized.tell(), 4 * 1024 * 1024)
+        with self.assertRaisesMessage(ValidationError, '8000x8000'):
+            describe_file(SimpleUploadedFile('wide.png', png(9000, 10)))
+        with self.assertRaisesMessage(ValidationError, 'Unsupported'):
+            describe_file(SimpleUploadedFile('a.zip', b'PK\x03\x04 zip'))
+
+    def send(self, *files):
+        response = self.client.post('/api/v1/chat/chat/', {
+            'chat_id': str(self.chat.id), 'message': 'Look', 'files': list(files)
+        }, format='multipart')
+        if response.status_code == 200:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_posted_files_are_sniffed_once(self):
+        with mock.patch('chat.utils.file_validators.magic.from_buffer', wraps=magic.from_buffer) as sniff:
+            response = self.send(
+                SimpleUploadedFile('IMG_0001.jpg', photo(1200, 900)),
+                SimpleUploadedFile('notes.txt', b'Meeting notes'),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sniff.call_count, 2)
+        contents = MessageContent.objects.filter(message__message_pair__chat=self.chat).exclude(content_type='text')
+        self.assertEqual(
+            sorted(contents.values_list('content_type', 'mime_type')),
+            [('document', 'text/plain'), ('image', 'image/jpeg')]
+        )
+
+    def test_per_message_limits_are_checked_before_anything_is_written(self):
+        response = self.send(*(SimpleUploadedFile(f'notes-{i}.txt', b'Meeting notes') for i in range(6)))
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Maximum 5 documents per message'))
+        self.assertFalse(MessagePair.objects.filter(chat=self.chat).exists())
+
+
+class ImagePipelineTests(InMemoryMediaMixin, APITestCase):
+    def test_derivative_is_upright_bounded_and_without_metadata(self):
+        model_image = optimize_for_model(photo(4000, 3000, orientation=6))
+        self.assertEqual((model_image.original_width, model_image.original_height), (4000, 3000))
+        self.assertEqual(model_image.mime_type, 'image/jpeg')
+        with Image.open(io.BytesIO(model_image.data)) as image:
+            self.assertEqual(image.size, (model_image.width, model_image.height))
+            # Rotated a quarter turn, then fitted to the pixel budget
+            self.assertLess(image.width, image.height)
+            self.assertLessEqual(max(image.size), image_pipeline.MAX_LONG_EDGE)
+            self.assertLessEqual(image.width * image.height, image_pipeline.MAX_PIXELS)
+            self.assertFalse(image.getexif())
+        self.assertLess(model_image.tokens, 1600)
+        self.assertLessEqual(model_image.tokens, model_image.original_tokens)
+
+    def test_jpegs_are_decoded_at_a_reduced_scale(self):
+        draft = JpegImagePlugin.JpegImageFile.draft
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, 'draft', autospec=True, side_effect=draft) as spy:
+            model_image = optimize_for_model(photo(4000, 3000))
+        spy.assert_called_once_with(mock.ANY, 'RGB', (1238, 928))
+        self.assertEqual((model_image.width, model_image.height), (1238, 928))
+
+    def test_oversized_images_are_refused_before_decoding(self):
+        with mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            self.assertIsNone(optimize_for_model(png(9000, 10)))
+        load.assert_not_called()
+
+    def test_small_clean_images_are_left_alone(self):
+        self.assertIsNone(optimize_for_model(png(40, 30)))
+        self.assertIsNone(optimize_for_model(b'not an image'))
+
+    def test_transparency_is_kept(self):
+        buffer = io.BytesIO()
+        bands = [Image.effect_noise((300, 150), 64).resize((2400, 1200)) for _ in range(4)]
+        Image.merge('RGBA', bands).save(buffer, 'PNG')
+        model_image = optimize_for_model(buffer.getvalue())
+        self.assertEqual((model_image.mime_type, model_image.width, model_image.height), ('image/webp', 1516, 758))
+        with Image.open(io.BytesIO(model_image.data)) as image:
+            self.assertEqual(image.mode, 'RGBA')
+
+    def test_history_sends_the_derivative(self):
+        user = AppUser.objects.create_user(email='images@example.com')
+        pair = MessagePair.objects.create(chat=Chat.objects.create(user=user, title='Chat'))
+        original = photo(2000, 1500)
+        ChatService.create_new_message(
+            ChatService.__new__(ChatService), pair, 'user', text='What is this?',
+            files=[SimpleUploadedFile('IMG_0001.jpg', original, content_type='image/jpeg')]
+        )
+        content = MessageContent.objects.get(message__message_pair=pair, content_type='image')
+        self.assertEqual((content.mime_type, content.optimized_mime_type), ('image/jpeg', 'image/jpeg'))
+        self.assertEqual(content.file_content.read(), original)
+
+        blocks = Message.objects.get(message_pair=pair).get_content()
+        image = base64.b64decode(blocks[1]['source']['data'])
+        self.assertEqual(blocks[1]['source']['media_type'], 'image/jpeg')
+        self.assertLess(len(image), len(original))
+        self.assertEqual(Image.open(io.BytesIO(image)).size, (1238, 928))
+
+
+class AttachmentBlobTests(InMemoryMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = AppUser.objects.create_user(email='blobs@example.com')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create(user=self.user, title='Chat')
+        self.service = ChatService.__new__(ChatService)
+
+    def attach(self, *files):
+        pair = MessagePair.objects.create(chat=self.chat)
+        self.service.create_new_message(pair, 'user', text='Look', files=list(files))
+        return pair
+
+    def test_duplicates_are_stored_and_optimized_once(self):
+        original = photo(2000, 1500)
+        with mock.patch.object(self.storage, 'save', wraps=self.storage.save) as save, \
+                mock.patch('chat.models.optimize_for_model', wraps=optimize_for_model) as optimize:
+            for name in ('IMG_0001.jpg', 'screenshot.jpg', 'IMG_0001.jpg'):
+                self.attach(SimpleUploadedFile(name, original))
+            self.attach(SimpleUploadedFile('notes.txt', b'Meeting notes'), SimpleUploadedFile('again.txt', b'Meeting notes'))
+        # The image and its derivative, then the document
+        self.assertEqual(save.call_count, 3)
+        optimize.assert_called_once()
+
+        blob = AttachmentBlob.objects.get(mime_type='image/jpeg')
+        self.assertEqual(blob.hash, hashlib.sha256(original).hexdigest())
+        self.assertEqual(blob.contents.count(), 3)
+        self.assertEqual(
+            set(blob.contents.values_list('file_content', 'optimized_file', 'optimized_mime_type')),
+            {(blob.file.name, blob.optimized_file.name, 'image/jpeg')}
+        )
+        self.assertEqual(AttachmentBlob.objects.get(mime_type='text/plain').contents.count(), 2)
+
+    def test_history_encodes_a_shared_image_once(self):
+        original = photo(800, 600)
+        pairs = [self.attach(SimpleUploadedFile('IMG_0001.jpg', original)) for _ in range(2)]
+        with mock.patch.object(self.storage, 'open', wraps=self.storage.open) as open_file:
+            blocks = [Message.objects.get(message_pair=pair).get_content()[1] for pair in pairs]
+        open_file.assert_called_once()
+        self.assertEqual(blocks[0], blocks[1])
+        self.assertEqual(base64.b64decode(blocks[0]['source']['data']), self.storage.open(
+            AttachmentBlob.objects.get().optimized_file.name
+        ).read())
+
+    def test_blobs_are_deleted_with_their_last_reference(self):
+        shared, single = photo(800, 600), b'Meeting notes'
+        first = self.attach(SimpleUploadedFile('IMG_0001.jpg', shared), SimpleUploadedFile('notes.txt', single))
+        second = self.attach(SimpleUploadedFile('IMG_0001.jpg', shared))
+        image = AttachmentBlob.objects.get(mime_type='image/jpeg')
+        names = [image.file.name, image.optimized_file.name]
+        Message.objects.get(message_pair=second).get_content()
+
+        self.assertEqual(self.client.delete(f'/api/v1/chat/message-pairs/{first.id}/delete/').status_code, 200)
+        self.assertEqual(list(AttachmentBlob.objects.values_list('mime_type', flat=True)), ['image/jpeg'])
+        self.assertTrue(all(self.storage.exists(name) for name in names))
+
+        # Files go once the deletion commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/v1/chat/message-pairs/{second.id}/delete/').status_code, 200)
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+        self.assertIsNone(attachment_service.encoded_cache.get(image.hash))
+
+    def test_deleting_a_chat_collects_its_blobs(self):
+        self.attach(SimpleUploadedFile('notes.txt', b'Meeting notes'))
+        other = Chat.objects.create(user=self.user, title='Other')
+        pair = MessagePair.objects.create(chat=other)
+        self.service.create_new_message(pair, 'user', files=[SimpleUploadedFile('notes.txt', b'Meeting notes')])
+
+        self.assertEqual(self.client.delete(f'/api/v1/chat/chats/{self.chat.id}/').status_code, 204)
+        self.assertEqual(AttachmentBlob.objects.get().contents.count(), 1)
+        self.assertEqual(self.client.delete(f'/api/v1/chat/chats/{other.id}/').status_code, 204)
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+
+class MessageWindowTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='window@example.com')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create(user=self.user, title='Long chat', system_prompt='Be brief')
+        for i in range(5):
+            pair = MessagePair.objects.create(chat=self.chat)
+            for role in ('user', 'assistant'):
+                message = Message.objects.create(message_pair=pair, role=role)
+                MessageContent.objects.create(message=message, content_type='text', text_content=f'{role} {i}')
+
+    def url(self):
+        return f'/api/v1/chat/chats/{self.chat.id}/messages/'
+
+    def test_newest_pairs_first_then_scroll_back(self):
+        response = self.client.get(self.url(), {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['system_prompt'], 'Be brief')
+        windows = [response.data['messages']]
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            windows.append(response.data['messages'])
+
+        texts = [[message['contents'][0]['text_content'] for message in window] for window in windows]
+        self.assertEqual(texts, [
+            ['user 3', 'assistant 3', 'user 4', 'assistant 4'],
+            ['user 1', 'assistant 1', 'user 2', 'assistant 2'],
+            ['user 0', 'assistant 0'],
+        ])
+        self.assertEqual(set(windows[0][0]['contents'][0]), {'id', 'content_type', 'text_content'})
+
+    def test_rejects_other_users_chats_and_bad_cursors(self):
+        self.assertEqual(self.client.get(self.url(), {'before': 'nope'}).status_code, 400)
+        self.client.force_authenticate(AppUser.objects.create_user(email='intruder@example.com'))
+        self.assertEqual(self.client.get(self.url()).status_code, 404)
+
+
+class ListingPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='pages@example.com')
+        self.client.force_authenticate(self.user)
+
+    def follow(self, url, params):
+        response = self.client.get(url, params)
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertNotIn('count', body)
+            pages.append([item['id'] for item in body['results']])
+            if not body['next']:
+                return pages
+            response = self.client.get(body['next'])
+
+    def test_chat_pages_follow_the_cursor_through_equal_timestamps(self):
+        chats = [Chat.objects.create(user=self.user, title=f'Chat {i}') for i in range(5)]
+        Chat.objects.filter(id__in=[chat.id for chat in chats[1:4]]).update(last_activity_at=chats[1].last_activity_at)
+        expected = [
+            str(chat.id) for chat in Chat.objects.filter(user=self.user).order_by('-last_activity_at', '-id')
+        ]
+
+        pages = self.follow('/api/v1/chat/chats/', {'page_size': 2})
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_memory_and_project_listings_use_cursors(self):
+        chat = Chat.objects.create(user=self.user, title='Source')
+        for i in range(3):
+            UserMemory.objects.create(
+                user=self.user, chat=chat, summary=f'Fact {i}', raw_content='x', category='preferences'
+            )
+            Project.objects.create(user=self.user, name=f'Project {i}')
+
+        self.assertEqual([len(page) for page in self.follow('/api/v1/chat/memories/', {'page_size': 2})], [2, 1])
+        self.assertEqual([len(page) for page in self.follow('/api/v1/chat/projects/', {'page_size': 2})], [2, 1])
+
+    def test_search_results_keep_page_numbers(self):
+        Chat.objects.create(user=self.user, title='Release plan')
+        response = self.client.get('/api/v1/chat/chats/', {'search': 'release'})
+        self.assertEqual(response.data['count'], 1)
+
+
+@override_settings(STREAM_FLUSH_INTERVAL=60)
+class ChatActivityTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='activity@example.com')
+        self.client.force_authenticate(self.user)
+        for target, attribute, value in [
+            (ChatService, 'invoke_model', lambda *args, **kwargs: bedrock_stream('Use a  \n form.')),
+            (MemoryExtractionService, 'extract_memories_from_chat', lambda *args, **kwargs: []),
+        ]:
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send(self, chat, message):
+        response = self.client.post('/api/v1/chat/chat/', {'chat_id': str(chat.id), 'message': message})
+        b''.join(response.streaming_content)
+
+    def test_turns_update_the_summary_and_move_the_chat_to_the_top(self):
+        older = Chat.objects.create(user=self.user, title='Older')
+        newer = Chat.objects.create(user=self.user, title='Newer')
+        self.send(older, 'How do I add a login page?')
+
+        older.refresh_from_db()
+        self.assertEqual(older.message_count, 2)
+        self.assertEqual(older.last_message_preview, 'Use a form. Done.')
+        self.assertGreater(older.last_activity_at, newer.last_activity_at)
+        results = self.client.get('/api/v1/chat/chats/').json()['results']
+        self.assertEqual([chat['title'] for chat in results], ['Older', 'Newer'])
+        self.assertEqual(results[0]['message_count'], 2)
+        self.assertEqual(results[0]['last_message_preview'], 'Use a form. Done.')
+
+    def test_long_previews_are_cut(self):
+        self.assertEqual(len(Chat.preview('word ' * 100)), Chat.PREVIEW_LENGTH)
+        self.assertTrue(Chat.preview('word ' * 100).endswith('\u2026'))
+
+    def test_deleting_a_pair_recomputes_the_summary(self):
+        chat = Chat.objects.create(user=self.user, title='Chat')
+        self.send(chat, 'First question')
+        self.send(chat, 'Second question')
+        chat.refresh_from_db()
+        self.assertEqual(chat.message_count, 4)
+
+        last_pair = chat.message_pairs.order_by('-created_at').first()
+        first_pair = chat.message_pairs.order_by('created_at').first()
+        MessageContent.objects.filter(message__message_pair=first_pair, message__role='assistant').update(
+            text_content='First answer'
+        )
+        self.client.delete(f'/api/v1/chat/message-pairs/{last_pair.id}/delete/')
+
+        chat.refresh_from_db()
+        self.assertEqual(chat.message_count, 2)
+        self.assertEqual(chat.last_message_preview, 'First answer')
+        self.assertEqual(chat.last_activity_at, first_pair.messages.order_by('-created_at').first().created_at)
+
+
+class FastReadPathTests(APITestCase):
+    """The values() read paths must render exactly what the serializers they bypass would"""
+
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='fast@example.com')
+        self.client.force_authenticate(self.user)
+        project = Project.objects.create(user=self.user, name='Project')
+        tags = [MemoryTag.objects.create(name=name) for name in ('python', 'django')]
+        for i in range(3):
+            chat = Chat.objects.create(user=self.user, project=project if i else None, title=f'Chat {i}')
+            memory = UserMemory.objects.create(
+                user=self.user, chat=chat, summary=f'Fact {i}', raw_content='x', category='work', confidence_score=0.75
+            )
+            memory.tags.set(tags[:i])
+
+    def assertRendersLike(self, url, serializer):
+        expected = json.loads(JSONRenderer().render(serializer.data))
+        self.assertEqual(self.client.get(url).json()['results'], expected)
+
+    def test_chat_list_matches_chat_serializer(self):
+        chats = Chat.objects.filter(user=self.user).order_by('-last_activity_at', '-id')
+        self.assertRendersLike('/api/v1/chat/chats/', ChatSerializer(chats, many=True))
+
+    def test_memory_list_matches_memory_list_serializer(self):
+        memories = UserMemoryListSerializer.setup_eager_loading(
+            UserMemory.objects.filter(user=self.user).order_by('-created_at', '-id')
+        )
+        self.assertRendersLike('/api/v1/chat/memories/', UserMemoryListSerializer(memories, many=True))
+
+
+@override_settings(STREAM_FLUSH_INTERVAL=60)
+class TokenQuotaTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = AppUser.objects.create_user(email='quota@example.com')
+        self.client.force_authenticate(self.user)
+        self.service = TokenQuotaService()
+        self.service.plans = {'free': PlanQuota(user_tokens=1000)}
+        self.chat = Chat.objects.create(user=self.user, title='Quota')
+        for target, attribute, value in [
+            (ChatService, 'invoke_model', lambda *args, **kwargs: bedrock_stream()),
+            (MemoryExtractionService, 'extract_memories_from_chat', lambda *args, **kwargs: []),
+        ]:
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def used(self, service=None):
+        return (service or self.service).get_status(self.user)['used']
+
+    def test_reserve_holds_the_estimate_and_takes_back_a_rejected_one(self):
+        self.service.reserve(self.user, 600)
+        self.assertEqual(self.used(), 600)
+        with self.assertRaises(QuotaExceeded) as raised:
+            self.service.reserve(self.user, 600)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(raised.exception.quota['remaining'], 400)
+        self.assertEqual(self.used(), 600)
+        self.service.reserve(self.user, 400)
+        self.assertEqual(self.used(), 1000)
+
+    def test_reconcile_replaces_the_estimate_once(self):
+        reservation = self.service.reserve(self.user, 600)
+        self.service.reconcile(reservation, 250)
+        self.assertEqual(self.used(), 250)
+        self.service.reconcile(reservation, 900)
+        self.service.release(reservation)
+        self.assertEqual(self.used(), 250)
+
+    def test_streamed_turns_are_charged_their_reported_usage(self):
+        response = self.client.post('/api/v1/chat/chat/', {'chat_id': str(self.chat.id), 'message': 'Hello'})
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(self.used(token_quota_service), 20)
+
+    def test_closing_an_unread_stream_releases_the_reservation(self):
+        response = self.client.post('/api/v1/chat/chat/', {'chat_id': str(self.chat.id), 'message': 'Hello'})
+        self.assertGreater(self.used(token_quota_service), 0)
+        response.close()
+        self.assertEqual(self.used(token_quota_service), 0)
+
+    def test_exhausted_budget_is_rejected_before_anything_is_written(self):
+        with mock.patch.dict(token_quota_service.plans, {'free': PlanQuota(user_tokens=100)}):
+            response = self.client.post('/api/v1/chat/chat/', {'chat_id': str(self.chat.id), 'message': 'Hello'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(response.data['retry_after']))
+        self.assertEqual(response.data['quota']['limit'], 100)
+        self.assertFalse(self.chat.message_pairs.exists())
+        self.assertEqual(self.used(token_quota_service), 0)
+
+
+class FakeEventStream:
+    """A Bedrock event stream that blocks before event ``hold_at`` until released or dropped"""
+
+    def __init__(self, text='Hi there', input_tokens=12, hold_at=None):
+        self.events = bedrock_stream(text)['body']
+        self.events[0] = {'chunk': {'bytes': json.dumps(
+            {'type': 'message_start', 'message': {'usage': {'input_tokens': input_tokens}}}
+        ).encode()}}
+        self.hold_at = hold_at
+        self.released = threading.Event()
+        self.dropped = threading.Event()
+        self.closed = False
+
+    def __iter__(self):
+        for i, event in enumerate(self.events):
+            if i == self.hold_at:
+                while not (self.released.wait(0.01) or self.dropped.is_set()):
+                    pass
+                if self.dropped.is_set():
+                    raise ConnectionError('Connection dropped')
+            yield event
+
+    def release(self):
+        self.released.set()
+
+    def close(self):
+        self.closed = True
+        self.dropped.set()
+
+
+class HedgedStreamTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.budget = HedgeBudget(max_per_minute=10)
+        self.opened = []
+
+    def opener(self, stream):
+        def open_stream():
+            self.opened.append(stream)
+            if isinstance(stream, Exception):
+                raise stream
+            return {'body': stream}
+        return open_stream
+
+    def race(self, primary, secondary, delay=0.02):
+        hedged = HedgedStream(
+            self.opener(primary), self.opener(secondary), delay, FirstTokenLatencyTracker(), self.budget
+        ).start()
+        text = ''.join(
+            json.loads(event['chunk']['bytes']).get('delta', {}).get('text', '') for event in hedged.body
+        )
+        for reader in hedged.readers.values():
+            if reader.ident is not None:
+                reader.join(timeout=2)
+                self.assertFalse(reader.is_alive())
+        return hedged, text
+
+    def test_fast_primary_is_not_hedged(self):
+        secondary = FakeEventStream('Secondary')
+        hedged, text = self.race(FakeEventStream('Primary'), secondary, delay=5)
+        self.assertEqual((hedged.winner, hedged.hedged, text), (PRIMARY, False, 'Primary Done.'))
+        self.assertNotIn(secondary, self.opened)
+        self.assertEqual(self.budget.stats()['hedged'], 0)
+
+    def test_secondary_wins_and_the_primary_is_dropped_and_charged(self):
+        primary = FakeEventStream('Primary', input_tokens=30, hold_at=1)
+        hedged, text = self.race(primary, FakeEventStream('Secondary', input_tokens=12))
+        self.assertEqual((hedged.winner, text), (SECONDARY, 'Secondary Done.'))
+        self.assertTrue(primary.dropped.is_set())
+        self.assertTrue(primary.closed)
+        stats = self.budget.stats()
+        self.assertEqual((stats['secondary_wins'], stats['extra_input_tokens']), (1, 30))
+
+    def test_primary_winning_after_the_hedge_charges_the_secondary(self):
+        primary = FakeEventStream('Primary', hold_at=0)
+        secondary = FakeEventStream('Secondary', input_tokens=25, hold_at=1)
+        threading.Timer(0.2, primary.release).start()
+        hedged, text = self.race(primary, secondary)
+        self.assertEqual((hedged.winner, text), (PRIMARY, 'Primary Done.'))
+        self.assertTrue(secondary.dropped.is_set())
+        stats = self.budget.stats()
+        self.assertEqual((stats['primary_wins_after_hedge'], stats['extra_input_tokens']), (1, 25))
+
+    def test_primary_error_surfaces_before_the_response(self):
+        error = ClientError({'Error': {'Code': 'ValidationException', 'Message': 'Bad'}}, 'InvokeModel')
+        with self.assertRaises(ClientError):
+            self.race(error, FakeEventStream('Secondary'), delay=5)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_throttled_primary_falls_back_at_once(self):
+        error = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Slow down'}}, 'InvokeModel')
+        hedged, text = self.race(error, FakeEventStream('Secondary'), delay=5)
+        self.assertEqual((hedged.winner, text), (SECONDARY, 'Secondary Done.'))
+
+    def test_exhausted_budget_waits_for_the_primary(self):
+        self.budget.max_per_minute = 0
+        primary = FakeEventStream('Primary', hold_at=0)
+        threading.Timer(0.2, primary.release).start()
+        hedged, text = self.race(primary, FakeEventStream('Secondary'))
+        self.assertEqual((hedged.winner, hedged.hedged, text), (PRIMARY, False, 'Primary Done.'))
+        self.assertEqual(len(self.opened), 1)
+        stats = self.budget.stats()
+        self.assertEqual((stats['budget_exhausted'], stats['hedged']), (1, 0))
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LLMResponseCache(ttl=60, max_entries=2)
+        self.calls = []
+
+    def call(self, value):
+        def fn():
+            self.calls.append(value)
+            return value
+        return fn
+
+    def test_keys_ignore_body_key_order(self):
+        self.assertEqual(
+            LLMResponseCache.make_key('model', '{"a": 1, "b": [2]}'), LLMResponseCache.make_key('model', {'b': [2], 'a': 1})
+        )
+        self.assertNotEqual(LLMResponseCache.make_key('model', {'a': 1}), LLMResponseCache.make_key('other', {'a': 1}))
+
+    def test_concurrent_misses_share_one_call(self):
+        release = threading.Event()
+
+        def slow():
+            self.calls.append('slow')
+            release.wait(2)
+            return {'text': 'shared'}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_call('key', slow))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.cache.stats()['coalesced'] < 4:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.calls, ['slow'])
+        self.assertEqual(results, [{'text': 'shared'}] * 5)
+        self.assertEqual(self.cache.get_or_call('key', self.call('again')), {'text': 'shared'})
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['coalesced'], stats['hits']), (1, 4, 1))
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch('chat.services.llm_cache.time.monotonic', return_value=1000.0) as clock:
+            self.cache.get_or_call('key', self.call('first'))
+            clock.return_value = 1059.0
+            self.assertEqual(self.cache.get_or_call('key', self.call('second')), 'first')
+            clock.return_value = 1061.0
+            self.assertEqual(self.cache.get_or_call('key', self.call('second')), 'second')
+        self.assertEqual(self.calls, ['first', 'second'])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.get_or_call('a', self.call('a'))
+        self.cache.get_or_call('b', self.call('b'))
+        self.cache.get_or_call('a', self.call('a2'))
+        self.cache.get_or_call('c', self.call('c'))
+        self.assertEqual(self.cache.get_or_call('a', self.call('a3')), 'a')
+        self.assertEqual(self.cache.get_or_call('b', self.call('b2')), 'b2')
+        self.assertEqual(self.calls, ['a', 'b', 'c', 'b2'])
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+
+    def test_bypass_neither_reads_nor_writes(self):
+        self.cache.get_or_call('key', self.call('cached'))
+        self.assertEqual(self.cache.get_or_call('key', self.call('fresh'), bypass=True), 'fresh')
+        self.assertEqual(self.cache.get_or_call('key', self.call('other')), 'cached')
+        self.assertEqual(self.cache.stats()['bypassed'], 1)
+        self.assertEqual(self.cache.lookup_or_call('key', self.call('other')), ('cached', True))
+        self.assertEqual(self.cache.lookup_or_call('new', self.call('new')), ('new', False))
+
+        factory = RequestFactory()
+        for value, bypass in [('1', True), ('true', True), ('Yes', True), ('0', False), ('', False)]:
+            request = factory.get('/', headers={BYPASS_HEADER: value})
+            self.assertEqual(cache_bypass_requested(request), bypass, value)
+        self.assertFalse(cache_bypass_requested(factory.get('/')))
+
+    def test_failed_calls_are_not_cached(self):
+        def failing():
+            self.calls.append('failed')
+            raise RuntimeError('Bedrock unavailable')
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_call('key', failing)
+        self.assertEqual(self.cache.get_or_call('key', self.call('retried')), 'retried')
+        self.assertEqual(self.calls, ['failed', 'retried'])
+        self.assertEqual(self.cache.stats()['size'], 1)
+
+
+class DeltaCoalescerTests(SimpleTestCase):
+    def test_first_delta_then_size_and_time_batched_frames(self):
+        now = [0.0]
+        relay = DeltaCoalescer(flush_interval=0.04, flush_bytes=8, clock=lambda: now[0])
+        frames = []
+        for at, delta in [(0.0, 'a'), (0.01, 'bcd'), (0.02, 'efghij'), (0.03, 'k'), (0.07, 'l'), (0.08, 'm')]:
+            now[0] = at
+            if relay.add(delta):
+                frames.append(relay.flush())
+            if delta == 'k':
+                # due 40ms after the size-triggered frame at 0.02
+                self.assertAlmostEqual(relay.time_until_flush(), 0.03)
+        self.assertTrue(relay.has_pending)
+        frames.append(relay.flush())
+
+        self.assertEqual(frames, ['a', 'bcdefghij', 'kl', 'm'])
+        self.assertEqual(relay.text, 'abcdefghijklm')
+        self.assertIsNone(relay.time_until_flush())
+
+    def test_held_text_is_flushed_while_the_model_pauses(self):
+        stream = FakeEventStream(text='Hi', hold_at=3)
+        relay = DeltaCoalescer(flush_interval=0.05)
+        frames = []
+        for chunk in with_flush_deadline(stream, relay):
+            if chunk is None:
+                frames.append(relay.flush())
+                stream.release()
+                continue
+            event = json.loads(chunk['chunk']['bytes'])
+            if event['type'] == 'content_block_delta' and relay.add(event['delta']['text']):
+                frames.append(relay.flush())
+        self.assertFalse(relay.has_pending)
+        # ' Done.' was held back, then sent at its deadline while the stream was stalled
+        self.assertEqual(frames, ['Hi', ' Done.'])
+        self.assertTrue(stream.closed)
+
+    def test_source_errors_reach_the_reader(self):
+        stream = FakeEventStream(hold_at=1)
+        stream.dropped.set()
+        with self.assertRaises(ConnectionError):
+            list(with_flush_deadline(stream, DeltaCoalescer()))
@@ -7,7 +7,8 @@ from .views import (
     SavedSystemPromptRetrieveUpdateDestroyView,
     ProjectChatsView, get_chat_token_usage, edit_message, toggle_message_pair,
     delete_message_pair, validate_file_view, UserMemoryViewSet, MemoryTagViewSet,
-    extract_memories_from_chat, memory_stats, get_user_context
+    extract_memories_from_chat, memory_stats, get_user_context, llm_cache_stats,
+    token_quota_status, bedrock_hedge_stats, search_messages, presign_upload_view
 )
 from rest_framework.routers import DefaultRouter
 
@@ -41,11 +42,23 @@ urlpatterns = [
     # Token usage
     path('chats/<str:chat_id>/tokens/', get_chat_token_usage, name='chat-tokens'),
     
+    # Message-level search
+    path('search/', search_messages, name='search-messages'),
+
     # Memory related URLs
     path('chats/<str:chat_id>/extract-memories/', extract_memories_from_chat, name='extract-memories'),
     path('memory/stats/', memory_stats, name='memory-stats'),
     path('memory/context/', get_user_context, name='user-context'),
 
+    # LLM response cache and hedging metrics (staff only)
+    path('llm-cache/stats/', llm_cache_stats, name='llm-cache-stats'),
+    path('hedging/stats/', bedrock_hedge_stats, name='bedrock-hedge-stats'),
+
+    # Token quota
+    path('quota/', token_quota_status, name='token-quota'),
+
     # File validation
     path('validate-file/', validate_file_view, name='validate-file'),
+    # Direct-to-S3 attachment uploads
+    path('uploads/presign/', presign_upload_view, name='presign-upload'),
 ]
@@ -1,34 +1,157 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from PIL import Image
+import hashlib
+import io
 import magic
 import os
 
+VALID_MIME_TYPES = {
+    'image': ['image/jpeg', 'image/png', 'image/gif', 'image/webp'],
+    'document': ['application/pdf', 'text/plain', 'text/markdown',
+                'application/msword',
+                'application/vnd.openxmlformats-officedocument.wordprocessingml.document']
+}
+MAX_IMAGE_BYTES = int(3.75 * 1024 * 1024)
+MAX_DOCUMENT_BYTES = int(4.5 * 1024 * 1024)
+MAX_IMAGE_SIDE = 8000
+# Enough for libmagic, and for PIL to find the dimensions past most EXIF blocks
+SNIFF_BYTES = 64 * 1024
+# Past this, an image's dimensions are left to Bedrock, as for direct uploads
+MAX_HEADER_BYTES = 1024 * 1024
+MAX_IMAGES_PER_MESSAGE = 20
+MAX_DOCUMENTS_PER_MESSAGE = 5
+
+
+@dataclass
+class FileDescriptor:
+    """
+    What one pass over an uploaded file found. Only describe_file builds
+    these, after validating, so later steps use the fields instead of
+    reading the file again.
+    """
+    file: Any = field(repr=False)
+    mime_type: str
+    size: int
+    sha256: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+    @property
+    def kind(self):
+        return content_kind(self.mime_type)
+
 def validate_image_size(image):
-    if image.size > 3.75 * 1024 * 1024:  # 3.75MB
+    if image.size > MAX_IMAGE_BYTES:
         raise ValidationError('Image size cannot exceed 3.75MB')
-    
+
     img = Image.open(image)
-    if img.height > 8000 or img.width > 8000:
-        raise ValidationError('Image dimensions cannot exceed 8000x8000 pixels')
+    validate_image_dimensions(img.width, img.height)
 
 def validate_document_size(document):
-    if document.size > 4.5 * 1024 * 1024:  # 4.5MB
+    if document.size > MAX_DOCUMENT_BYTES:
+        raise ValidationError('Document size cannot exceed 4.5MB')
+
+def content_kind(mime_type):
+    """'image' or 'document' for an accepted mime type, None otherwise"""
+    return next((kind for kind, types in VALID_MIME_TYPES.items() if mime_type in types), None)
+
+def validate_declared_upload(mime_type, size):
+    """Checks what a client says it will upload, before it gets an upload URL"""
+    kind = content_kind(mime_type)
+    if kind is None:
+        raise ValidationError(f'Unsupported file type: {mime_type}')
+    if kind == 'image' and size > MAX_IMAGE_BYTES:
+        raise ValidationError('Image size cannot exceed 3.75MB')
+    if kind == 'document' and size > MAX_DOCUMENT_BYTES:
         raise ValidationError('Document size cannot exceed 4.5MB')
+    return kind
+
+def validate_image_dimensions(width, height):
+    if height > MAX_IMAGE_SIDE or width > MAX_IMAGE_SIDE:
+        raise ValidationError('Image dimensions cannot exceed 8000x8000 pixels')
+
+def validate_attachment_counts(mime_types):
+    """Per-message limits, checked once for all of a message's files"""
+    kinds = [content_kind(mime_type) for mime_type in mime_types]
+    if kinds.count('image') > MAX_IMAGES_PER_MESSAGE:
+        raise ValidationError(f'Maximum {MAX_IMAGES_PER_MESSAGE} images per message')
+    if kinds.count('document') > MAX_DOCUMENTS_PER_MESSAGE:
+        raise ValidationError(f'Maximum {MAX_DOCUMENTS_PER_MESSAGE} documents per message')
+
+def describe_file(upload, chunk_size=SNIFF_BYTES):
+    """
+    Validates an uploaded file in one streaming pass and returns its
+    FileDescriptor: size and SHA-256 over every chunk, the type sniffed from
+    the first one, and image dimensions from the header alone; pixels are
+    never decoded and the file is never held whole. Stops as soon as the
+    file is too large for its type. Raises ValidationError.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    mime_type = None
+    header = None
+    dimensions = None
+    upload.seek(0)
+    # Fixed-size reads: chunks() of an in-memory upload is the whole file at once
+    for chunk in iter(lambda: upload.read(chunk_size), b''):
+        if mime_type is None:
+            mime_type = magic.from_buffer(chunk[:1024], mime=True)
+            if content_kind(mime_type) is None:
+                raise ValidationError(f'Unsupported file type: {mime_type}')
+            if content_kind(mime_type) == 'image':
+                header = b''
+        size += len(chunk)
+        validate_declared_upload(mime_type, size)
+        digest.update(chunk)
+        if header is not None:
+            header += chunk
+            dimensions = _image_dimensions(header)
+            if dimensions is not None:
+                validate_image_dimensions(*dimensions)
+            if dimensions is not None or len(header) >= MAX_HEADER_BYTES:
+                header = None
+    upload.seek(0)
+    if mime_type is None:
+        raise ValidationError('The uploaded file is empty')
+
+    width, height = dimensions or (None, None)
+    return FileDescriptor(
+        file=upload, mime_type=mime_type, size=size, sha256=digest.hexdigest(), width=width, height=height
+    )
+
+def _image_dimensions(header):
+    """Width and height from an image's leading bytes, None until they hold the header"""
+    try:
+        # Image.open only parses headers; nothing is decoded or allocated for the pixels
+        return Image.open(io.BytesIO(header)).size
+    except Image.DecompressionBombError:
+        raise ValidationError('Image dimensions cannot exceed 8000x8000 pixels')
+    except Exception:
+        return None
+
+def validate_upload_header(header, size):
+    """
+    Validates an upload from its first bytes and total size, without the
+    rest of the file. Returns the sniffed mime type. Image dimensions are
+    checked when the header holds them.
+    """
+    mime_type = magic.from_buffer(header[:1024], mime=True)
+    if validate_declared_upload(mime_type, size) == 'image':
+        dimensions = _image_dimensions(header)
+        # Dimensions past the sniffed bytes are left to Bedrock, which rejects oversized images itself
+        if dimensions is not None:
+            validate_image_dimensions(*dimensions)
+    return mime_type
 
 def validate_mime_type(upload):
-    valid_mime_types = {
-        'image': ['image/jpeg', 'image/png', 'image/gif', 'image/webp'],
-        'document': ['application/pdf', 'text/plain', 'text/markdown',
-                    'application/msword', 
-                    'application/vnd.openxmlformats-officedocument.wordprocessingml.document']
-    }
-    
     mime_type = magic.from_buffer(upload.read(1024), mime=True)
     upload.seek(0)  # Reset file pointer
-    
-    if not any(mime_type in types for types in valid_mime_types.values()):
+
+    if content_kind(mime_type) is None:
         raise ValidationError(f'Unsupported file type: {mime_type}')
-    
-    return mime_type
\ No newline at end of file
+
+    return mime_type
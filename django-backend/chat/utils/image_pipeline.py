@@ -0,0 +1,128 @@
+"""
+Model-ready derivatives of uploaded images.
+
+Claude bills an image by its pixel area (about width * height / 750
+tokens) and scales anything past ~1568 px on the long edge, or ~1.15
+megapixels, down on its side anyway. Each turn resends the whole history,
+so images are normalized once at upload: rotated upright from their EXIF
+orientation, fitted to that bound, stripped of metadata and re-encoded.
+The original is kept for display; the derivative is what gets sent.
+"""
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import ExifTags, Image, ImageOps
+
+from .file_validators import MAX_IMAGE_SIDE
+
+logger = logging.getLogger(__name__)
+
+MAX_LONG_EDGE = 1568
+MAX_PIXELS = 1_150_000
+JPEG_QUALITY = 85
+WEBP_QUALITY = 85
+
+
+@dataclass
+class ModelImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    original_bytes: int
+
+    @property
+    def extension(self) -> str:
+        return {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp'}[self.mime_type]
+
+    @property
+    def tokens(self) -> int:
+        return estimate_image_tokens(self.width, self.height)
+
+    @property
+    def original_tokens(self) -> int:
+        return estimate_image_tokens(*model_size(self.original_width, self.original_height))
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    return math.ceil(width * height / 750)
+
+
+def fit_size(width: int, height: int) -> Tuple[int, int]:
+    """The largest size with the same aspect ratio inside MAX_LONG_EDGE and MAX_PIXELS"""
+    scale = min(1.0, MAX_LONG_EDGE / max(width, height), math.sqrt(MAX_PIXELS / (width * height)))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def model_size(width: int, height: int) -> Tuple[int, int]:
+    """What the model would scale an image sent as-is down to, for token estimates"""
+    return fit_size(width, height)
+
+
+def _encode(image: Image.Image, format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+def optimize_for_model(data: bytes) -> Optional[ModelImage]:
+    """
+    The model derivative of an encoded image, or None when the original is
+    already as good: not rotated, within bounds, without metadata and not
+    larger than a re-encode. Animated images are left alone.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_format = image.format
+        original_size = image.size
+        # The header is enough to refuse what upload validation would have; nothing is decoded yet
+        if max(original_size) > MAX_IMAGE_SIDE:
+            logger.warning(f"Image of {original_size[0]}x{original_size[1]} is too large for a model derivative")
+            return None
+        if original_format == 'JPEG':
+            # Let the decoder scale down by up to 8x on its own, to no less than the size wanted
+            image.draft('RGB', fit_size(*original_size))
+        image.load()
+    except Exception as e:
+        logger.warning(f"Could not decode image for the model derivative: {e}")
+        return None
+    if getattr(image, 'is_animated', False):
+        return None
+
+    exif = image.getexif()
+    has_metadata = bool(exif) or any(key in image.info for key in ('icc_profile', 'xmp', 'exif'))
+    rotated = exif.get(ExifTags.Base.Orientation, 1) != 1
+    upright = ImageOps.exif_transpose(image) if rotated else image
+    size = fit_size(*upright.size)
+    if size != upright.size:
+        upright = upright.resize(size, Image.Resampling.LANCZOS)
+
+    # Few colours (screenshots, diagrams) survive an adaptive palette, which PNG stores far smaller
+    flat = original_format in ('PNG', 'GIF') and image.getcolors(256) is not None
+    if upright.mode in ('RGBA', 'LA', 'PA') or (upright.mode == 'P' and 'transparency' in upright.info):
+        rgba = upright.convert('RGBA')
+        # WebP keeps transparency at a fraction of PNG's size
+        candidates = [(_encode(rgba, 'WEBP', quality=WEBP_QUALITY, method=4), 'image/webp')]
+        if flat:
+            candidates.append((_encode(rgba.quantize(256, method=Image.Quantize.FASTOCTREE), 'PNG', optimize=True), 'image/png'))
+    else:
+        rgb = upright.convert('RGB')
+        candidates = [(_encode(rgb, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True), 'image/jpeg')]
+        if original_format in ('PNG', 'GIF'):
+            # Screenshots and diagrams: lossless is often smaller, and keeps text crisp
+            candidates.append((_encode(rgb.quantize(256) if flat else rgb, 'PNG', optimize=True), 'image/png'))
+    encoded, mime_type = min(candidates, key=lambda candidate: len(candidate[0]))
+
+    # Rotation and metadata always need the re-encode; a resize alone only when it is smaller,
+    # since the model would scale the original down itself at the same token cost
+    if not (rotated or has_metadata) and len(encoded) >= len(data):
+        return None
+    return ModelImage(
+        data=encoded, mime_type=mime_type, width=upright.width, height=upright.height,
+        original_width=original_size[0], original_height=original_size[1], original_bytes=len(data),
+    )
@@ -0,0 +1,22 @@
+import base64
+
+import orjson
+
+
+def encode_cursor(*key) -> str:
+    """
+    Opaque, URL-safe cursor for keyset pagination: the sort key of the last
+    row a client has seen, which the next page seeks past.
+    """
+    return base64.urlsafe_b64encode(orjson.dumps(key)).decode()
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """The key in ``cursor``, checked against ``types``; ValueError for anything encode_cursor didn't make"""
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != len(types) or not all(map(isinstance, key, types)):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
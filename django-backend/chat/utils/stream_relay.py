@@ -0,0 +1,114 @@
+import inspect
+import io
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+
+class DeltaCoalescer:
+    """
+    Batches streamed text deltas into larger client frames.
+
+    Deltas are buffered until ``flush_interval`` seconds have passed since
+    the last frame or ``flush_bytes`` characters are pending; the first delta
+    is always flushed straight away so time-to-first-token is unchanged. The
+    full response is accumulated in a ``StringIO`` instead of repeated string
+    concatenation.
+    """
+
+    def __init__(self, flush_interval: float = 0.04, flush_bytes: int = 512,
+                 clock: Callable[[], float] = time.monotonic):
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.clock = clock
+        self._text = io.StringIO()
+        self._pending = []
+        self._pending_size = 0
+        self._last_flush = None
+
+    def add(self, delta: str) -> bool:
+        """Buffer ``delta`` and return True when a frame should be flushed"""
+        self._text.write(delta)
+        self._pending.append(delta)
+        self._pending_size += len(delta)
+        if self._last_flush is None:
+            return True
+        return (self._pending_size >= self.flush_bytes
+                or self.clock() - self._last_flush >= self.flush_interval)
+
+    def flush(self) -> str:
+        """Return and clear the pending text"""
+        frame = ''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        self._last_flush = self.clock()
+        return frame
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds until the pending text is due as a frame, or None when nothing is pending"""
+        if not self._pending:
+            return None
+        if self._last_flush is None:
+            return 0.0
+        return max(0.0, self._last_flush + self.flush_interval - self.clock())
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    @property
+    def text(self) -> str:
+        """Everything received so far"""
+        return self._text.getvalue()
+
+
+_END = object()
+
+
+def with_flush_deadline(source: Iterable, relay: DeltaCoalescer) -> Iterator:
+    """
+    Yield the items of ``source``, and ``None`` whenever ``relay``'s pending
+    text falls due before the next item arrives, so a frame held back by
+    ``add`` still goes out on time when the model pauses. ``source`` is read
+    on a helper thread, since a blocking read can't otherwise be interrupted.
+    Closing this iterator stops the reader: a ``source`` with ``close()``
+    (like botocore's EventStream) is closed, a generator is closed by the
+    reader after its next item.
+    """
+    items = queue.Queue()
+    stopped = threading.Event()
+
+    def read():
+        iterator = iter(source)
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                items.put((item, None))
+        except Exception as e:
+            items.put((_END, e))
+        else:
+            items.put((_END, None))
+        finally:
+            if inspect.isgenerator(iterator):
+                iterator.close()
+
+    threading.Thread(target=read, daemon=True).start()
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=relay.time_until_flush())
+            except queue.Empty:
+                yield None
+                continue
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stopped.set()
+        close = getattr(source, 'close', None)
+        if close is not None and not inspect.isgenerator(source):
+            close()
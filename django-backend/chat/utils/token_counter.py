@@ -14,11 +14,7 @@ def validate_token_count(text: str, max_tokens: int = 160000) -> bool:  # 80% of
 
 def get_token_usage_stats(chat):
     """Get detailed token usage stats for a chat"""
-    message_tokens = sum(
-        message.token_count 
-        for pair in chat.message_pairs.all()
-        for message in pair.messages.all()
-    )
+    message_tokens = chat.message_tokens
     
     project_tokens = chat.project.total_knowledge_tokens if chat.project else 0
     total_tokens = message_tokens + project_tokens
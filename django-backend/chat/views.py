@@ -1,27 +1,40 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.http import StreamingHttpResponse
+from django.conf import settings
 from rest_framework import generics, permissions
-from .models import Chat, MessagePair, Message, SavedSystemPrompt, Project, ProjectKnowledge, MessageContent, UserMemory, MemoryTag
-from .serializers import ChatSerializer, MessageSerializer,SystemPromptSerializer, ProjectSerializer, ProjectKnowledgeSerializer, UserMemorySerializer, UserMemoryListSerializer, MemoryTagSerializer
+from .models import Chat, MessagePair, Message, SavedSystemPrompt, Project, ProjectKnowledge, MessageContent, UserMemory, MemoryTag, TokenUsage
+from .serializers import ChatSerializer, MessageSerializer,SystemPromptSerializer, ProjectSerializer, ProjectKnowledgeSerializer, UserMemorySerializer, UserMemoryListSerializer, MemoryTagSerializer, memory_tags_prefetch, compact_messages
 import os
 import json
 import boto3
+import orjson
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from .utils.token_counter import count_tokens,get_token_usage_stats
+from .utils.stream_relay import DeltaCoalescer, with_flush_deadline
 from .services.chat_service import ChatService
-from .utils.file_validators import validate_image_size, validate_document_size, validate_mime_type
+from .utils.file_validators import describe_file, validate_attachment_counts
 from django.core.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from django.db.models import Q, prefetch_related_objects
 from django.utils import timezone
 from django.db import models
 from .services.memory_service import MemoryExtractionService
+from .services.llm_cache import llm_response_cache, cache_bypass_requested
+from .services.quota_service import token_quota_service, QuotaExceeded, ReservedStream
+from .services.hedging import hedge_budget, latency_tracker
+from .services.search_service import get_search_backend
+from .services.upload_service import MAX_UPLOADS_PER_MESSAGE, inspect_upload, presign_upload
+from .services.attachment_service import collect_garbage, referenced_blobs
+from .utils.keyset import decode_cursor, encode_cursor
+from rest_framework.utils.urls import replace_query_param
+from datetime import datetime
+import uuid
 
 
 # Initialize Bedrock client
@@ -29,7 +42,8 @@ bedrock_runtime = boto3.client(
     service_name="bedrock-runtime",
     region_name="us-west-2",
     aws_access_key_id=os.getenv("AWS_BEDROCK_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY")
+    aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY"),
+    endpoint_url=os.getenv("AWS_BEDROCK_ENDPOINT_URL")  # local stand-in for load tests
 )   
 CLAUDE_35_SONNET_V1_0 = "anthropic.claude-3-5-sonnet-20240620-v1:0"
 CLAUDE_35_SONNET_V2 = "anthropic.claude-3-5-sonnet-20241022-v2:0"
@@ -40,20 +54,50 @@ CLAUDE_35_HAIKU_V1_0 = "anthropic.claude-3-5-haiku-20241022-v1:0"
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def claude_chat_view(request):
-    chat_service = ChatService()
+    bypass_cache = cache_bypass_requested(request)
+    chat_service = ChatService(bypass_cache=bypass_cache)
     
-    if not request.data.get('message') and not request.FILES:
+    # Keys of files the client uploaded straight to S3 (see presign_upload_view)
+    if hasattr(request.data, 'getlist'):
+        file_keys = request.data.getlist('file_keys')
+    else:
+        file_keys = request.data.get('file_keys') or []
+    if not request.data.get('message') and not request.FILES and not file_keys:
         return Response(
             {'error': 'Either message or files must be provided'}, 
             status=400
         )
 
+    chat_id = request.data.get('chat_id')
+    message_text = request.data.get('message', '')
+    project_id = request.data.get('project_id')
+    files = request.FILES.getlist('files', [])
+    if not isinstance(file_keys, list) or len(file_keys) > MAX_UPLOADS_PER_MESSAGE:
+        return Response({'error': f'At most {MAX_UPLOADS_PER_MESSAGE} uploaded files per message'}, status=400)
+    try:
+        # One streaming pass per posted file; later steps reuse what it found
+        files = [describe_file(file) for file in files]
+        # Header-only checks: a ranged GET and a HEAD per object, the bytes stay in S3
+        uploads = [inspect_upload(request.user, str(key)) for key in file_keys]
+        validate_attachment_counts([attachment.mime_type for attachment in (*files, *uploads)])
+    except ValidationError as e:
+        return Response({'error': e.messages[0]}, status=400)
+
+    # Admission control: hold an estimate against the user's token budget before
+    # anything is written or sent to Bedrock, corrected from real usage afterwards
+    try:
+        reservation = token_quota_service.reserve(
+            request.user,
+            token_quota_service.estimate_tokens(message_text, len(files) + len(uploads), ChatService.MAX_OUTPUT_TOKENS)
+        )
+    except QuotaExceeded as e:
+        return Response(
+            {'error': e.message, 'retry_after': e.retry_after, 'quota': e.quota},
+            status=429,
+            headers={'Retry-After': str(e.retry_after)}
+        )
+
     try:
-        chat_id = request.data.get('chat_id')
-        message_text = request.data.get('message', '')
-        project_id = request.data.get('project_id')
-        files = request.FILES.getlist('files', [])
-        
         # Create or get chat
         chat = chat_service.create_or_get_chat(request.user, chat_id, message_text, project_id)
         
@@ -63,8 +107,10 @@ def claude_chat_view(request):
             message_pair=message_pair,
             role="user",
             text=message_text,
-            files=files
+            files=files,
+            uploads=uploads
         )
+        chat.record_message(message_text)
 
         # Send initial message data including file contents
         def stream_response(response):
@@ -85,7 +131,8 @@ def claude_chat_view(request):
                     } for content in user_message.contents.all()],
                     'created_at': user_message.created_at.isoformat(),
                     'message_pair': str(message_pair.id)
-                }
+                },
+                'quota': token_quota_service.get_status(request.user)
             }
             yield json.dumps(user_message_data) + '\n'
 
@@ -121,23 +168,54 @@ def claude_chat_view(request):
             }
             yield json.dumps(assistant_init_data) + '\n'
 
-            # Stream the assistant's response
-            current_text = ""
+            # Stream the assistant's response, coalescing deltas into ~40ms frames so
+            # encoding, writes and the DB update happen per frame instead of per token
+            relay = DeltaCoalescer(
+                flush_interval=settings.STREAM_FLUSH_INTERVAL,
+                flush_bytes=settings.STREAM_FLUSH_BYTES
+            )
+            assistant_message_id = str(assistant_message.id)
+            usage = {'input_tokens': 0, 'output_tokens': 0}
+
+            def content_frame():
+                content = relay.flush()
+                assistant_content.text_content = relay.text
+                assistant_content.save(update_fields=['text_content'])
+                return orjson.dumps({
+                    'type': 'content',
+                    'message_id': assistant_message_id,
+                    'content': content
+                }) + b'\n'
             
-            for chunk in response['body']:
-                chunk_data = json.loads(chunk['chunk']['bytes'].decode())
-                if chunk_data['type'] == 'content_block_delta':
-                    content = chunk_data['delta']['text']
-                    current_text += content
-                    # Update the message content in the database
-                    assistant_content.text_content = current_text
-                    assistant_content.save()
-                    
-                    yield json.dumps({
-                        'type': 'content',
-                        'message_id': str(assistant_message.id),
-                        'content': content
-                    }) + '\n'
+            try:
+                for chunk in with_flush_deadline(response['body'], relay):
+                    if chunk is None:
+                        # The model paused with text held back; send it rather than wait for more
+                        yield content_frame()
+                        continue
+                    chunk_data = orjson.loads(chunk['chunk']['bytes'])
+                    if chunk_data['type'] == 'content_block_delta':
+                        if relay.add(chunk_data['delta'].get('text', '')):
+                            yield content_frame()
+                    elif chunk_data['type'] == 'message_start':
+                        usage['input_tokens'] = chunk_data['message'].get('usage', {}).get('input_tokens', 0)
+                    elif chunk_data['type'] == 'message_delta':
+                        usage['output_tokens'] = chunk_data.get('usage', {}).get('output_tokens', usage['output_tokens'])
+                if relay.has_pending:
+                    yield content_frame()
+            finally:
+                # Runs on client disconnect too, so aborted streams keep their partial
+                # text and are still charged
+                if relay.has_pending:
+                    assistant_content.text_content = relay.text
+                    assistant_content.save(update_fields=['text_content'])
+                # Frame saves skip the search index; index the finished text once
+                get_search_backend().index_content(assistant_content)
+                chat.record_message(relay.text)
+                tokens_used = usage['input_tokens'] + usage['output_tokens']
+                token_quota_service.reconcile(reservation, tokens_used)
+                if tokens_used:
+                    TokenUsage.objects.create(user=request.user, chat=chat, tokens_used=tokens_used)
 
             # Send chat ID at the end
             yield json.dumps({
@@ -147,7 +225,7 @@ def claude_chat_view(request):
             
             # Extract memories from this conversation asynchronously
             try:
-                memory_service = MemoryExtractionService()
+                memory_service = MemoryExtractionService(bypass_cache=bypass_cache)
                 # Extract memories from the current message pair
                 extracted_memories = memory_service.extract_memories_from_chat(chat, message_pair)
                 if extracted_memories:
@@ -161,56 +239,67 @@ def claude_chat_view(request):
         response = chat_service.invoke_model(body)
 
         return StreamingHttpResponse(
-            stream_response(response),
+            ReservedStream(stream_response(response), reservation, token_quota_service),
             content_type='text/event-stream'
         )
 
     except Exception as e:
+        # Nothing was generated, release the reservation
+        token_quota_service.release(reservation)
         raise e
 
+MESSAGE_WINDOW_PAIRS = 20
+MAX_MESSAGE_WINDOW_PAIRS = 100
+
+
 class ChatMessagesListView(generics.ListCreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         chat_id = self.kwargs['chat_id']
-        message_pairs = MessagePair.objects.filter(chat_id=chat_id).order_by('created_at')
-        messages = []
-        for pair in message_pairs:
-            messages.extend(pair.messages.all())
-        return messages
+        return (
+            Message.objects.filter(message_pair__chat_id=chat_id)
+            .order_by('message_pair__created_at', 'created_at')
+            .prefetch_related('contents')
+        )
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        chat = Chat.objects.get(id=self.kwargs['chat_id'])
-        
-        messages = []
-        for message in serializer.data:
-            message_contents = []
-            for content in message['contents']:
-                message_contents.append({
-                    'id': content['id'],
-                    'content_type': content['content_type'],
-                    'text_content': content['text_content'],
-                    'file_content': content['file_content'],
-                    'mime_type': content['mime_type'],
-                    'edited_at': content['edited_at'],
-                    'created_at': content['created_at']
-                })
-
-            messages.append({
-                'id': message['id'],
-                'role': message['role'],
-                'contents': message_contents,
-                'created_at': message['created_at'],
-                'message_pair': message['message_pair'],
-                'hidden': message['hidden']
-            })
-
+        """
+        The newest ``limit`` message pairs, oldest first, and a ``previous``
+        link to the pairs before them. The window is an index range scan on
+        (chat, created_at, id) and rows are sent in a compact shape, so
+        opening a chat costs the same however long it is.
+        """
+        chat_id = self.kwargs['chat_id']
+        chat = Chat.objects.filter(id=chat_id, user=request.user).values('system_prompt').first()
+        if chat is None:
+            return Response({'error': 'Chat not found'}, status=404)
+
+        pairs = MessagePair.objects.filter(chat_id=chat_id)
+        try:
+            limit = min(max(int(request.query_params.get('limit', MESSAGE_WINDOW_PAIRS)), 1), MAX_MESSAGE_WINDOW_PAIRS)
+            before = request.query_params.get('before')
+            if before:
+                created_at, pair_id = decode_cursor(before, str, str)
+                created_at, pair_id = datetime.fromisoformat(created_at), uuid.UUID(pair_id)
+                pairs = pairs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pair_id))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        # One extra pair tells whether there is anything older
+        window = list(pairs.order_by('-created_at', '-id').values_list('id', 'created_at')[:limit + 1])
+        previous = None
+        if len(window) > limit:
+            window = window[:limit]
+            oldest_id, oldest_created_at = window[-1]
+            previous = replace_query_param(
+                request.build_absolute_uri(), 'before', encode_cursor(oldest_created_at.isoformat(), str(oldest_id))
+            )
         return Response({
-            'system_prompt': chat.system_prompt,
-            'messages': messages
+            'system_prompt': chat['system_prompt'],
+            'messages': compact_messages([pair_id for pair_id, _ in reversed(window)]),
+            'previous': previous,
         })
 
     def perform_create(self, serializer):
@@ -218,12 +307,13 @@ class ChatMessagesListView(generics.ListCreateAPIView):
         chat = Chat.objects.get(id=chat_id)
         message_pair = MessagePair.objects.create(chat=chat)
         serializer.save(message_pair=message_pair)
+        chat.record_message()
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def chat_list_view(request):
     if request.method == 'GET':
-        chats = Chat.objects.filter(user=request.user).order_by('-created_at')
+        chats = Chat.objects.filter(user=request.user).order_by('-last_activity_at', '-id')
         return Response([{'id': chat.id, 'title': chat.title} for chat in chats])
     elif request.method == 'POST':
         title = request.data.get('title', 'New Chat')
@@ -249,7 +339,7 @@ class ChatListView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Chat.objects.filter(user=self.request.user).order_by('-created_at')
+        return Chat.objects.filter(user=self.request.user).order_by('-last_activity_at', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -258,7 +348,7 @@ class ChatListView(generics.ListCreateAPIView):
 @permission_classes([IsAuthenticated])
 def chat_list_view(request):
     if request.method == 'GET':
-        chats = Chat.objects.filter(user=request.user).order_by('-created_at')
+        chats = Chat.objects.filter(user=request.user).order_by('-last_activity_at', '-id')
         return Response([{'id': chat.id, 'title': chat.title} for chat in chats])
     elif request.method == 'POST':
         title = request.data.get('title', 'New Chat')
@@ -273,7 +363,7 @@ def chat_messages_view(request, chat_id):
     except Chat.DoesNotExist:
         return Response({'error': 'Chat not found'}, status=404)
 
-    message_pairs = MessagePair.objects.filter(chat=chat).order_by('created_at')
+    message_pairs = MessagePair.objects.filter(chat=chat).order_by('created_at').prefetch_related('messages__contents')
     messages = []
     for pair in message_pairs:
         for message in pair.messages.all():
@@ -290,7 +380,7 @@ def chat_messages_view(request, chat_id):
                     'created_at': content.created_at
                 } for content in message.contents.all()],
                 'created_at': message.created_at,
-                'message_pair': message.message_pair.id,
+                'message_pair': pair.id,
                 'hidden': message.hidden
             })
     return Response(messages)
@@ -341,26 +431,71 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+
+class NewestFirstCursorPagination(CursorPagination):
+    """
+    Newest first by (created_at, id). Each page seeks from the previous one's
+    last created_at along a (user, created_at, id) index, so it costs the same
+    at any depth and skips the COUNT(*); ``next`` and ``previous`` carry the cursor.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class RecentActivityCursorPagination(NewestFirstCursorPagination):
+    """
+    Chats by their last message, along the (user, last_activity_at, id) index.
+
+    ``last_activity_at`` changes as chats are used, so the order moves under
+    an open cursor. A chat that gets a message while a client pages through
+    jumps ahead of the cursor and is missing from the pages that follow; one
+    whose latest messages are deleted can drop behind it and be listed
+    again. Clients restart from the first page when their chats change; the
+    chat sidebar does this by invalidating its query when a reply finishes
+    streaming.
+    """
+    ordering = ('-last_activity_at', '-id')
+
+
 class ChatViewSet(viewsets.ModelViewSet):
     serializer_class = ChatSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = RecentActivityCursorPagination
     permission_classes = [IsAuthenticated]
 
+    @property
+    def paginator(self):
+        # Ranked search results aren't in created_at order; they are capped, so pages of them are cheap
+        if not hasattr(self, '_paginator'):
+            searching = bool(self.request.query_params.get('search'))
+            self._paginator = StandardResultsSetPagination() if searching else self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
         queryset = Chat.objects.filter(user=self.request.user)
         search = self.request.query_params.get('search', None)
         
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(message_pairs__messages__contents__text_content__icontains=search)
-            ).distinct()
-            
-        return queryset.order_by('-created_at')
+            # Best ranked first; see services/search_service.py
+            return get_search_backend().filter_chats(queryset, self.request.user, search)
+
+        return queryset.order_by('-last_activity_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        # Same output as ChatSerializer, read straight from values()
+        page = self.paginate_queryset(self.get_queryset().values(*ChatSerializer.list_columns))
+        return self.get_paginated_response(ChatSerializer.list_rows(page))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        blobs = referenced_blobs(message__message_pair__chat=instance)
+        instance.delete()
+        if blobs:
+            collect_garbage(blobs)
+
     @action(detail=True, methods=['post'])
     def archive(self, request, pk=None):
         chat = self.get_object()
@@ -377,7 +512,7 @@ class ChatViewSet(viewsets.ModelViewSet):
 
 class ProjectViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
         queryset = Project.objects.filter(user=self.request.user)
@@ -389,7 +524,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
                 Q(description__icontains=search)
             )
             
-        return queryset.order_by('-created_at')
+        return ProjectSerializer.setup_eager_loading(queryset).order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -477,7 +612,7 @@ class ProjectChatsView(generics.ListAPIView):
         return Chat.objects.filter(
             user=self.request.user,
             project_id=project_id
-        ).order_by('-created_at')
+        ).order_by('-last_activity_at', '-id')
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
@@ -507,12 +642,8 @@ def edit_message(request, message_id):
 def toggle_message_pair(request, pair_id):
     try:
         message_pair = MessagePair.objects.get(id=pair_id)
-        messages = message_pair.messages.all()
         hidden = request.data.get('hidden', True)
-        
-        for message in messages:
-            message.hidden = hidden
-            message.save()
+        message_pair.messages.update(hidden=hidden)
             
         return Response({'status': 'success'})
     except MessagePair.DoesNotExist:
@@ -522,8 +653,13 @@ def toggle_message_pair(request, pair_id):
 @permission_classes([IsAuthenticated])
 def delete_message_pair(request, pair_id):
     try:
-        message_pair = MessagePair.objects.get(id=pair_id, chat__user=request.user)
+        message_pair = MessagePair.objects.select_related('chat').get(id=pair_id, chat__user=request.user)
+        blobs = referenced_blobs(message__message_pair=message_pair)
         message_pair.delete()
+        if blobs:
+            # Attachments no other message shares any more
+            collect_garbage(blobs)
+        message_pair.chat.refresh_activity()
         return Response({'message': 'Message pair deleted successfully'})
     except MessagePair.DoesNotExist:
         return Response({'error': 'Message pair not found'}, status=404)
@@ -533,16 +669,10 @@ def delete_message_pair(request, pair_id):
 
 # Memory Management Views
 
-class MemoryPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
 class UserMemoryViewSet(viewsets.ModelViewSet):
     """ViewSet for managing user memories"""
     permission_classes = [IsAuthenticated]
-    pagination_class = MemoryPagination
+    pagination_class = NewestFirstCursorPagination
     
     def get_queryset(self):
         queryset = UserMemory.objects.filter(user=self.request.user)
@@ -569,12 +699,19 @@ class UserMemoryViewSet(viewsets.ModelViewSet):
                 Q(summary__icontains=search) | Q(raw_content__icontains=search)
             )
         
-        return queryset.order_by('-created_at')
+        if self.action == 'retrieve':
+            queryset = UserMemoryListSerializer.setup_eager_loading(queryset)
+        return queryset.order_by('-created_at', '-id')
     
     def get_serializer_class(self):
         if self.action == 'list':
             return UserMemoryListSerializer
         return UserMemorySerializer
+
+    def list(self, request, *args, **kwargs):
+        # Same output as UserMemoryListSerializer, read straight from values()
+        page = self.paginate_queryset(self.get_queryset().values(*UserMemoryListSerializer.list_columns))
+        return self.get_paginated_response(UserMemoryListSerializer.list_rows(page))
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -604,9 +741,9 @@ class MemoryTagViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Return tags that are used by the current user's memories
-        return MemoryTag.objects.filter(
+        return MemoryTagSerializer.setup_eager_loading(MemoryTag.objects.filter(
             memories__user=self.request.user
-        ).distinct().order_by('name')
+        ).distinct().order_by('name'))
 
 
 @api_view(['POST'])
@@ -616,8 +753,9 @@ def extract_memories_from_chat(request, chat_id):
     try:
         chat = Chat.objects.get(id=chat_id, user=request.user)
         
-        memory_service = MemoryExtractionService()
+        memory_service = MemoryExtractionService(bypass_cache=cache_bypass_requested(request))
         memories = memory_service.extract_memories_from_chat(chat)
+        prefetch_related_objects(memories, memory_tags_prefetch())
         
         serializer = UserMemoryListSerializer(memories, many=True)
         
@@ -679,11 +817,79 @@ def get_user_context(request):
     # Mark as referenced
     if memories:
         memory_service.mark_memories_as_referenced(memories)
+        prefetch_related_objects(memories, memory_tags_prefetch())
     
     serializer = UserMemoryListSerializer(memories, many=True)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def llm_cache_stats(request):
+    """Hit-rate metrics for the LLM response cache in this worker process"""
+    return Response(llm_response_cache.stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def bedrock_hedge_stats(request):
+    """Hedged request counts, extra tokens spent and the current first-token p90"""
+    stats = hedge_budget.stats()
+    stats['first_token_p90'] = latency_tracker.percentile(0.9)
+    return Response(stats)
+
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_messages(request):
+    """Ranked message hits for ``q`` across the user's chats, with highlighted snippets; follow ``next`` for more"""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'q is required'}, status=400)
+    try:
+        limit = min(max(int(request.query_params.get('limit', SEARCH_PAGE_SIZE)), 1), MAX_SEARCH_PAGE_SIZE)
+        cursor = request.query_params.get('cursor')
+        after = decode_cursor(cursor, float, int) if cursor else None
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    # One extra hit tells whether there is a next page
+    hits = get_search_backend().search_messages(request.user, query, limit + 1, after)
+    page = hits[:limit]
+    messages = Message.objects.select_related('message_pair__chat').only(
+        'id', 'role', 'created_at', 'message_pair__chat__id', 'message_pair__chat__title'
+    ).in_bulk([hit.message_id for hit in page])
+    results = []
+    for hit in page:
+        message = messages.get(hit.message_id)
+        if message is None:
+            continue
+        results.append({
+            'chat_id': str(hit.chat_id),
+            'chat_title': message.message_pair.chat.title,
+            'message_id': str(hit.message_id),
+            'role': message.role,
+            'created_at': message.created_at,
+            'snippet': hit.snippet,
+            'score': hit.score,
+        })
+    next_url = None
+    if len(hits) > limit:
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', page[-1].cursor)
+    return Response({'results': results, 'next': next_url})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def token_quota_status(request):
+    """Remaining token budget for the current user in the rolling window"""
+    return Response(token_quota_service.get_status(request.user))
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def validate_file_view(request):
@@ -692,19 +898,37 @@ def validate_file_view(request):
         return Response({'error': 'No file provided'}, status=400)
     
     try:
-        mime_type = validate_mime_type(file)
-        
-        if mime_type.startswith('image/'):
-            validate_image_size(file)
-        else:
-            validate_document_size(file)
-            
+        descriptor = describe_file(file)
         return Response({
             'valid': True,
-            'mime_type': mime_type
+            'mime_type': descriptor.mime_type
         })
     except ValidationError as e:
         return Response({
             'valid': False,
             'error': str(e)
-        }, status=400)
\ No newline at end of file
+        }, status=400)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def presign_upload_view(request):
+    """
+    A presigned S3 POST for one attachment. The client posts the file to
+    ``url`` with ``fields``, then sends ``key`` in the chat request's
+    ``file_keys``; the file never passes through this server. ``sha256``
+    is the base64 SHA-256 of the file, which S3 checks on upload.
+    """
+    filename = request.data.get('filename')
+    mime_type = request.data.get('content_type')
+    sha256 = request.data.get('sha256')
+    try:
+        size = int(request.data.get('size'))
+    except (TypeError, ValueError):
+        size = 0
+    if not filename or not mime_type or not sha256 or size <= 0:
+        return Response({'error': 'filename, content_type, sha256 and a positive size are required'}, status=400)
+
+    try:
+        return Response(presign_upload(request.user, filename, mime_type, size, str(sha256)), status=201)
+    except ValidationError as e:
+        return Response({'error': e.messages[0]}, status=400)
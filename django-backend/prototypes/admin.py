@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DesignProject, Group, Prototype, PrototypeVariant, PrototypeVersion
+from .models import DesignProject, Group, Prototype, PrototypeVariant, PrototypeVersion, PrototypeJob, HtmlBlob
 
 @admin.register(DesignProject)
 class DesignProjectAdmin(admin.ModelAdmin):
@@ -16,6 +16,7 @@ class GroupAdmin(admin.ModelAdmin):
 @admin.register(Prototype)
 class PrototypeAdmin(admin.ModelAdmin):
     list_display = ('title', 'design_project', 'group', 'created_at')
+    list_select_related = ('design_project', 'group')
     search_fields = ('title', 'design_project__title', 'group__name')
     list_filter = ('created_at',)
 
@@ -27,7 +28,22 @@ class PrototypeVariantAdmin(admin.ModelAdmin):
 
 @admin.register(PrototypeVersion)
 class PrototypeVersionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'variant', 'version_number', 'created_at')
+    list_display = ('name', 'variant', 'version_number', 'edit_mode', 'output_tokens', 'output_tokens_saved', 'created_at')
     search_fields = ('name', 'variant__name', 'variant__prototype__title')
-    list_filter = ('version_number', 'created_at')
+    list_filter = ('edit_mode', 'version_number', 'created_at')
     readonly_fields = ('html_content',)
+    exclude = ('legacy_html', 'blob')
+
+@admin.register(HtmlBlob)
+class HtmlBlobAdmin(admin.ModelAdmin):
+    list_display = ('hash', 'depth', 'size', 'created_at')
+    search_fields = ('hash',)
+    readonly_fields = ('hash', 'base', 'depth', 'size')
+    exclude = ('data',)
+
+@admin.register(PrototypeJob)
+class PrototypeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'user', 'input_tokens', 'output_tokens', 'created_at', 'finished_at')
+    search_fields = ('user__email', 'name')
+    list_filter = ('kind', 'status', 'created_at')
+    readonly_fields = ('params', 'error')
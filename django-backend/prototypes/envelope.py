@@ -0,0 +1,70 @@
+import re
+from typing import Any, Dict, List, Optional
+
+OPEN_TAG = re.compile(r'<prototype_file name="([^"]+)">')
+OPEN_PREFIX = '<prototype_file'
+CLOSE_TAG = '</prototype_file>'
+
+
+class PrototypeEnvelopeParser:
+    """
+    Incremental parser for ``<prototype_file name="...">HTML</prototype_file>``.
+
+    Feed it text deltas as they stream in; it returns ``name`` events as soon
+    as the opening tag is complete and ``html`` events with the body, holding
+    back just enough characters that a closing tag split across deltas is
+    never emitted. ``result()`` gives the same ``{'name', 'html_content'}``
+    shape as ``PrototypeService._parse_prototype_response``.
+    """
+
+    def __init__(self, default_name: str):
+        self.default_name = default_name
+        self.name: Optional[str] = None
+        self._raw = []
+        self._buffer = ''
+        self._html = []
+        self._state = 'preamble'
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        self._raw.append(delta)
+        if self._state == 'done':
+            return []
+        self._buffer += delta
+        events = []
+
+        if self._state == 'preamble':
+            match = OPEN_TAG.search(self._buffer)
+            if not match:
+                # Keep only a possible partial opening tag
+                start = self._buffer.rfind('<')
+                self._buffer = self._buffer[start:] if start != -1 else ''
+                return events
+            self.name = match.group(1)
+            self._buffer = self._buffer[match.end():]
+            self._state = 'body'
+            events.append({'type': 'name', 'name': self.name})
+
+        end = self._buffer.find(CLOSE_TAG)
+        if end != -1:
+            html, self._buffer = self._buffer[:end], ''
+            self._state = 'done'
+        else:
+            # Hold back a tail that could be the start of the closing tag
+            keep = len(CLOSE_TAG) - 1
+            html, self._buffer = self._buffer[:-keep], self._buffer[-keep:]
+            if len(html) == 0:
+                return events
+        if html:
+            self._html.append(html)
+            events.append({'type': 'html', 'content': html})
+        return events
+
+    def result(self) -> Dict[str, str]:
+        if self._state == 'preamble':
+            # No envelope at all: same fallback as the non-streaming parser
+            return {'name': self.default_name, 'html_content': ''.join(self._raw)}
+        if self._state == 'body':
+            # Truncated before the closing tag (e.g. max_tokens reached)
+            self._html.append(self._buffer)
+            self._buffer = ''
+        return {'name': self.name, 'html_content': ''.join(self._html)}
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from prototypes.models import HtmlBlob, PrototypeVariant, PrototypeVersion
+
+
+class Command(BaseCommand):
+    help = 'Move inline PrototypeVersion HTML into delta-compressed, deduplicated blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many versions would be moved')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many variants')
+        parser.add_argument('--prune', action='store_true', help='Also delete blobs no version uses any more')
+
+    def handle(self, *args, **options):
+        variant_ids = (
+            PrototypeVersion.objects.filter(blob__isnull=True)
+            .order_by('variant_id')
+            .values_list('variant_id', flat=True)
+            .distinct()
+        )
+        if options['limit']:
+            variant_ids = variant_ids[:options['limit']]
+        variant_ids = list(variant_ids)
+
+        if options['dry_run']:
+            pending = PrototypeVersion.objects.filter(blob__isnull=True, variant_id__in=variant_ids)
+            self.stdout.write(f"{pending.count()} versions in {len(variant_ids)} variants would be moved")
+            return
+
+        moved = inline_chars = 0
+        for variant_id in variant_ids:
+            # One variant at a time so each chain is built oldest first and a failure loses little
+            with transaction.atomic():
+                PrototypeVariant.objects.select_for_update().filter(id=variant_id).first()
+                for version in PrototypeVersion.objects.filter(variant_id=variant_id).order_by('version_number'):
+                    if version.blob_id:
+                        continue
+                    inline_chars += len(version.legacy_html)
+                    version.store_html()
+                    version.save(update_fields=['blob', 'legacy_html'])
+                    moved += 1
+            self.stdout.write(f"Variant {variant_id}: done")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} versions ({inline_chars} characters of inline HTML) into blobs"
+        ))
+
+        if options['prune']:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {self.prune()} unused blobs"))
+
+    def prune(self) -> int:
+        """Delete blobs with no versions, repeating as bases of deleted deltas become unused"""
+        deleted = 0
+        while True:
+            unused = HtmlBlob.objects.filter(Q(versions__isnull=True) & Q(deltas__isnull=True))
+            # The total includes the blobs' encodings
+            count = unused.delete()[1].get(HtmlBlob._meta.label, 0)
+            if not count:
+                return deleted
+            deleted += count
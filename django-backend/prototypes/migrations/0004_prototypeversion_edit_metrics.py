@@ -0,0 +1,48 @@
+# Generated by Django 5.0.3 on 2026-10-19 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prototypes", "0003_prototypejob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="prototypeversion",
+            name="edit_mode",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("full", "Full regeneration"),
+                    ("patch", "Patch"),
+                    ("fallback", "Patch failed, regenerated"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="prototypeversion",
+            name="generation_ms",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="prototypeversion",
+            name="latency_saved_ms",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="prototypeversion",
+            name="output_tokens",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="prototypeversion",
+            name="output_tokens_saved",
+            field=models.IntegerField(
+                default=0, help_text="Negative when a failed patch was paid for too"
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.3 on 2026-10-19 04:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prototypes", "0004_prototypeversion_edit_metrics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HtmlBlob",
+            fields=[
+                ("hash", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("depth", models.PositiveSmallIntegerField(default=0, help_text="Deltas between this blob and its snapshot")),
+                ("data", models.BinaryField()),
+                ("size", models.PositiveIntegerField(help_text="Length of the reconstructed HTML")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "base",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="deltas",
+                        to="prototypes.htmlblob",
+                    ),
+                ),
+            ],
+        ),
+        # The existing column keeps its name; existing rows are moved into blobs
+        # by the compact_prototype_versions command
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name="prototypeversion",
+                    old_name="html_content",
+                    new_name="legacy_html",
+                ),
+                migrations.AlterField(
+                    model_name="prototypeversion",
+                    name="legacy_html",
+                    field=models.TextField(blank=True, db_column="html_content", default=""),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="prototypeversion",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="versions",
+                to="prototypes.htmlblob",
+            ),
+        ),
+    ]
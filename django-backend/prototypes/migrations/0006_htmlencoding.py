@@ -0,0 +1,53 @@
+# Generated by Django 5.0.3 on 2026-10-19 04:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prototypes", "0005_htmlblob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="htmlblob",
+            name="published_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Uploaded to PrototypeHtmlStorage", null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="HtmlEncoding",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "encoding",
+                    models.CharField(
+                        choices=[("gzip", "gzip"), ("br", "Brotli")], max_length=10
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                (
+                    "blob",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="encodings",
+                        to="prototypes.htmlblob",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("blob", "encoding")},
+            },
+        ),
+    ]
@@ -1,6 +1,12 @@
 import uuid
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from appauth.models import AppUser
+from .version_store import (
+    apply_delta, compress_full, content_hash, decompress_full, encode_delta, text_cache, transfer_encodings
+)
 
 # Create your models here.
 
@@ -62,18 +68,271 @@ class PrototypeVariant(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class HtmlBlob(models.Model):
+    """
+    Content-addressed prototype HTML, keyed by its SHA-256. Either a
+    compressed full snapshot or a compressed line delta against ``base``;
+    a new snapshot is taken every PROTOTYPE_SNAPSHOT_INTERVAL blobs along a
+    chain, so reading never applies more deltas than that.
+    """
+    hash = models.CharField(max_length=64, primary_key=True)
+    base = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, related_name='deltas')
+    depth = models.PositiveSmallIntegerField(default=0, help_text="Deltas between this blob and its snapshot")
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(help_text="Length of the reconstructed HTML")
+    published_at = models.DateTimeField(null=True, blank=True, help_text="Uploaded to PrototypeHtmlStorage")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({'delta' if self.is_delta else 'snapshot'})"
+
+    @property
+    def is_delta(self):
+        return self.base_id is not None
+
+    @property
+    def published_name(self) -> str:
+        return f"{self.hash}.html"
+
+    @property
+    def published_url(self):
+        if not self.published_at:
+            return None
+        from aiassistant.storage_backends import PrototypeHtmlStorage
+        return PrototypeHtmlStorage().url(self.published_name)
+
+    @classmethod
+    def store(cls, html: str, base: 'HtmlBlob' = None) -> 'HtmlBlob':
+        """
+        Return the blob for ``html``, reusing an identical one if it exists.
+        New content is stored as a delta against ``base`` when that is
+        smaller than a snapshot and the chain isn't already at the limit.
+        """
+        digest = content_hash(html)
+        existing = cls.objects.filter(hash=digest).first()
+        if existing:
+            return existing
+
+        blob = cls(hash=digest, size=len(html), data=compress_full(html))
+        interval = getattr(settings, 'PROTOTYPE_SNAPSHOT_INTERVAL', 10)
+        if base is not None and base.depth + 1 < interval:
+            delta = encode_delta(base.read(), html)
+            if len(delta) < len(blob.data):
+                blob.base, blob.depth, blob.data = base, base.depth + 1, delta
+        try:
+            with transaction.atomic():
+                blob.save(force_insert=True)
+        except IntegrityError:
+            # Stored concurrently by another request
+            return cls.objects.get(hash=digest)
+        text_cache.put(digest, html)
+        return blob
+
+    def read(self) -> str:
+        """Reconstruct the HTML, applying deltas from the nearest snapshot"""
+        text = text_cache.get(self.hash)
+        if text is not None:
+            return text
+        if self.is_delta and not HtmlBlob.base.is_cached(self) and self.depth > 1:
+            # Fetch the rest of the chain in one query; depth is bounded by the snapshot interval
+            self.base = HtmlBlob.objects.select_related('__'.join(['base'] * (self.depth - 1))).get(hash=self.base_id)
+        chain = []
+        blob = self
+        while blob.is_delta:
+            chain.append(blob)
+            blob = blob.base
+            text = text_cache.get(blob.hash)
+            if text is not None:
+                break
+        else:
+            text = decompress_full(blob.data)
+        for delta in reversed(chain):
+            text = apply_delta(text, delta.data)
+        text_cache.put(self.hash, text)
+        return text
+
+class HtmlEncoding(models.Model):
+    """
+    A blob's HTML precompressed for Content-Encoding. Written on the first
+    request for the blob's HTML rather than with the blob: most versions
+    in a chain are never served, and their encodings would outweigh the
+    deltas many times over.
+    """
+    ENCODING_CHOICES = [
+        ('gzip', 'gzip'),
+        ('br', 'Brotli'),
+    ]
+
+    blob = models.ForeignKey(HtmlBlob, on_delete=models.CASCADE, related_name='encodings')
+    encoding = models.CharField(max_length=10, choices=ENCODING_CHOICES)
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.blob_id[:12]} ({self.encoding})"
+
+    @classmethod
+    def create_for(cls, blob: HtmlBlob, html: str = None):
+        """Store every available encoding of ``blob`` and return them"""
+        html = blob.read() if html is None else html
+        return cls.objects.bulk_create(
+            [cls(blob=blob, encoding=encoding, data=data) for encoding, data in transfer_encodings(html).items()],
+            ignore_conflicts=True
+        )
+
+    class Meta:
+        unique_together = ['blob', 'encoding']
+
 class PrototypeVersion(models.Model):
+    EDIT_MODE_CHOICES = [
+        ('full', 'Full regeneration'),
+        ('patch', 'Patch'),
+        ('fallback', 'Patch failed, regenerated'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     variant = models.ForeignKey(PrototypeVariant, on_delete=models.CASCADE, related_name='versions')
     version_number = models.PositiveIntegerField()
     name = models.CharField(max_length=200)
     edit_prompt = models.TextField(blank=True, null=True)
-    html_content = models.TextField()
+    # HTML lives in ``blob``; rows written before blobs existed keep it inline until compacted
+    legacy_html = models.TextField(blank=True, default='', db_column='html_content')
+    blob = models.ForeignKey(HtmlBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='versions')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # How an edited version was produced and what it cost compared with a full regeneration
+    edit_mode = models.CharField(max_length=20, choices=EDIT_MODE_CHOICES, blank=True)
+    output_tokens = models.PositiveIntegerField(null=True, blank=True)
+    generation_ms = models.PositiveIntegerField(null=True, blank=True)
+    output_tokens_saved = models.IntegerField(default=0, help_text="Negative when a failed patch was paid for too")
+    latency_saved_ms = models.IntegerField(default=0)
+
+    _html = None
+    _html_changed = False
+
     def __str__(self):
         return f"{self.variant.name} - v{self.version_number}: {self.name}"
+
+    @property
+    def html_content(self) -> str:
+        if self._html is None:
+            self._html = self.blob.read() if self.blob_id else self.legacy_html
+        return self._html
+
+    @html_content.setter
+    def html_content(self, value: str):
+        self._html = value
+        self._html_changed = True
+
+    def previous_blob(self):
+        """Blob of the closest earlier version of this variant, the delta base for this one"""
+        previous = (
+            PrototypeVersion.objects
+            .filter(variant_id=self.variant_id, version_number__lt=self.version_number, blob__isnull=False)
+            .order_by('-version_number')
+            .select_related('blob')
+            .first()
+        )
+        return previous.blob if previous else None
+
+    def store_html(self):
+        """Move the HTML into a blob; saved with the next ``save()``"""
+        self.blob = HtmlBlob.store(self.html_content, self.previous_blob())
+        self.legacy_html = ''
+        self._html_changed = False
+        if getattr(settings, 'PROTOTYPE_HTML_PUBLISH', False) and not self.blob.published_at:
+            from .tasks import publish_html_blob
+            blob_hash = self.blob.hash
+            transaction.on_commit(lambda: publish_html_blob.delay(blob_hash))
+
+    def save(self, *args, **kwargs):
+        if self._html_changed:
+            self.store_html()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'blob', 'legacy_html'} - {'html_content'}
+        super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['version_number']
         unique_together = ['variant', 'version_number']
+
+class PrototypeJob(models.Model):
+    """A queued generate/edit/variant request, run by a Celery worker"""
+    KIND_CHOICES = [
+        ('generate', 'Generate prototype'),
+        ('edit', 'Edit version'),
+        ('variant', 'Create variant'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(AppUser, on_delete=models.CASCADE, related_name='prototype_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    params = models.JSONField(default=dict, help_text="Request parameters (prompt, names, group)")
+
+    # Inputs: the design project for 'generate', the prototype for 'variant', the variant for 'edit'
+    design_project = models.ForeignKey(DesignProject, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    prototype = models.ForeignKey(Prototype, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    variant = models.ForeignKey(PrototypeVariant, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+
+    # Progress and outcome
+    name = models.CharField(max_length=200, blank=True, help_text="Prototype name, known once generation starts")
+    generated_chars = models.PositiveIntegerField(default=0)
+    result_version = models.ForeignKey(PrototypeVersion, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.TextField(blank=True)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+    @staticmethod
+    def stale_before():
+        """Running jobs started before this lost their worker and no longer hold a slot"""
+        return timezone.now() - timedelta(seconds=getattr(settings, 'PROTOTYPE_JOB_TIME_LIMIT', 600))
+
+    @classmethod
+    def active_for(cls, user_id):
+        """The user's pending jobs and running ones that still have a worker"""
+        return cls.objects.filter(
+            models.Q(status='pending') | models.Q(status='running', started_at__gte=cls.stale_before()),
+            user_id=user_id
+        )
+
+    @classmethod
+    def fail_stale(cls, user_id):
+        """Mark the user's running jobs that lost their worker as failed, so pollers see them finish"""
+        return cls.objects.filter(user_id=user_id, status='running', started_at__lt=cls.stale_before()).update(
+            status='failed', error='The worker running this job stopped responding', finished_at=timezone.now()
+        )
+
+    @property
+    def tokens_used(self):
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def duration(self):
+        """Seconds spent running, or None while pending"""
+        if not self.started_at:
+            return None
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status']),
+        ]
@@ -0,0 +1,78 @@
+import re
+from typing import List, Optional, Tuple
+
+PATCH_ENVELOPE = re.compile(r'<prototype_patch name="([^"]+)">(.*?)</prototype_patch>', re.DOTALL)
+HUNK = re.compile(
+    r'<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE',
+    re.DOTALL
+)
+
+
+class PatchError(Exception):
+    """The model's patch could not be parsed or applied to the current HTML"""
+
+
+def parse_patch(content: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Extract the version name and the ``(search, replace)`` hunks from a
+    ``<prototype_patch>`` response.
+    """
+    match = PATCH_ENVELOPE.search(content)
+    if not match:
+        raise PatchError('Response has no <prototype_patch> envelope')
+    hunks = HUNK.findall(match.group(2))
+    if not hunks:
+        raise PatchError('Patch contains no SEARCH/REPLACE hunks')
+    return match.group(1), hunks
+
+
+def _locate(html: str, search: str) -> Optional[Tuple[int, int]]:
+    """
+    Span of the single occurrence of ``search`` in ``html``. Falls back to
+    matching line by line with trailing whitespace ignored, which is the
+    usual way a model's copy drifts from the source.
+    """
+    count = html.count(search)
+    if count == 1:
+        start = html.index(search)
+        return start, start + len(search)
+    if count > 1:
+        raise PatchError(f'SEARCH block matches {count} places: {search[:80]!r}')
+
+    lines = html.splitlines(keepends=True)
+    wanted = [line.rstrip() for line in search.splitlines()]
+    if not wanted:
+        return None
+    found = None
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    for i in range(len(lines) - len(wanted) + 1):
+        if all(lines[i + j].rstrip() == wanted[j] for j in range(len(wanted))):
+            if found is not None:
+                raise PatchError(f'SEARCH block matches several places: {search[:80]!r}')
+            found = (offsets[i], offsets[i + len(wanted)])
+    if found is None:
+        return None
+    # Keep the line break that followed the matched block
+    start, end = found
+    if html[start:end].endswith('\n') and not search.endswith('\n'):
+        end -= 1
+    return start, end
+
+
+def apply_patch(html: str, hunks: List[Tuple[str, str]]) -> str:
+    """
+    Apply the hunks in order. Every SEARCH block must match exactly one
+    place in the (already partly patched) document, otherwise the whole
+    patch is rejected so the caller can fall back to full regeneration.
+    """
+    for search, replace in hunks:
+        if not search.strip():
+            raise PatchError('Empty SEARCH block')
+        span = _locate(html, search)
+        if span is None:
+            raise PatchError(f'SEARCH block not found: {search[:80]!r}')
+        start, end = span
+        html = html[:start] + replace + html[end:]
+    return html
@@ -1,5 +1,8 @@
+from django.db.models import Count, Prefetch, prefetch_related_objects
 from rest_framework import serializers
-from .models import DesignProject, Group, Prototype, PrototypeVariant, PrototypeVersion
+from .models import DesignProject, Group, Prototype, PrototypeVariant, PrototypeVersion, PrototypeJob
+
+EDIT_MODES = ('patch', 'full')
 
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,40 +11,90 @@ class GroupSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 class PrototypeVersionSerializer(serializers.ModelSerializer):
+    html_content = serializers.CharField(read_only=True)
+    html_url = serializers.SerializerMethodField()
 
     class Meta:
         model = PrototypeVersion
-        fields = '__all__'
-        read_only_fields = ['id', 'created_at', 'version_number', 'html_content']
+        exclude = ['legacy_html', 'blob']
+        read_only_fields = [
+            'id', 'created_at', 'version_number', 'html_content',
+            'edit_mode', 'output_tokens', 'generation_ms', 'output_tokens_saved', 'latency_saved_ms'
+        ]
+
+    def get_html_url(self, obj):
+        """Public CDN URL once the HTML has been published (PROTOTYPE_HTML_PUBLISH)"""
+        return obj.blob.published_url if obj.blob_id else None
+
+class PrototypeVersionSummarySerializer(serializers.ModelSerializer):
+    """Version metadata without the HTML, which is served by ``versions/<id>/html/``"""
+    html_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PrototypeVersion
+        fields = ['id', 'variant', 'version_number', 'name', 'edit_prompt', 'edit_mode', 'html_url', 'created_at']
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('blob').defer('legacy_html', 'blob__data')
+
+    def get_html_url(self, obj):
+        return obj.blob.published_url if obj.blob_id else None
+
+def version_summaries_prefetch():
+    return Prefetch(
+        'versions',
+        queryset=PrototypeVersionSummarySerializer.setup_eager_loading(PrototypeVersion.objects.order_by('version_number'))
+    )
 
 class PrototypeVariantSerializer(serializers.ModelSerializer):
-    latest_version = serializers.SerializerMethodField()
+    latest_version_id = serializers.SerializerMethodField()
     versions_count = serializers.SerializerMethodField()
-    versions = PrototypeVersionSerializer(many=True, read_only=True)
+    versions = PrototypeVersionSummarySerializer(many=True, read_only=True)
     
     class Meta:
         model = PrototypeVariant
         fields = ['id', 'prototype', 'name', 'description', 'is_original', 
-                 'created_at', 'updated_at', 'latest_version', 'versions_count', 'versions']
+                 'created_at', 'updated_at', 'latest_version_id', 'versions_count', 'versions']
         read_only_fields = ['id', 'created_at', 'updated_at', 'is_original']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Prefetch version summaries; count and latest version are then read from them"""
+        return queryset.prefetch_related(version_summaries_prefetch())
+
+    def _versions(self, obj):
+        if 'versions' not in getattr(obj, '_prefetched_objects_cache', {}):
+            # Created or saved in the request, or cleared by an update
+            prefetch_related_objects([obj], version_summaries_prefetch())
+        return list(obj.versions.all())
     
-    def get_latest_version(self, obj):
-        latest = obj.versions.order_by('-version_number').first()
-        if latest:
-            return PrototypeVersionSerializer(latest).data
+    def get_latest_version_id(self, obj):
+        versions = self._versions(obj)
+        if versions:
+            return max(versions, key=lambda version: version.version_number).id
         return None
     
     def get_versions_count(self, obj):
-        return obj.versions.count()
+        return len(self._versions(obj))
 
 class PrototypeVariantDetailSerializer(PrototypeVariantSerializer):
-    versions = PrototypeVersionSerializer(many=True, read_only=True)
+    """Adds the latest version with its HTML, for responses to create/edit calls"""
+    latest_version = serializers.SerializerMethodField()
     
     class Meta(PrototypeVariantSerializer.Meta):
-        fields = PrototypeVariantSerializer.Meta.fields + ['versions']
+        fields = PrototypeVariantSerializer.Meta.fields + ['latest_version']
+
+    def get_latest_version(self, obj):
+        versions = self._versions(obj)
+        if versions:
+            latest = max(versions, key=lambda version: version.version_number)
+            return PrototypeVersionSerializer(latest).data
+        return None
 
 class PrototypeSerializer(serializers.ModelSerializer):
-    variants_count = serializers.SerializerMethodField()
+    variants_count = serializers.IntegerField(read_only=True)
     original_variant = serializers.SerializerMethodField()
     
     class Meta:
@@ -49,12 +102,30 @@ class PrototypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'design_project', 'group', 'title', 'prompt', 
                  'created_at', 'updated_at', 'variants_count', 'original_variant']
         read_only_fields = ['id', 'created_at', 'updated_at']
-    
-    def get_variants_count(self, obj):
-        return obj.variants.count()
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.annotate(variants_count=Count('variants', distinct=True)).prefetch_related(
+            Prefetch(
+                'variants',
+                queryset=PrototypeVariantSerializer.setup_eager_loading(
+                    PrototypeVariant.objects.filter(is_original=True)
+                ),
+                to_attr='original_variants'
+            )
+        )
+
+    def to_representation(self, instance):
+        if not hasattr(instance, 'variants_count'):
+            # Saved or fetched without setup_eager_loading
+            instance.variants_count = instance.variants.count()
+        return super().to_representation(instance)
     
     def get_original_variant(self, obj):
-        original = obj.variants.filter(is_original=True).first()
+        if hasattr(obj, 'original_variants'):
+            original = obj.original_variants[0] if obj.original_variants else None
+        else:
+            original = obj.variants.filter(is_original=True).first()
         if original:
             return PrototypeVariantSerializer(original).data
         return None
@@ -65,21 +136,113 @@ class PrototypeDetailSerializer(PrototypeSerializer):
     class Meta(PrototypeSerializer.Meta):
         fields = PrototypeSerializer.Meta.fields + ['variants']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return PrototypeSerializer.setup_eager_loading(queryset).prefetch_related(
+            Prefetch('variants', queryset=PrototypeVariantSerializer.setup_eager_loading(PrototypeVariant.objects.all()))
+        )
+
 class DesignProjectSerializer(serializers.ModelSerializer):
     groups = GroupSerializer(many=True, read_only=True)
-    prototypes_count = serializers.SerializerMethodField()
+    prototypes_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = DesignProject
         fields = ['id', 'user', 'title', 'description', 'created_at', 'updated_at', 
                  'groups', 'prototypes_count']
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
-    
-    def get_prototypes_count(self, obj):
-        return obj.prototypes.count()
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.annotate(prototypes_count=Count('prototypes', distinct=True)).prefetch_related('groups')
+
+    def to_representation(self, instance):
+        if not hasattr(instance, 'prototypes_count'):
+            instance.prototypes_count = instance.prototypes.count()
+        return super().to_representation(instance)
 
 class DesignProjectDetailSerializer(DesignProjectSerializer):
     prototypes = PrototypeSerializer(many=True, read_only=True)
     
     class Meta(DesignProjectSerializer.Meta):
-        fields = DesignProjectSerializer.Meta.fields + ['prototypes'] 
\ No newline at end of file
+        fields = DesignProjectSerializer.Meta.fields + ['prototypes'] 
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return DesignProjectSerializer.setup_eager_loading(queryset).prefetch_related(
+            Prefetch('prototypes', queryset=PrototypeSerializer.setup_eager_loading(Prototype.objects.all()))
+        )
+
+class PrototypeJobSerializer(serializers.ModelSerializer):
+    tokens_used = serializers.IntegerField(read_only=True)
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = PrototypeJob
+        fields = ['id', 'kind', 'status', 'name', 'generated_chars', 'error',
+                 'input_tokens', 'output_tokens', 'tokens_used', 'duration',
+                 'design_project', 'prototype', 'variant', 'result_version',
+                 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class PrototypeJobCreateSerializer(serializers.Serializer):
+    """
+    Validates a job submission. Required fields depend on ``kind``:
+    generate (design_project_id, prompt, optional group_id), variant
+    (prototype_id, optional prompt/name/description) and edit (variant_id,
+    edit_prompt, optional mode).
+    """
+    kind = serializers.ChoiceField(choices=PrototypeJob.KIND_CHOICES)
+    design_project_id = serializers.UUIDField(required=False)
+    group_id = serializers.UUIDField(required=False, allow_null=True)
+    prototype_id = serializers.UUIDField(required=False)
+    variant_id = serializers.UUIDField(required=False)
+    prompt = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    edit_prompt = serializers.CharField(required=False)
+    name = serializers.CharField(required=False, max_length=200)
+    description = serializers.CharField(required=False, allow_blank=True)
+    mode = serializers.ChoiceField(choices=EDIT_MODES, required=False, allow_null=True)
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        kind = attrs['kind']
+        job = {'kind': kind, 'user': user, 'params': {}}
+
+        if kind == 'generate':
+            if not attrs.get('prompt'):
+                raise serializers.ValidationError({'prompt': 'Prompt is required'})
+            design_project = DesignProject.objects.filter(id=attrs.get('design_project_id'), user=user).first()
+            if not design_project:
+                raise serializers.ValidationError({'design_project_id': 'Design project not found'})
+            group_id = attrs.get('group_id')
+            if group_id and not design_project.groups.filter(id=group_id).exists():
+                raise serializers.ValidationError({'group_id': 'Group not found'})
+            job['design_project'] = design_project
+            job['params'] = {'prompt': attrs['prompt'], 'group_id': str(group_id) if group_id else None}
+
+        elif kind == 'variant':
+            prototype = Prototype.objects.filter(id=attrs.get('prototype_id'), design_project__user=user).first()
+            if not prototype:
+                raise serializers.ValidationError({'prototype_id': 'Prototype not found'})
+            job['prototype'] = prototype
+            job['params'] = {
+                'prompt': attrs.get('prompt'),
+                'name': attrs.get('name') or f"Variant of {prototype.title}",
+                'description': attrs.get('description', ''),
+            }
+
+        else:
+            if not attrs.get('edit_prompt'):
+                raise serializers.ValidationError({'edit_prompt': 'Edit prompt is required'})
+            variant = PrototypeVariant.objects.filter(
+                id=attrs.get('variant_id'), prototype__design_project__user=user
+            ).first()
+            if not variant:
+                raise serializers.ValidationError({'variant_id': 'Variant not found'})
+            job['variant'] = variant
+            job['params'] = {'edit_prompt': attrs['edit_prompt'], 'mode': attrs.get('mode')}
+
+        return job
+
+    def create(self, validated_data):
+        return PrototypeJob.objects.create(**validated_data)
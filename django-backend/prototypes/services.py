@@ -1,27 +1,48 @@
 import json
+import logging
+import time
 import boto3
+import orjson
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
-from .models import PrototypeVariant, PrototypeVersion
+from django.db import transaction
+from chat.services.llm_cache import llm_response_cache
+from chat.utils.stream_relay import DeltaCoalescer, with_flush_deadline
+from .envelope import PrototypeEnvelopeParser
+from .patching import PatchError, apply_patch, parse_patch
+from .models import Prototype, PrototypeVariant, PrototypeVersion
+
+logger = logging.getLogger(__name__)
+
+
+def _usage(response_body):
+    usage = response_body.get('usage', {})
+    return {'input_tokens': usage.get('input_tokens', 0), 'output_tokens': usage.get('output_tokens', 0)}
+
 
 class PrototypeService:
     CLAUDE_35_SONNET_V2 = "anthropic.claude-3-5-sonnet-20241022-v2:0"
     CLAUDE_35_SONNET_V1 = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+    MAX_TOKENS = 4096
     
-    def __init__(self):
+    def __init__(self, bypass_cache: bool = False):
+        self.bypass_cache = bypass_cache
         self.bedrock_runtime = boto3.client(
             service_name="bedrock-runtime",
             region_name="us-west-2",
             aws_access_key_id=os.getenv("AWS_BEDROCK_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY")
+            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY"),
+            endpoint_url=os.getenv("AWS_BEDROCK_ENDPOINT_URL")  # local stand-in for load tests
         )
 
         self.bedrock_runtime_us_east = boto3.client(
             service_name="bedrock-runtime",
             region_name="us-east-1",
             aws_access_key_id=os.getenv("AWS_BEDROCK_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY")
+            aws_secret_access_key=os.getenv("AWS_BEDROCK_SECRET_ACCESS_KEY"),
+            endpoint_url=os.getenv("AWS_BEDROCK_ENDPOINT_URL")  # local stand-in for load tests
         )
     
     def get_ui_prototype_system_prompt(self):
@@ -60,6 +81,29 @@ IMPORTANT INSTRUCTIONS:
 9. Maintain accessibility features and performance optimizations
 
 Remember, your output MUST ONLY contain the complete modified code wrapped in <prototype_file> tags, with no other text.
+"""
+
+    def get_ui_prototype_patch_system_prompt(self):
+        return """You are an expert UI/UX designer and frontend developer specializing in modifying beautiful, responsive, and functional prototypes.
+When asked to edit a prototype, you will make the specified changes as a minimal patch against the current code.
+
+IMPORTANT INSTRUCTIONS:
+1. I will provide you with the current HTML code for a prototype and a request for changes.
+2. Your response MUST be ONLY a patch inside XML tags: <prototype_patch name="NAME">HUNKS HERE</prototype_patch>
+3. Replace "NAME" with a short, descriptive name for this edited version
+4. Each hunk has exactly this form:
+<<<<<<< SEARCH
+lines copied exactly from the current code
+=======
+the lines that replace them
+>>>>>>> REPLACE
+5. Every SEARCH block must match the current code character for character, including indentation, and must be long enough to match only one place
+6. Hunks are applied in order; keep them small and do not repeat unchanged code beyond what is needed to make the SEARCH block unique
+7. To insert code, include the neighbouring lines in SEARCH and repeat them in REPLACE with the new code added
+8. Ensure all Tailwind CSS classes are properly applied and consistent with the original design
+9. Preserve responsive design, JavaScript functionality and accessibility unless asked to change them
+
+Remember, your output MUST ONLY contain SEARCH/REPLACE hunks wrapped in <prototype_patch> tags, with no other text.
 """
 
     def get_ui_prototype_variant_system_prompt(self):
@@ -84,50 +128,28 @@ The variant should be clearly different in visual design while preserving the us
 Remember, your output MUST ONLY contain the complete code wrapped in <prototype_file> tags, with no other text.
 """
 
-    def generate_prototype(self, prompt: str):
-        """Generate a UI prototype using Claude"""
-        
-        # Prepare the messages for Claude
-        messages = [{
-            "role": "user",
-            "content": [{
-                "type": "text",
-                "text": prompt
-            }]
-        }]
+    def _parse_prototype_response(self, content: str, default_name: str):
+        """Extract the name and HTML from the <prototype_file> envelope"""
+        prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
         
-        # Create request body
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": self.get_ui_prototype_system_prompt(),
-            "messages": messages
-        })
-        
-        # Invoke model and get response
+        if prototype_match:
+            return {
+                'name': prototype_match.group(1),
+                'html_content': prototype_match.group(2)
+            }
+        return {
+            'name': default_name,
+            'html_content': content  # Return raw content if no match
+        }
+
+    def _invoke_model(self, body: str, action: str):
+        """Invoke Claude, falling back to the other model/region on any error; returns the response body"""
         try:
             response = self.bedrock_runtime.invoke_model(
                 body=body,
                 modelId=self.CLAUDE_35_SONNET_V2
             )
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            content = response_body['content'][0]['text']
-            
-            # Extract HTML content from XML tags
-            prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
-            
-            if prototype_match:
-                prototype_name = prototype_match.group(1)
-                html_content = prototype_match.group(2)
-                return {
-                    'name': prototype_name,
-                    'html_content': html_content
-                }
-            else:
-                return {
-                    'name': 'Untitled Prototype',
-                    'html_content': content  # Return raw content if no match
-                }
+            return json.loads(response['body'].read().decode('utf-8'))
                 
         except Exception as e:
             # Fallback to other model or region
@@ -136,107 +158,47 @@ Remember, your output MUST ONLY contain the complete code wrapped in <prototype_
                     body=body,
                     modelId=self.CLAUDE_35_SONNET_V1
                 )
-                response_body = json.loads(response['body'].read().decode('utf-8'))
-                content = response_body['content'][0]['text']
-                
-                # Extract HTML content from XML tags
-                prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
-                
-                if prototype_match:
-                    prototype_name = prototype_match.group(1)
-                    html_content = prototype_match.group(2)
-                    return {
-                        'name': prototype_name,
-                        'html_content': html_content
-                    }
-                else:
-                    return {
-                        'name': 'Untitled Prototype',
-                        'html_content': content  # Return raw content if no match
-                    }
+                return json.loads(response['body'].read().decode('utf-8'))
             except Exception as fallback_error:
-                raise Exception(f"Failed to generate prototype: {str(fallback_error)}")
+                raise Exception(f"Failed to {action}: {str(fallback_error)}")
 
-    def edit_prototype(self, current_html: str, edit_prompt: str):
-        """
-        Edit a UI prototype using Claude based on an existing version
-        """
-        
-        # Prepare the messages for Claude
-        messages = [{
-            "role": "user",
-            "content": [{
-                "type": "text",
-                "text": f"Here is the current prototype code:\n\n```html\n{current_html}\n```\n\nPlease make the following changes:\n\n{edit_prompt}"
-            }]
-        }]
-        
-        # Create request body
-        body = json.dumps({
+    def _invoke_prototype_model(self, body: str, default_name: str, action: str):
+        """Invoke Claude and parse the <prototype_file> envelope, with the token usage"""
+        response_body = self._invoke_model(body, action)
+        result = self._parse_prototype_response(response_body['content'][0]['text'], default_name)
+        result['usage'] = _usage(response_body)
+        return result
+
+    def _request_body(self, system_prompt: str, text: str) -> str:
+        return json.dumps({
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": self.get_ui_prototype_edit_system_prompt(),
-            "messages": messages
+            "max_tokens": self.MAX_TOKENS,
+            "system": system_prompt,
+            "messages": [{
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": text
+                }]
+            }]
         })
-        
-        try:
-            response = self.bedrock_runtime.invoke_model(
-                body=body,
-                modelId=self.CLAUDE_35_SONNET_V2
-            )
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            content = response_body['content'][0]['text']
-            
-            # Extract HTML content from XML tags
-            prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
-            
-            if prototype_match:
-                prototype_name = prototype_match.group(1)
-                html_content = prototype_match.group(2)
-                return {
-                    'name': prototype_name,
-                    'html_content': html_content
-                }
-            else:
-                return {
-                    'name': f"Edited Prototype",
-                    'html_content': content  # Return raw content if no match
-                }
-                
-        except Exception as e:
-            # Fallback to other model or region
-            try:
-                response = self.bedrock_runtime_us_east.invoke_model(
-                    body=body,
-                    modelId=self.CLAUDE_35_SONNET_V1
-                )
-                response_body = json.loads(response['body'].read().decode('utf-8'))
-                content = response_body['content'][0]['text']
-                
-                # Extract HTML content from XML tags
-                prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
-                
-                if prototype_match:
-                    prototype_name = prototype_match.group(1)
-                    html_content = prototype_match.group(2)
-                    return {
-                        'name': prototype_name,
-                        'html_content': html_content
-                    }
-                else:
-                    return {
-                        'name': f"Edited Prototype",
-                        'html_content': content  # Return raw content if no match
-                    }
-            except Exception as fallback_error:
-                raise Exception(f"Failed to edit prototype: {str(fallback_error)}")
-    
-    def create_variant(self, current_html: str, variant_prompt: str = None):
-        """
-        Create a variant of a UI prototype using Claude based on an existing version
-        """
-        
-        # Prepare the messages for Claude
+
+    def _generate_body(self, prompt: str) -> str:
+        return self._request_body(self.get_ui_prototype_system_prompt(), prompt)
+
+    def _edit_body(self, current_html: str, edit_prompt: str) -> str:
+        return self._request_body(
+            self.get_ui_prototype_edit_system_prompt(),
+            f"Here is the current prototype code:\n\n```html\n{current_html}\n```\n\nPlease make the following changes:\n\n{edit_prompt}"
+        )
+
+    def _patch_body(self, current_html: str, edit_prompt: str) -> str:
+        return self._request_body(
+            self.get_ui_prototype_patch_system_prompt(),
+            f"Here is the current prototype code:\n\n```html\n{current_html}\n```\n\nPlease make the following changes:\n\n{edit_prompt}"
+        )
+
+    def _variant_body(self, current_html: str, variant_prompt: str = None) -> str:
         prompt_text = "Here is the original prototype code:\n\n```html\n{}\n```\n\n".format(current_html)
         
         if variant_prompt:
@@ -244,70 +206,247 @@ Remember, your output MUST ONLY contain the complete code wrapped in <prototype_
         else:
             prompt_text += "Please create a variant of this prototype with a different visual design but maintaining the same functionality."
         
-        messages = [{
-            "role": "user",
-            "content": [{
-                "type": "text",
-                "text": prompt_text
-            }]
-        }]
+        return self._request_body(self.get_ui_prototype_variant_system_prompt(), prompt_text)
+
+    def generate_prototype(self, prompt: str):
+        """Generate a UI prototype using Claude"""
+        body = self._generate_body(prompt)
         
-        # Create request body
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": self.get_ui_prototype_variant_system_prompt(),
-            "messages": messages
+        # Identical prompts are served from the response cache, and concurrent
+        # identical requests share a single upstream call
+        shared, cached = llm_response_cache.lookup_or_call(
+            llm_response_cache.make_key(self.CLAUDE_35_SONNET_V2, body),
+            lambda: self._invoke_prototype_model(body, 'Untitled Prototype', 'generate prototype'),
+            bypass=self.bypass_cache
+        )
+        # The cached dict is shared by every caller, so each gets its own copy
+        result = {**shared, 'usage': dict(shared['usage']), 'cached': cached}
+        if cached:
+            # No tokens were spent on this request
+            result['usage'] = {'input_tokens': 0, 'output_tokens': 0}
+        return result
+
+    def edit_prototype(self, current_html: str, edit_prompt: str, mode: str = None):
+        """
+        Edit a UI prototype using Claude based on an existing version.
+
+        In ``patch`` mode (the default, see ``PROTOTYPE_EDIT_MODE``) the model
+        returns SEARCH/REPLACE hunks that are applied to ``current_html``; if
+        they don't apply cleanly the edit is regenerated in full. ``full``
+        mode always asks for the complete file. The result also carries
+        ``edit_mode`` (patch, full or fallback), the token usage and the
+        savings recorded by ``_with_edit_metrics``.
+        """
+        mode = mode or getattr(settings, 'PROTOTYPE_EDIT_MODE', 'patch')
+        started = time.monotonic()
+        patch_output_tokens = 0
+
+        if mode == 'patch':
+            response_body = self._invoke_model(self._patch_body(current_html, edit_prompt), 'edit prototype')
+            usage = _usage(response_body)
+            try:
+                if response_body.get('stop_reason') == 'max_tokens':
+                    raise PatchError('Patch was truncated')
+                name, hunks = parse_patch(response_body['content'][0]['text'])
+                result = {'name': name, 'html_content': apply_patch(current_html, hunks), 'usage': usage}
+                return self._with_edit_metrics(result, 'patch', started)
+            except PatchError as e:
+                logger.info(f"Prototype patch rejected, regenerating in full: {e}")
+                patch_output_tokens = usage['output_tokens']
+
+        body = self._edit_body(current_html, edit_prompt)
+        result = self._invoke_prototype_model(body, "Edited Prototype", 'edit prototype')
+        if mode != 'patch':
+            return self._with_edit_metrics(result, 'full', started)
+        result['usage']['output_tokens'] += patch_output_tokens
+        return self._with_edit_metrics(result, 'fallback', started, wasted_tokens=patch_output_tokens)
+
+    def _with_edit_metrics(self, result, edit_mode: str, started: float, wasted_tokens: int = 0):
+        """
+        Attach what the edit cost and what it saved compared with a full
+        regeneration. A full regeneration would have written the whole
+        envelope (~4 characters per token, capped at max_tokens); latency
+        saved converts the token difference at ``PROTOTYPE_OUTPUT_TOKENS_PER_SECOND``.
+        """
+        if edit_mode == 'patch':
+            full_tokens = min(self.MAX_TOKENS, (len(result['html_content']) + len(result['name']) + 40) // 4)
+            saved = max(0, full_tokens - result['usage']['output_tokens'])
+        else:
+            saved = -wasted_tokens
+        tokens_per_second = getattr(settings, 'PROTOTYPE_OUTPUT_TOKENS_PER_SECOND', 60)
+        result.update({
+            'edit_mode': edit_mode,
+            'generation_ms': int((time.monotonic() - started) * 1000),
+            'output_tokens_saved': saved,
+            'latency_saved_ms': int(saved / tokens_per_second * 1000),
         })
-        
+        return result
+    
+    def create_variant(self, current_html: str, variant_prompt: str = None):
+        """
+        Create a variant of a UI prototype using Claude based on an existing version
+        """
+        body = self._variant_body(current_html, variant_prompt)
+        return self._invoke_prototype_model(body, "New Variant", 'create variant')
+
+    def create_variants(self, current_html: str, variant_prompts, max_workers: int):
+        """
+        Generate one variant per entry of ``variant_prompts`` concurrently, at
+        most ``max_workers`` model calls at a time. Yields ``(index, result,
+        error)`` in completion order so callers can save each variant as soon
+        as it is ready; a failed variant doesn't affect the others.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prototype-variant') as executor:
+            futures = {
+                executor.submit(self.create_variant, current_html, variant_prompt): index
+                for index, variant_prompt in enumerate(variant_prompts)
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    def _open_prototype_stream(self, body: str, action: str):
+        """Start a streamed invocation, falling back to the other model/region on any error"""
         try:
-            response = self.bedrock_runtime.invoke_model(
+            return self.bedrock_runtime.invoke_model_with_response_stream(
                 body=body,
                 modelId=self.CLAUDE_35_SONNET_V2
             )
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            content = response_body['content'][0]['text']
-            
-            # Extract HTML content from XML tags
-            prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
-            
-            if prototype_match:
-                prototype_name = prototype_match.group(1)
-                html_content = prototype_match.group(2)
-                return {
-                    'name': prototype_name,
-                    'html_content': html_content
-                }
-            else:
-                return {
-                    'name': "New Variant",
-                    'html_content': content  # Return raw content if no match
-                }
-                
-        except Exception as e:
-            # Fallback to other model or region
+        except Exception:
             try:
-                response = self.bedrock_runtime_us_east.invoke_model(
+                return self.bedrock_runtime_us_east.invoke_model_with_response_stream(
                     body=body,
                     modelId=self.CLAUDE_35_SONNET_V1
                 )
-                response_body = json.loads(response['body'].read().decode('utf-8'))
-                content = response_body['content'][0]['text']
-                
-                # Extract HTML content from XML tags
-                prototype_match = re.search(r'<prototype_file name="([^"]+)">(.*?)</prototype_file>', content, re.DOTALL)
-                
-                if prototype_match:
-                    prototype_name = prototype_match.group(1)
-                    html_content = prototype_match.group(2)
-                    return {
-                        'name': prototype_name,
-                        'html_content': html_content
-                    }
-                else:
-                    return {
-                        'name': "New Variant",
-                        'html_content': content  # Return raw content if no match
-                    }
             except Exception as fallback_error:
-                raise Exception(f"Failed to create variant: {str(fallback_error)}") 
\ No newline at end of file
+                raise Exception(f"Failed to {action}: {str(fallback_error)}")
+
+    def _stream_prototype_model(self, body: str, default_name: str, action: str):
+        """
+        Yield ``name`` and ``html`` events as the envelope streams in, then a
+        final ``result`` event with the same shape the blocking methods return
+        plus the token ``usage``. HTML deltas are coalesced into frames like
+        chat streaming.
+        """
+        response = self._open_prototype_stream(body, action)
+        parser = PrototypeEnvelopeParser(default_name)
+        relay = DeltaCoalescer(
+            flush_interval=getattr(settings, 'STREAM_FLUSH_INTERVAL', 0.04),
+            flush_bytes=getattr(settings, 'STREAM_FLUSH_BYTES', 512)
+        )
+        usage = {'input_tokens': 0, 'output_tokens': 0}
+        started = time.monotonic()
+        try:
+            for chunk in with_flush_deadline(response['body'], relay):
+                if chunk is None:
+                    yield {'type': 'html', 'content': relay.flush()}
+                    continue
+                chunk_data = orjson.loads(chunk['chunk']['bytes'])
+                if chunk_data['type'] == 'message_start':
+                    usage['input_tokens'] = chunk_data['message'].get('usage', {}).get('input_tokens', 0)
+                elif chunk_data['type'] == 'message_delta':
+                    usage['output_tokens'] = chunk_data.get('usage', {}).get('output_tokens', usage['output_tokens'])
+                if chunk_data['type'] != 'content_block_delta':
+                    continue
+                for event in parser.feed(chunk_data['delta'].get('text', '')):
+                    if event['type'] == 'name':
+                        yield event
+                    elif relay.add(event['content']):
+                        yield {'type': 'html', 'content': relay.flush()}
+        except Exception as e:
+            raise Exception(f"Failed to {action}: {str(e)}")
+        if relay.has_pending:
+            yield {'type': 'html', 'content': relay.flush()}
+        yield {
+            'type': 'result', **parser.result(), 'usage': usage,
+            'generation_ms': int((time.monotonic() - started) * 1000)
+        }
+
+    def generate_prototype_stream(self, prompt: str):
+        """Streaming variant of ``generate_prototype``"""
+        return self._stream_prototype_model(self._generate_body(prompt), 'Untitled Prototype', 'generate prototype')
+
+    def edit_prototype_stream(self, current_html: str, edit_prompt: str, mode: str = None):
+        """
+        Streaming variant of ``edit_prototype``. A patch is only useful once
+        it has been applied, so in ``patch`` mode the edited HTML arrives in a
+        single ``html`` event when the (short) patch response is complete.
+        """
+        mode = mode or getattr(settings, 'PROTOTYPE_EDIT_MODE', 'patch')
+        if mode == 'patch':
+            return self._patched_edit_events(current_html, edit_prompt)
+        return self._stream_prototype_model(self._edit_body(current_html, edit_prompt), "Edited Prototype", 'edit prototype')
+
+    def _patched_edit_events(self, current_html: str, edit_prompt: str):
+        result = self.edit_prototype(current_html, edit_prompt, mode='patch')
+        yield {'type': 'name', 'name': result['name']}
+        yield {'type': 'html', 'content': result['html_content']}
+        yield {'type': 'result', **result}
+
+    def create_variant_stream(self, current_html: str, variant_prompt: str = None):
+        """Streaming variant of ``create_variant``"""
+        return self._stream_prototype_model(self._variant_body(current_html, variant_prompt), "New Variant", 'create variant')
+
+    # Persistence, shared by the blocking, streaming and job endpoints
+
+    @staticmethod
+    def save_prototype(design_project, group, prompt: str, result) -> Prototype:
+        """Create a prototype with its original variant and version 0"""
+        with transaction.atomic():
+            prototype = Prototype.objects.create(
+                design_project=design_project,
+                group=group,
+                title=result['name'],
+                prompt=prompt
+            )
+            variant = PrototypeVariant.objects.create(
+                prototype=prototype,
+                name="Original",
+                description="Original prototype design",
+                is_original=True
+            )
+            PrototypeVersion.objects.create(
+                variant=variant,
+                version_number=0,
+                name=result['name'],
+                html_content=result['html_content']
+            )
+        return prototype
+
+    @staticmethod
+    def save_variant(prototype, name: str, description: str, variant_prompt: str, result) -> PrototypeVariant:
+        """Create a new variant with its first version"""
+        with transaction.atomic():
+            variant = PrototypeVariant.objects.create(
+                prototype=prototype,
+                name=name,
+                description=description,
+                is_original=False
+            )
+            PrototypeVersion.objects.create(
+                variant=variant,
+                version_number=0,
+                name=result['name'],
+                edit_prompt=variant_prompt,
+                html_content=result['html_content']
+            )
+        return variant
+
+    @staticmethod
+    def save_version(variant, edit_prompt: str, result) -> PrototypeVersion:
+        """Append an edited version, numbered at save time"""
+        latest = variant.versions.order_by('-version_number').first()
+        return PrototypeVersion.objects.create(
+            variant=variant,
+            version_number=latest.version_number + 1 if latest else 0,
+            name=result['name'],
+            edit_prompt=edit_prompt,
+            html_content=result['html_content'],
+            edit_mode=result.get('edit_mode', 'full'),
+            output_tokens=result.get('usage', {}).get('output_tokens'),
+            generation_ms=result.get('generation_ms'),
+            output_tokens_saved=result.get('output_tokens_saved', 0),
+            latency_saved_ms=result.get('latency_saved_ms', 0)
+        )
@@ -0,0 +1,131 @@
+import logging
+import time
+from celery import shared_task
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from appauth.models import AppUser
+from aiassistant.storage_backends import PrototypeHtmlStorage
+from .models import HtmlBlob, HtmlEncoding, PrototypeJob
+from .services import PrototypeService
+
+logger = logging.getLogger(__name__)
+
+# How often progress (name, generated characters) is written back to the job row
+PROGRESS_INTERVAL = 1.0  # seconds
+
+
+def _claim(job: PrototypeJob) -> bool:
+    """
+    Move a pending job to running unless the user is already at their
+    concurrency limit. The user row is locked so two workers can't both
+    take the last slot.
+    """
+    limit = getattr(settings, 'PROTOTYPE_JOBS_PER_USER', 2)
+    with transaction.atomic():
+        AppUser.objects.select_for_update().get(pk=job.user_id)
+        # Jobs whose worker died are failed rather than counted forever
+        PrototypeJob.fail_stale(job.user_id)
+        running = PrototypeJob.objects.filter(user_id=job.user_id, status='running').count()
+        if running >= limit:
+            return False
+        return PrototypeJob.objects.filter(id=job.id, status='pending').update(
+            status='running', started_at=timezone.now()
+        ) == 1
+
+
+def _events_for(job: PrototypeJob, service: PrototypeService):
+    params = job.params
+    if job.kind == 'generate':
+        return service.generate_prototype_stream(params['prompt'])
+
+    if job.kind == 'variant':
+        original = job.prototype.variants.filter(is_original=True).first()
+        base_version = original.versions.order_by('-version_number').first() if original else None
+        if not base_version:
+            raise ValueError('No versions found for the original variant')
+        return service.create_variant_stream(base_version.html_content, params.get('prompt'))
+
+    latest_version = job.variant.versions.order_by('-version_number').first()
+    if not latest_version:
+        raise ValueError('No previous versions found for this variant')
+    return service.edit_prototype_stream(latest_version.html_content, params['edit_prompt'], mode=params.get('mode'))
+
+
+def _save(job: PrototypeJob, result):
+    """Persist the generated HTML and return the new PrototypeVersion"""
+    params = job.params
+    if job.kind == 'generate':
+        prototype = PrototypeService.save_prototype(
+            job.design_project, job.design_project.groups.filter(id=params.get('group_id')).first(),
+            params['prompt'], result
+        )
+        return prototype.variants.get(is_original=True).versions.get(version_number=0)
+
+    if job.kind == 'variant':
+        variant = PrototypeService.save_variant(
+            job.prototype,
+            params.get('name') or f"Variant of {job.prototype.title}",
+            params.get('description', ''),
+            params.get('prompt'),
+            result
+        )
+        return variant.versions.get(version_number=0)
+
+    return PrototypeService.save_version(job.variant, params['edit_prompt'], result)
+
+
+@shared_task(bind=True, max_retries=None, ignore_result=True)
+def run_prototype_job(self, job_id: str):
+    """Run one prototype job, waiting for a free per-user slot first"""
+    try:
+        job = PrototypeJob.objects.select_related('design_project', 'prototype', 'variant').get(id=job_id)
+    except PrototypeJob.DoesNotExist:
+        return
+    if job.status != 'pending':
+        return
+
+    if not _claim(job):
+        raise self.retry(countdown=getattr(settings, 'PROTOTYPE_JOB_RETRY_DELAY', 5))
+
+    jobs = PrototypeJob.objects.filter(id=job.id)
+    try:
+        generated = 0
+        last_progress = time.monotonic()
+        for event in _events_for(job, PrototypeService()):
+            if event['type'] == 'name':
+                jobs.update(name=event['name'][:200])
+            elif event['type'] == 'html':
+                generated += len(event['content'])
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    jobs.update(generated_chars=generated)
+                    last_progress = time.monotonic()
+            elif event['type'] == 'result':
+                version = _save(job, event)
+                jobs.update(
+                    status='done',
+                    name=event['name'][:200],
+                    generated_chars=len(event['html_content']),
+                    result_version=version,
+                    input_tokens=event['usage']['input_tokens'],
+                    output_tokens=event['usage']['output_tokens'],
+                    finished_at=timezone.now()
+                )
+    except Exception as e:
+        logger.exception(f"Prototype job {job.id} failed")
+        jobs.update(status='failed', error=str(e), finished_at=timezone.now())
+
+
+@shared_task(ignore_result=True)
+def publish_html_blob(blob_hash: str):
+    """Upload a blob's gzipped HTML to PrototypeHtmlStorage so previews can be served by the CDN"""
+    blob = HtmlBlob.objects.filter(hash=blob_hash, published_at__isnull=True).first()
+    if not blob:
+        return
+    encoding = blob.encodings.filter(encoding='gzip').first()
+    if not encoding:
+        HtmlEncoding.create_for(blob)
+        encoding = blob.encodings.get(encoding='gzip')
+    PrototypeHtmlStorage().save(blob.published_name, ContentFile(bytes(encoding.data)))
+    HtmlBlob.objects.filter(hash=blob_hash).update(published_at=timezone.now())
@@ -1,3 +1,514 @@
-from django.test import TestCase
+import gzip
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from aiassistant.query_budget import Endpoint, QueryBudgetMixin
+from appauth.models import AppUser
+from chat.services.llm_cache import llm_response_cache
+from .models import (
+    DesignProject, Group, HtmlBlob, HtmlEncoding, Prototype, PrototypeJob, PrototypeVariant, PrototypeVersion
+)
+from .envelope import PrototypeEnvelopeParser
+from .patching import PatchError, apply_patch, parse_patch
+from .services import PrototypeService
+from .tasks import run_prototype_job
+from .version_store import text_cache
+
+PAGE = '<!DOCTYPE html>\n<html>\n<body>\n<h1>{title}</h1>\n<p>{body}</p>\n</body>\n</html>\n'
+RESULT = {'name': 'Landing page', 'html_content': PAGE.format(title='Landing', body='Generated')}
+EDIT_RESULT = {
+    **RESULT, 'edit_mode': 'patch', 'usage': {'output_tokens': 40},
+    'generation_ms': 900, 'output_tokens_saved': 200, 'latency_saved_ms': 3000,
+}
+
+
+def stream(result):
+    return iter([{'type': 'delta', 'content': '<!DOCTYPE html>'}, {'type': 'result', **result}])
+
+
+class PrototypeQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    url_prefix = '/api/v1/prototypes/'
+    endpoints = [
+        Endpoint('GET', 'design-projects/', 2),
+        Endpoint('POST', 'design-projects/', 3, data={'title': 'New project'}, status=201),
+        Endpoint('GET', 'design-projects/{project.id}/', 5),
+        Endpoint('PATCH', 'design-projects/{project.id}/', 4, data={'title': 'Renamed'}),
+        Endpoint('DELETE', 'design-projects/{project.id}/', 16, status=204),
+        Endpoint('GET', 'design-projects/{project.id}/prototypes/', 4),
+        Endpoint('GET', 'groups/', 1),
+        Endpoint('POST', 'groups/', 3, data=lambda f: {'name': 'New group', 'design_project': str(f['project'].id)},
+                 status=201),
+        Endpoint('GET', 'groups/{group.id}/', 1),
+        Endpoint('PATCH', 'groups/{group.id}/', 2, data={'name': 'Renamed'}),
+        Endpoint('DELETE', 'groups/{group.id}/', 3, status=204),
+        Endpoint('GET', 'groups/{group.id}/prototypes/', 4),
+        Endpoint('GET', 'prototypes/', 3),
+        Endpoint('POST', 'prototypes/', 4, status=201, data=lambda f: {
+            'title': 'Blank', 'prompt': 'A blank page', 'design_project': str(f['project'].id),
+        }),
+        Endpoint('GET', 'prototypes/{prototype.id}/', 5),
+        Endpoint('PATCH', 'prototypes/{prototype.id}/', 5, data={'title': 'Renamed'}),
+        Endpoint('DELETE', 'prototypes/{prototype.id}/', 9, status=204),
+        Endpoint('POST', 'prototypes/{prototype.id}/create_variant/', 7, data={'prompt': 'Dark mode'}, status=202),
+        Endpoint('POST', 'prototypes/{prototype.id}/create_variant/stream/', 15, data={'prompt': 'Dark mode'}),
+        Endpoint('POST', 'prototypes/{prototype.id}/create_variants/', 22, data={'count': 2, 'prompt': 'Dark mode'},
+                 status=201),
+        Endpoint('GET', 'variants/', 2),
+        Endpoint('GET', 'variants/?prototype={prototype.id}', 2),
+        Endpoint('GET', 'variants/{variant.id}/', 4),
+        Endpoint('PATCH', 'variants/{variant.id}/', 3, data={'name': 'Renamed'}),
+        Endpoint('DELETE', 'variants/{variant.id}/', 6, status=204),
+        Endpoint('POST', 'variants/{variant.id}/create_version/', 6, data={'edit_prompt': 'Bigger title'}, status=202),
+        Endpoint('POST', 'variants/{variant.id}/create_version/stream/', 11, data={'edit_prompt': 'Bigger title'}),
+        Endpoint('GET', 'versions/', 1),
+        Endpoint('GET', 'versions/?variant={variant.id}', 1),
+        Endpoint('GET', 'versions/edit_stats/', 1),
+        Endpoint('GET', 'versions/{version.id}/', 3),
+        Endpoint('GET', 'versions/{version.id}/html/', 5, headers={'Accept-Encoding': 'gzip, br'}),
+        Endpoint('GET', 'jobs/', 2),
+        Endpoint('POST', 'jobs/', 4, data=lambda f: {'kind': 'edit', 'variant_id': str(f['variant'].id),
+                                                    'edit_prompt': 'Bigger title'}, status=202),
+        Endpoint('GET', 'jobs/{job.id}/', 2),
+        Endpoint('GET', 'jobs/{job.id}/events/', 2),
+        Endpoint('POST', 'generate-prototype/', 5, status=202,
+                 data=lambda f: {'design_project_id': str(f['project'].id), 'prompt': 'A landing page'}),
+        Endpoint('POST', 'generate-prototype/stream/', 16,
+                 data=lambda f: {'design_project_id': str(f['project'].id), 'prompt': 'A landing page'}),
+        # Admin changelists, which have the same N+1 risk in their list_display columns
+        Endpoint('GET', '/admin/prototypes/prototype/', 5, user='admin', session=True),
+        Endpoint('GET', '/admin/prototypes/prototypevariant/', 5, user='admin', session=True),
+        Endpoint('GET', '/admin/prototypes/prototypeversion/', 6, user='admin', session=True),
+        Endpoint('GET', '/admin/prototypes/prototypejob/', 5, user='admin', session=True),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        for attribute, value in [
+            ('generate_prototype', lambda *args, **kwargs: dict(RESULT)),
+            ('generate_prototype_stream', lambda *args, **kwargs: stream(RESULT)),
+            ('create_variant', lambda *args, **kwargs: dict(RESULT)),
+            ('create_variant_stream', lambda *args, **kwargs: stream(RESULT)),
+            ('create_variants', lambda self, html, prompts, max_workers: (
+                (index, dict(RESULT), None) for index in range(len(prompts))
+            )),
+            ('edit_prototype', lambda *args, **kwargs: dict(EDIT_RESULT)),
+            ('edit_prototype_stream', lambda *args, **kwargs: stream(EDIT_RESULT)),
+        ]:
+            patcher = mock.patch.object(PrototypeService, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reset_state(self):
+        super().reset_state()
+        # Measure cold reads, which walk the delta chain
+        text_cache.clear()
+
+    def build_fixture(self, size):
+        user = AppUser.objects.create_user(email=f'budget-{size}@example.com')
+        admin = AppUser.objects.create_superuser(email=f'budget-admin-{size}@example.com')
+        projects = [DesignProject.objects.create(user=user, title=f'Project {i}') for i in range(size)]
+        groups = [Group.objects.create(design_project=projects[0], name=f'Group {i}') for i in range(size)]
+        prototypes = [
+            Prototype.objects.create(design_project=projects[0], group=groups[0], title=f'Prototype {i}', prompt='A page')
+            for i in range(size)
+        ]
+        # n variants of n versions on the prototype the endpoints use; the rest stay small so cascade
+        # deletes stay under Django's 100-row delete batches
+        for i, prototype in enumerate(prototypes):
+            for j in range(size if i == 0 else 1):
+                variant = PrototypeVariant.objects.create(
+                    prototype=prototype, name='Original' if j == 0 else f'Variant {j}', is_original=j == 0
+                )
+                for k in range(size if i == 0 else 1):
+                    PrototypeVersion.objects.create(
+                        variant=variant, version_number=k, name=f'v{k}', edit_mode='patch' if k else '',
+                        html_content=PAGE.format(title=f'Prototype {i}.{j}', body=f'Version {k}')
+                    )
+        jobs = [
+            PrototypeJob.objects.create(
+                user=user, kind='generate', status='done', design_project=projects[0], params={'prompt': 'A page'}
+            )
+            for _ in range(size)
+        ]
+        variant = prototypes[0].variants.get(is_original=True)
+        return {
+            'user': user,
+            'admin': admin,
+            'project': projects[0],
+            'group': groups[0],
+            'prototype': prototypes[0],
+            'variant': variant,
+            'version': variant.versions.order_by('-version_number').first(),
+            'job': jobs[0],
+        }
+
+
+class VersionHtmlTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='html@example.com')
+        self.client.force_authenticate(self.user)
+        project = DesignProject.objects.create(user=self.user, title='Project')
+        prototype = Prototype.objects.create(design_project=project, title='Prototype', prompt='A page')
+        self.variant = PrototypeVariant.objects.create(prototype=prototype, name='Original', is_original=True)
+        self.versions = [
+            PrototypeVersion.objects.create(
+                variant=self.variant, version_number=k, name=f'v{k}', html_content=PAGE.format(title='Page', body=k)
+            )
+            for k in range(3)
+        ]
+
+    def get_html(self, version, **headers):
+        return self.client.get(f'/api/v1/prototypes/versions/{version.id}/html/', headers=headers)
+
+    def test_encodings_are_stored_on_first_request_only(self):
+        self.assertFalse(HtmlEncoding.objects.exists())
+        latest = self.versions[-1]
+        response = self.get_html(latest, **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), latest.html_content)
+        self.assertEqual(set(HtmlEncoding.objects.values_list('blob_id', flat=True)), {latest.blob_id})
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_html(latest, **{'Accept-Encoding': 'gzip'}).status_code, 200)
+        # Versions nobody requested keep no encodings
+        self.assertEqual(HtmlEncoding.objects.exclude(blob_id=latest.blob_id).count(), 0)
+
+    def test_pages_are_sandboxed(self):
+        latest = self.versions[-1]
+        plain = self.get_html(latest)
+        self.assertNotIn('Content-Encoding', plain)
+        encoded = self.get_html(latest, **{'Accept-Encoding': 'br, gzip'})
+        self.assertIn(encoded['Content-Encoding'], ('br', 'gzip'))
+        for response in (plain, encoded):
+            self.assertEqual(response['Content-Security-Policy'], 'sandbox allow-scripts')
+            self.assertNotIn('allow-same-origin', response['Content-Security-Policy'])
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+
+class PrototypeJobQueueTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='jobs@example.com')
+        self.client.force_authenticate(self.user)
+        self.project = DesignProject.objects.create(user=self.user, title='Project')
+        patcher = mock.patch('prototypes.views.run_prototype_job.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def running(self, count, started_at):
+        return [
+            PrototypeJob.objects.create(
+                user=self.user, kind='generate', status='running', design_project=self.project,
+                params={'prompt': 'A page'}, started_at=started_at
+            )
+            for _ in range(count)
+        ]
+
+    def submit(self):
+        return self.client.post(
+            '/api/v1/prototypes/jobs/', {'kind': 'generate', 'design_project_id': str(self.project.id), 'prompt': 'A page'}
+        )
+
+    @override_settings(PROTOTYPE_JOBS_MAX_QUEUED=2, PROTOTYPE_JOB_TIME_LIMIT=600)
+    def test_stale_running_jobs_do_not_fill_the_queue(self):
+        stale = self.running(2, timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.submit().status_code, 202)
+        self.running(1, timezone.now())
+        self.assertEqual(self.submit().status_code, 429)
+        # and are failed, so anything following them sees them finish
+        for job in stale:
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'failed')
+            self.assertIsNotNone(job.finished_at)
+
+    def test_sync_endpoints_queue_jobs(self):
+        prototype = PrototypeService.save_prototype(self.project, None, 'A page', RESULT)
+        variant = prototype.variants.get()
+        response = self.client.post(
+            f'/api/v1/prototypes/variants/{variant.id}/create_version/', {'edit_prompt': 'Bigger', 'mode': 'full'}
+        )
+        self.assertEqual(response.status_code, 202)
+        job = PrototypeJob.objects.get(id=response.data['id'])
+        self.assertEqual((job.kind, job.variant, job.params), ('edit', variant, {'edit_prompt': 'Bigger', 'mode': 'full'}))
+
+        response = self.client.post(
+            '/api/v1/prototypes/generate-prototype/', {'design_project_id': str(self.project.id), 'prompt': 'A page'}
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(PrototypeJob.objects.get(id=response.data['id']).kind, 'generate')
+
+    @override_settings(PROTOTYPE_JOB_EVENTS_TIMEOUT=0, PROTOTYPE_JOB_POLL_INTERVAL=0)
+    def test_events_stream_closes_after_its_timeout(self):
+        job, = self.running(1, timezone.now())
+        response = self.client.get(f'/api/v1/prototypes/jobs/{job.id}/events/')
+        events = b''.join(response.streaming_content).decode().split('\n\n')
+        self.assertTrue(events[0].startswith('event: running\n'))
+
+
+def job_stream(result, usage=None):
+    yield {'type': 'name', 'name': result['name']}
+    yield {'type': 'html', 'content': result['html_content']}
+    yield {'type': 'result', **result, 'usage': usage or {'input_tokens': 100, 'output_tokens': 50}}
+
+
+class PrototypeJobRunTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='runner@example.com')
+        self.project = DesignProject.objects.create(user=self.user, title='Project')
+
+    def run_job(self, **fields):
+        job = PrototypeJob.objects.create(user=self.user, **fields)
+        run_prototype_job(str(job.id))
+        job.refresh_from_db()
+        return job
+
+    def test_generate_job_saves_the_prototype(self):
+        with mock.patch.object(PrototypeService, 'generate_prototype_stream', return_value=job_stream(RESULT)):
+            job = self.run_job(kind='generate', design_project=self.project, params={'prompt': 'A page'})
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.name, job.input_tokens, job.output_tokens), ('Landing page', 100, 50))
+        self.assertEqual(job.result_version.html_content, RESULT['html_content'])
+        self.assertEqual(job.result_version.variant.prototype.design_project, self.project)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_edit_job_uses_its_mode(self):
+        variant = PrototypeService.save_prototype(self.project, None, 'A page', RESULT).variants.get()
+        with mock.patch.object(
+            PrototypeService, 'edit_prototype_stream', return_value=job_stream(EDIT_RESULT)
+        ) as edit:
+            job = self.run_job(kind='edit', variant=variant, params={'edit_prompt': 'Bigger', 'mode': 'full'})
+        self.assertEqual(edit.call_args.kwargs['mode'], 'full')
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.result_version.version_number, 1)
+
+    def test_failed_generation_marks_the_job_failed(self):
+        def failing(*args, **kwargs):
+            yield {'type': 'name', 'name': 'Landing page'}
+            raise RuntimeError('Model unavailable')
+
+        with mock.patch.object(PrototypeService, 'generate_prototype_stream', failing):
+            job = self.run_job(kind='generate', design_project=self.project, params={'prompt': 'A page'})
+        self.assertEqual((job.status, job.error), ('failed', 'Model unavailable'))
+        self.assertIsNone(job.result_version)
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(Prototype.objects.exists())
+
+
+def patch_response(*hunks, name='Edited page'):
+    body = ''.join(f'<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n' for search, replace in hunks)
+    return f'<prototype_patch name="{name}">\n{body}</prototype_patch>'
+
+
+class PatchingTests(SimpleTestCase):
+    html = PAGE.format(title='Title', body='Body')
+
+    def test_exact_match_is_replaced(self):
+        name, hunks = parse_patch(patch_response(('<h1>Title</h1>', '<h1>New title</h1>')))
+        self.assertEqual(name, 'Edited page')
+        self.assertEqual(apply_patch(self.html, hunks), PAGE.format(title='New title', body='Body'))
+
+    def test_trailing_whitespace_drift_still_matches(self):
+        html = self.html.replace('<h1>Title</h1>\n', '<h1>Title</h1>   \n')
+        patched = apply_patch(html, [('<h1>Title</h1>\n<p>Body</p>', '<h1>New</h1>\n<p>Text</p>')])
+        self.assertEqual(patched, PAGE.format(title='New', body='Text'))
+
+    def test_missing_search_block_is_rejected(self):
+        with self.assertRaisesMessage(PatchError, 'not found'):
+            apply_patch(self.html, [('<h2>Missing</h2>', '<h2>Found</h2>')])
+
+    def test_ambiguous_search_block_is_rejected(self):
+        html = self.html + '<p>Body</p>\n'
+        with self.assertRaisesMessage(PatchError, 'matches 2 places'):
+            apply_patch(html, [('<p>Body</p>', '<p>Text</p>')])
+        # Whitespace-insensitive matches must be unique too
+        html = '<p>Body</p>  \n<p>Body</p>\t\n'
+        with self.assertRaisesMessage(PatchError, 'several places'):
+            apply_patch(html, [('<p>Body</p>\n', '<p>Text</p>\n')])
+
+    def test_hunks_apply_in_order_to_the_patched_document(self):
+        hunks = [('<h1>Title</h1>', '<h1>Renamed</h1>'), ('<h1>Renamed</h1>\n<p>Body</p>', '<p>Merged</p>')]
+        self.assertNotIn('<h1>', apply_patch(self.html, hunks))
+        # A later hunk overlapping text an earlier one replaced no longer matches
+        overlapping = [('<h1>Title</h1>', '<h1>Renamed</h1>'), ('<h1>Title</h1>\n<p>Body</p>', '<p>Merged</p>')]
+        with self.assertRaises(PatchError):
+            apply_patch(self.html, overlapping)
+
+    def test_malformed_markers_are_rejected(self):
+        for content in [
+            '<h1>Title</h1>',
+            '<prototype_patch name="Edit">no hunks here</prototype_patch>',
+            '<prototype_patch name="Edit">\n<<<<<<< SEARCH\n<h1>Title</h1>\n>>>>>>> REPLACE\n</prototype_patch>',
+            '<prototype_patch name="Edit">\n<<<<<<< SEARCH\n<h1>Title</h1>\n=======\n<h1>New</h1>\n',
+        ]:
+            with self.subTest(content=content), self.assertRaises(PatchError):
+                parse_patch(content)
+        with self.assertRaisesMessage(PatchError, 'Empty SEARCH'):
+            apply_patch(self.html, [('  ', '<p>Inserted</p>')])
+
+    def test_rejected_patch_falls_back_to_full_regeneration(self):
+        full = f'<prototype_file name="Edited page">{PAGE.format(title="Full", body="Body")}</prototype_file>'
+        responses = [
+            {'content': [{'text': patch_response(('<h2>Missing</h2>', '<h2>Found</h2>'))}], 'usage': {'output_tokens': 30}},
+            {'content': [{'text': full}], 'usage': {'output_tokens': 400}},
+        ]
+        with mock.patch.object(PrototypeService, '_invoke_model', side_effect=responses):
+            result = PrototypeService().edit_prototype(self.html, 'Rename the title', mode='patch')
+        self.assertEqual(result['edit_mode'], 'fallback')
+        self.assertEqual(result['html_content'], PAGE.format(title='Full', body='Body'))
+        self.assertEqual(result['usage']['output_tokens'], 430)
+
+
+def long_page(revision):
+    """A page big enough for line deltas to beat a snapshot, with one line changed per revision"""
+    lines = [f'<li id="item-{i}">Item {i} of the catalogue, with a description</li>' for i in range(200)]
+    lines[revision * 7 % 200] = f'<li id="edited">Revision {revision}</li>'
+    return PAGE.format(title=f'Revision {revision}', body='\n'.join(lines))
+
+
+@override_settings(PROTOTYPE_SNAPSHOT_INTERVAL=5)
+class VersionStoreTests(APITestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(email='store@example.com')
+        project = DesignProject.objects.create(user=self.user, title='Project')
+        prototype = Prototype.objects.create(design_project=project, title='Prototype', prompt='A page')
+        self.variant = PrototypeVariant.objects.create(prototype=prototype, name='Original', is_original=True)
+        text_cache.clear()
+        self.addCleanup(text_cache.clear)
+
+    def create_versions(self, count, start=0):
+        return [
+            PrototypeVersion.objects.create(variant=self.variant, version_number=k, name=f'v{k}', html_content=long_page(k))
+            for k in range(start, start + count)
+        ]
+
+    def test_long_chain_round_trips_with_a_snapshot_every_interval(self):
+        self.create_versions(23)
+        text_cache.clear()
+        versions = PrototypeVersion.objects.filter(variant=self.variant).select_related('blob').order_by('version_number')
+        self.assertEqual([version.blob.depth for version in versions], [k % 5 for k in range(23)])
+        self.assertEqual([version.blob.is_delta for version in versions], [k % 5 != 0 for k in range(23)])
+        for k, version in enumerate(versions):
+            self.assertEqual(version.html_content, long_page(k))
+
+    def test_reading_a_delta_fetches_its_chain_in_one_query(self):
+        deepest = self.create_versions(5)[-1]
+        text_cache.clear()
+        version = PrototypeVersion.objects.get(id=deepest.id)
+        with self.assertNumQueries(2):
+            self.assertEqual(version.html_content, long_page(4))
+
+    def test_identical_html_shares_a_blob(self):
+        first, second = self.create_versions(2)
+        second.html_content = long_page(0)
+        second.save(update_fields=['html_content'])
+        second.refresh_from_db()
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(HtmlBlob.objects.count(), 2)
+
+    def test_legacy_rows_are_read_inline_and_compacted_into_blobs(self):
+        PrototypeVersion.objects.bulk_create([
+            PrototypeVersion(variant=self.variant, version_number=k, name=f'v{k}', legacy_html=long_page(k))
+            for k in range(3)
+        ])
+        legacy = PrototypeVersion.objects.get(variant=self.variant, version_number=2)
+        self.assertIsNone(legacy.blob_id)
+        self.assertEqual(legacy.html_content, long_page(2))
+
+        call_command('compact_prototype_versions', stdout=io.StringIO())
+        text_cache.clear()
+        versions = PrototypeVersion.objects.filter(variant=self.variant).order_by('version_number')
+        self.assertEqual([version.legacy_html for version in versions], ['', '', ''])
+        self.assertEqual([version.blob.depth for version in versions], [0, 1, 2])
+        self.assertEqual([version.html_content for version in versions], [long_page(k) for k in range(3)])
+
+    def test_prune_keeps_blobs_versions_or_deltas_still_use(self):
+        versions = self.create_versions(4)
+        orphan = HtmlBlob.store(long_page(99))
+        HtmlEncoding.create_for(orphan)
+        # v1's blob is still the base of v2's delta
+        versions[1].delete()
+
+        output = io.StringIO()
+        call_command('compact_prototype_versions', prune=True, stdout=output)
+        self.assertIn('Deleted 1 unused blobs', output.getvalue())
+        self.assertFalse(HtmlBlob.objects.filter(hash=orphan.hash).exists())
+        self.assertTrue(HtmlBlob.objects.filter(hash=versions[1].blob_id).exists())
+        text_cache.clear()
+        for k in (0, 2, 3):
+            self.assertEqual(PrototypeVersion.objects.get(id=versions[k].id).html_content, long_page(k))
+
+
+class GenerateCacheTests(SimpleTestCase):
+    def setUp(self):
+        llm_response_cache.clear()
+        self.addCleanup(llm_response_cache.clear)
+        invoked = {**RESULT, 'usage': {'input_tokens': 900, 'output_tokens': 2500}}
+        patcher = mock.patch.object(PrototypeService, '_invoke_prototype_model', return_value=invoked)
+        self.invoke = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hits_are_private_copies_that_spent_no_tokens(self):
+        first = PrototypeService().generate_prototype('A landing page')
+        self.assertFalse(first['cached'])
+        self.assertEqual(first['usage'], {'input_tokens': 900, 'output_tokens': 2500})
+        first['usage']['output_tokens'] += 100
+        first['name'] = 'Changed by the caller'
+
+        second = PrototypeService().generate_prototype('A landing page')
+        self.assertEqual(self.invoke.call_count, 1)
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['usage'], {'input_tokens': 0, 'output_tokens': 0})
+        self.assertEqual(second['name'], RESULT['name'])
+        self.assertEqual(PrototypeService(bypass_cache=True).generate_prototype('A landing page')['usage']['input_tokens'], 900)
+
+
+class EnvelopeParserTests(SimpleTestCase):
+    def feed(self, deltas, default_name='Untitled'):
+        parser = PrototypeEnvelopeParser(default_name)
+        events = [event for delta in deltas for event in parser.feed(delta)]
+        return events, parser.result()
+
+    def split(self, text, size):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def test_tags_split_across_deltas(self):
+        html = PAGE.format(title='Split', body='Body')
+        envelope = f'Here you go:\n<prototype_file name="Landing page">{html}</prototype_file>\nDone.'
+        for size in (1, 2, 7, len(envelope)):
+            with self.subTest(size=size):
+                events, result = self.feed(self.split(envelope, size))
+                self.assertEqual(events[0], {'type': 'name', 'name': 'Landing page'})
+                self.assertEqual([event['type'] for event in events[1:]], ['html'] * (len(events) - 1))
+                self.assertEqual(''.join(event['content'] for event in events[1:]), html)
+                self.assertEqual(result, {'name': 'Landing page', 'html_content': html})
+
+    def test_markup_resembling_the_tags_stays_in_the_html(self):
+        html = (
+            '<p>&lt;/prototype_file&gt; and </prototype_files> are text</p>\n'
+            '<script>const tag = "<prototype_file name=\\"x\\">";</script>\n'
+        )
+        events, result = self.feed(self.split(f'<prototype_file name="Tricky">{html}</prototype_file>', 5))
+        self.assertEqual(result['html_content'], html)
+        self.assertEqual(''.join(event['content'] for event in events if event['type'] == 'html'), html)
+
+    def test_missing_envelope_falls_back_to_the_raw_text(self):
+        raw = '<html><body>No envelope</body></html>'
+        events, result = self.feed(self.split(raw, 4), default_name='Untitled Prototype')
+        self.assertEqual(events, [])
+        self.assertEqual(result, {'name': 'Untitled Prototype', 'html_content': raw})
+
+    def test_truncated_body_keeps_what_arrived(self):
+        events, result = self.feed(['<prototype_file name="Cut">', '<main>half a page'])
+        self.assertEqual(result, {'name': 'Cut', 'html_content': '<main>half a page'})
+        # The held-back tail is only released by result()
+        self.assertNotEqual(''.join(event.get('content', '') for event in events), result['html_content'])
+
+    def test_empty_body_and_text_after_the_envelope(self):
+        events, result = self.feed(['<prototype_file name="Empty"></prototype_file>', ' trailing text'])
+        self.assertEqual(events, [{'type': 'name', 'name': 'Empty'}])
+        self.assertEqual(result, {'name': 'Empty', 'html_content': ''})
@@ -8,10 +8,12 @@ router.register(r'groups', views.GroupViewSet, basename='group')
 router.register(r'prototypes', views.PrototypeViewSet, basename='prototype')
 router.register(r'variants', views.PrototypeVariantViewSet, basename='variant')
 router.register(r'versions', views.PrototypeVersionViewSet, basename='version')
+router.register(r'jobs', views.PrototypeJobViewSet, basename='prototype-job')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('design-projects/<uuid:project_id>/prototypes/', views.design_project_prototypes, name='design-project-prototypes'),
     path('groups/<uuid:group_id>/prototypes/', views.group_prototypes, name='group-prototypes'),
     path('generate-prototype/', views.generate_prototype, name='generate-prototype'),
+    path('generate-prototype/stream/', views.generate_prototype_stream, name='generate-prototype-stream'),
 ] 
\ No newline at end of file
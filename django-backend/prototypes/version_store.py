@@ -0,0 +1,121 @@
+import difflib
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import orjson
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is precompressed
+    brotli = None
+
+COMPRESSION_LEVEL = 6
+
+
+def content_hash(html: str) -> str:
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def compress_full(html: str) -> bytes:
+    return zlib.compress(html.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress_full(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+
+def encode_delta(base: str, target: str) -> bytes:
+    """
+    Line-level delta from ``base`` to ``target``: a compressed JSON list
+    whose items are either ``[start, end]`` (copy those base lines) or a
+    string (insert this text).
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(target_lines[j1:j2]))
+    return zlib.compress(orjson.dumps(ops), COMPRESSION_LEVEL)
+
+
+def apply_delta(base: str, data: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in orjson.loads(zlib.decompress(data)):
+        parts.append(op if isinstance(op, str) else ''.join(base_lines[op[0]:op[1]]))
+    return ''.join(parts)
+
+
+def transfer_encodings(html: str) -> Dict[str, bytes]:
+    """
+    The HTML precompressed at maximum effort for ``Content-Encoding``; done
+    once per blob so serving never compresses.
+    """
+    raw = html.encode('utf-8')
+    encoded = {'gzip': gzip.compress(raw, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(raw, mode=brotli.MODE_TEXT, quality=11)
+    return encoded
+
+
+def choose_encoding(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """Best of ``available`` that the ``Accept-Encoding`` header allows (br before gzip)"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    available = set(available)
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+class TextCache:
+    """
+    Small LRU of reconstructed HTML keyed by content hash. Blobs never
+    change once written, so entries can't go stale; it mostly saves walking
+    a delta chain again when the next edit is stored against the version
+    that was just read.
+    """
+
+    def __init__(self, size: int = 128):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            text = self._items.get(digest)
+            if text is not None:
+                self._items.move_to_end(digest)
+            return text
+
+    def put(self, digest: str, text: str):
+        with self._lock:
+            self._items[digest] = text
+            self._items.move_to_end(digest)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+text_cache = TextCache()
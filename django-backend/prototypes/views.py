@@ -1,25 +1,82 @@
 from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+from rest_framework import mixins
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import DesignProject, Group, Prototype, PrototypeVariant, PrototypeVersion
+from .models import DesignProject, Group, Prototype, PrototypeVariant, PrototypeVersion, PrototypeJob, HtmlEncoding
 from .serializers import (
     DesignProjectSerializer, DesignProjectDetailSerializer,
     GroupSerializer, 
     PrototypeSerializer, PrototypeDetailSerializer,
     PrototypeVariantSerializer, PrototypeVariantDetailSerializer,
-    PrototypeVersionSerializer
+    PrototypeVersionSerializer, PrototypeVersionSummarySerializer,
+    PrototypeJobSerializer, PrototypeJobCreateSerializer, EDIT_MODES
 )
 from .services import PrototypeService
+from .version_store import choose_encoding, content_hash
+from .tasks import run_prototype_job
+import time
+import orjson
 
 # Create your views here.
 
+def queue_prototype_job(request, data):
+    """
+    Validate ``data`` with PrototypeJobCreateSerializer and queue the job for
+    a worker. Returns 202 with the job, or 429 when the user already has
+    ``PROTOTYPE_JOBS_MAX_QUEUED`` jobs in progress.
+    """
+    serializer = PrototypeJobCreateSerializer(data=data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+
+    PrototypeJob.fail_stale(request.user.pk)
+    max_queued = getattr(settings, 'PROTOTYPE_JOBS_MAX_QUEUED', 10)
+    queued = PrototypeJob.active_for(request.user.pk).count()
+    if queued >= max_queued:
+        return Response(
+            {'error': f'Too many prototype jobs in progress (limit {max_queued})'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    job = serializer.save()
+    transaction.on_commit(lambda: run_prototype_job.delay(str(job.id)))
+    return Response(PrototypeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+def stream_prototype_events(events, persist):
+    """
+    Relay prototype stream events as NDJSON lines. ``persist`` is called once
+    with the final result and returns the serialized object for the ``done``
+    line, so nothing is written to the database unless generation finishes.
+    """
+    try:
+        for event in events:
+            if event['type'] == 'result':
+                result = {key: value for key, value in event.items() if key != 'type'}
+                yield orjson.dumps({'type': 'done', 'data': persist(result)}) + b'\n'
+            else:
+                yield orjson.dumps(event) + b'\n'
+    except Exception as e:
+        yield orjson.dumps({'type': 'error', 'error': str(e)}) + b'\n'
+
+
+def prototype_stream_response(events, persist):
+    return StreamingHttpResponse(
+        stream_prototype_events(events, persist),
+        content_type='text/event-stream'
+    )
+
 class DesignProjectViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return DesignProject.objects.filter(user=self.request.user)
+        queryset = DesignProject.objects.filter(user=self.request.user)
+        return self.get_serializer_class().setup_eager_loading(queryset)
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -48,7 +105,10 @@ class PrototypeViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Prototype.objects.filter(design_project__user=self.request.user)
+        queryset = Prototype.objects.filter(design_project__user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = self.get_serializer_class().setup_eager_loading(queryset)
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -57,11 +117,11 @@ class PrototypeViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def create_variant(self, request, pk=None):
-        """Create a new variant for a prototype"""
+        """
+        Queue a new variant for a prototype. Returns 202 with the
+        PrototypeJob; follow it at ``jobs/<id>/`` for the new version.
+        """
         prototype = self.get_object()
-        variant_name = request.data.get('name', f"Variant of {prototype.title}")
-        variant_description = request.data.get('description', '')
-        variant_prompt = request.data.get('prompt', None)
         
         # Get the original variant to use as a base
         original_variant = prototype.variants.filter(is_original=True).first()
@@ -81,43 +141,139 @@ class PrototypeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            # Create the new variant
-            new_variant = PrototypeVariant.objects.create(
-                prototype=prototype,
-                name=variant_name,
-                description=variant_description,
-                is_original=False
-            )
-            
-            # Generate the variant using Claude
-            prototype_service = PrototypeService()
-            result = prototype_service.create_variant(
-                base_version.html_content, 
-                variant_prompt
-            )
-            
-            # Create the first version (version 0) for this variant
-            version = PrototypeVersion.objects.create(
-                variant=new_variant,
-                version_number=0,
-                name=result['name'],
-                edit_prompt=variant_prompt,
-                html_content=result['html_content']
-            )
-            
-            # Return the new variant with its first version
-            variant_serializer = PrototypeVariantDetailSerializer(new_variant)
-            return Response(variant_serializer.data, status=status.HTTP_201_CREATED)
-            
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Generated by a worker, so a slow model call can't time out the request
+        return queue_prototype_job(request, {
+            'kind': 'variant',
+            'prototype_id': prototype.id,
+            **{key: request.data[key] for key in ('prompt', 'name', 'description') if key in request.data},
+        })
+
+    @action(detail=True, methods=['post'], url_path='create_variant/stream')
+    def create_variant_stream(self, request, pk=None):
+        """Stream a new variant as it is generated; the variant is saved once complete"""
+        prototype = self.get_object()
+        variant_name = request.data.get('name', f"Variant of {prototype.title}")
+        variant_description = request.data.get('description', '')
+        variant_prompt = request.data.get('prompt', None)
+        
+        original_variant = prototype.variants.filter(is_original=True).first()
+        if not original_variant:
+            return Response(
+                {'error': 'No original variant found for this prototype'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        base_version = original_variant.versions.order_by('-version_number').first()
+        if not base_version:
+            return Response(
+                {'error': 'No versions found for the original variant'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def persist(result):
+            new_variant = PrototypeService.save_variant(
+                prototype, variant_name, variant_description, variant_prompt, result
+            )
+            return PrototypeVariantDetailSerializer(new_variant).data
+
+        events = PrototypeService().create_variant_stream(base_version.html_content, variant_prompt)
+        return prototype_stream_response(events, persist)
+
+    @action(detail=True, methods=['post'])
+    def create_variants(self, request, pk=None):
+        """
+        Create several variants at once. Takes either ``variants``, a list of
+        ``{prompt, name, description}``, or ``count`` with an optional shared
+        ``prompt``. Variants are generated concurrently and each is saved as
+        soon as it completes; failures are reported per variant.
+        """
+        prototype = self.get_object()
+        max_batch = getattr(settings, 'PROTOTYPE_VARIANT_BATCH_MAX', 8)
+
+        specs = request.data.get('variants')
+        if specs is None:
+            try:
+                count = int(request.data.get('count', 0))
+            except (TypeError, ValueError):
+                count = 0
+            specs = [{'prompt': request.data.get('prompt')} for _ in range(count)]
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            return Response(
+                {'error': 'variants must be a list of objects'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= len(specs) <= max_batch:
+            return Response(
+                {'error': f'Between 1 and {max_batch} variants can be created at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        original_variant = prototype.variants.filter(is_original=True).first()
+        if not original_variant:
+            return Response(
+                {'error': 'No original variant found for this prototype'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        base_version = original_variant.versions.order_by('-version_number').first()
+        if not base_version:
+            return Response(
+                {'error': 'No versions found for the original variant'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        started = time.monotonic()
+        created, failed = [], []
+        results = PrototypeService().create_variants(
+            base_version.html_content,
+            [spec.get('prompt') for spec in specs],
+            max_workers=min(len(specs), getattr(settings, 'PROTOTYPE_VARIANT_CONCURRENCY', 6))
+        )
+        for index, result, error in results:
+            spec = specs[index]
+            if error is None:
+                try:
+                    # Saved from this thread as each one finishes, so a later failure loses nothing
+                    variant = PrototypeService.save_variant(
+                        prototype,
+                        spec.get('name') or f"Variant of {prototype.title}",
+                        spec.get('description', ''),
+                        spec.get('prompt'),
+                        result
+                    )
+                    created.append((index, variant))
+                    continue
+                except Exception as e:
+                    error = e
+            failed.append({'index': index, 'error': str(error)})
+
+        created.sort(key=lambda item: item[0])
+        failed.sort(key=lambda item: item['index'])
+        data = {
+            'variants': [
+                {'index': index, **PrototypeVariantDetailSerializer(variant).data}
+                for index, variant in created
+            ],
+            'failed': failed,
+            'elapsed': round(time.monotonic() - started, 3),
+        }
+        if not created:
+            return Response(data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if failed:
+            return Response(data, status=status.HTTP_207_MULTI_STATUS)
+        return Response(data, status=status.HTTP_201_CREATED)
 
 class PrototypeVariantViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return PrototypeVariant.objects.filter(prototype__design_project__user=self.request.user)
+        queryset = PrototypeVariant.objects.filter(prototype__design_project__user=self.request.user)
+        prototype_id = self.request.query_params.get('prototype')
+        if prototype_id:
+            queryset = queryset.filter(prototype_id=prototype_id)
+        if self.action in ('list', 'retrieve'):
+            queryset = PrototypeVariantSerializer.setup_eager_loading(queryset)
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -126,16 +282,27 @@ class PrototypeVariantViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def create_version(self, request, pk=None):
-        """Create a new version for a variant by editing the previous version"""
+        """
+        Queue a new version for a variant, made by editing the previous one.
+        ``mode`` is ``patch`` (model returns a diff, falling back to a full
+        rewrite if it doesn't apply) or ``full``; see PROTOTYPE_EDIT_MODE.
+        Returns 202 with the PrototypeJob; follow it at ``jobs/<id>/``.
+        """
         variant = self.get_object()
         edit_prompt = request.data.get('edit_prompt')
-        version_name = request.data.get('name', 'Updated Version')
+        edit_mode = request.data.get('mode')
         
         if not edit_prompt:
             return Response(
                 {'error': 'Edit prompt is required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        if edit_mode not in (None, *EDIT_MODES):
+            return Response(
+                {'error': f"mode must be one of: {', '.join(EDIT_MODES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # Get the latest version to edit
         latest_version = variant.versions.order_by('-version_number').first()
@@ -146,43 +313,134 @@ class PrototypeVariantViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            # Generate the edited version
-            prototype_service = PrototypeService()
-            result = prototype_service.edit_prototype(
-                latest_version.html_content, 
-                edit_prompt
-            )
-            
-            # Create the new version with incremented version number
-            new_version = PrototypeVersion.objects.create(
-                variant=variant,
-                version_number=latest_version.version_number + 1,
-                name=result['name'],
-                edit_prompt=edit_prompt,
-                html_content=result['html_content']
-            )
-            
-            # Return the new version
-            serializer = PrototypeVersionSerializer(new_version)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-            
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return queue_prototype_job(request, {
+            'kind': 'edit', 'variant_id': variant.id, 'edit_prompt': edit_prompt, 'mode': edit_mode
+        })
+
+    @action(detail=True, methods=['post'], url_path='create_version/stream')
+    def create_version_stream(self, request, pk=None):
+        """Stream an edited version as it is generated; the version is saved once complete"""
+        variant = self.get_object()
+        edit_prompt = request.data.get('edit_prompt')
+        edit_mode = request.data.get('mode')
+        
+        if not edit_prompt:
+            return Response(
+                {'error': 'Edit prompt is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if edit_mode not in (None, *EDIT_MODES):
+            return Response(
+                {'error': f"mode must be one of: {', '.join(EDIT_MODES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        latest_version = variant.versions.order_by('-version_number').first()
+        if not latest_version:
+            return Response(
+                {'error': 'No previous versions found for this variant'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def persist(result):
+            new_version = PrototypeService.save_version(variant, edit_prompt, result)
+            return PrototypeVersionSerializer(new_version).data
+
+        events = PrototypeService().edit_prototype_stream(latest_version.html_content, edit_prompt, mode=edit_mode)
+        return prototype_stream_response(events, persist)
 
 class PrototypeVersionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = PrototypeVersionSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return PrototypeVersion.objects.filter(variant__prototype__design_project__user=self.request.user)
+        queryset = PrototypeVersion.objects.filter(variant__prototype__design_project__user=self.request.user)
+        variant_id = self.request.query_params.get('variant')
+        if variant_id:
+            queryset = queryset.filter(variant_id=variant_id)
+        if self.action == 'list':
+            queryset = PrototypeVersionSummarySerializer.setup_eager_loading(queryset)
+        elif self.action == 'html':
+            # Encoded responses never need the blob's delta data
+            queryset = queryset.select_related('blob').defer('legacy_html', 'blob__data')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PrototypeVersionSummarySerializer
+        return PrototypeVersionSerializer
+
+    @action(detail=True, methods=['get'])
+    def html(self, request, pk=None):
+        """
+        The version's HTML as ``text/html``. Versions never change, so the
+        response is cacheable forever and its strong ETag is derived from the
+        content hash; revalidation is answered with 304 without reading the
+        HTML. Brotli/gzip bodies are built on the blob's first request and
+        sent as stored after that. The page is served sandboxed, since it is
+        model-generated HTML on the app's own origin.
+        """
+        version = self.get_object()
+        digest = version.blob_id or content_hash(version.html_content)
+
+        encodings = {}
+        if version.blob_id:
+            encodings = {item.encoding: item for item in version.blob.encodings.all()}
+            if not encodings:
+                # First request for this blob: encode it once, outside the write that stored it
+                encodings = {item.encoding: item for item in HtmlEncoding.create_for(version.blob)}
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), encodings)
+        etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+        requested = [
+            tag.strip().removeprefix('W/').strip('"').split('-')[0]
+            for tag in request.headers.get('If-None-Match', '').split(',')
+        ]
+        if digest in requested:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif encoding:
+            response = HttpResponse(bytes(encodings[encoding].data), content_type='text/html; charset=utf-8')
+            response['Content-Encoding'] = encoding
+        else:
+            response = HttpResponse(version.html_content, content_type='text/html; charset=utf-8')
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        # Generated pages run their own scripts, but in an opaque origin without access to the app's cookies or API
+        response['Content-Security-Policy'] = 'sandbox allow-scripts'
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def edit_stats(self, request):
+        """Edits by mode, with output tokens and latency saved by patch edits"""
+        stats = (
+            self.get_queryset()
+            .exclude(edit_mode='')
+            .values('edit_mode')
+            .annotate(
+                edits=Count('id'),
+                output_tokens=Sum('output_tokens'),
+                output_tokens_saved=Sum('output_tokens_saved'),
+                latency_saved_ms=Sum('latency_saved_ms'),
+                avg_generation_ms=Avg('generation_ms'),
+            )
+            .order_by('edit_mode')
+        )
+        by_mode = {row.pop('edit_mode'): row for row in stats}
+        return Response({
+            'by_mode': by_mode,
+            'output_tokens_saved': sum(row['output_tokens_saved'] or 0 for row in by_mode.values()),
+            'latency_saved_ms': sum(row['latency_saved_ms'] or 0 for row in by_mode.values()),
+        })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def design_project_prototypes(request, project_id):
     """Get all prototypes for a specific design project"""
     design_project = get_object_or_404(DesignProject, id=project_id, user=request.user)
-    prototypes = Prototype.objects.filter(design_project=design_project)
+    prototypes = PrototypeSerializer.setup_eager_loading(Prototype.objects.filter(design_project=design_project))
     serializer = PrototypeSerializer(prototypes, many=True)
     return Response(serializer.data)
 
@@ -191,14 +449,17 @@ def design_project_prototypes(request, project_id):
 def group_prototypes(request, group_id):
     """Get all prototypes for a specific group"""
     group = get_object_or_404(Group, id=group_id, design_project__user=request.user)
-    prototypes = Prototype.objects.filter(group=group)
+    prototypes = PrototypeSerializer.setup_eager_loading(Prototype.objects.filter(group=group))
     serializer = PrototypeSerializer(prototypes, many=True)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_prototype(request):
-    """Generate a new prototype using AI"""
+    """
+    Queue a new prototype for generation. Returns 202 with the PrototypeJob;
+    follow it at ``jobs/<id>/`` for the prototype's first version.
+    """
     # Get the design project
     design_project_id = request.data.get('design_project_id')
     design_project = get_object_or_404(DesignProject, id=design_project_id, user=request.user)
@@ -215,38 +476,89 @@ def generate_prototype(request):
     if group_id:
         group = get_object_or_404(Group, id=group_id, design_project=design_project)
     
-    # Generate prototype using AI
-    try:
-        prototype_service = PrototypeService()
-        result = prototype_service.generate_prototype(prompt)
-        
-        # Create and save the prototype
-        prototype = Prototype.objects.create(
-            design_project=design_project,
-            group=group,
-            title=result['name'],
-            prompt=prompt
-        )
-        
-        # Create the original variant
-        variant = PrototypeVariant.objects.create(
-            prototype=prototype,
-            name="Original",
-            description="Original prototype design",
-            is_original=True
-        )
-        
-        # Create the first version (version 0)
-        version = PrototypeVersion.objects.create(
-            variant=variant,
-            version_number=0,
-            name=result['name'],
-            html_content=result['html_content']
-        )
-        
-        # Return the created prototype with its variant and version
-        serializer = PrototypeDetailSerializer(prototype)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return queue_prototype_job(request, {
+        'kind': 'generate',
+        'design_project_id': design_project.id,
+        'prompt': prompt,
+        'group_id': group.id if group else None,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def generate_prototype_stream(request):
+    """Stream a new prototype as it is generated; it is saved once complete"""
+    design_project_id = request.data.get('design_project_id')
+    design_project = get_object_or_404(DesignProject, id=design_project_id, user=request.user)
     
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    prompt = request.data.get('prompt')
+    group_id = request.data.get('group_id', None)
+    
+    if not prompt:
+        return Response({'error': 'Prompt is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    group = None
+    if group_id:
+        group = get_object_or_404(Group, id=group_id, design_project=design_project)
+
+    def persist(result):
+        prototype = PrototypeService.save_prototype(design_project, group, prompt, result)
+        return PrototypeDetailSerializer(prototype).data
+
+    events = PrototypeService().generate_prototype_stream(prompt)
+    return prototype_stream_response(events, persist)
+
+
+class PrototypeJobViewSet(mixins.CreateModelMixin,
+                          mixins.ListModelMixin,
+                          mixins.RetrieveModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    Queue prototype generation, edits and variants as background jobs.
+    POST returns 202 with the job; poll it or follow ``events/`` (SSE).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        # Clients learn a job finished by reading it, so fail any that lost their worker first
+        PrototypeJob.fail_stale(self.request.user.pk)
+        return PrototypeJob.objects.filter(user=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return PrototypeJobCreateSerializer
+        return PrototypeJobSerializer
+
+    def create(self, request, *args, **kwargs):
+        return queue_prototype_job(request, request.data)
+
+    @action(detail=True, methods=['get'])
+    def events(self, request, pk=None):
+        """
+        Server-sent events with the job state whenever it changes, until it
+        finishes or ``PROTOTYPE_JOB_EVENTS_TIMEOUT`` passes. The stream holds
+        a worker while it polls, so it is kept short; EventSource reconnects
+        when it closes and is sent the current state first.
+        """
+        job = self.get_object()
+        poll_interval = getattr(settings, 'PROTOTYPE_JOB_POLL_INTERVAL', 1.0)
+        timeout = getattr(settings, 'PROTOTYPE_JOB_EVENTS_TIMEOUT', 30)
+
+        def stream(job):
+            last = None
+            deadline = time.monotonic() + timeout
+            while True:
+                data = PrototypeJobSerializer(job).data
+                # duration ticks on its own; only send when something else moved
+                state = (data['status'], data['name'], data['generated_chars'])
+                if state != last:
+                    yield f"event: {data['status']}\ndata: ".encode() + orjson.dumps(data) + b"\n\n"
+                    last = state
+                if job.is_finished or time.monotonic() > deadline:
+                    return
+                time.sleep(poll_interval)
+                job.refresh_from_db()
+
+        response = StreamingHttpResponse(stream(job), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
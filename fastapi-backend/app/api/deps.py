@@ -1,4 +1,8 @@
 from typing import Optional, AsyncGenerator
+from datetime import datetime
+import base64
+import uuid
+import orjson
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -191,4 +195,38 @@ def get_pagination(page: int = 1, size: int = 20) -> Pagination:
     """
     Pagination dependency.
     """
-    return Pagination(page=page, size=size) 
\ No newline at end of file
+    return Pagination(page=page, size=size)
+
+
+class Cursor:
+    """
+    Keyset position in a newest-first listing: the (timestamp, id) of the
+    last row already returned, e.g. its (created_at, id), passed around as
+    an opaque URL-safe token.
+    """
+    def __init__(self, at: datetime, id: uuid.UUID):
+        self.at = at
+        self.id = id
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(orjson.dumps([self.at.isoformat(), str(self.id)])).decode()
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        try:
+            at, id = orjson.loads(base64.urlsafe_b64decode(token.encode()))
+            return cls(datetime.fromisoformat(at), uuid.UUID(id))
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+
+
+def get_cursor(cursor: Optional[str] = None) -> Optional[Cursor]:
+    """
+    Cursor dependency.
+    """
+    if cursor is None:
+        return None
+    try:
+        return Cursor.decode(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
@@ -1,20 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import uuid
 import json
+import orjson
 
-from app.api.deps import get_current_user, get_db
+from app.api.deps import Cursor, get_current_user, get_current_superuser, get_cursor, get_db
 from app.models.user import User
 from app.models.chat import Chat
 from app.schemas.chat import (
-    ChatCreate, ChatResponse, ChatDetailResponse, ChatUpdate,
+    ChatCreate, ChatResponse, ChatListResponse, ChatUpdate, MessageWindowResponse,
     ChatMessageRequest, ChatStreamChunk, ProjectCreate, ProjectResponse,
     ProjectDetailResponse, ProjectKnowledgeCreate, ProjectKnowledgeResponse,
     SavedSystemPromptCreate, SavedSystemPromptResponse
 )
 from app.services.chat_service import ChatService
+from app.utils.llm_cache import llm_response_cache, cache_bypass_requested
 
 router = APIRouter()
 
@@ -38,37 +40,63 @@ async def create_chat(
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create chat")
 
-@router.get("/chats", response_model=List[ChatResponse])
+@router.get("/chats", response_model=ChatListResponse)
 async def get_chats(
     project_id: Optional[uuid.UUID] = None,
     include_archived: bool = False,
-    limit: int = 50,
-    offset: int = 0,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[Cursor] = Depends(get_cursor),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's chats with optional filtering."""
+    """Get user's chats most recently active first; follow ``next_cursor`` for older ones."""
     chat_service = ChatService(db)
+    # One extra row tells whether there is a next page
     chats = await chat_service.get_user_chats(
-        current_user.id, project_id, include_archived, limit, offset
+        current_user.id, project_id, include_archived, limit + 1,
+        (cursor.at, cursor.id) if cursor else None
     )
-    return chats
+    page = chats[:limit]
+    next_cursor = Cursor(page[-1].last_activity_at, page[-1].id).encode() if len(chats) > limit else None
+    return ChatListResponse(results=page, next_cursor=next_cursor)
 
-@router.get("/chats/{chat_id}", response_model=ChatDetailResponse)
+@router.get("/chats/{chat_id}", response_model=ChatResponse)
 async def get_chat(
     chat_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get a specific chat with full details."""
+    """Get a specific chat; its messages come from ``GET /chats/{chat_id}/messages``."""
     chat_service = ChatService(db)
-    chat = await chat_service.get_chat(chat_id, current_user.id)
+    chat = await chat_service.get_chat_summary(chat_id, current_user.id)
     
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
     
     return chat
 
+@router.get("/chats/{chat_id}/messages", response_model=MessageWindowResponse)
+async def get_chat_messages(
+    chat_id: uuid.UUID,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[Cursor] = Depends(get_cursor),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a chat's newest message pairs, oldest first; follow ``previous_cursor`` to scroll back."""
+    chat_service = ChatService(db)
+    # One extra pair tells whether there is anything older
+    pairs = await chat_service.get_message_window(
+        chat_id, current_user.id, limit + 1, (cursor.at, cursor.id) if cursor else None
+    )
+    
+    if pairs is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
+    
+    window = pairs[:limit]
+    previous_cursor = Cursor(window[-1].created_at, window[-1].id).encode() if len(pairs) > limit else None
+    return MessageWindowResponse(message_pairs=window[::-1], previous_cursor=previous_cursor)
+
 @router.put("/chats/{chat_id}", response_model=ChatResponse)
 async def update_chat(
     chat_id: uuid.UUID,
@@ -133,19 +161,21 @@ async def archive_chat(
 async def send_message(
     chat_id: uuid.UUID,
     message_request: ChatMessageRequest,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Send a message to a chat and get streaming response."""
     chat_service = ChatService(db)
+    bypass_cache = cache_bypass_requested(request)
     
     async def generate_response():
         """Generator function for streaming response."""
         async for chunk in chat_service.stream_chat_response(
-            chat_id, current_user.id, message_request
+            chat_id, current_user.id, message_request, bypass_cache=bypass_cache
         ):
             # Convert chunk to JSON and add newline for SSE format
-            yield f"data: {chunk.model_dump_json()}\n\n"
+            yield b"data: " + orjson.dumps(chunk.model_dump()) + b"\n\n"
     
     return StreamingResponse(
         generate_response(),
@@ -314,6 +344,13 @@ async def get_system_prompts(
 # Utility Endpoints
 # ===============================
 
+@router.get("/llm-cache/stats")
+async def get_llm_cache_stats(
+    current_user: User = Depends(get_current_superuser)
+):
+    """Hit-rate metrics for the LLM response cache in this worker."""
+    return llm_response_cache.stats()
+
 @router.get("/chats/{chat_id}/export")
 async def export_chat(
     chat_id: uuid.UUID,
@@ -1,11 +1,35 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.api.deps import get_current_user
+from app.models.user import User
+from app.schemas.file import PresignUploadRequest, PresignUploadResponse
+from app.services.upload_service import check_type_and_size, upload_key
+from app.utils.aws_client import s3_client
 
 router = APIRouter()
 
-# File endpoints will be implemented here
-# - Upload file
+UPLOAD_URL_EXPIRES = 900
+
+@router.post("/presign", response_model=PresignUploadResponse, status_code=status.HTTP_201_CREATED)
+async def presign_upload(
+    request: PresignUploadRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a presigned S3 POST for one chat attachment. Upload the file to
+    ``url`` with ``fields``, then send ``key`` in the chat message's
+    ``files``; the file never passes through the API server.
+    """
+    try:
+        check_type_and_size(request.content_type, request.size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    key = upload_key(current_user.id, request.filename)
+    post = await s3_client.presign_upload(key, request.content_type, request.size, UPLOAD_URL_EXPIRES)
+    return PresignUploadResponse(key=key, url=post["url"], fields=post["fields"], expires_in=UPLOAD_URL_EXPIRES)
+
+# Still to do here:
 # - Download file
 # - Delete file
 # - List files
-# - File validation
-# - S3 integration 
\ No newline at end of file
@@ -70,6 +70,7 @@ class Settings(BaseSettings):
     AWS_BEDROCK_SECRET_ACCESS_KEY: str = Field(alias="AWS_BEDROCK_SECRET_ACCESS_KEY") 
     AWS_BEDROCK_REGION: str = "us-west-2"
     AWS_BEDROCK_REGION_FALLBACK: str = "us-east-1"
+    AWS_BEDROCK_ENDPOINT_URL: Optional[str] = None  # Point at benchmarks/fake_bedrock.py for load tests
     
     @property
     def AWS_STORAGE_BUCKET_NAME(self) -> str:
@@ -126,6 +127,15 @@ class Settings(BaseSettings):
     CLAUDE_TEMPERATURE: float = 0.7
     CLAUDE_DEFAULT_MODEL: str = "anthropic.claude-3-5-sonnet-20241022-v2:0"
     CLAUDE_FALLBACK_MODEL: str = "anthropic.claude-3-5-haiku-20241022-v1:0"
+    BEDROCK_STREAM_QUEUE_SIZE: int = 64  # Buffered events per stream before the reader thread blocks
+    # Streamed text deltas are batched into one frame per interval (seconds) or once
+    # this many characters are pending; the first delta is always sent immediately
+    STREAM_FLUSH_INTERVAL: float = 0.04
+    STREAM_FLUSH_BYTES: int = 512
+    
+    # Response cache for deterministic LLM calls (titles, memory extraction)
+    LLM_CACHE_TTL: int = 3600  # seconds
+    LLM_CACHE_MAX_ENTRIES: int = 1024
     
     # Default System Prompt
     DEFAULT_SYSTEM_PROMPT: str = """You are Claude, an AI assistant created by Anthropic. You are helpful, harmless, and honest. You should be conversational and engaging while providing accurate, thoughtful responses. If you're not sure about something, say so rather than guessing."""
@@ -138,6 +148,9 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/1"
     
+    # Expose DB query / RSS counters for benchmarks/chat_load.py (load testing only)
+    PERF_METRICS: bool = False
+    
     # Logging
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
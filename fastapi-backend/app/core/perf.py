@@ -0,0 +1,32 @@
+"""
+Process-level performance counters used by the load-test harness
+(benchmarks/chat_load.py). Only wired up when PERF_METRICS is enabled.
+"""
+import os
+import resource
+from typing import Dict
+
+from sqlalchemy import event
+
+from app.core.database import async_engine
+
+_counters = {"db_queries": 0}
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _counters["db_queries"] += 1
+
+
+def install_query_counter():
+    """Count every statement executed through the async engine."""
+    if not event.contains(async_engine.sync_engine, "before_cursor_execute", _count_query):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", _count_query)
+
+
+def perf_snapshot() -> Dict[str, int]:
+    """Cumulative DB query count and peak RSS (KB) for this worker process."""
+    return {
+        "pid": os.getpid(),
+        "db_queries": _counters["db_queries"],
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
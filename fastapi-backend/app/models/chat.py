@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Boolean, Integer, DateTime, ForeignKey, Float, Table
+from sqlalchemy import Column, String, Text, Boolean, Integer, DateTime, ForeignKey, Float, Table, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -86,6 +86,10 @@ class Chat(Base):
     system_prompt = Column(Text, nullable=True)
     is_archived = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Denormalized for the chat list, bumped by each turn
+    last_activity_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_message_preview = Column(String(200), nullable=False, default="", server_default="")
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     user = relationship("User", back_populates="chats")
@@ -93,6 +97,11 @@ class Chat(Base):
     message_pairs = relationship("MessagePair", back_populates="chat", cascade="all, delete-orphan")
     extracted_memories = relationship("UserMemory", back_populates="chat")
     token_usage = relationship("TokenUsage", back_populates="chat")
+    
+    # Keyset pagination of a user's chats, most recently active first
+    __table_args__ = (
+        Index('ix_chats_user_last_activity_at_id', 'user_id', 'last_activity_at', 'id'),
+    )
 
 class MessagePair(Base):
     __tablename__ = "message_pairs"
@@ -105,6 +114,11 @@ class MessagePair(Base):
     chat = relationship("Chat", back_populates="message_pairs")
     messages = relationship("Message", back_populates="message_pair", cascade="all, delete-orphan")
     source_memories = relationship("UserMemory", back_populates="source_message_pair")
+    
+    # Windows of a chat's newest pairs
+    __table_args__ = (
+        Index('ix_message_pairs_chat_created_at_id', 'chat_id', 'created_at', 'id'),
+    )
 
 class SavedSystemPrompt(Base):
     __tablename__ = "saved_system_prompts"
@@ -49,6 +49,36 @@ class MessagePairResponse(BaseModel):
     created_at: datetime
     messages: List[MessageResponse] = []
 
+# Compact shapes for windowed message loading
+class MessageWindowContent(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: uuid.UUID
+    content_type: str
+    text_content: Optional[str] = None
+    file_path: Optional[str] = None
+    mime_type: Optional[str] = None
+
+class MessageWindowMessage(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: uuid.UUID
+    role: str
+    hidden: bool = False
+    created_at: datetime
+    contents: List[MessageWindowContent] = []
+
+class MessageWindowPair(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: uuid.UUID
+    created_at: datetime
+    messages: List[MessageWindowMessage] = []
+
+class MessageWindowResponse(BaseModel):
+    message_pairs: List[MessageWindowPair] = Field(..., description="Oldest first")
+    previous_cursor: Optional[str] = Field(None, description="Pass as ``cursor`` for the pairs before these; null at the start of the chat")
+
 # Chat schemas
 class ChatBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=100)
@@ -71,7 +101,14 @@ class ChatResponse(ChatBase):
     project_id: Optional[uuid.UUID] = None
     is_archived: bool = False
     created_at: datetime
+    last_activity_at: datetime
+    last_message_preview: str = ""
+    message_count: int = 0
     
+class ChatListResponse(BaseModel):
+    results: List[ChatResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as ``cursor`` for the next page; null on the last page")
+
 class ChatDetailResponse(ChatResponse):
     message_pairs: List[MessagePairResponse] = []
     total_tokens: int = 0
@@ -79,7 +116,9 @@ class ChatDetailResponse(ChatResponse):
 # Chat interaction schemas
 class ChatMessageRequest(BaseModel):
     message: str = Field(..., min_length=1, description="User message text")
-    files: Optional[List[str]] = Field(None, description="List of uploaded file IDs")
+    files: Optional[List[str]] = Field(
+        None, max_length=20, description="Keys of files uploaded through POST /files/presign"
+    )
     system_prompt_override: Optional[str] = Field(None, description="Override system prompt for this message")
 
 class ChatStreamChunk(BaseModel):
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict
+
+class PresignUploadRequest(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=200)
+    content_type: str = Field(..., description="MIME type the file will be uploaded with")
+    size: int = Field(..., gt=0, description="File size in bytes; larger uploads are refused by S3")
+
+class PresignUploadResponse(BaseModel):
+    key: str = Field(..., description="Pass in ChatMessageRequest.files once uploaded")
+    url: str = Field(..., description="S3 form endpoint to POST the file to")
+    fields: Dict[str, Any] = Field(..., description="Form fields to send before the file")
+    expires_in: int
@@ -1,9 +1,11 @@
 import logging
 import uuid
-from typing import List, Optional, Dict, Any, AsyncGenerator
+from datetime import datetime
+from typing import List, Optional, Dict, Any, AsyncGenerator, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, func, desc, tuple_
+from contextlib import aclosing
 import base64
 import asyncio
 
@@ -11,10 +13,15 @@ from app.models.chat import Chat, MessagePair, Message, MessageContent, Project,
 from app.models.user import User
 from app.schemas.chat import ChatCreate, ChatMessageRequest, ChatStreamChunk
 from app.utils.aws_client import bedrock_client, s3_client
+from app.utils.llm_cache import llm_response_cache
+from app.utils.stream_relay import coalesce_text
+from app.services.upload_service import inspect_upload
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+PREVIEW_LENGTH = 120
+
 class ChatService:
     """Service for handling AI chat conversations."""
     
@@ -65,15 +72,59 @@ class ChatService:
         
         return await self.db.scalar(query)
     
+    async def get_chat_summary(self, chat_id: uuid.UUID, user_id: uuid.UUID) -> Optional[Chat]:
+        """Get a chat's own fields, without loading its history."""
+        return await self.db.scalar(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id))
+    
+    async def get_message_window(
+        self,
+        chat_id: uuid.UUID,
+        user_id: uuid.UUID,
+        limit: int = 20,
+        before: Optional[Tuple[datetime, uuid.UUID]] = None
+    ) -> Optional[List[MessagePair]]:
+        """
+        Get a chat's newest ``limit`` message pairs, newest first, with their
+        messages and contents; None if the chat isn't the user's.
+
+        ``before`` is the (created_at, id) of the oldest pair already loaded.
+        Pairs are read along the (chat_id, created_at, id) index, so a window
+        costs the same however long the chat is.
+        """
+        owner = await self.db.scalar(select(Chat.user_id).where(Chat.id == chat_id))
+        if owner != user_id:
+            return None
+        
+        query = select(MessagePair).options(
+            selectinload(MessagePair.messages).selectinload(Message.contents)
+        ).where(MessagePair.chat_id == chat_id)
+        
+        if before:
+            query = query.where(tuple_(MessagePair.created_at, MessagePair.id) < tuple_(*before))
+        
+        query = query.order_by(desc(MessagePair.created_at), desc(MessagePair.id)).limit(limit)
+        
+        result = await self.db.execute(query)
+        pairs = list(result.scalars().all())
+        for pair in pairs:
+            pair.messages.sort(key=lambda message: message.created_at)
+        return pairs
+    
     async def get_user_chats(
         self, 
         user_id: uuid.UUID, 
         project_id: Optional[uuid.UUID] = None,
         include_archived: bool = False,
         limit: int = 50,
-        offset: int = 0
+        after: Optional[Tuple[datetime, uuid.UUID]] = None
     ) -> List[Chat]:
-        """Get user's chats with optional filtering."""
+        """
+        Get user's chats most recently active first, with optional filtering.
+
+        ``after`` is the (last_activity_at, id) of the last chat already seen;
+        the page seeks past it on the (user_id, last_activity_at, id) index
+        instead of skipping an OFFSET, so deep pages cost the same as the first.
+        """
         query = select(Chat).where(Chat.user_id == user_id)
         
         if project_id:
@@ -82,12 +133,15 @@ class ChatService:
         if not include_archived:
             query = query.where(Chat.is_archived == False)
         
-        query = query.order_by(desc(Chat.created_at)).limit(limit).offset(offset)
+        if after:
+            query = query.where(tuple_(Chat.last_activity_at, Chat.id) < tuple_(*after))
+        
+        query = query.order_by(desc(Chat.last_activity_at), desc(Chat.id)).limit(limit)
         
         result = await self.db.execute(query)
         return result.scalars().all()
     
-    async def generate_chat_title(self, messages: List[Dict[str, Any]]) -> str:
+    async def generate_chat_title(self, messages: List[Dict[str, Any]], bypass_cache: bool = False) -> str:
         """Generate a title for the chat based on the first few messages."""
         try:
             # Get first user message for title generation
@@ -121,11 +175,18 @@ class ChatService:
                 }
             ]
             
-            title = await bedrock_client.generate_single_response(
-                messages=title_messages,
-                model='claude-3.5-haiku',
-                max_tokens=50,
-                temperature=0.1
+            # Low temperature makes this effectively deterministic, so cache it
+            title = await llm_response_cache.get_or_call(
+                llm_response_cache.make_key(
+                    'claude-3.5-haiku', messages=title_messages, max_tokens=50, temperature=0.1
+                ),
+                lambda: bedrock_client.generate_single_response(
+                    messages=title_messages,
+                    model='claude-3.5-haiku',
+                    max_tokens=50,
+                    temperature=0.1
+                ),
+                bypass=bypass_cache
             )
             
             # Clean up the title
@@ -163,6 +224,25 @@ class ChatService:
             logger.error(f"Error getting project context: {e}")
             return ""
     
+    async def attachment_block(self, content_type: str, key: str, mime_type: Optional[str]) -> Dict[str, Any]:
+        """Claude content block for an uploaded file: images inline as base64, documents by name."""
+        name = key.rsplit('/', 1)[-1]
+        if content_type == 'image':
+            try:
+                data = await s3_client.read_file(key)
+            except FileNotFoundError:
+                logger.warning(f"Image {key} is missing from S3")
+                return {'type': 'text', 'text': f"[Image: {name}]"}
+            return {
+                'type': 'image',
+                'source': {
+                    'type': 'base64',
+                    'media_type': mime_type,
+                    'data': base64.b64encode(data).decode('utf-8')
+                }
+            }
+        return {'type': 'text', 'text': f"[Document: {name}]"}
+
     async def prepare_messages_for_claude(
         self, 
         chat: Chat, 
@@ -185,18 +265,10 @@ class ChatService:
                             'type': 'text',
                             'text': content.text_content
                         })
-                    elif content.content_type == 'image' and content.file_path:
-                        # For images, we would need to get the base64 content
-                        # This is a simplified version - in production you'd fetch from S3
-                        content_blocks.append({
-                            'type': 'text',
-                            'text': f"[Image: {content.file_path}]"
-                        })
-                    elif content.content_type == 'document' and content.file_path:
-                        content_blocks.append({
-                            'type': 'text',
-                            'text': f"[Document: {content.file_path}]"
-                        })
+                    elif content.content_type in ('image', 'document') and content.file_path:
+                        content_blocks.append(await self.attachment_block(
+                            content.content_type, content.file_path, content.mime_type
+                        ))
                 
                 if content_blocks:
                     messages.append({
@@ -228,7 +300,8 @@ class ChatService:
         self,
         chat_id: uuid.UUID,
         user_id: uuid.UUID,
-        message_request: ChatMessageRequest
+        message_request: ChatMessageRequest,
+        bypass_cache: bool = False
     ) -> AsyncGenerator[ChatStreamChunk, None]:
         """Stream chat response from Claude."""
         try:
@@ -238,6 +311,13 @@ class ChatService:
                 yield ChatStreamChunk(type="error", error="Chat not found")
                 return
             
+            # Header-only checks of direct uploads: one ranged GET each, the bytes stay in S3
+            try:
+                uploads = [await inspect_upload(user_id, key) for key in message_request.files or []]
+            except ValueError as e:
+                yield ChatStreamChunk(type="error", error=str(e))
+                return
+            
             # Create message pair
             message_pair = MessagePair(chat_id=chat_id)
             self.db.add(message_pair)
@@ -258,12 +338,22 @@ class ChatService:
                 text_content=message_request.message
             )
             self.db.add(message_content)
+            for upload in uploads:
+                self.db.add(MessageContent(
+                    message_id=user_message.id,
+                    content_type=upload.content_type,
+                    file_path=upload.key,
+                    mime_type=upload.mime_type,
+                    file_size=upload.size
+                ))
             
             # Prepare messages for Claude
             new_content = [{"type": "text", "text": message_request.message}]
-            
-            # TODO: Handle file uploads in message_request.files
-            
+            for upload in uploads:
+                new_content.append(
+                    await self.attachment_block(upload.content_type, upload.key, upload.mime_type)
+                )
+
             messages = await self.prepare_messages_for_claude(chat, new_content)
             
             # Get system prompt
@@ -271,7 +361,7 @@ class ChatService:
             
             # Generate title if this is the first message
             if not chat.message_pairs:
-                new_title = await self.generate_chat_title(messages)
+                new_title = await self.generate_chat_title(messages, bypass_cache=bypass_cache)
                 chat.title = new_title
             
             # Create assistant message
@@ -283,26 +373,33 @@ class ChatService:
             await self.db.flush()
             
             # Stream response from Claude
-            response_text = ""
+            response_parts = []
             
             yield ChatStreamChunk(type="start", message_pair_id=message_pair.id)
             
-            # Real AWS Bedrock streaming
-            async for chunk in bedrock_client.generate_response(
-                messages=messages,
-                system_prompt=system_prompt,
-                stream=True
-            ):
-                response_text += chunk
-                yield ChatStreamChunk(type="text", content=chunk)
+            # Real AWS Bedrock streaming, deltas coalesced into ~40ms frames
+            frames = coalesce_text(
+                bedrock_client.generate_response(
+                    messages=messages,
+                    system_prompt=system_prompt,
+                    stream=True
+                ),
+                flush_interval=settings.STREAM_FLUSH_INTERVAL,
+                flush_bytes=settings.STREAM_FLUSH_BYTES
+            )
+            async with aclosing(frames):
+                async for chunk in frames:
+                    response_parts.append(chunk)
+                    yield ChatStreamChunk(type="text", content=chunk)
             
             # Save assistant response
             assistant_content = MessageContent(
                 message_id=assistant_message.id,
                 content_type="text",
-                text_content=response_text
+                text_content="".join(response_parts)
             )
             self.db.add(assistant_content)
+            self.record_turn(chat, message_request.message, assistant_content.text_content)
             
             # TODO: Count tokens and update token_count fields
             
@@ -315,6 +412,17 @@ class ChatService:
             logger.error(f"Error in stream_chat_response: {e}")
             yield ChatStreamChunk(type="error", error=str(e))
     
+    @staticmethod
+    def record_turn(chat: Chat, *texts: str) -> None:
+        """Count a turn's messages and bump the chat's activity; the last non-empty text becomes the preview."""
+        chat.last_activity_at = func.now()
+        chat.message_count = Chat.message_count + len(texts)
+        preview = next((" ".join(text.split()) for text in reversed(texts) if text and text.strip()), None)
+        if preview:
+            chat.last_message_preview = preview if len(preview) <= PREVIEW_LENGTH else (
+                preview[:PREVIEW_LENGTH - 1].rstrip() + "\u2026"
+            )
+    
     async def delete_chat(self, chat_id: uuid.UUID, user_id: uuid.UUID) -> bool:
         """Delete a chat."""
         try:
@@ -0,0 +1,79 @@
+"""
+Direct-to-S3 uploads for chat attachments.
+
+Clients get a presigned POST from ``POST /files/presign``, upload straight
+to the bucket and pass the key in ``ChatMessageRequest.files``. Keys are
+validated when the message arrives, from a ranged GET of the object's
+first bytes rather than the whole file.
+"""
+import io
+import re
+import uuid
+from dataclasses import dataclass
+
+import magic
+from PIL import Image
+
+from app.core.config import settings
+from app.utils.aws_client import s3_client
+
+UPLOAD_PREFIX = "uploads"
+# Enough for libmagic, and for PIL to find the dimensions past most EXIF blocks
+SNIFF_BYTES = 64 * 1024
+MAX_IMAGE_SIDE = 8000
+
+
+@dataclass
+class Upload:
+    """An uploaded object that passed validation, ready to attach to a message."""
+    key: str
+    mime_type: str
+    size: int
+    
+    @property
+    def content_type(self) -> str:
+        return "image" if self.mime_type in settings.ALLOWED_IMAGE_TYPES else "document"
+
+
+def check_type_and_size(mime_type: str, size: int) -> None:
+    """Raise ValueError for a type or size a message can't take."""
+    if mime_type in settings.ALLOWED_IMAGE_TYPES:
+        if size > settings.MAX_IMAGE_SIZE:
+            raise ValueError(f"Images cannot exceed {settings.MAX_IMAGE_SIZE // (1024 * 1024)}MB")
+    elif mime_type in settings.ALLOWED_DOCUMENT_TYPES:
+        if size > settings.MAX_FILE_SIZE:
+            raise ValueError(f"Files cannot exceed {settings.MAX_FILE_SIZE // (1024 * 1024)}MB")
+    else:
+        raise ValueError(f"Unsupported file type: {mime_type}")
+
+
+def upload_key(user_id: uuid.UUID, filename: str) -> str:
+    """A fresh key under the user's prefix, keeping a sanitized file name."""
+    name = re.sub(r"[^\w.-]", "_", filename.rsplit("/", 1)[-1].strip()).lstrip(".") or "file"
+    return f"{UPLOAD_PREFIX}/{user_id}/{uuid.uuid4().hex}/{name}"
+
+
+async def inspect_upload(user_id: uuid.UUID, key: str) -> Upload:
+    """
+    Validate an uploaded object before it is attached to a message: it must
+    be under the user's prefix, and its sniffed type, size and image
+    dimensions must be allowed. Raises ValueError otherwise.
+    """
+    if not key.startswith(f"{UPLOAD_PREFIX}/{user_id}/") or ".." in key.split("/"):
+        raise ValueError("Uploaded file not found")
+    try:
+        header, size = await s3_client.read_header(key, SNIFF_BYTES)
+    except FileNotFoundError:
+        raise ValueError("Uploaded file not found")
+    
+    mime_type = magic.from_buffer(header[:1024], mime=True)
+    check_type_and_size(mime_type, size)
+    if mime_type in settings.ALLOWED_IMAGE_TYPES:
+        try:
+            width, height = Image.open(io.BytesIO(header)).size
+        except Exception:
+            # Dimensions past the sniffed bytes; Bedrock rejects oversized images itself
+            width = height = 0
+        if max(width, height) > MAX_IMAGE_SIDE:
+            raise ValueError(f"Image dimensions cannot exceed {MAX_IMAGE_SIDE}x{MAX_IMAGE_SIDE} pixels")
+    return Upload(key=key, mime_type=mime_type, size=size)
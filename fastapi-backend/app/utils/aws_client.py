@@ -1,12 +1,97 @@
+import asyncio
 import boto3
 import json
 import logging
-from typing import Dict, Any, Optional, AsyncGenerator
+import orjson
+import threading
+from contextlib import aclosing
+from typing import Dict, Any, Optional, AsyncGenerator, Callable, Iterable, Tuple
 from botocore.exceptions import ClientError
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Sentinel placed on the bridge queue once the producer thread has finished
+_STREAM_END = object()
+
+
+class _StreamError:
+    """Wraps an exception raised inside the producer thread."""
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+async def iterate_in_thread(
+    open_stream: Callable[[], Iterable[Any]],
+    max_buffered: int = 64,
+    thread_name: str = "bedrock-stream"
+) -> AsyncGenerator[Any, None]:
+    """
+    Consume a blocking iterable from a dedicated thread.
+
+    ``open_stream`` is called inside the thread (so the initial HTTP round trip
+    does not block the event loop either) and every item it yields is handed
+    to the event loop through a bounded ``asyncio.Queue``. When the consumer
+    falls behind the queue fills up and the producer thread blocks, which
+    gives us backpressure instead of unbounded buffering.
+
+    Exceptions raised in the thread are re-raised in the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+    stop = threading.Event()
+    stream_holder: Dict[str, Any] = {}
+
+    def put(item: Any) -> bool:
+        # Blocks this thread until the event loop has room for the item
+        if stop.is_set():
+            return False
+        try:
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+            return True
+        except RuntimeError:
+            # Event loop is gone, nobody is listening anymore
+            return False
+
+    def produce():
+        try:
+            stream = open_stream()
+            stream_holder['stream'] = stream
+            for item in stream:
+                if not put(item):
+                    break
+        except BaseException as e:
+            put(_StreamError(e))
+        finally:
+            put(_STREAM_END)
+
+    thread = threading.Thread(target=produce, name=thread_name, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, _StreamError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        # Close the underlying HTTP stream if the consumer went away early
+        stream = stream_holder.get('stream')
+        close = getattr(stream, 'close', None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"Error closing bedrock stream: {e}")
+        # Unblock a producer that is waiting on a full queue
+        while not queue.empty():
+            queue.get_nowait()
+
+
 class AWSBedrockClient:
     """AWS Bedrock client for Claude AI integration."""
     
@@ -15,7 +100,8 @@ class AWSBedrockClient:
             'bedrock-runtime',
             aws_access_key_id=settings.AWS_BEDROCK_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_BEDROCK_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_BEDROCK_REGION
+            region_name=settings.AWS_BEDROCK_REGION,
+            endpoint_url=settings.AWS_BEDROCK_ENDPOINT_URL
         )
         # log the keys and region
         logger.info(f"AWS Bedrock client initialized with keys: {settings.AWS_BEDROCK_ACCESS_KEY_ID} and region: {settings.AWS_BEDROCK_REGION}")
@@ -71,29 +157,40 @@ class AWSBedrockClient:
             logger.info(f"Sending request to {model_id} with {len(messages)} messages")
             
             if stream:
-                # Stream the response
-                response = self.client.invoke_model_with_response_stream(
-                    modelId=model_id,
-                    body=json.dumps(body)
+                # boto3 is blocking, so the event stream is read on its own
+                # thread and bridged back to the event loop
+                def open_stream():
+                    response = self.client.invoke_model_with_response_stream(
+                        modelId=model_id,
+                        body=json.dumps(body)
+                    )
+                    return response['body']
+
+                events = iterate_in_thread(
+                    open_stream,
+                    max_buffered=settings.BEDROCK_STREAM_QUEUE_SIZE,
+                    thread_name=f"bedrock-stream-{model_id}"
                 )
-                
-                for event in response['body']:
-                    chunk = json.loads(event['chunk']['bytes'])
-                    
-                    if chunk['type'] == 'content_block_delta':
-                        if chunk['delta']['type'] == 'text_delta':
-                            yield chunk['delta']['text']
-                    elif chunk['type'] == 'message_stop':
-                        break
+                async with aclosing(events):
+                    async for event in events:
+                        chunk = orjson.loads(event['chunk']['bytes'])
+                        
+                        if chunk['type'] == 'content_block_delta':
+                            if chunk['delta']['type'] == 'text_delta':
+                                yield chunk['delta']['text']
+                        elif chunk['type'] == 'message_stop':
+                            break
                         
             else:
                 # Non-streaming response
-                response = self.client.invoke_model(
-                    modelId=model_id,
-                    body=json.dumps(body)
-                )
-                
-                result = json.loads(response['body'].read())
+                def invoke():
+                    response = self.client.invoke_model(
+                        modelId=model_id,
+                        body=json.dumps(body)
+                    )
+                    return json.loads(response['body'].read())
+
+                result = await asyncio.to_thread(invoke)
                 if result.get('content'):
                     for content in result['content']:
                         if content['type'] == 'text':
@@ -220,6 +317,88 @@ class AWSS3Client:
             logger.error(f"Error generating presigned URL: {e}")
             raise Exception(f"Failed to generate file URL: {e}")
     
+    async def presign_upload(
+        self,
+        file_key: str,
+        content_type: str,
+        max_size: int,
+        expires_in: int = 900
+    ) -> Dict[str, Any]:
+        """
+        Generate a presigned POST so a client can upload one file straight to S3.
+        
+        Args:
+            file_key: S3 key the file must be uploaded to
+            content_type: MIME type the upload must declare
+            max_size: Largest accepted upload in bytes, enforced by S3
+            expires_in: Policy expiration time in seconds
+            
+        Returns:
+            Dict with the form ``url`` and the ``fields`` to post with the file
+        """
+        try:
+            return self.client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=file_key,
+                Fields={'Content-Type': content_type, 'acl': 'private'},
+                Conditions=[
+                    {'Content-Type': content_type},
+                    {'acl': 'private'},
+                    ['content-length-range', 1, max_size]
+                ],
+                ExpiresIn=expires_in
+            )
+        except ClientError as e:
+            logger.error(f"Error generating presigned POST: {e}")
+            raise Exception(f"Failed to generate upload URL: {e}")
+    
+    async def read_header(self, file_key: str, length: int) -> Tuple[bytes, int]:
+        """
+        Read the first bytes of a file with a ranged GET, leaving the rest in S3.
+        
+        Args:
+            file_key: S3 key of the file
+            length: Number of leading bytes to read
+            
+        Returns:
+            The leading bytes and the file's total size
+        """
+        def get():
+            response = self.client.get_object(
+                Bucket=self.bucket_name, Key=file_key, Range=f'bytes=0-{length - 1}'
+            )
+            return response['Body'].read(), response.get('ContentRange', '')
+        
+        try:
+            header, content_range = await asyncio.to_thread(get)
+        except ClientError as e:
+            # NoSuchKey, or InvalidRange for an empty object
+            logger.info(f"Upload {file_key} not readable: {e}")
+            raise FileNotFoundError(file_key) from e
+        # "bytes 0-65535/1234567"; absent when S3 answers the whole object
+        total = content_range.rpartition('/')[2]
+        return header, int(total) if total.isdigit() else len(header)
+
+    async def read_file(self, file_key: str) -> bytes:
+        """
+        Read a whole file from S3.
+
+        Args:
+            file_key: S3 key of the file
+
+        Returns:
+            File content as bytes
+        """
+        def get():
+            response = self.client.get_object(Bucket=self.bucket_name, Key=file_key)
+            return response['Body'].read()
+
+        try:
+            return await asyncio.to_thread(get)
+        except ClientError as e:
+            logger.info(f"Upload {file_key} not readable: {e}")
+            raise FileNotFoundError(file_key) from e
+
     async def delete_file(self, file_key: str) -> bool:
         """
         Delete a file from S3.
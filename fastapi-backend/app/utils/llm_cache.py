@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import Request
+
+from app.core.config import settings
+
+# Request header that skips the response cache for a single request (debugging)
+BYPASS_HEADER = "X-LLM-Cache-Bypass"
+
+
+class LLMResponseCache:
+    """
+    In-process response cache for deterministic Bedrock calls.
+
+    Entries are keyed on a hash of the model and request parameters, expire
+    after ``ttl`` seconds and are evicted least-recently-used once
+    ``max_entries`` is reached. Concurrent misses for the same key share a
+    single upstream call (single-flight). Errors are never cached.
+    """
+
+    def __init__(self, ttl: int = 3600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "bypassed": 0}
+
+    @staticmethod
+    def make_key(model: str, **params: Any) -> str:
+        """Build a cache key from the model and request parameters."""
+        canonical = json.dumps({"model": model, **params}, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get_or_call(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        bypass: bool = False
+    ) -> Any:
+        """
+        Return the cached value for ``key`` or compute it with ``fn``.
+        With ``bypass`` the cache is neither read nor written.
+        """
+        if bypass:
+            self._stats["bypassed"] += 1
+            return await fn()
+
+        cached = self._get(key)
+        if cached is not None:
+            self._stats["hits"] += 1
+            return cached
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._stats["coalesced"] += 1
+            # shield so one waiter being cancelled doesn't cancel the shared call
+            return await asyncio.shield(in_flight)
+
+        self._stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await fn()
+            self._set(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def _get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for this worker process."""
+        stats = dict(self._stats)
+        stats["size"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        self._entries.clear()
+
+
+def cache_bypass_requested(request: Request) -> bool:
+    """True when the client asked to skip the LLM response cache."""
+    return request.headers.get(BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+
+
+# Global instance
+llm_response_cache = LLMResponseCache(
+    ttl=settings.LLM_CACHE_TTL,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from contextlib import suppress
+from typing import AsyncIterator, Callable
+
+_END = object()
+_DUE = object()
+
+
+async def coalesce_text(
+    chunks: AsyncIterator[str],
+    flush_interval: float = 0.04,
+    flush_bytes: int = 512,
+    clock: Callable[[], float] = time.monotonic
+) -> AsyncIterator[str]:
+    """
+    Batch streamed text deltas into larger frames.
+
+    The first delta is passed through immediately so time-to-first-token is
+    unchanged; after that deltas are joined until ``flush_interval`` seconds
+    have passed since the last frame or ``flush_bytes`` characters are
+    pending. Pending text is also flushed at that deadline when the next
+    delta is slow to arrive, and whatever is left when the source ends.
+
+    ``chunks`` is read by a separate task into a queue, which a timer also
+    posts to when held-back text falls due, so the source is never
+    cancelled mid-read; closing this generator cancels that task, which
+    closes the source.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in chunks:
+                queue.put_nowait((chunk, None))
+        except Exception as e:
+            queue.put_nowait((_END, e))
+        else:
+            queue.put_nowait((_END, None))
+
+    reader = asyncio.ensure_future(pump())
+    timer = None
+    pending = []
+    pending_size = 0
+    last_flush = None
+
+    def take() -> str:
+        nonlocal pending, pending_size, last_flush, timer
+        frame = "".join(pending)
+        pending = []
+        pending_size = 0
+        last_flush = clock()
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        return frame
+
+    def due_in() -> float:
+        return last_flush + flush_interval - clock()
+
+    try:
+        while True:
+            try:
+                chunk, error = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                chunk, error = await queue.get()
+            if error is not None:
+                raise error
+            if chunk is _END:
+                break
+
+            if chunk is _DUE:
+                timer = None
+                if pending and due_in() <= 0:
+                    yield take()
+                elif pending:
+                    timer = loop.call_later(due_in(), queue.put_nowait, (_DUE, None))
+                continue
+
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if last_flush is None or pending_size >= flush_bytes or due_in() <= 0:
+                yield take()
+            elif timer is None:
+                # Only wait as long as the held-back text can stay unsent
+                timer = loop.call_later(due_in(), queue.put_nowait, (_DUE, None))
+    finally:
+        if timer is not None:
+            timer.cancel()
+        reader.cancel()
+        with suppress(asyncio.CancelledError):
+            await reader
+    if pending:
+        yield "".join(pending)
@@ -128,6 +128,20 @@ async def root():
     }
 
 
+# Load-test instrumentation, never enable in production
+if settings.PERF_METRICS:
+    from app.core.perf import install_query_counter, perf_snapshot
+
+    install_query_counter()
+
+    @app.get("/api/v1/perf/metrics", include_in_schema=False)
+    async def perf_metrics():
+        """
+        Cumulative DB query count and peak RSS for this worker.
+        """
+        return perf_snapshot()
+
+
 # Include API routers
 app.include_router(
     auth.router,
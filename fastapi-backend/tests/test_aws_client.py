@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.utils.aws_client import AWSBedrockClient, iterate_in_thread
+
+
+def _event(payload: dict) -> dict:
+    return {'chunk': {'bytes': json.dumps(payload).encode()}}
+
+
+class StubBedrockRuntime:
+    """Blocking stand-in for the boto3 bedrock-runtime client."""
+
+    def __init__(self, chunks: int = 5, delay: float = 0.05):
+        self.chunks = chunks
+        self.delay = delay
+
+    def _events(self):
+        yield _event({'type': 'message_start'})
+        for i in range(self.chunks):
+            time.sleep(self.delay)  # simulates a slow network read
+            yield _event({
+                'type': 'content_block_delta',
+                'delta': {'type': 'text_delta', 'text': f"{i} "}
+            })
+        yield _event({'type': 'message_stop'})
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        time.sleep(self.delay)  # time to first byte
+        return {'body': self._events()}
+
+
+def _stub_client(**kwargs) -> AWSBedrockClient:
+    client = AWSBedrockClient()
+    client.client = StubBedrockRuntime(**kwargs)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_concurrent_streams_interleave():
+    streams = 5
+    chunks = 5
+    delay = 0.05
+    client = _stub_client(chunks=chunks, delay=delay)
+    arrivals = []
+
+    async def consume(stream_id: int) -> str:
+        text = ""
+        async for chunk in client.generate_response(
+            messages=[{'role': 'user', 'content': 'hi'}]
+        ):
+            arrivals.append(stream_id)
+            text += chunk
+        return text
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(consume(i) for i in range(streams)))
+    elapsed = time.monotonic() - started
+
+    assert results == ["0 1 2 3 4 "] * streams
+
+    # A serialized implementation would take streams * (chunks + 1) * delay
+    single_stream = (chunks + 1) * delay
+    assert elapsed < single_stream * 2.5
+
+    # Every stream has produced output before the first one finishes
+    first_done = min(
+        max(i for i, s in enumerate(arrivals) if s == stream_id)
+        for stream_id in range(streams)
+    )
+    assert set(arrivals[:first_done + 1]) == set(range(streams))
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive_during_stream():
+    client = _stub_client(chunks=4, delay=0.05)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    tick_task = asyncio.create_task(ticker())
+    async for _ in client.generate_response(messages=[{'role': 'user', 'content': 'hi'}]):
+        pass
+    tick_task.cancel()
+
+    # ~0.25s of streaming should leave room for many 10ms ticks
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_iterate_in_thread_applies_backpressure():
+    produced = []
+
+    def source():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = iterate_in_thread(source, max_buffered=2)
+    first = await items.__anext__()
+    await asyncio.sleep(0.05)
+
+    assert first == 0
+    # The producer is held back by the bounded queue instead of running ahead
+    assert len(produced) <= 5
+    await items.aclose()
+
+
+@pytest.mark.asyncio
+async def test_iterate_in_thread_reraises_producer_errors():
+    def source():
+        yield 1
+        raise RuntimeError("stream broke")
+
+    received = []
+    with pytest.raises(RuntimeError, match="stream broke"):
+        async for item in iterate_in_thread(source):
+            received.append(item)
+
+    assert received == [1]
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.utils.llm_cache import LLMResponseCache
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call():
+    cache = LLMResponseCache(ttl=60, max_entries=10)
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "Title"
+
+    key = cache.make_key("claude-3.5-haiku", messages=[{"role": "user", "content": "hi"}], temperature=0.1)
+    results = await asyncio.gather(*(cache.get_or_call(key, upstream) for _ in range(5)))
+
+    assert results == ["Title"] * 5
+    assert calls == 1
+    assert await cache.get_or_call(key, upstream) == "Title"
+    assert calls == 1
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bypass_errors_and_eviction():
+    cache = LLMResponseCache(ttl=60, max_entries=2)
+
+    async def failing():
+        raise RuntimeError("throttled")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_call("k", failing)
+    # Errors are not cached
+    assert cache.stats()["size"] == 0
+
+    async def value():
+        return "fresh"
+
+    assert await cache.get_or_call("k", value, bypass=True) == "fresh"
+    assert cache.stats()["size"] == 0
+
+    for key in ("a", "b", "c"):
+        await cache.get_or_call(key, value)
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
@@ -0,0 +1,68 @@
+import uuid
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app.api.deps import Cursor, get_cursor
+from app.models.chat import Chat
+from app.services.chat_service import ChatService
+
+
+def test_cursor_round_trip():
+    cursor = Cursor(datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc), uuid.uuid4())
+    decoded = get_cursor(cursor.encode())
+    assert (decoded.at, decoded.id) == (cursor.at, cursor.id)
+    assert get_cursor(None) is None
+
+
+@pytest.mark.parametrize("token", ["", "not-base64!", "WzFd", "WyJ4IiwgInkiXQ=="])
+def test_malformed_cursor_is_a_bad_request(token):
+    with pytest.raises(HTTPException) as excinfo:
+        get_cursor(token)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_chat_listing_seeks_past_the_cursor_instead_of_offsetting():
+    db = mock.Mock(execute=mock.AsyncMock(return_value=mock.Mock()))
+    after = (datetime(2026, 1, 2, tzinfo=timezone.utc), uuid.uuid4())
+    await ChatService(db).get_user_chats(uuid.uuid4(), limit=21, after=after)
+
+    sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "(chats.last_activity_at, chats.id) < (" in sql
+    assert "ORDER BY chats.last_activity_at DESC, chats.id DESC" in sql
+    assert "OFFSET" not in sql
+
+
+@pytest.mark.asyncio
+async def test_message_window_reads_one_index_range_of_pairs():
+    user_id = uuid.uuid4()
+    db = mock.Mock(scalar=mock.AsyncMock(return_value=user_id), execute=mock.AsyncMock(return_value=mock.Mock()))
+    db.execute.return_value.scalars.return_value.all.return_value = []
+    before = (datetime(2026, 1, 2, tzinfo=timezone.utc), uuid.uuid4())
+    assert await ChatService(db).get_message_window(uuid.uuid4(), user_id, limit=21, before=before) == []
+
+    sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "(message_pairs.created_at, message_pairs.id) < (" in sql
+    assert "ORDER BY message_pairs.created_at DESC, message_pairs.id DESC" in sql
+    assert "LIMIT" in sql
+
+
+@pytest.mark.asyncio
+async def test_message_window_of_another_users_chat_is_none():
+    db = mock.Mock(scalar=mock.AsyncMock(return_value=uuid.uuid4()), execute=mock.AsyncMock())
+    assert await ChatService(db).get_message_window(uuid.uuid4(), uuid.uuid4()) is None
+    db.execute.assert_not_called()
+
+
+def test_a_turn_updates_the_chat_list_summary():
+    chat = Chat(title="Chat", last_message_preview="Earlier answer")
+    ChatService.record_turn(chat, "Question", "An  answer\nover two lines")
+    assert chat.last_message_preview == "An answer over two lines"
+    assert "chats.message_count + " in str(chat.message_count)
+
+    ChatService.record_turn(chat, "word " * 100, "")
+    assert len(chat.last_message_preview) == 120 and chat.last_message_preview.endswith("…")
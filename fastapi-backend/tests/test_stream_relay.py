@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.utils.stream_relay import coalesce_text
+
+
+class FakeClock:
+    """Integer milliseconds, so frame boundaries are exact."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+async def deltas(clock, items, gap):
+    for item in items:
+        # Arrives after the relay has handled the previous one, like a network read
+        await asyncio.sleep(0)
+        clock.now += gap
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_first_delta_is_immediate_then_frames_are_time_batched():
+    clock = FakeClock()
+    tokens = [f"t{i} " for i in range(20)]
+
+    # 10ms between tokens, 40ms frames: first token alone, then 4 tokens per frame
+    frames = [f async for f in coalesce_text(deltas(clock, tokens, 10), 40, 10_000, clock)]
+
+    assert frames[0] == "t0 "
+    assert "".join(frames) == "".join(tokens)
+    assert [len(frame.split()) for frame in frames] == [1, 4, 4, 4, 4, 3]
+
+
+@pytest.mark.asyncio
+async def test_size_limit_and_tail_flush():
+    clock = FakeClock()
+    tokens = ["abcd"] * 9
+
+    # No time passes, so only the size limit and the final flush emit frames
+    frames = [f async for f in coalesce_text(deltas(clock, tokens, 0), 1000, 8, clock)]
+
+    assert frames == ["abcd", "abcdabcd", "abcdabcd", "abcdabcd", "abcdabcd"]
+
+
+@pytest.mark.asyncio
+async def test_held_text_is_flushed_while_the_source_pauses():
+    async def paused():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.5)
+        yield "c"
+
+    frames = [f async for f in coalesce_text(paused(), 0.05, 10_000)]
+
+    # Without the deadline "b" would wait for "c" and go out as "bc"
+    assert frames == ["a", "b", "c"]
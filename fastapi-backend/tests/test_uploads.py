@@ -0,0 +1,94 @@
+import base64
+import io
+import json
+import uuid
+from unittest import mock
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app.api.v1.files import presign_upload
+from app.schemas.file import PresignUploadRequest
+from app.services import upload_service
+from app.services.chat_service import ChatService
+from app.services.upload_service import inspect_upload
+from app.utils.aws_client import s3_client
+
+
+def _png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_presigned_post_is_scoped_to_the_user_and_declared_size():
+    user = mock.Mock(id=uuid.uuid4())
+    response = await presign_upload(
+        PresignUploadRequest(filename="../My photo.png", content_type="image/png", size=1000), user
+    )
+    assert response.key.startswith(f"uploads/{user.id}/") and response.key.endswith("/My_photo.png")
+    assert response.fields["key"] == response.key
+    policy = json.loads(base64.b64decode(response.fields["policy"]))
+    assert ["content-length-range", 1, 1000] in policy["conditions"]
+
+    for content_type, size in [("application/zip", 1000), ("image/png", 50 * 1024 * 1024)]:
+        with pytest.raises(HTTPException) as excinfo:
+            await presign_upload(PresignUploadRequest(filename="a", content_type=content_type, size=size), user)
+        assert excinfo.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_uploads_are_checked_from_a_ranged_read_of_their_header():
+    user_id = uuid.uuid4()
+    key = f"uploads/{user_id}/abc/photo.png"
+    with mock.patch.object(s3_client, "read_header", mock.AsyncMock(return_value=(_png(40, 30), 1000))) as read:
+        upload = await inspect_upload(user_id, key)
+    read.assert_awaited_once_with(key, upload_service.SNIFF_BYTES)
+    assert (upload.mime_type, upload.size, upload.content_type) == ("image/png", 1000, "image")
+
+    for header, size in [(_png(9000, 10), 1000), (b"PK\x03\x04 zip", 1000), (_png(40, 30), 50 * 1024 * 1024)]:
+        with mock.patch.object(s3_client, "read_header", mock.AsyncMock(return_value=(header, size))):
+            with pytest.raises(ValueError):
+                await inspect_upload(user_id, key)
+
+
+@pytest.mark.asyncio
+async def test_other_users_keys_are_rejected_without_reading_s3():
+    user_id = uuid.uuid4()
+    with mock.patch.object(s3_client, "read_header", mock.AsyncMock()) as read:
+        for key in [f"uploads/{uuid.uuid4()}/abc/a.png", f"uploads/{user_id}/../x/a.png"]:
+            with pytest.raises(ValueError):
+                await inspect_upload(user_id, key)
+    read.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_read_header_takes_the_total_size_from_the_content_range():
+    body = mock.Mock(read=mock.Mock(return_value=b"%PDF-1.7"))
+    client = mock.Mock(get_object=mock.Mock(return_value={"Body": body, "ContentRange": "bytes 0-7/123456"}))
+    with mock.patch.object(s3_client, "client", client):
+        assert await s3_client.read_header("uploads/x/a.pdf", 8) == (b"%PDF-1.7", 123456)
+    assert client.get_object.call_args.kwargs["Range"] == "bytes=0-7"
+
+
+@pytest.mark.asyncio
+async def test_uploads_reach_the_model_as_content_blocks():
+    chat = mock.Mock(message_pairs=[mock.Mock(messages=[mock.Mock(hidden=False, role="user", contents=[
+        mock.Mock(content_type="text", text_content="what's this?"),
+        mock.Mock(content_type="image", file_path="uploads/u/a/photo.png", mime_type="image/png"),
+        mock.Mock(content_type="document", file_path="uploads/u/b/report.pdf", mime_type="application/pdf"),
+    ])])])
+    with mock.patch.object(s3_client, "read_file", mock.AsyncMock(return_value=b"png bytes")) as read:
+        messages = await ChatService(mock.Mock()).prepare_messages_for_claude(chat, [{"type": "text", "text": "hi"}])
+    read.assert_awaited_once_with("uploads/u/a/photo.png")
+    assert messages[0]["content"][1:] == [
+        {"type": "image", "source": {"type": "base64", "media_type": "image/png",
+                                     "data": base64.b64encode(b"png bytes").decode()}},
+        {"type": "text", "text": "[Document: report.pdf]"},
+    ]
+
+    with mock.patch.object(s3_client, "read_file", mock.AsyncMock(side_effect=FileNotFoundError)):
+        block = await ChatService(mock.Mock()).attachment_block("image", "uploads/u/a/photo.png", "image/png")
+    assert block == {"type": "text", "text": "[Image: photo.png]"}
@@ -30,7 +30,7 @@ const ChatList: React.FC = () => {
         fetchController.current = new AbortController();
 
         const response = await chatService.getChats();
-        setChats(Array.isArray(response) ? response : []);
+        setChats(Array.isArray(response?.results) ? response.results : []);
       } catch (error) {
         console.error("Error fetching chats:", error);
         setChats([]);
@@ -51,21 +51,20 @@ export function Sidebar() {
     isFetchingNextPage,
   } = useInfiniteQuery({
     queryKey: ["chats", debouncedSearch],
-    queryFn: async ({ pageParam = 1 }) => {
+    queryFn: async ({ pageParam }) => {
       const response = await chatService.getChats(
         undefined,
         false,
         20,
-        (pageParam - 1) * 20
+        pageParam
       );
-      // Transform to match expected format
       return {
-        results: response || [],
-        next: response && response.length === 20 ? pageParam + 1 : null,
+        results: response?.results || [],
+        next: response?.next_cursor ?? null,
       };
     },
     getNextPageParam: (lastPage) => lastPage.next,
-    initialPageParam: 1,
+    initialPageParam: null as string | null,
   });
 
   // Flatten chat pages into a single array
@@ -254,8 +253,14 @@ export function Sidebar() {
               <Link
                 to={`/chat/${chat.id}`}
                 className="block w-[calc(100%-64px)] truncate"
+                title={chat.last_message_preview || undefined}
               >
                 {chat.title}
+                {chat.last_message_preview && (
+                  <span className="block truncate text-xs text-muted-foreground">
+                    {chat.last_message_preview}
+                  </span>
+                )}
               </Link>
               <div className="absolute right-2 flex items-center gap-0.5 opacity-0 group-hover:opacity-100 transition-opacity">
                 <Button
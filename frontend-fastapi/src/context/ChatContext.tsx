@@ -30,6 +30,8 @@ export const ChatProvider: React.FC<{
     messages,
     setMessages,
     fetchMessages,
+    hasOlderMessages,
+    fetchOlderMessages,
     handleEditMessage,
     handleDeleteMessagePair,
     handleToggleMessagePair,
@@ -58,6 +60,8 @@ export const ChatProvider: React.FC<{
     savedSystemPrompts,
     chat,
     fetchMessages,
+    hasOlderMessages,
+    fetchOlderMessages,
     handleSystemPromptChange,
     handleSaveSystemPrompt,
     handleUpdateSystemPrompt,
@@ -66,10 +66,15 @@ export const useMessageSubmission = ({
           }
         }
 
+        // Attachments go straight to S3; the message only carries their keys
+        const fileKeys = await Promise.all(
+          selectedFiles.map((file) => chatService.uploadFile(file))
+        );
+
         // Prepare message data
         const messageData = {
           message: messageText,
-          files: [], // TODO: Handle file uploads
+          files: fileKeys,
           system_prompt_override: systemPrompt || undefined,
         };
 
@@ -177,6 +182,8 @@ export const useMessageSubmission = ({
               queryClient.invalidateQueries({
                 queryKey: ["chat", currentChatId, "messages"],
               });
+              // The chat moves to the top of the list with its new preview
+              queryClient.invalidateQueries({ queryKey: ["chats"] });
               break;
             }
 
@@ -4,28 +4,47 @@ import { toast } from "sonner";
 import { Message } from "@/types/chat";
 import { chatService } from "@/services/chat";
 
+const flattenPairs = (
+  pairs: { id: string; messages: Omit<Message, "message_pair">[] }[]
+): Message[] =>
+  pairs.flatMap((pair) =>
+    pair.messages.map((message) => ({ ...message, message_pair: pair.id }))
+  );
+
 export const useMessages = (chatId: string) => {
   const [messages, setMessages] = useState<Message[]>([]);
+  // Cursor for the window of pairs before the loaded ones; null once the start of the chat is loaded
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState<
+    string | null
+  >(null);
 
+  // Only the newest pairs; older ones are loaded on demand
   const fetchMessages = useCallback(async () => {
     if (chatId === "new") return;
 
     try {
-      const chatDetail = await chatService.getChat(chatId);
-      // Extract messages from message pairs
-      const allMessages: Message[] = [];
-      if (chatDetail.message_pairs) {
-        chatDetail.message_pairs.forEach((pair: { messages: Message[] }) => {
-          allMessages.push(...pair.messages);
-        });
-      }
-      setMessages(allMessages);
+      const page = await chatService.getMessages(chatId);
+      setMessages(flattenPairs(page.message_pairs));
+      setOlderMessagesCursor(page.previous_cursor);
     } catch (error) {
       console.error("Error fetching messages:", error);
       toast.error("Failed to fetch messages");
     }
   }, [chatId]);
 
+  const fetchOlderMessages = useCallback(async () => {
+    if (!olderMessagesCursor) return;
+
+    try {
+      const page = await chatService.getMessages(chatId, olderMessagesCursor);
+      setMessages((prev) => [...flattenPairs(page.message_pairs), ...prev]);
+      setOlderMessagesCursor(page.previous_cursor);
+    } catch (error) {
+      console.error("Error fetching older messages:", error);
+      toast.error("Failed to load earlier messages");
+    }
+  }, [chatId, olderMessagesCursor]);
+
   const handleEditMessage = useCallback(
     async (messageId: string, newText: string) => {
       try {
@@ -91,6 +110,8 @@ export const useMessages = (chatId: string) => {
     messages,
     setMessages,
     fetchMessages,
+    hasOlderMessages: olderMessagesCursor !== null,
+    fetchOlderMessages,
     handleEditMessage,
     handleDeleteMessagePair,
     handleToggleMessagePair,
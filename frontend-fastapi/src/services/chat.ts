@@ -81,7 +81,30 @@ export interface StreamChunk {
   error?: string;
 }
 
+export interface PresignedUpload {
+  key: string;
+  url: string;
+  fields: Record<string, string>;
+  expires_in: number;
+}
+
 export const chatService = {
+  // Upload an attachment straight to S3; returns the key to send in ChatMessage.files
+  async uploadFile(file: File) {
+    const response = await chatApi.post<PresignedUpload>(
+      `${API_URL}/api/v1/files/presign`,
+      { filename: file.name, content_type: file.type, size: file.size },
+      { headers: createAuthHeaders() }
+    );
+    const { key, url, fields } = response.data;
+
+    const form = new FormData();
+    Object.entries(fields).forEach(([name, value]) => form.append(name, value));
+    form.append("file", file); // S3 ignores fields after the file
+    await axios.post(url, form);
+    return key;
+  },
+
   // Create a new chat
   async createChat(chatData: ChatCreateRequest) {
     const response = await chatApi.post(`${BASE_CHAT_URL}/chats`, chatData, {
@@ -90,22 +113,24 @@ export const chatService = {
     return response.data;
   },
 
-  // Get all chats
+  // Get a page of chats, newest first; pass the previous page's next_cursor for older ones
   async getChats(
     projectId?: string,
     includeArchived = false,
     limit = 50,
-    offset = 0
+    cursor?: string | null
   ) {
     const params = new URLSearchParams({
       include_archived: includeArchived.toString(),
       limit: limit.toString(),
-      offset: offset.toString(),
     });
 
     if (projectId) {
       params.append("project_id", projectId);
     }
+    if (cursor) {
+      params.append("cursor", cursor);
+    }
 
     const response = await chatApi.get(`${BASE_CHAT_URL}/chats?${params}`, {
       headers: createAuthHeaders(),
@@ -121,6 +146,21 @@ export const chatService = {
     return response.data;
   },
 
+  // Get a window of a chat's newest message pairs; pass previous_cursor to scroll back
+  async getMessages(chatId: string, cursor?: string | null, limit = 20) {
+    const params = new URLSearchParams({ limit: limit.toString() });
+
+    if (cursor) {
+      params.append("cursor", cursor);
+    }
+
+    const response = await chatApi.get(
+      `${BASE_CHAT_URL}/chats/${chatId}/messages?${params}`,
+      { headers: createAuthHeaders() }
+    );
+    return response.data;
+  },
+
   // Update chat
   async updateChat(chatId: string, updateData: Partial<ChatCreateRequest>) {
     const response = await chatApi.put(
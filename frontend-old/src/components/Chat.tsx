@@ -15,20 +15,23 @@ import { ChatInput } from "./ChatInput";
 import { ChatProvider } from "@/context/ChatContext";
 
 const MessageList = React.memo(() => {
-  const { messages, isStreaming } = useChat();
+  const { messages, isStreaming, hasOlderMessages, fetchOlderMessages } =
+    useChat();
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const listRef = useRef<HTMLDivElement>(null);
-  const prevMessagesLength = useRef(messages.length);
+  const lastMessageId = useRef(messages[messages.length - 1]?.id);
 
+  // Follow new messages at the bottom, but stay put when older ones load above
   useEffect(() => {
-    if (isStreaming || messages.length > prevMessagesLength.current) {
+    const lastId = messages[messages.length - 1]?.id;
+    if (isStreaming || lastId !== lastMessageId.current) {
       const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
       };
       requestAnimationFrame(scrollToBottom);
     }
-    prevMessagesLength.current = messages.length;
-  }, [messages.length, isStreaming]);
+    lastMessageId.current = lastId;
+  }, [messages, isStreaming]);
 
   const renderMessage = useCallback((message: Message) => {
     return message.role === "user" ? (
@@ -41,6 +44,13 @@ const MessageList = React.memo(() => {
   return (
     <ScrollArea className="overflow-y-auto relative">
       <div className="max-w-3xl mx-auto" ref={listRef}>
+        {hasOlderMessages && (
+          <div className="flex justify-center p-2">
+            <Button variant="ghost" size="sm" onClick={fetchOlderMessages}>
+              Load earlier messages
+            </Button>
+          </div>
+        )}
         {messages?.length === 0 ? (
           <div className="flex items-center justify-center h-full min-h-[400px]">
             <h1 className="text-2xl font-semibold text-muted-foreground">
@@ -33,23 +33,25 @@ export default function Projects() {
     isFetchingNextPage,
   } = useInfiniteQuery({
     queryKey: ["projects", debouncedSearch],
-    queryFn: async ({ pageParam = 1 }) => {
+    queryFn: async ({ pageParam }) => {
+      // `next` is a complete URL, carrying the cursor for the following page
       const response = await axios.get<{
         results: Project[];
-        next: number | null;
-      }>(urls.projects, {
+        next: string | null;
+      }>(pageParam ?? urls.projects, {
         headers: { Authorization: `token ${token}` },
-        params: {
-          page: pageParam,
-          search: debouncedSearch,
-          page_size: 12,
-        },
+        params: pageParam
+          ? undefined
+          : {
+              search: debouncedSearch,
+              page_size: 12,
+            },
       });
       console.log("projects response", response.data);
       return response.data;
     },
     getNextPageParam: (lastPage) => lastPage.next,
-    initialPageParam: 1,
+    initialPageParam: null as string | null,
   });
 
   const projects = projectsData?.pages.flatMap((page) => page.results) ?? [];
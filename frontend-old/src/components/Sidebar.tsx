@@ -77,22 +77,24 @@ export function Sidebar() {
     isFetchingNextPage,
   } = useInfiniteQuery({
     queryKey: ["chats", debouncedSearch],
-    queryFn: async ({ pageParam = 1 }) => {
+    queryFn: async ({ pageParam }) => {
+      // `next` is a complete URL, carrying the cursor for the following page
       const response = await axios.get<{
         results: Chat[];
-        next: number | null;
-      }>(urls.chats, {
+        next: string | null;
+      }>(pageParam ?? urls.chats, {
         headers: { Authorization: `token ${token}` },
-        params: {
-          page: pageParam,
-          search: debouncedSearch,
-          page_size: 20,
-        },
+        params: pageParam
+          ? undefined
+          : {
+              search: debouncedSearch,
+              page_size: 20,
+            },
       });
       return response.data;
     },
     getNextPageParam: (lastPage) => lastPage.next,
-    initialPageParam: 1,
+    initialPageParam: null as string | null,
   });
 
   // Flatten chat pages into a single array
@@ -288,8 +290,14 @@ export function Sidebar() {
               <Link
                 to={`/chat/${chat.id}`}
                 className="block w-[calc(100%-64px)] truncate"
+                title={chat.last_message_preview || undefined}
               >
                 {chat.title}
+                {chat.last_message_preview && (
+                  <span className="block truncate text-xs text-muted-foreground">
+                    {chat.last_message_preview}
+                  </span>
+                )}
               </Link>
               <div className="absolute right-2 flex items-center gap-0.5 opacity-0 group-hover:opacity-100 transition-opacity">
                 <Button
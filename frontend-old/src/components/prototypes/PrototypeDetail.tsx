@@ -32,6 +32,7 @@ import { Skeleton } from "@/components/ui/skeleton";
 import {
   fetchPrototype,
   fetchVariants,
+  fetchVersionHtml,
   createVariant,
   createVersion,
 } from "@/services/prototypes";
@@ -85,14 +86,22 @@ const PrototypeDetail: React.FC = () => {
   console.log("active version", activeVersion);
   console.log("prototype", prototype);
 
+  // Fetch the active version's HTML on demand; versions never change
+  const { data: versionHtml } = useQuery({
+    queryKey: ["version-html", activeVersion],
+    queryFn: () => fetchVersionHtml(activeVersion ?? ""),
+    enabled: !!activeVersion,
+    staleTime: Infinity,
+  });
+
   // Set active variant and version when data is loaded
   useEffect(() => {
     if (variants && variants.length > 0) {
       const originalVariant =
         variants.find((v) => v.is_original) || variants[0];
       setActiveVariant(originalVariant.id);
-      if (originalVariant.latest_version) {
-        setActiveVersion(originalVariant.latest_version.id);
+      if (originalVariant.latest_version_id) {
+        setActiveVersion(originalVariant.latest_version_id);
       }
     }
   }, [variants]);
@@ -106,8 +115,8 @@ const PrototypeDetail: React.FC = () => {
       resetVariantForm();
       toast.success("Variant created successfully");
       setActiveVariant(newVariant.id);
-      if (newVariant.latest_version) {
-        setActiveVersion(newVariant.latest_version.id);
+      if (newVariant.latest_version_id) {
+        setActiveVersion(newVariant.latest_version_id);
       }
     },
     onError: (error) => {
@@ -172,30 +181,16 @@ const PrototypeDetail: React.FC = () => {
   };
 
   const copyCode = () => {
-    const activeVariantObj = variants?.find((v) => v.id === activeVariant);
-    if (!activeVariantObj) return;
-
-    const activeVersionObj = activeVariantObj.versions?.find(
-      (v) => v.id === activeVersion
-    );
-    if (!activeVersionObj) return;
+    if (!versionHtml) return;
 
-    navigator.clipboard.writeText(activeVersionObj.html_content);
+    navigator.clipboard.writeText(versionHtml);
     toast.success("Code copied to clipboard");
   };
 
   const getVersionContent = () => {
     if (!activeVariant || !activeVersion) return "";
 
-    const activeVariantObj = variants?.find((v) => v.id === activeVariant);
-    if (!activeVariantObj) return "";
-
-    const activeVersionObj = activeVariantObj.versions?.find(
-      (v) => v.id === activeVersion
-    );
-    if (!activeVersionObj) return "";
-
-    return activeVersionObj.html_content;
+    return versionHtml ?? "";
   };
 
   const openFullscreen = () => {
@@ -205,13 +200,13 @@ const PrototypeDetail: React.FC = () => {
     const activeVersionObj = activeVariantObj.versions?.find(
       (v) => v.id === activeVersion
     );
-    if (!activeVersionObj) return;
+    if (!activeVersionObj || !versionHtml) return;
 
     // Create a new window with the HTML content
     const newWindow = window.open("", "_blank");
     if (newWindow) {
-      newWindow.document.write(activeVersionObj.html_content);
-      newWindow.document.title = `${prototype?.name} - ${activeVariantObj.name} (V${activeVersionObj.version})`;
+      newWindow.document.write(versionHtml);
+      newWindow.document.title = `${prototype?.name} - ${activeVariantObj.name} (V${activeVersionObj.version_number})`;
       newWindow.document.close();
     } else {
       toast.error("Popup blocked. Please allow popups for this site.");
@@ -288,8 +283,8 @@ const PrototypeDetail: React.FC = () => {
                 onValueChange={(value: string) => {
                   setActiveVariant(value);
                   const variant = variants?.find((v) => v.id === value);
-                  if (variant && variant.latest_version) {
-                    setActiveVersion(variant.latest_version.id);
+                  if (variant && variant.latest_version_id) {
+                    setActiveVersion(variant.latest_version_id);
                   }
                 }}
                 className="w-full"
@@ -324,7 +319,7 @@ const PrototypeDetail: React.FC = () => {
                           key={version.id}
                           value={version.id.toString()}
                         >
-                          V{version.version}{" "}
+                          V{version.version_number}{" "}
                           {version.name ? `- ${version.name}` : ""}
                         </TabsTrigger>
                       ))}
@@ -27,6 +27,7 @@ const urls = {
   chatDetail: (chatId: string) => `${BASE_CHATS_URL}chats/${chatId}/`,
   chatTokens: (chatId: string) => `${BASE_CHATS_URL}chats/${chatId}/tokens/`,
   chat: `${BASE_CHATS_URL}chat/`,
+  presignUpload: `${BASE_CHATS_URL}uploads/presign/`,
   savedSystemPrompts: `${BASE_CHATS_URL}saved-system-prompts/`,
   updateSystemPrompt: (chatId: string) =>
     `${BASE_CHATS_URL}chats/${chatId}/system-prompt/`,
@@ -3,6 +3,7 @@ import { useCallback } from "react";
 import { useNavigate } from "react-router-dom";
 import token from "@/constants/token";
 import urls from "@/constants/urls";
+import { uploadFileDirect } from "@/services/uploads";
 import { Message } from "@/types/chat";
 import { toast } from "sonner";
 import { useQueryClient } from "@tanstack/react-query";
@@ -50,14 +51,16 @@ export const useMessageSubmission = ({
       if (systemPrompt) {
         formData.append("system_prompt", systemPrompt);
       }
-      selectedFiles.forEach((file) => {
-        formData.append("files", file);
-      });
-
       setNewMessage("");
       setIsStreaming(true);
 
       try {
+        // Attachments go straight to S3; the chat request only carries their keys
+        const fileKeys = await Promise.all(selectedFiles.map(uploadFileDirect));
+        fileKeys.forEach((key) => {
+          formData.append("file_keys", key);
+        });
+
         const response = await fetch(urls.chat, {
           method: "POST",
           headers: { Authorization: `Token ${token}` },
@@ -7,7 +7,10 @@ import { Message } from "@/types/chat";
 
 export const useMessages = (chatId: string) => {
   const [messages, setMessages] = useState<Message[]>([]);
+  // Link to the window of pairs before the loaded ones; null once the start of the chat is loaded
+  const [olderMessagesUrl, setOlderMessagesUrl] = useState<string | null>(null);
 
+  // Only the newest pairs; older ones are loaded on demand
   const fetchMessages = useCallback(async () => {
     if (chatId === "new") return;
 
@@ -17,12 +20,29 @@ export const useMessages = (chatId: string) => {
       });
       const data = await response.json();
       setMessages(data.messages);
+      setOlderMessagesUrl(data.previous);
     } catch (error) {
       console.error("Error fetching messages:", error);
       toast.error("Failed to fetch messages");
     }
   }, [chatId]);
 
+  const fetchOlderMessages = useCallback(async () => {
+    if (!olderMessagesUrl) return;
+
+    try {
+      const response = await fetch(olderMessagesUrl, {
+        headers: { Authorization: `Token ${token}` },
+      });
+      const data = await response.json();
+      setMessages((prev) => [...data.messages, ...prev]);
+      setOlderMessagesUrl(data.previous);
+    } catch (error) {
+      console.error("Error fetching older messages:", error);
+      toast.error("Failed to load earlier messages");
+    }
+  }, [olderMessagesUrl]);
+
   const handleEditMessage = useCallback(
     async (messageId: string, newText: string) => {
       try {
@@ -89,6 +109,8 @@ export const useMessages = (chatId: string) => {
     messages,
     setMessages,
     fetchMessages,
+    hasOlderMessages: olderMessagesUrl !== null,
+    fetchOlderMessages,
     handleEditMessage,
     handleDeleteMessagePair,
     handleToggleMessagePair,
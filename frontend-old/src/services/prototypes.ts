@@ -9,10 +9,30 @@ import {
   GeneratePrototypeRequest,
   EditVersionRequest,
   CreateVariantRequest,
+  PrototypeJob,
 } from "@/types/prototype";
 import { BASE_PROTOTYPES_URL } from "@/constants/urls";
 
 const API_BASE_URL = BASE_PROTOTYPES_URL;
+const JOB_POLL_INTERVAL = 1000;
+
+// Generation runs as a background job; wait for it and return the version it saved
+const waitForJob = async (job: PrototypeJob) => {
+  while (job.status === "pending" || job.status === "running") {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+    const response = await axios.get<PrototypeJob>(
+      `${API_BASE_URL}/jobs/${job.id}/`,
+      {
+        headers: { Authorization: `token ${token}` },
+      }
+    );
+    job = response.data;
+  }
+  if (job.status === "failed" || !job.result_version) {
+    throw new Error(job.error || "Prototype generation failed");
+  }
+  return fetchVersion(job.result_version);
+};
 
 // Design Projects
 export const fetchDesignProjects = async () => {
@@ -160,14 +180,16 @@ export const fetchPrototype = async (id: string) => {
 };
 
 export const generatePrototype = async (data: GeneratePrototypeRequest) => {
-  const response = await axios.post<Prototype>(
+  const response = await axios.post<PrototypeJob>(
     `${API_BASE_URL}/generate-prototype/`,
     data,
     {
       headers: { Authorization: `token ${token}` },
     }
   );
-  return response.data;
+  const version = await waitForJob(response.data);
+  const variant = await fetchVariant(version.variant);
+  return fetchPrototype(variant.prototype);
 };
 
 export const updatePrototype = async (
@@ -201,7 +223,7 @@ export const fetchVariants = async (prototypeId: string) => {
   return response.data;
 };
 
-export const fetchVariant = async (variantId: number) => {
+export const fetchVariant = async (variantId: number | string) => {
   const response = await axios.get<PrototypeVariant>(
     `${API_BASE_URL}/variants/${variantId}/`,
     {
@@ -212,14 +234,15 @@ export const fetchVariant = async (variantId: number) => {
 };
 
 export const createVariant = async (data: CreateVariantRequest) => {
-  const response = await axios.post<PrototypeVariant>(
+  const response = await axios.post<PrototypeJob>(
     `${API_BASE_URL}/prototypes/${data.prototype_id}/create_variant/`,
     data,
     {
       headers: { Authorization: `token ${token}` },
     }
   );
-  return response.data;
+  const version = await waitForJob(response.data);
+  return fetchVariant(version.variant);
 };
 
 // Versions
@@ -233,7 +256,7 @@ export const fetchVersions = async (variantId: number) => {
   return response.data;
 };
 
-export const fetchVersion = async (versionId: number) => {
+export const fetchVersion = async (versionId: number | string) => {
   const response = await axios.get<PrototypeVersion>(
     `${API_BASE_URL}/versions/${versionId}/`,
     {
@@ -243,13 +266,24 @@ export const fetchVersion = async (versionId: number) => {
   return response.data;
 };
 
+export const fetchVersionHtml = async (versionId: string) => {
+  const response = await axios.get<string>(
+    `${API_BASE_URL}/versions/${versionId}/html/`,
+    {
+      headers: { Authorization: `token ${token}` },
+      responseType: "text",
+    }
+  );
+  return response.data;
+};
+
 export const createVersion = async (data: EditVersionRequest) => {
-  const response = await axios.post<PrototypeVersion>(
+  const response = await axios.post<PrototypeJob>(
     `${API_BASE_URL}/variants/${data.variant_id}/create_version/`,
     data,
     {
       headers: { Authorization: `token ${token}` },
     }
   );
-  return response.data;
+  return waitForJob(response.data);
 };
@@ -9,6 +9,8 @@ export interface ChatContextType {
   savedSystemPrompts: SavedSystemPrompt[];
   chat: Chat | null;
   fetchMessages: () => Promise<void>;
+  hasOlderMessages: boolean;
+  fetchOlderMessages: () => Promise<void>;
   handleSystemPromptChange: (prompt: string) => void;
   handleSaveSystemPrompt: (title: string, prompt: string) => Promise<void>;
   handleUpdateSystemPrompt: () => Promise<void>;
@@ -46,6 +46,9 @@ export interface Chat {
   system_prompt: string | null;
   project?: number;
   user: number;
+  last_activity_at: string;
+  last_message_preview: string;
+  message_count: number;
 }
 
 // Project related types
@@ -33,15 +33,26 @@ export interface PrototypeVariant {
   is_original: boolean;
   created_at: string;
   updated_at: string;
-  versions: PrototypeVersion[];
-  version_count: number;
-  latest_version: PrototypeVersion;
+  versions: PrototypeVersionSummary[];
+  versions_count: number;
+  latest_version_id: string | null;
+  // Only on responses to create calls
+  latest_version?: PrototypeVersion;
+}
+
+export interface PrototypeVersionSummary {
+  id: string;
+  name: string;
+  version_number: number;
+  variant: string;
+  edit_prompt: string | null;
+  created_at: string;
 }
 
 export interface PrototypeVersion {
   id: string;
   name: string;
-  version: number;
+  version_number: number;
   variant: string;
   html_content: string;
   created_at: string;
@@ -67,3 +78,16 @@ export interface CreateVariantRequest {
   description: string;
   prompt?: string;
 }
+
+export interface PrototypeJob {
+  id: string;
+  kind: "generate" | "edit" | "variant";
+  status: "pending" | "running" | "done" | "failed";
+  name: string;
+  generated_chars: number;
+  error: string;
+  result_version: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}